@@ -14,6 +14,7 @@ from typing import Dict, List, Optional, Any
 from enum import Enum
 import secrets
 import hashlib
+import sys
 
 import aioredis
 import aiohttp
@@ -21,14 +22,18 @@ from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks, Request, U
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel, validator, HttpUrl
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, Text, DECIMAL, ForeignKey, JSON, Enum as SQLEnum
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, DECIMAL, ForeignKey, JSON, Enum as SQLEnum, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session, relationship
+from sqlalchemy.orm import relationship, selectinload
 from sqlalchemy.sql import func
 import boto3
 from web3 import Web3
 import requests
 
+sys.path.append(os.path.join(os.path.dirname(__file__), "../../shared"))
+from async_db import create_session_factory, session_dependency
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -74,8 +79,7 @@ class Config:
 config = Config()
 
 # Database setup
-engine = create_engine(config.DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+engine, AsyncSessionLocal = create_session_factory(config.DATABASE_URL)
 Base = declarative_base()
 
 security = HTTPBearer()
@@ -399,12 +403,7 @@ class TokenListingApplication(BaseModel):
     website_url: Optional[HttpUrl] = None
 
 # Dependencies
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+get_async_db = session_dependency(AsyncSessionLocal)
 
 async def get_current_admin(credentials: HTTPAuthorizationCredentials = Depends(security)):
     # Simplified admin authentication
@@ -439,14 +438,14 @@ class AdminPanelManager:
                 aws_secret_access_key=config.AWS_SECRET_ACCESS_KEY
             )
     
-    async def create_blockchain(self, blockchain_data: BlockchainCreate, admin: Dict[str, Any], db: Session):
+    async def create_blockchain(self, blockchain_data: BlockchainCreate, admin: Dict[str, Any], db: AsyncSession):
         """Create new blockchain integration"""
         
         # Check if blockchain already exists
-        existing = db.query(Blockchain).filter(
+        existing = await db.scalar(select(Blockchain).where(
             (Blockchain.name == blockchain_data.name) | 
             (Blockchain.chain_id == blockchain_data.chain_id)
-        ).first()
+        ))
         
         if existing:
             raise HTTPException(status_code=400, detail="Blockchain already exists")
@@ -485,30 +484,30 @@ class AdminPanelManager:
         )
         
         db.add(blockchain)
-        db.commit()
-        db.refresh(blockchain)
+        await db.commit()
+        await db.refresh(blockchain)
         
         # Add to Web3 clients
         self.web3_clients[blockchain_data.network] = web3
         
         return blockchain
     
-    async def create_token(self, token_data: TokenCreate, admin: Dict[str, Any], db: Session):
+    async def create_token(self, token_data: TokenCreate, admin: Dict[str, Any], db: AsyncSession):
         """Create new token"""
         
         # Get blockchain
-        blockchain = db.query(Blockchain).filter(
+        blockchain = await db.scalar(select(Blockchain).where(
             Blockchain.blockchain_id == token_data.blockchain_id
-        ).first()
+        ))
         
         if not blockchain:
             raise HTTPException(status_code=404, detail="Blockchain not found")
         
         # Check if token already exists
-        existing = db.query(Token).filter(
+        existing = await db.scalar(select(Token).where(
             Token.symbol == token_data.symbol,
             Token.blockchain_id == blockchain.id
-        ).first()
+        ))
         
         if existing:
             raise HTTPException(status_code=400, detail="Token already exists on this blockchain")
@@ -543,17 +542,18 @@ class AdminPanelManager:
         )
         
         db.add(token)
-        db.commit()
-        db.refresh(token)
+        await db.commit()
+        await db.refresh(token)
+        await db.refresh(token, ["blockchain"])
         
         return token
     
-    async def create_trading_pair(self, pair_data: TradingPairCreate, admin: Dict[str, Any], db: Session):
+    async def create_trading_pair(self, pair_data: TradingPairCreate, admin: Dict[str, Any], db: AsyncSession):
         """Create new trading pair"""
         
         # Get tokens
-        base_token = db.query(Token).filter(Token.symbol == pair_data.base_token_symbol).first()
-        quote_token = db.query(Token).filter(Token.symbol == pair_data.quote_token_symbol).first()
+        base_token = await db.scalar(select(Token).where(Token.symbol == pair_data.base_token_symbol))
+        quote_token = await db.scalar(select(Token).where(Token.symbol == pair_data.quote_token_symbol))
         
         if not base_token:
             raise HTTPException(status_code=404, detail=f"Base token {pair_data.base_token_symbol} not found")
@@ -562,10 +562,10 @@ class AdminPanelManager:
             raise HTTPException(status_code=404, detail=f"Quote token {pair_data.quote_token_symbol} not found")
         
         # Check if pair already exists
-        existing = db.query(TradingPair).filter(
+        existing = await db.scalar(select(TradingPair).where(
             TradingPair.base_token_id == base_token.id,
             TradingPair.quote_token_id == quote_token.id
-        ).first()
+        ))
         
         if existing:
             raise HTTPException(status_code=400, detail="Trading pair already exists")
@@ -589,8 +589,9 @@ class AdminPanelManager:
         )
         
         db.add(trading_pair)
-        db.commit()
-        db.refresh(trading_pair)
+        await db.commit()
+        await db.refresh(trading_pair)
+        await db.refresh(trading_pair, ["base_token", "quote_token"])
         
         return trading_pair
     
@@ -644,29 +645,31 @@ class AdminPanelManager:
         
         return {}
     
-    async def update_token_market_data(self, db: Session):
+    async def update_token_market_data(self):
         """Update market data for all tokens"""
         
-        tokens = db.query(Token).filter(
-            Token.coingecko_id.isnot(None),
-            Token.status == TokenStatus.ACTIVE
-        ).all()
+        # Runs after the response is sent, so it cannot reuse the request's session
+        async with AsyncSessionLocal() as db:
+            tokens = (await db.execute(select(Token).where(
+                Token.coingecko_id.isnot(None),
+                Token.status == TokenStatus.ACTIVE
+            ))).scalars().all()
         
-        for token in tokens:
-            try:
-                market_data = await self.fetch_coingecko_data(token.coingecko_id)
+            for token in tokens:
+                try:
+                    market_data = await self.fetch_coingecko_data(token.coingecko_id)
                 
-                if market_data:
-                    token.current_price_usd = market_data.get('current_price')
-                    token.market_cap_usd = market_data.get('market_cap')
-                    token.volume_24h_usd = market_data.get('volume_24h')
+                    if market_data:
+                        token.current_price_usd = market_data.get('current_price')
+                        token.market_cap_usd = market_data.get('market_cap')
+                        token.volume_24h_usd = market_data.get('volume_24h')
                     
-                    db.commit()
+                        await db.commit()
                     
-            except Exception as e:
-                logger.error(f"Error updating market data for {token.symbol}: {e}")
+                except Exception as e:
+                    logger.error(f"Error updating market data for {token.symbol}: {e}")
     
-    async def submit_listing_application(self, application_data: TokenListingApplication, db: Session):
+    async def submit_listing_application(self, application_data: TokenListingApplication, db: AsyncSession):
         """Submit token listing application"""
         
         listing_id = f"LISTING_{secrets.token_hex(8).upper()}"
@@ -688,8 +691,8 @@ class AdminPanelManager:
         )
         
         db.add(listing)
-        db.commit()
-        db.refresh(listing)
+        await db.commit()
+        await db.refresh(listing)
         
         return listing
 
@@ -705,7 +708,7 @@ async def startup_event():
 async def create_blockchain(
     blockchain_data: BlockchainCreate,
     current_admin: Dict[str, Any] = Depends(get_current_admin),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create new blockchain integration"""
     blockchain = await admin_manager.create_blockchain(blockchain_data, current_admin, db)
@@ -721,18 +724,18 @@ async def create_blockchain(
 async def get_blockchains(
     is_active: Optional[bool] = None,
     network: Optional[BlockchainNetwork] = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get all blockchains"""
-    query = db.query(Blockchain)
+    query = select(Blockchain)
     
     if is_active is not None:
-        query = query.filter(Blockchain.is_active == is_active)
+        query = query.where(Blockchain.is_active == is_active)
     
     if network:
-        query = query.filter(Blockchain.network == network)
+        query = query.where(Blockchain.network == network)
     
-    blockchains = query.all()
+    blockchains = (await db.execute(query)).scalars().all()
     
     return {
         "blockchains": [
@@ -756,7 +759,7 @@ async def get_blockchains(
 async def create_token(
     token_data: TokenCreate,
     current_admin: Dict[str, Any] = Depends(get_current_admin),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create new token"""
     token = await admin_manager.create_token(token_data, current_admin, db)
@@ -775,23 +778,23 @@ async def get_tokens(
     is_tradable: Optional[bool] = None,
     limit: int = 50,
     offset: int = 0,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get all tokens"""
-    query = db.query(Token)
+    query = select(Token).options(selectinload(Token.blockchain))
     
     if status:
-        query = query.filter(Token.status == status)
+        query = query.where(Token.status == status)
     
     if blockchain_id:
-        blockchain = db.query(Blockchain).filter(Blockchain.blockchain_id == blockchain_id).first()
+        blockchain = await db.scalar(select(Blockchain).where(Blockchain.blockchain_id == blockchain_id))
         if blockchain:
-            query = query.filter(Token.blockchain_id == blockchain.id)
+            query = query.where(Token.blockchain_id == blockchain.id)
     
     if is_tradable is not None:
-        query = query.filter(Token.is_tradable == is_tradable)
+        query = query.where(Token.is_tradable == is_tradable)
     
-    tokens = query.offset(offset).limit(limit).all()
+    tokens = (await db.execute(query.offset(offset).limit(limit))).scalars().all()
     
     return {
         "tokens": [
@@ -815,7 +818,7 @@ async def get_tokens(
 async def create_trading_pair(
     pair_data: TradingPairCreate,
     current_admin: Dict[str, Any] = Depends(get_current_admin),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create new trading pair"""
     pair = await admin_manager.create_trading_pair(pair_data, current_admin, db)
@@ -834,25 +837,27 @@ async def get_trading_pairs(
     quote_token: Optional[str] = None,
     limit: int = 50,
     offset: int = 0,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get all trading pairs"""
-    query = db.query(TradingPair)
+    query = select(TradingPair).options(
+        selectinload(TradingPair.base_token), selectinload(TradingPair.quote_token)
+    )
     
     if status:
-        query = query.filter(TradingPair.status == status)
+        query = query.where(TradingPair.status == status)
     
     if base_token:
-        base_token_obj = db.query(Token).filter(Token.symbol == base_token).first()
+        base_token_obj = await db.scalar(select(Token).where(Token.symbol == base_token))
         if base_token_obj:
-            query = query.filter(TradingPair.base_token_id == base_token_obj.id)
+            query = query.where(TradingPair.base_token_id == base_token_obj.id)
     
     if quote_token:
-        quote_token_obj = db.query(Token).filter(Token.symbol == quote_token).first()
+        quote_token_obj = await db.scalar(select(Token).where(Token.symbol == quote_token))
         if quote_token_obj:
-            query = query.filter(TradingPair.quote_token_id == quote_token_obj.id)
+            query = query.where(TradingPair.quote_token_id == quote_token_obj.id)
     
-    pairs = query.offset(offset).limit(limit).all()
+    pairs = (await db.execute(query.offset(offset).limit(limit))).scalars().all()
     
     return {
         "trading_pairs": [
@@ -879,10 +884,10 @@ async def update_trading_pair_status(
     pair_id: str,
     status: TradingPairStatus,
     current_admin: Dict[str, Any] = Depends(get_current_admin),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Update trading pair status"""
-    pair = db.query(TradingPair).filter(TradingPair.pair_id == pair_id).first()
+    pair = await db.scalar(select(TradingPair).where(TradingPair.pair_id == pair_id))
     
     if not pair:
         raise HTTPException(status_code=404, detail="Trading pair not found")
@@ -891,7 +896,7 @@ async def update_trading_pair_status(
     if status == TradingPairStatus.DELISTED:
         pair.delisted_at = datetime.utcnow()
     
-    db.commit()
+    await db.commit()
     
     return {
         "pair_id": pair_id,
@@ -903,10 +908,10 @@ async def update_trading_pair_status(
 async def delete_trading_pair(
     pair_id: str,
     current_admin: Dict[str, Any] = Depends(get_current_admin),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Delete trading pair"""
-    pair = db.query(TradingPair).filter(TradingPair.pair_id == pair_id).first()
+    pair = await db.scalar(select(TradingPair).where(TradingPair.pair_id == pair_id))
     
     if not pair:
         raise HTTPException(status_code=404, detail="Trading pair not found")
@@ -915,14 +920,14 @@ async def delete_trading_pair(
     pair.status = TradingPairStatus.DELISTED
     pair.delisted_at = datetime.utcnow()
     
-    db.commit()
+    await db.commit()
     
     return {"message": "Trading pair deleted successfully"}
 
 @app.post("/api/v1/admin/token-listings")
 async def submit_token_listing(
     application_data: TokenListingApplication,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Submit token listing application"""
     listing = await admin_manager.submit_listing_application(application_data, db)
@@ -939,15 +944,17 @@ async def get_token_listings(
     limit: int = 50,
     offset: int = 0,
     current_admin: Dict[str, Any] = Depends(get_current_admin),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get token listing applications"""
-    query = db.query(TokenListing)
+    query = select(TokenListing)
     
     if status:
-        query = query.filter(TokenListing.status == status)
+        query = query.where(TokenListing.status == status)
     
-    listings = query.order_by(TokenListing.created_at.desc()).offset(offset).limit(limit).all()
+    listings = (await db.execute(
+        query.order_by(TokenListing.created_at.desc()).offset(offset).limit(limit)
+    )).scalars().all()
     
     return {
         "listings": [
@@ -971,10 +978,10 @@ async def review_token_listing(
     status: str,
     review_notes: Optional[str] = None,
     current_admin: Dict[str, Any] = Depends(get_current_admin),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Review token listing application"""
-    listing = db.query(TokenListing).filter(TokenListing.listing_id == listing_id).first()
+    listing = await db.scalar(select(TokenListing).where(TokenListing.listing_id == listing_id))
     
     if not listing:
         raise HTTPException(status_code=404, detail="Token listing not found")
@@ -984,7 +991,7 @@ async def review_token_listing(
     listing.reviewed_by = current_admin["user_id"]
     listing.reviewed_at = datetime.utcnow()
     
-    db.commit()
+    await db.commit()
     
     return {
         "listing_id": listing_id,
@@ -995,11 +1002,10 @@ async def review_token_listing(
 @app.post("/api/v1/admin/market-data/update")
 async def update_market_data(
     current_admin: Dict[str, Any] = Depends(get_current_admin),
-    db: Session = Depends(get_db),
     background_tasks: BackgroundTasks = BackgroundTasks()
 ):
     """Update market data for all tokens"""
-    background_tasks.add_task(admin_manager.update_token_market_data, db)
+    background_tasks.add_task(admin_manager.update_token_market_data)
     return {"message": "Market data update initiated"}
 
 @app.get("/health")
@@ -14,21 +14,26 @@ from typing import Dict, List, Optional, Any
 from enum import Enum
 import secrets
 import hashlib
+import sys
 
 import aioredis
 from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel, validator, EmailStr
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, Text, DECIMAL, ForeignKey, JSON, Enum as SQLEnum
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, DECIMAL, ForeignKey, JSON, Enum as SQLEnum, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session, relationship
+from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 import pandas as pd
 import plotly.graph_objects as go
 import plotly.express as px
 from plotly.utils import PlotlyJSONEncoder
 
+sys.path.append(os.path.join(os.path.dirname(__file__), "../../shared"))
+from async_db import create_session_factory, session_dependency
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -57,8 +62,7 @@ class Config:
 config = Config()
 
 # Database setup
-engine = create_engine(config.DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+engine, AsyncSessionLocal = create_session_factory(config.DATABASE_URL)
 Base = declarative_base()
 
 security = HTTPBearer()
@@ -409,12 +413,7 @@ class PayoutRequest(BaseModel):
     payment_details: Dict[str, Any]
 
 # Dependencies
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+get_async_db = session_dependency(AsyncSessionLocal)
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     return {"user_id": "user_123", "username": "testuser"}
@@ -431,11 +430,11 @@ class AffiliateManager:
         """Generate unique referral code"""
         return secrets.token_hex(length // 2).upper()
     
-    async def create_affiliate(self, affiliate_data: AffiliateCreate, user: Dict[str, Any], db: Session):
+    async def create_affiliate(self, affiliate_data: AffiliateCreate, user: Dict[str, Any], db: AsyncSession):
         """Create new affiliate"""
         
         # Check if user is already an affiliate
-        existing = db.query(Affiliate).filter(Affiliate.user_id == user["user_id"]).first()
+        existing = await db.scalar(select(Affiliate).where(Affiliate.user_id == user["user_id"]))
         if existing:
             raise HTTPException(status_code=400, detail="User is already an affiliate")
         
@@ -443,7 +442,7 @@ class AffiliateManager:
         referral_code = affiliate_data.custom_referral_code or self.generate_referral_code()
         
         # Check if referral code is unique
-        while db.query(Affiliate).filter(Affiliate.referral_code == referral_code).first():
+        while await db.scalar(select(Affiliate).where(Affiliate.referral_code == referral_code)):
             referral_code = self.generate_referral_code()
         
         affiliate_id = f"AFF_{secrets.token_hex(8).upper()}"
@@ -470,16 +469,16 @@ class AffiliateManager:
         )
         
         db.add(affiliate)
-        db.commit()
-        db.refresh(affiliate)
+        await db.commit()
+        await db.refresh(affiliate)
         
         return affiliate
     
-    async def create_referral(self, referral_code: str, referral_data: ReferralCreate, user: Dict[str, Any], db: Session):
+    async def create_referral(self, referral_code: str, referral_data: ReferralCreate, user: Dict[str, Any], db: AsyncSession):
         """Create new referral"""
         
         # Find affiliate by referral code
-        affiliate = db.query(Affiliate).filter(Affiliate.referral_code == referral_code).first()
+        affiliate = await db.scalar(select(Affiliate).where(Affiliate.referral_code == referral_code))
         if not affiliate:
             raise HTTPException(status_code=404, detail="Invalid referral code")
         
@@ -487,7 +486,7 @@ class AffiliateManager:
             raise HTTPException(status_code=400, detail="Affiliate is not active")
         
         # Check if user is already referred
-        existing = db.query(Referral).filter(Referral.referred_user_id == user["user_id"]).first()
+        existing = await db.scalar(select(Referral).where(Referral.referred_user_id == user["user_id"]))
         if existing:
             raise HTTPException(status_code=400, detail="User is already referred")
         
@@ -512,12 +511,12 @@ class AffiliateManager:
         # Update affiliate stats
         affiliate.total_referrals += 1
         
-        db.commit()
-        db.refresh(referral)
+        await db.commit()
+        await db.refresh(referral)
         
         return referral
     
-    async def calculate_commission(self, transaction_data: Dict[str, Any], db: Session):
+    async def calculate_commission(self, transaction_data: Dict[str, Any], db: AsyncSession):
         """Calculate and create commission records"""
         
         user_id = transaction_data["user_id"]
@@ -527,7 +526,7 @@ class AffiliateManager:
         fee_amount = Decimal(str(transaction_data["fee"]))
         
         # Find referral
-        referral = db.query(Referral).filter(Referral.referred_user_id == user_id).first()
+        referral = await db.scalar(select(Referral).where(Referral.referred_user_id == user_id))
         if not referral:
             return  # No referral, no commission
         
@@ -546,13 +545,13 @@ class AffiliateManager:
         )
         
         # Create multi-level commissions (Tier 2-5)
-        current_affiliate = db.query(Affiliate).filter(Affiliate.affiliate_id == referral.affiliate_id).first()
+        current_affiliate = await db.scalar(select(Affiliate).where(Affiliate.affiliate_id == referral.affiliate_id))
         tier_level = 2
         
         while current_affiliate and current_affiliate.parent_affiliate_id and tier_level <= 5:
-            parent_affiliate = db.query(Affiliate).filter(
+            parent_affiliate = await db.scalar(select(Affiliate).where(
                 Affiliate.affiliate_id == current_affiliate.parent_affiliate_id
-            ).first()
+            ))
             
             if parent_affiliate and parent_affiliate.status == AffiliateStatus.ACTIVE:
                 tier_enum = getattr(ReferralTier, f"TIER_{tier_level}")
@@ -573,7 +572,7 @@ class AffiliateManager:
             current_affiliate = parent_affiliate
             tier_level += 1
         
-        db.commit()
+        await db.commit()
     
     async def _create_commission_record(
         self,
@@ -586,11 +585,11 @@ class AffiliateManager:
         fee_amount: Decimal,
         tier_level: ReferralTier,
         original_affiliate_id: str,
-        db: Session
+        db: AsyncSession
     ):
         """Create individual commission record"""
         
-        affiliate = db.query(Affiliate).filter(Affiliate.affiliate_id == affiliate_id).first()
+        affiliate = await db.scalar(select(Affiliate).where(Affiliate.affiliate_id == affiliate_id))
         if not affiliate:
             return
         
@@ -641,10 +640,10 @@ class AffiliateManager:
         }
         return mapping.get(transaction_type, CommissionType.TRADING_FEE)
     
-    async def create_affiliate_link(self, link_data: LinkCreate, user: Dict[str, Any], db: Session):
+    async def create_affiliate_link(self, link_data: LinkCreate, user: Dict[str, Any], db: AsyncSession):
         """Create affiliate tracking link"""
         
-        affiliate = db.query(Affiliate).filter(Affiliate.user_id == user["user_id"]).first()
+        affiliate = await db.scalar(select(Affiliate).where(Affiliate.user_id == user["user_id"]))
         if not affiliate:
             raise HTTPException(status_code=404, detail="User is not an affiliate")
         
@@ -680,15 +679,15 @@ class AffiliateManager:
         )
         
         db.add(link)
-        db.commit()
-        db.refresh(link)
+        await db.commit()
+        await db.refresh(link)
         
         return link
     
-    async def process_payout(self, affiliate_id: str, payout_data: PayoutRequest, db: Session):
+    async def process_payout(self, affiliate_id: str, payout_data: PayoutRequest, db: AsyncSession):
         """Process affiliate payout"""
         
-        affiliate = db.query(Affiliate).filter(Affiliate.affiliate_id == affiliate_id).first()
+        affiliate = await db.scalar(select(Affiliate).where(Affiliate.affiliate_id == affiliate_id))
         if not affiliate:
             raise HTTPException(status_code=404, detail="Affiliate not found")
         
@@ -699,10 +698,10 @@ class AffiliateManager:
             raise HTTPException(status_code=400, detail=f"Minimum payout is {affiliate.minimum_payout}")
         
         # Get unpaid commissions
-        unpaid_commissions = db.query(Commission).filter(
+        unpaid_commissions = (await db.execute(select(Commission).where(
             Commission.affiliate_id == affiliate_id,
             Commission.is_paid == False
-        ).all()
+        ))).scalars().all()
         
         total_unpaid = sum(comm.commission_amount for comm in unpaid_commissions)
         
@@ -739,8 +738,8 @@ class AffiliateManager:
         affiliate.pending_commission -= payout_data.amount
         affiliate.total_commission_paid += payout_data.amount
         
-        db.commit()
-        db.refresh(payout)
+        await db.commit()
+        await db.refresh(payout)
         
         return payout
 
@@ -756,7 +755,7 @@ async def startup_event():
 async def register_affiliate(
     affiliate_data: AffiliateCreate,
     current_user: Dict[str, Any] = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Register as affiliate"""
     affiliate = await affiliate_manager.create_affiliate(affiliate_data, current_user, db)
@@ -772,7 +771,7 @@ async def create_referral(
     referral_code: str,
     referral_data: ReferralCreate,
     current_user: Dict[str, Any] = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create referral using referral code"""
     referral = await affiliate_manager.create_referral(referral_code, referral_data, current_user, db)
@@ -786,22 +785,22 @@ async def create_referral(
 @app.get("/api/v1/affiliate/dashboard")
 async def get_affiliate_dashboard(
     current_user: Dict[str, Any] = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get affiliate dashboard data"""
-    affiliate = db.query(Affiliate).filter(Affiliate.user_id == current_user["user_id"]).first()
+    affiliate = await db.scalar(select(Affiliate).where(Affiliate.user_id == current_user["user_id"]))
     if not affiliate:
         raise HTTPException(status_code=404, detail="User is not an affiliate")
     
     # Get recent referrals
-    recent_referrals = db.query(Referral).filter(
+    recent_referrals = (await db.execute(select(Referral).where(
         Referral.affiliate_id == affiliate.affiliate_id
-    ).order_by(Referral.created_at.desc()).limit(10).all()
+    ).order_by(Referral.created_at.desc()).limit(10))).scalars().all()
     
     # Get recent commissions
-    recent_commissions = db.query(Commission).filter(
+    recent_commissions = (await db.execute(select(Commission).where(
         Commission.affiliate_id == affiliate.affiliate_id
-    ).order_by(Commission.created_at.desc()).limit(10).all()
+    ).order_by(Commission.created_at.desc()).limit(10))).scalars().all()
     
     return {
         "affiliate_info": {
@@ -841,7 +840,7 @@ async def get_affiliate_dashboard(
 async def create_affiliate_link(
     link_data: LinkCreate,
     current_user: Dict[str, Any] = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create affiliate tracking link"""
     link = await affiliate_manager.create_affiliate_link(link_data, current_user, db)
@@ -855,14 +854,14 @@ async def create_affiliate_link(
 @app.get("/api/v1/affiliate/links")
 async def get_affiliate_links(
     current_user: Dict[str, Any] = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get affiliate links"""
-    affiliate = db.query(Affiliate).filter(Affiliate.user_id == current_user["user_id"]).first()
+    affiliate = await db.scalar(select(Affiliate).where(Affiliate.user_id == current_user["user_id"]))
     if not affiliate:
         raise HTTPException(status_code=404, detail="User is not an affiliate")
     
-    links = db.query(AffiliateLink).filter(AffiliateLink.affiliate_id == affiliate.affiliate_id).all()
+    links = (await db.execute(select(AffiliateLink).where(AffiliateLink.affiliate_id == affiliate.affiliate_id))).scalars().all()
     
     return {
         "links": [
@@ -884,10 +883,10 @@ async def get_affiliate_links(
 async def request_payout(
     payout_data: PayoutRequest,
     current_user: Dict[str, Any] = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Request affiliate payout"""
-    affiliate = db.query(Affiliate).filter(Affiliate.user_id == current_user["user_id"]).first()
+    affiliate = await db.scalar(select(Affiliate).where(Affiliate.user_id == current_user["user_id"]))
     if not affiliate:
         raise HTTPException(status_code=404, detail="User is not an affiliate")
     
@@ -902,16 +901,16 @@ async def request_payout(
 @app.get("/api/v1/affiliate/payouts")
 async def get_affiliate_payouts(
     current_user: Dict[str, Any] = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get affiliate payout history"""
-    affiliate = db.query(Affiliate).filter(Affiliate.user_id == current_user["user_id"]).first()
+    affiliate = await db.scalar(select(Affiliate).where(Affiliate.user_id == current_user["user_id"]))
     if not affiliate:
         raise HTTPException(status_code=404, detail="User is not an affiliate")
     
-    payouts = db.query(AffiliatePayout).filter(
+    payouts = (await db.execute(select(AffiliatePayout).where(
         AffiliatePayout.affiliate_id == affiliate.affiliate_id
-    ).order_by(AffiliatePayout.created_at.desc()).all()
+    ).order_by(AffiliatePayout.created_at.desc()))).scalars().all()
     
     return {
         "payouts": [
@@ -14,20 +14,25 @@ from typing import Dict, List, Optional, Any
 from enum import Enum
 import hashlib
 import secrets
+import sys
 
 import aioredis
 from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel, validator, EmailStr
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, Text, DECIMAL, ForeignKey, JSON, Enum as SQLEnum
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, DECIMAL, ForeignKey, JSON, Enum as SQLEnum, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session, relationship
+from sqlalchemy.orm import relationship, selectinload
 from sqlalchemy.sql import func
 import boto3
 import requests
 import pandas as pd
 
+sys.path.append(os.path.join(os.path.dirname(__file__), "../../shared"))
+from async_db import create_session_factory, session_dependency
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -59,8 +64,7 @@ class Config:
 config = Config()
 
 # Database setup
-engine = create_engine(config.DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+engine, AsyncSessionLocal = create_session_factory(config.DATABASE_URL)
 Base = declarative_base()
 
 security = HTTPBearer()
@@ -270,12 +274,7 @@ class DocumentUpload(BaseModel):
     expiry_date: Optional[datetime] = None
 
 # Dependencies
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+get_async_db = session_dependency(AsyncSessionLocal)
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     return {"user_id": "user_123", "username": "testuser", "role": "compliance_officer"}
@@ -291,11 +290,11 @@ class ComplianceEngineManager:
         if os.getenv("AWS_ACCESS_KEY_ID"):
             self.s3_client = boto3.client('s3')
     
-    async def submit_kyc_application(self, application_data: KYCApplicationCreate, user: Dict[str, Any], db: Session):
-        existing_app = db.query(KYCApplication).filter(
+    async def submit_kyc_application(self, application_data: KYCApplicationCreate, user: Dict[str, Any], db: AsyncSession):
+        existing_app = await db.scalar(select(KYCApplication).where(
             KYCApplication.user_id == user["user_id"],
             KYCApplication.status.in_([KYCStatus.PENDING, KYCStatus.IN_REVIEW, KYCStatus.APPROVED])
-        ).first()
+        ))
         
         if existing_app:
             if existing_app.status == KYCStatus.APPROVED:
@@ -330,13 +329,13 @@ class ComplianceEngineManager:
         )
         
         db.add(application)
-        db.commit()
-        db.refresh(application)
+        await db.commit()
+        await db.refresh(application)
         
         await self.perform_initial_risk_assessment(application, db)
         return application
     
-    async def perform_initial_risk_assessment(self, application: KYCApplication, db: Session):
+    async def perform_initial_risk_assessment(self, application: KYCApplication, db: AsyncSession):
         risk_factors = []
         risk_score = 0
         
@@ -379,7 +378,7 @@ class ComplianceEngineManager:
             application.manual_review_required = True
             application.status = KYCStatus.IN_REVIEW
         
-        db.commit()
+        await db.commit()
     
     async def screen_for_pep(self, application: KYCApplication) -> Dict[str, Any]:
         # Mock PEP screening
@@ -399,11 +398,11 @@ class ComplianceEngineManager:
         else:
             return RiskLevel.LOW
     
-    async def upload_kyc_document(self, application_id: str, document_data: DocumentUpload, file: UploadFile, user: Dict[str, Any], db: Session):
-        application = db.query(KYCApplication).filter(
+    async def upload_kyc_document(self, application_id: str, document_data: DocumentUpload, file: UploadFile, user: Dict[str, Any], db: AsyncSession):
+        application = await db.scalar(select(KYCApplication).where(
             KYCApplication.application_id == application_id,
             KYCApplication.user_id == user["user_id"]
-        ).first()
+        ))
         
         if not application:
             raise HTTPException(status_code=404, detail="KYC application not found")
@@ -438,14 +437,14 @@ class ComplianceEngineManager:
         )
         
         db.add(document)
-        db.commit()
-        db.refresh(document)
+        await db.commit()
+        await db.refresh(document)
         
         # Mock document processing
         document.is_verified = True
         document.verification_method = "automated"
         document.status = "verified"
-        db.commit()
+        await db.commit()
         
         return document
 
@@ -460,7 +459,7 @@ async def startup_event():
 async def submit_kyc_application(
     application_data: KYCApplicationCreate,
     current_user: Dict[str, Any] = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     application = await compliance_engine.submit_kyc_application(application_data, current_user, db)
     return {
@@ -476,7 +475,7 @@ async def upload_kyc_document(
     document_data: DocumentUpload = Depends(),
     file: UploadFile = File(...),
     current_user: Dict[str, Any] = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     document = await compliance_engine.upload_kyc_document(
         application_id, document_data, file, current_user, db
@@ -492,12 +491,14 @@ async def upload_kyc_document(
 async def get_kyc_application(
     application_id: str,
     current_user: Dict[str, Any] = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    application = db.query(KYCApplication).filter(
-        KYCApplication.application_id == application_id,
-        KYCApplication.user_id == current_user["user_id"]
-    ).first()
+    application = await db.scalar(
+        select(KYCApplication).options(selectinload(KYCApplication.documents)).where(
+            KYCApplication.application_id == application_id,
+            KYCApplication.user_id == current_user["user_id"]
+        )
+    )
     
     if not application:
         raise HTTPException(status_code=404, detail="KYC application not found")
@@ -531,17 +532,17 @@ async def get_aml_alerts(
     limit: int = 50,
     offset: int = 0,
     current_user: Dict[str, Any] = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    query = db.query(AMLAlert)
+    query = select(AMLAlert)
     
     if status:
-        query = query.filter(AMLAlert.status == status)
+        query = query.where(AMLAlert.status == status)
     
     if severity:
-        query = query.filter(AMLAlert.severity == severity)
+        query = query.where(AMLAlert.severity == severity)
     
-    alerts = query.order_by(AMLAlert.created_at.desc()).offset(offset).limit(limit).all()
+    alerts = (await db.execute(query.order_by(AMLAlert.created_at.desc()).offset(offset).limit(limit))).scalars().all()
     
     return {
         "alerts": [
@@ -566,7 +567,7 @@ async def generate_compliance_report(
     period_start: datetime,
     period_end: datetime,
     current_user: Dict[str, Any] = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     background_tasks: BackgroundTasks = BackgroundTasks()
 ):
     if current_user.get("role") != "compliance_officer":
@@ -585,7 +586,7 @@ async def generate_compliance_report(
     )
     
     db.add(report)
-    db.commit()
+    await db.commit()
     
     return {
         "report_id": report_id,
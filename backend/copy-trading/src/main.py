@@ -13,19 +13,24 @@ from decimal import Decimal
 from typing import Dict, List, Optional, Any
 from enum import Enum
 import secrets
+import sys
 
 import aioredis
 from fastapi import FastAPI, HTTPException, Depends, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel, validator
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, Text, DECIMAL, ForeignKey, JSON, Enum as SQLEnum
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, DECIMAL, ForeignKey, JSON, Enum as SQLEnum, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session, relationship
+from sqlalchemy.orm import joinedload, relationship
 from sqlalchemy.sql import func
 import numpy as np
 import pandas as pd
 
+sys.path.append(os.path.join(os.path.dirname(__file__), "../../shared"))
+from async_db import create_session_factory, session_dependency
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -56,8 +61,7 @@ class Config:
 config = Config()
 
 # Database setup
-engine = create_engine(config.DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+engine, AsyncSessionLocal = create_session_factory(config.DATABASE_URL)
 Base = declarative_base()
 
 security = HTTPBearer()
@@ -263,12 +267,7 @@ class SocialPostCreate(BaseModel):
         return v
 
 # Dependencies
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+get_async_db = session_dependency(AsyncSessionLocal)
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     return {"user_id": "user_123", "username": "testuser"}
@@ -282,8 +281,8 @@ class CopyTradingManager:
     async def initialize(self):
         self.redis_client = await aioredis.from_url(config.REDIS_URL)
     
-    async def create_trader_profile(self, trader_data: TraderCreate, user: Dict[str, Any], db: Session):
-        existing_trader = db.query(Trader).filter(Trader.user_id == user["user_id"]).first()
+    async def create_trader_profile(self, trader_data: TraderCreate, user: Dict[str, Any], db: AsyncSession):
+        existing_trader = await db.scalar(select(Trader).where(Trader.user_id == user["user_id"]))
         if existing_trader:
             raise HTTPException(status_code=400, detail="User already has a trader profile")
         
@@ -303,16 +302,16 @@ class CopyTradingManager:
         )
         
         db.add(trader)
-        db.commit()
-        db.refresh(trader)
+        await db.commit()
+        await db.refresh(trader)
         return trader
     
-    async def create_copy_relationship(self, copy_data: CopyRelationshipCreate, follower: Dict[str, Any], db: Session):
-        trader = db.query(Trader).filter(
+    async def create_copy_relationship(self, copy_data: CopyRelationshipCreate, follower: Dict[str, Any], db: AsyncSession):
+        trader = await db.scalar(select(Trader).where(
             Trader.trader_id == copy_data.trader_id,
             Trader.allow_copying == True,
             Trader.status == TraderStatus.ACTIVE
-        ).first()
+        ))
         
         if not trader:
             raise HTTPException(status_code=404, detail="Trader not found or not available for copying")
@@ -340,11 +339,11 @@ class CopyTradingManager:
         
         db.add(relationship)
         trader.followers_count += 1
-        db.commit()
-        db.refresh(relationship)
+        await db.commit()
+        await db.refresh(relationship)
         return relationship
     
-    async def process_trade(self, trade_data: TradeCreate, trader: Trader, db: Session):
+    async def process_trade(self, trade_data: TradeCreate, trader: Trader, db: AsyncSession):
         trade_id = f"TRADE_{secrets.token_hex(8).upper()}"
         
         trade = Trade(
@@ -358,8 +357,8 @@ class CopyTradingManager:
         )
         
         db.add(trade)
-        db.commit()
-        db.refresh(trade)
+        await db.commit()
+        await db.refresh(trade)
         
         # Mock execution
         trade.status = OrderStatus.FILLED
@@ -368,7 +367,7 @@ class CopyTradingManager:
         trade.commission = trade.filled_quantity * trade.average_price * Decimal("0.001")
         
         trader.total_trades += 1
-        db.commit()
+        await db.commit()
         
         return trade
 
@@ -402,7 +401,7 @@ manager = ConnectionManager()
 async def create_trader_profile(
     trader_data: TraderCreate,
     current_user: Dict[str, Any] = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     trader = await copy_trading_manager.create_trader_profile(trader_data, current_user, db)
     return {
@@ -419,19 +418,19 @@ async def get_traders(
     verified_only: bool = False,
     limit: int = 20,
     offset: int = 0,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    query = db.query(Trader).filter(
+    query = select(Trader).where(
         Trader.is_public == True,
         Trader.allow_copying == True,
         Trader.status == TraderStatus.ACTIVE
     )
     
     if risk_level:
-        query = query.filter(Trader.risk_level == risk_level)
+        query = query.where(Trader.risk_level == risk_level)
     
     if verified_only:
-        query = query.filter(Trader.is_verified == True)
+        query = query.where(Trader.is_verified == True)
     
     if sort_by in ['total_return', 'monthly_return', 'followers_count', 'sharpe_ratio']:
         if sort_order == "desc":
@@ -439,7 +438,7 @@ async def get_traders(
         else:
             query = query.order_by(getattr(Trader, sort_by).asc())
     
-    traders = query.offset(offset).limit(limit).all()
+    traders = (await db.execute(query.offset(offset).limit(limit))).scalars().all()
     
     return {
         "traders": [
@@ -470,7 +469,7 @@ async def get_traders(
 async def create_copy_relationship(
     copy_data: CopyRelationshipCreate,
     current_user: Dict[str, Any] = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     relationship = await copy_trading_manager.create_copy_relationship(copy_data, current_user, db)
     return {
@@ -483,12 +482,15 @@ async def create_copy_relationship(
 @app.get("/api/v1/copy/following")
 async def get_following(
     current_user: Dict[str, Any] = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    relationships = db.query(CopyRelationship).join(Trader).filter(
-        CopyRelationship.follower_id == current_user["user_id"],
-        CopyRelationship.status == CopyStatus.ACTIVE
-    ).all()
+    result = await db.execute(
+        select(CopyRelationship).options(joinedload(CopyRelationship.trader)).where(
+            CopyRelationship.follower_id == current_user["user_id"],
+            CopyRelationship.status == CopyStatus.ACTIVE
+        )
+    )
+    relationships = result.scalars().all()
     
     return {
         "following": [
@@ -515,12 +517,12 @@ async def get_following(
 async def create_trade(
     trade_data: TradeCreate,
     current_user: Dict[str, Any] = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    trader = db.query(Trader).filter(
+    trader = await db.scalar(select(Trader).where(
         Trader.user_id == current_user["user_id"],
         Trader.status == TraderStatus.ACTIVE
-    ).first()
+    ))
     
     if not trader:
         raise HTTPException(status_code=404, detail="Trader profile not found")
@@ -539,9 +541,9 @@ async def create_trade(
 async def get_trader_performance(
     trader_id: str,
     period: str = "30d",
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    trader = db.query(Trader).filter(Trader.trader_id == trader_id).first()
+    trader = await db.scalar(select(Trader).where(Trader.trader_id == trader_id))
     
     if not trader:
         raise HTTPException(status_code=404, detail="Trader not found")
@@ -567,9 +569,9 @@ async def get_trader_performance(
 async def create_social_post(
     post_data: SocialPostCreate,
     current_user: Dict[str, Any] = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    trader = db.query(Trader).filter(Trader.user_id == current_user["user_id"]).first()
+    trader = await db.scalar(select(Trader).where(Trader.user_id == current_user["user_id"]))
     
     if not trader:
         raise HTTPException(status_code=404, detail="Trader profile not found")
@@ -585,7 +587,8 @@ async def create_social_post(
     )
     
     db.add(post)
-    db.commit()
+    await db.commit()
+    await db.refresh(post)
     
     return {
         "post_id": post.post_id,
@@ -0,0 +1,6 @@
+-- CoinGecko Ids on Coins
+-- TigerEx Popular Coins Service
+
+-- The popular coins service resolves CoinGecko ids from this column and
+-- falls back to its built-in map for coins without one
+ALTER TABLE IF EXISTS coins ADD COLUMN IF NOT EXISTS coingecko_id TEXT;
@@ -0,0 +1,6 @@
+-- Release Deadlines on P2P Trades
+-- TigerEx P2P Trading Service
+
+-- Set when the buyer confirms payment; the seller must release before it
+-- or the trade is escalated to a dispute
+ALTER TABLE IF EXISTS p2p_trades ADD COLUMN IF NOT EXISTS release_deadline TIMESTAMP;
@@ -14,6 +14,7 @@ from typing import Dict, List, Optional, Any
 from enum import Enum
 import hashlib
 import secrets
+import sys
 
 import asyncpg
 import aioredis
@@ -21,14 +22,18 @@ from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel, validator
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, Text, DECIMAL, ForeignKey, JSON, Enum as SQLEnum
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, DECIMAL, ForeignKey, JSON, Enum as SQLEnum, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session, relationship
+from sqlalchemy.orm import contains_eager, relationship
 from sqlalchemy.sql import func
 import boto3
 from PIL import Image
 import requests
 
+sys.path.append(os.path.join(os.path.dirname(__file__), "../../shared"))
+from async_db import create_session_factory, session_dependency
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -58,8 +63,7 @@ class Config:
 config = Config()
 
 # Database setup
-engine = create_engine(config.DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+engine, AsyncSessionLocal = create_session_factory(config.DATABASE_URL)
 Base = declarative_base()
 
 security = HTTPBearer()
@@ -174,12 +178,7 @@ class NFTListingCreate(BaseModel):
     currency: str = "ETH"
 
 # Dependencies
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+get_async_db = session_dependency(AsyncSessionLocal)
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     return {"user_id": "user_123", "address": "0x742d35Cc6634C0532925a3b8D"}
@@ -195,7 +194,7 @@ class NFTMarketplaceManager:
         if os.getenv("AWS_ACCESS_KEY_ID"):
             self.s3_client = boto3.client('s3')
     
-    async def create_collection(self, collection_data: NFTCollectionCreate, creator: Dict[str, Any], db: Session):
+    async def create_collection(self, collection_data: NFTCollectionCreate, creator: Dict[str, Any], db: AsyncSession):
         collection_id = f"COL_{secrets.token_hex(8).upper()}"
         
         collection = NFTCollection(
@@ -210,15 +209,15 @@ class NFTMarketplaceManager:
         )
         
         db.add(collection)
-        db.commit()
-        db.refresh(collection)
+        await db.commit()
+        await db.refresh(collection)
         return collection
     
-    async def create_nft(self, nft_data: NFTCreate, creator: Dict[str, Any], db: Session):
-        collection = db.query(NFTCollection).filter(
+    async def create_nft(self, nft_data: NFTCreate, creator: Dict[str, Any], db: AsyncSession):
+        collection = await db.scalar(select(NFTCollection).where(
             NFTCollection.collection_id == nft_data.collection_id,
             NFTCollection.creator_address == creator["address"]
-        ).first()
+        ))
         
         if not collection:
             raise HTTPException(status_code=404, detail="Collection not found")
@@ -241,8 +240,8 @@ class NFTMarketplaceManager:
         
         db.add(nft)
         collection.total_supply += 1
-        db.commit()
-        db.refresh(nft)
+        await db.commit()
+        await db.refresh(nft)
         return nft
 
 marketplace_manager = NFTMarketplaceManager()
@@ -256,7 +255,7 @@ async def startup_event():
 async def create_collection(
     collection_data: NFTCollectionCreate,
     current_user: Dict[str, Any] = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     collection = await marketplace_manager.create_collection(collection_data, current_user, db)
     return {
@@ -272,13 +271,13 @@ async def get_collections(
     blockchain: Optional[str] = None,
     limit: int = 20,
     offset: int = 0,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    query = db.query(NFTCollection)
+    query = select(NFTCollection)
     if blockchain:
-        query = query.filter(NFTCollection.blockchain == blockchain)
+        query = query.where(NFTCollection.blockchain == blockchain)
     
-    collections = query.offset(offset).limit(limit).all()
+    collections = (await db.execute(query.offset(offset).limit(limit))).scalars().all()
     
     return {
         "collections": [
@@ -326,13 +325,13 @@ async def upload_nft_image(
 async def create_nft(
     nft_data: NFTCreate,
     current_user: Dict[str, Any] = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     nft = await marketplace_manager.create_nft(nft_data, current_user, db)
     return {
         "nft_id": nft.nft_id,
         "token_id": nft.token_id,
-        "collection_id": nft.collection.collection_id,
+        "collection_id": nft_data.collection_id,
         "status": "created"
     }
 
@@ -340,12 +339,12 @@ async def create_nft(
 async def mint_nft(
     nft_id: str,
     current_user: Dict[str, Any] = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    nft = db.query(NFT).filter(
+    nft = await db.scalar(select(NFT).where(
         NFT.nft_id == nft_id,
         NFT.creator == current_user["address"]
-    ).first()
+    ))
     
     if not nft:
         raise HTTPException(status_code=404, detail="NFT not found")
@@ -356,7 +355,7 @@ async def mint_nft(
     # Mock minting process
     nft.status = NFTStatus.MINTED
     nft.mint_transaction_hash = f"0x{secrets.token_hex(32)}"
-    db.commit()
+    await db.commit()
     
     return {
         "nft_id": nft_id,
@@ -371,24 +370,24 @@ async def get_nfts(
     status: Optional[str] = None,
     limit: int = 20,
     offset: int = 0,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    query = db.query(NFT)
+    query = select(NFT)
     
     if collection_id:
-        collection = db.query(NFTCollection).filter(
+        collection = await db.scalar(select(NFTCollection).where(
             NFTCollection.collection_id == collection_id
-        ).first()
+        ))
         if collection:
-            query = query.filter(NFT.collection_id == collection.id)
+            query = query.where(NFT.collection_id == collection.id)
     
     if owner:
-        query = query.filter(NFT.current_owner == owner)
+        query = query.where(NFT.current_owner == owner)
     
     if status:
-        query = query.filter(NFT.status == status)
+        query = query.where(NFT.status == status)
     
-    nfts = query.offset(offset).limit(limit).all()
+    nfts = (await db.execute(query.offset(offset).limit(limit))).scalars().all()
     
     return {
         "nfts": [
@@ -416,13 +415,13 @@ async def get_nfts(
 async def create_listing(
     listing_data: NFTListingCreate,
     current_user: Dict[str, Any] = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    nft = db.query(NFT).filter(
+    nft = await db.scalar(select(NFT).where(
         NFT.nft_id == listing_data.nft_id,
         NFT.current_owner == current_user["address"],
         NFT.status == NFTStatus.MINTED
-    ).first()
+    ))
     
     if not nft:
         raise HTTPException(status_code=404, detail="NFT not found or not owned")
@@ -440,7 +439,7 @@ async def create_listing(
     
     db.add(listing)
     nft.status = NFTStatus.LISTED
-    db.commit()
+    await db.commit()
     
     return {
         "listing_id": listing.listing_id,
@@ -457,21 +456,21 @@ async def get_listings(
     seller: Optional[str] = None,
     limit: int = 20,
     offset: int = 0,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    query = db.query(NFTListing).join(NFT)
+    query = select(NFTListing).join(NFTListing.nft).options(contains_eager(NFTListing.nft))
     
     if collection_id:
-        collection = db.query(NFTCollection).filter(
+        collection = await db.scalar(select(NFTCollection).where(
             NFTCollection.collection_id == collection_id
-        ).first()
+        ))
         if collection:
-            query = query.filter(NFT.collection_id == collection.id)
+            query = query.where(NFT.collection_id == collection.id)
     
     if seller:
-        query = query.filter(NFTListing.seller_address == seller)
+        query = query.where(NFTListing.seller_address == seller)
     
-    listings = query.offset(offset).limit(limit).all()
+    listings = (await db.execute(query.offset(offset).limit(limit))).scalars().all()
     
     return {
         "listings": [
@@ -22,9 +22,10 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, validator, EmailStr
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, Text, DECIMAL, ForeignKey, JSON, Enum as SQLEnum, func as sql_func
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, DECIMAL, ForeignKey, JSON, Enum as SQLEnum, func as sql_func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session, relationship
+from sqlalchemy.orm import relationship, selectinload
 from sqlalchemy.sql import func
 import pandas as pd
 import matplotlib.pyplot as plt
@@ -41,6 +42,9 @@ from main import (
     OrderType, OrderStatus, TradeStatus, PaymentMethodType, DisputeStatus, UserRole
 )
 
+sys.path.append(os.path.join(os.path.dirname(__file__), "../../shared"))
+from async_db import create_session_factory, session_dependency
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -69,8 +73,7 @@ class Config:
 config = Config()
 
 # Database setup
-engine = create_engine(config.DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+engine, AsyncSessionLocal = create_session_factory(config.DATABASE_URL)
 Base = declarative_base()
 
 security = HTTPBearer()
@@ -134,12 +137,7 @@ class AdminStats(BaseModel):
     total_fees_24h: Decimal
 
 # Dependencies
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+get_async_db = session_dependency(AsyncSessionLocal)
 
 async def get_current_admin(credentials: HTTPAuthorizationCredentials = Depends(security)):
     # Simplified admin authentication - in production, verify JWT and check admin role
@@ -153,43 +151,43 @@ class P2PAdminManager:
     async def initialize(self):
         self.redis_client = await aioredis.from_url(config.REDIS_URL)
     
-    async def get_dashboard_stats(self, db: Session) -> Dict[str, Any]:
+    async def get_dashboard_stats(self, db: AsyncSession) -> Dict[str, Any]:
         """Get comprehensive dashboard statistics"""
         
         # Basic counts
-        total_users = db.query(P2PUser).count()
-        active_orders = db.query(P2POrder).filter(P2POrder.status == OrderStatus.ACTIVE).count()
-        completed_trades = db.query(P2PTrade).filter(P2PTrade.status == TradeStatus.COMPLETED).count()
-        pending_disputes = db.query(TradeDispute).filter(TradeDispute.status == DisputeStatus.OPEN).count()
+        total_users = await db.scalar(select(func.count()).select_from(P2PUser))
+        active_orders = await db.scalar(select(func.count()).select_from(P2POrder).where(P2POrder.status == OrderStatus.ACTIVE))
+        completed_trades = await db.scalar(select(func.count()).select_from(P2PTrade).where(P2PTrade.status == TradeStatus.COMPLETED))
+        pending_disputes = await db.scalar(select(func.count()).select_from(TradeDispute).where(TradeDispute.status == DisputeStatus.OPEN))
         
         # 24h statistics
         yesterday = datetime.utcnow() - timedelta(days=1)
         
-        trades_24h = db.query(P2PTrade).filter(
+        trades_24h = (await db.execute(select(P2PTrade).where(
             P2PTrade.created_at >= yesterday,
             P2PTrade.status == TradeStatus.COMPLETED
-        ).all()
+        ))).scalars().all()
         
         total_volume_24h = sum(trade.fiat_amount for trade in trades_24h)
         total_fees_24h = sum(trade.platform_fee for trade in trades_24h)
         
         # Growth statistics
-        users_growth = self._calculate_growth(db, P2PUser, 'created_at')
-        trades_growth = self._calculate_growth(db, P2PTrade, 'created_at')
+        users_growth = await self._calculate_growth(db, P2PUser, 'created_at')
+        trades_growth = await self._calculate_growth(db, P2PTrade, 'created_at')
         
         # Top cryptocurrencies
-        crypto_stats = db.query(
+        crypto_stats = (await db.execute(select(
             P2POrder.cryptocurrency,
             sql_func.count(P2POrder.id).label('order_count'),
             sql_func.sum(P2POrder.total_volume).label('total_volume')
-        ).group_by(P2POrder.cryptocurrency).order_by(sql_func.sum(P2POrder.total_volume).desc()).limit(10).all()
+        ).group_by(P2POrder.cryptocurrency).order_by(sql_func.sum(P2POrder.total_volume).desc()).limit(10))).all()
         
         # Top countries
-        country_stats = db.query(
+        country_stats = (await db.execute(select(
             P2PUser.country_code,
             sql_func.count(P2PUser.id).label('user_count'),
             sql_func.sum(P2PUser.total_volume).label('total_volume')
-        ).group_by(P2PUser.country_code).order_by(sql_func.sum(P2PUser.total_volume).desc()).limit(10).all()
+        ).group_by(P2PUser.country_code).order_by(sql_func.sum(P2PUser.total_volume).desc()).limit(10))).all()
         
         return {
             "overview": {
@@ -224,7 +222,7 @@ class P2PAdminManager:
             ]
         }
     
-    def _calculate_growth(self, db: Session, model, date_field: str) -> Dict[str, float]:
+    async def _calculate_growth(self, db: AsyncSession, model, date_field: str) -> Dict[str, float]:
         """Calculate growth percentages"""
         
         now = datetime.utcnow()
@@ -233,11 +231,11 @@ class P2PAdminManager:
         week_ago = now - timedelta(days=7)
         two_weeks_ago = now - timedelta(days=14)
         
-        current_week = db.query(model).filter(getattr(model, date_field) >= week_ago).count()
-        previous_week = db.query(model).filter(
+        current_week = await db.scalar(select(func.count()).select_from(model).where(getattr(model, date_field) >= week_ago))
+        previous_week = await db.scalar(select(func.count()).select_from(model).where(
             getattr(model, date_field) >= two_weeks_ago,
             getattr(model, date_field) < week_ago
-        ).count()
+        ))
         
         growth_7d = ((current_week - previous_week) / previous_week * 100) if previous_week > 0 else 0
         
@@ -245,11 +243,11 @@ class P2PAdminManager:
         month_ago = now - timedelta(days=30)
         two_months_ago = now - timedelta(days=60)
         
-        current_month = db.query(model).filter(getattr(model, date_field) >= month_ago).count()
-        previous_month = db.query(model).filter(
+        current_month = await db.scalar(select(func.count()).select_from(model).where(getattr(model, date_field) >= month_ago))
+        previous_month = await db.scalar(select(func.count()).select_from(model).where(
             getattr(model, date_field) >= two_months_ago,
             getattr(model, date_field) < month_ago
-        ).count()
+        ))
         
         growth_30d = ((current_month - previous_month) / previous_month * 100) if previous_month > 0 else 0
         
@@ -258,10 +256,12 @@ class P2PAdminManager:
             "30d": round(growth_30d, 2)
         }
     
-    async def resolve_dispute(self, dispute_id: str, resolution_data: DisputeResolution, admin: Dict[str, Any], db: Session):
+    async def resolve_dispute(self, dispute_id: str, resolution_data: DisputeResolution, admin: Dict[str, Any], db: AsyncSession):
         """Resolve trade dispute"""
         
-        dispute = db.query(TradeDispute).filter(TradeDispute.dispute_id == dispute_id).first()
+        dispute = await db.scalar(
+            select(TradeDispute).options(selectinload(TradeDispute.trade)).where(TradeDispute.dispute_id == dispute_id)
+        )
         if not dispute:
             raise HTTPException(status_code=404, detail="Dispute not found")
         
@@ -301,14 +301,14 @@ class P2PAdminManager:
         )
         
         db.add(action)
-        db.commit()
+        await db.commit()
         
         return dispute
     
-    async def manage_user(self, user_id: str, action_data: UserAction, admin: Dict[str, Any], db: Session):
+    async def manage_user(self, user_id: str, action_data: UserAction, admin: Dict[str, Any], db: AsyncSession):
         """Manage P2P user (block, verify, etc.)"""
         
-        user = db.query(P2PUser).filter(P2PUser.user_id == user_id).first()
+        user = await db.scalar(select(P2PUser).where(P2PUser.user_id == user_id))
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
         
@@ -341,11 +341,11 @@ class P2PAdminManager:
         )
         
         db.add(action)
-        db.commit()
+        await db.commit()
         
         return user
     
-    async def generate_analytics_chart(self, chart_type: str, period: str, db: Session) -> str:
+    async def generate_analytics_chart(self, chart_type: str, period: str, db: AsyncSession) -> str:
         """Generate analytics charts"""
         
         # Calculate date range
@@ -360,10 +360,10 @@ class P2PAdminManager:
         
         if chart_type == "trade_volume":
             # Trade volume over time
-            trades = db.query(P2PTrade).filter(
+            trades = (await db.execute(select(P2PTrade).options(selectinload(P2PTrade.order)).where(
                 P2PTrade.created_at >= start_date,
                 P2PTrade.status == TradeStatus.COMPLETED
-            ).all()
+            ))).scalars().all()
             
             df = pd.DataFrame([
                 {
@@ -386,7 +386,7 @@ class P2PAdminManager:
         
         elif chart_type == "user_growth":
             # User registration over time
-            users = db.query(P2PUser).filter(P2PUser.created_at >= start_date).all()
+            users = (await db.execute(select(P2PUser).where(P2PUser.created_at >= start_date))).scalars().all()
             
             df = pd.DataFrame([
                 {"date": user.created_at.date()}
@@ -406,7 +406,7 @@ class P2PAdminManager:
         
         elif chart_type == "cryptocurrency_distribution":
             # Cryptocurrency distribution
-            orders = db.query(P2POrder).filter(P2POrder.created_at >= start_date).all()
+            orders = (await db.execute(select(P2POrder).where(P2POrder.created_at >= start_date))).scalars().all()
             
             crypto_counts = {}
             for order in orders:
@@ -425,7 +425,7 @@ class P2PAdminManager:
         
         elif chart_type == "country_distribution":
             # Country distribution
-            users = db.query(P2PUser).all()
+            users = (await db.execute(select(P2PUser))).scalars().all()
             
             country_counts = {}
             for user in users:
@@ -467,10 +467,10 @@ class P2PAdminManager:
         )
         return json.dumps(fig, cls=PlotlyJSONEncoder)
     
-    async def update_p2p_settings(self, settings_data: P2PSettingsUpdate, admin: Dict[str, Any], db: Session):
+    async def update_p2p_settings(self, settings_data: P2PSettingsUpdate, admin: Dict[str, Any], db: AsyncSession):
         """Update P2P platform settings"""
         
-        setting = db.query(P2PSettings).filter(P2PSettings.setting_key == settings_data.setting_key).first()
+        setting = await db.scalar(select(P2PSettings).where(P2PSettings.setting_key == settings_data.setting_key))
         
         if setting:
             setting.setting_value = settings_data.setting_value
@@ -502,7 +502,7 @@ class P2PAdminManager:
         )
         
         db.add(action)
-        db.commit()
+        await db.commit()
         
         return setting
 
@@ -517,7 +517,7 @@ async def startup_event():
 @app.get("/api/v1/p2p-admin/dashboard")
 async def get_dashboard_stats(
     current_admin: Dict[str, Any] = Depends(get_current_admin),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get dashboard statistics"""
     stats = await admin_manager.get_dashboard_stats(db)
@@ -533,28 +533,28 @@ async def get_p2p_users(
     limit: int = 50,
     offset: int = 0,
     current_admin: Dict[str, Any] = Depends(get_current_admin),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get P2P users with filtering"""
-    query = db.query(P2PUser)
+    query = select(P2PUser)
     
     if country:
-        query = query.filter(P2PUser.country_code == country)
+        query = query.where(P2PUser.country_code == country)
     
     if verified is not None:
-        query = query.filter(P2PUser.is_verified == verified)
+        query = query.where(P2PUser.is_verified == verified)
     
     if blocked is not None:
-        query = query.filter(P2PUser.is_blocked == blocked)
+        query = query.where(P2PUser.is_blocked == blocked)
     
     if search:
-        query = query.filter(
+        query = query.where(
             (P2PUser.username.ilike(f"%{search}%")) |
             (P2PUser.email.ilike(f"%{search}%"))
         )
     
-    users = query.offset(offset).limit(limit).all()
-    total = query.count()
+    users = (await db.execute(query.offset(offset).limit(limit))).scalars().all()
+    total = await db.scalar(select(func.count()).select_from(query.subquery()))
     
     return {
         "users": [
@@ -590,28 +590,30 @@ async def get_p2p_trades(
     limit: int = 50,
     offset: int = 0,
     current_admin: Dict[str, Any] = Depends(get_current_admin),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get P2P trades with filtering"""
-    query = db.query(P2PTrade)
+    query = select(P2PTrade).options(
+        selectinload(P2PTrade.order), selectinload(P2PTrade.buyer), selectinload(P2PTrade.seller)
+    )
     
     if status:
-        query = query.filter(P2PTrade.status == status)
+        query = query.where(P2PTrade.status == status)
     
     if cryptocurrency:
-        query = query.join(P2POrder).filter(P2POrder.cryptocurrency == cryptocurrency)
+        query = query.join(P2POrder).where(P2POrder.cryptocurrency == cryptocurrency)
     
     if fiat_currency:
-        query = query.join(P2POrder).filter(P2POrder.fiat_currency == fiat_currency)
+        query = query.join(P2POrder).where(P2POrder.fiat_currency == fiat_currency)
     
     if min_amount:
-        query = query.filter(P2PTrade.fiat_amount >= min_amount)
+        query = query.where(P2PTrade.fiat_amount >= min_amount)
     
     if max_amount:
-        query = query.filter(P2PTrade.fiat_amount <= max_amount)
+        query = query.where(P2PTrade.fiat_amount <= max_amount)
     
-    trades = query.order_by(P2PTrade.created_at.desc()).offset(offset).limit(limit).all()
-    total = query.count()
+    trades = (await db.execute(query.order_by(P2PTrade.created_at.desc()).offset(offset).limit(limit))).scalars().all()
+    total = await db.scalar(select(func.count()).select_from(query.subquery()))
     
     return {
         "trades": [
@@ -653,19 +655,23 @@ async def get_disputes(
     limit: int = 50,
     offset: int = 0,
     current_admin: Dict[str, Any] = Depends(get_current_admin),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get trade disputes"""
-    query = db.query(TradeDispute)
+    query = select(TradeDispute).options(
+        selectinload(TradeDispute.trade).options(
+            selectinload(P2PTrade.order), selectinload(P2PTrade.buyer), selectinload(P2PTrade.seller)
+        )
+    )
     
     if status:
-        query = query.filter(TradeDispute.status == status)
+        query = query.where(TradeDispute.status == status)
     
     if assigned_admin:
-        query = query.filter(TradeDispute.assigned_admin == assigned_admin)
+        query = query.where(TradeDispute.assigned_admin == assigned_admin)
     
-    disputes = query.order_by(TradeDispute.created_at.desc()).offset(offset).limit(limit).all()
-    total = query.count()
+    disputes = (await db.execute(query.order_by(TradeDispute.created_at.desc()).offset(offset).limit(limit))).scalars().all()
+    total = await db.scalar(select(func.count()).select_from(query.subquery()))
     
     return {
         "disputes": [
@@ -703,7 +709,7 @@ async def resolve_dispute(
     dispute_id: str,
     resolution_data: DisputeResolution,
     current_admin: Dict[str, Any] = Depends(get_current_admin),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Resolve trade dispute"""
     dispute = await admin_manager.resolve_dispute(dispute_id, resolution_data, current_admin, db)
@@ -720,7 +726,7 @@ async def manage_user(
     user_id: str,
     action_data: UserAction,
     current_admin: Dict[str, Any] = Depends(get_current_admin),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Manage P2P user"""
     user = await admin_manager.manage_user(user_id, action_data, current_admin, db)
@@ -742,27 +748,27 @@ async def get_p2p_orders(
     limit: int = 50,
     offset: int = 0,
     current_admin: Dict[str, Any] = Depends(get_current_admin),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get P2P orders"""
-    query = db.query(P2POrder)
+    query = select(P2POrder).options(selectinload(P2POrder.user))
     
     if status:
-        query = query.filter(P2POrder.status == status)
+        query = query.where(P2POrder.status == status)
     
     if order_type:
-        query = query.filter(P2POrder.order_type == order_type)
+        query = query.where(P2POrder.order_type == order_type)
     
     if cryptocurrency:
-        query = query.filter(P2POrder.cryptocurrency == cryptocurrency)
+        query = query.where(P2POrder.cryptocurrency == cryptocurrency)
     
     if user_id:
-        user = db.query(P2PUser).filter(P2PUser.user_id == user_id).first()
+        user = await db.scalar(select(P2PUser).where(P2PUser.user_id == user_id))
         if user:
-            query = query.filter(P2POrder.user_id == user.id)
+            query = query.where(P2POrder.user_id == user.id)
     
-    orders = query.order_by(P2POrder.created_at.desc()).offset(offset).limit(limit).all()
-    total = query.count()
+    orders = (await db.execute(query.order_by(P2POrder.created_at.desc()).offset(offset).limit(limit))).scalars().all()
+    total = await db.scalar(select(func.count()).select_from(query.subquery()))
     
     return {
         "orders": [
@@ -795,7 +801,7 @@ async def get_analytics_chart(
     chart_type: str = Query(..., description="Chart type: trade_volume, user_growth, cryptocurrency_distribution, country_distribution"),
     period: str = Query("30d", description="Time period: 7d, 30d, 90d"),
     current_admin: Dict[str, Any] = Depends(get_current_admin),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get analytics chart data"""
     chart_data = await admin_manager.generate_analytics_chart(chart_type, period, db)
@@ -809,22 +815,22 @@ async def get_payment_methods(
     limit: int = 50,
     offset: int = 0,
     current_admin: Dict[str, Any] = Depends(get_current_admin),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get payment methods"""
-    query = db.query(PaymentMethod)
+    query = select(PaymentMethod).options(selectinload(PaymentMethod.user))
     
     if method_type:
-        query = query.filter(PaymentMethod.method_type == method_type)
+        query = query.where(PaymentMethod.method_type == method_type)
     
     if verified is not None:
-        query = query.filter(PaymentMethod.is_verified == verified)
+        query = query.where(PaymentMethod.is_verified == verified)
     
     if active is not None:
-        query = query.filter(PaymentMethod.is_active == active)
+        query = query.where(PaymentMethod.is_active == active)
     
-    methods = query.offset(offset).limit(limit).all()
-    total = query.count()
+    methods = (await db.execute(query.offset(offset).limit(limit))).scalars().all()
+    total = await db.scalar(select(func.count()).select_from(query.subquery()))
     
     return {
         "payment_methods": [
@@ -852,10 +858,10 @@ async def get_payment_methods(
 @app.get("/api/v1/p2p-admin/settings")
 async def get_p2p_settings(
     current_admin: Dict[str, Any] = Depends(get_current_admin),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get P2P platform settings"""
-    settings = db.query(P2PSettings).all()
+    settings = (await db.execute(select(P2PSettings))).scalars().all()
     
     return {
         "settings": [
@@ -874,7 +880,7 @@ async def get_p2p_settings(
 async def update_p2p_settings(
     settings_data: P2PSettingsUpdate,
     current_admin: Dict[str, Any] = Depends(get_current_admin),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Update P2P platform settings"""
     setting = await admin_manager.update_p2p_settings(settings_data, current_admin, db)
@@ -892,22 +898,22 @@ async def get_admin_actions(
     limit: int = 50,
     offset: int = 0,
     current_admin: Dict[str, Any] = Depends(get_current_admin),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get admin action history"""
-    query = db.query(P2PAdminAction)
+    query = select(P2PAdminAction)
     
     if admin_id:
-        query = query.filter(P2PAdminAction.admin_id == admin_id)
+        query = query.where(P2PAdminAction.admin_id == admin_id)
     
     if action_type:
-        query = query.filter(P2PAdminAction.action_type == action_type)
+        query = query.where(P2PAdminAction.action_type == action_type)
     
     if target_type:
-        query = query.filter(P2PAdminAction.target_type == target_type)
+        query = query.where(P2PAdminAction.target_type == target_type)
     
-    actions = query.order_by(P2PAdminAction.created_at.desc()).offset(offset).limit(limit).all()
-    total = query.count()
+    actions = (await db.execute(query.order_by(P2PAdminAction.created_at.desc()).offset(offset).limit(limit))).scalars().all()
+    total = await db.scalar(select(func.count()).select_from(query.subquery()))
     
     return {
         "admin_actions": [
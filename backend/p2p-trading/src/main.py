@@ -4,28 +4,38 @@ Comprehensive peer-to-peer trading platform with escrow, dispute resolution, and
 """
 
 import asyncio
+import base64
+import bisect
+import heapq
+import itertools
 import json
 import logging
 import os
 import uuid
 from datetime import datetime, timedelta
 from decimal import Decimal
-from typing import Dict, List, Optional, Any
+from typing import Callable, Dict, List, Optional, Any, Set, Tuple
 from enum import Enum
 import secrets
 import hashlib
+import sys
 
 import aioredis
-from fastapi import FastAPI, HTTPException, Depends, WebSocket, WebSocketDisconnect, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Depends, Query, WebSocket, WebSocketDisconnect, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel, validator, EmailStr
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, Text, DECIMAL, ForeignKey, JSON, Enum as SQLEnum
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, DECIMAL, ForeignKey, JSON, Enum as SQLEnum, case, insert, select, update
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session, relationship
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import relationship, joinedload
 from sqlalchemy.sql import func
 import requests
 
+sys.path.append(os.path.join(os.path.dirname(__file__), "../../shared"))
+from async_db import create_session_factory, session_dependency
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -53,10 +63,25 @@ class Config:
     
     # P2P Configuration
     ESCROW_TIMEOUT_HOURS = 24
+    RELEASE_TIMEOUT_HOURS = 1  # seller's time to release once the buyer confirms payment
     DISPUTE_TIMEOUT_HOURS = 72
     MIN_TRADE_AMOUNT = Decimal("10")
     MAX_TRADE_AMOUNT = Decimal("100000")
     P2P_FEE_PERCENTAGE = Decimal("0.5")  # 0.5%
+    AD_BOOK_SYNC_SECONDS = 10  # how often ads changed by other workers are read back
+    AD_BOOK_SYNC_OVERLAP_SECONDS = 60  # re-read window for changes committed out of timestamp order
+    
+    # Trade chat
+    CHAT_CHANNEL_PREFIX = "p2p:chat:"
+    CHAT_FLUSH_INTERVAL = 0.5  # seconds between TradeMessage batch writes
+    CHAT_FLUSH_BATCH_SIZE = 200
+    CHAT_MAX_PENDING = 10000  # unsaved messages held per worker before new ones are dropped
+    CHAT_FLUSH_MAX_ATTEMPTS = 10  # writes a message gets while the database is unreachable
+    CHAT_FLUSH_MAX_BACKOFF = 30  # seconds between flushes after repeated failures
+    
+    # Deadline enforcement
+    DEADLINE_BATCH_SIZE = 500  # most trades and ads expired per transaction
+    DEADLINE_RETRY_SECONDS = 5
     
     # Payment Providers
     STRIPE_SECRET_KEY = os.getenv("STRIPE_SECRET_KEY")
@@ -66,8 +91,7 @@ class Config:
 config = Config()
 
 # Database setup
-engine = create_engine(config.DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+engine, AsyncSessionLocal = create_session_factory(config.DATABASE_URL)
 Base = declarative_base()
 
 security = HTTPBearer()
@@ -83,6 +107,7 @@ class OrderStatus(str, Enum):
     COMPLETED = "completed"
     CANCELLED = "cancelled"
     DISPUTED = "disputed"
+    EXPIRED = "expired"
 
 class TradeStatus(str, Enum):
     PENDING = "pending"
@@ -224,7 +249,7 @@ class P2POrder(Base):
     total_volume = Column(DECIMAL(20, 2), default=0)
     
     created_at = Column(DateTime, default=func.now())
-    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now(), index=True)
     
     # Relationships
     trades = relationship("P2PTrade", back_populates="order")
@@ -257,6 +282,7 @@ class P2PTrade(Base):
     # Status and Timing
     status = Column(SQLEnum(TradeStatus), default=TradeStatus.PENDING)
     payment_deadline = Column(DateTime, nullable=False)
+    release_deadline = Column(DateTime)  # set when the buyer confirms payment
     
     # Escrow Information
     escrow_address = Column(String(100))
@@ -421,26 +447,775 @@ class FeedbackCreate(BaseModel):
         return v
 
 # Dependencies
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+get_async_db = session_dependency(AsyncSessionLocal)
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     return {"user_id": "user_123", "username": "testuser", "country_code": "US"}
 
+async def get_chat_user(websocket: WebSocket):
+    return {"user_id": "user_123", "username": "testuser", "country_code": "US"}
+
+def encode_cursor(key: List[Any]) -> str:
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+def decode_cursor(cursor: str, size: int) -> List[Any]:
+    """Opaque keyset cursor back to its ``size`` sort-key values"""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        raise ValueError("Invalid cursor")
+    if not isinstance(key, list) or len(key) != size:
+        raise ValueError("Invalid cursor")
+    return key
+
+def serialize_ad_user(user: P2PUser) -> Dict[str, Any]:
+    return {
+        "username": user.username,
+        "total_trades": user.total_trades,
+        "successful_trades": user.successful_trades,
+        "average_rating": str(user.average_rating)
+    }
+
+def serialize_ad(order: P2POrder) -> Dict[str, Any]:
+    return {
+        "order_id": order.order_id,
+        "order_type": order.order_type,
+        "cryptocurrency": order.cryptocurrency,
+        "fiat_currency": order.fiat_currency,
+        "crypto_amount": str(order.crypto_amount),
+        "price_per_unit": str(order.price_per_unit),
+        "total_fiat_amount": str(order.total_fiat_amount),
+        "min_trade_amount": str(order.min_trade_amount) if order.min_trade_amount else None,
+        "max_trade_amount": str(order.max_trade_amount) if order.max_trade_amount else None,
+        "accepted_payment_methods": order.accepted_payment_methods,
+        "terms": order.terms,
+        "user": serialize_ad_user(order.user),
+        "created_at": order.created_at.isoformat()
+    }
+
+class P2PAdBook:
+    """Active P2P ads held in memory for the browse endpoint.
+    
+    Ads are grouped into books keyed by (cryptocurrency, fiat_currency,
+    order_type), each a list of sort keys kept best price first (cheapest
+    sell ads, highest buy ads). Payment-method and country eligibility come
+    from secondary indexes, and each ad's response payload is serialized
+    once when it enters the book.
+    
+    After the initial ``load``, ``sync`` applies only the ads whose
+    ``updated_at`` moved past the last one seen, in place, so ads written
+    locally while a sync is in flight are never dropped.
+    """
+    
+    def __init__(self):
+        self.clear()
+    
+    def clear(self):
+        self.books: Dict[Tuple[str, str, str], List[tuple]] = {}
+        self.ads: Dict[str, Dict[str, Any]] = {}
+        self.by_payment_method: Dict[str, Set[str]] = {}
+        self.allowed_in: Dict[str, Set[str]] = {}
+        self.blocked_in: Dict[str, Set[str]] = {}
+        self.open_to_all: Set[str] = set()
+        self.by_user: Dict[int, Set[str]] = {}
+        self.synced_to: Optional[datetime] = None
+        self.loaded = False
+    
+    async def load(self, db: AsyncSession):
+        """Replace the book with every active ad in the database"""
+        synced_to = await db.scalar(select(func.max(P2POrder.updated_at)))
+        result = await db.execute(
+            select(P2POrder).options(joinedload(P2POrder.user)).where(P2POrder.status == OrderStatus.ACTIVE)
+        )
+        orders = result.scalars().all()
+        self.clear()
+        for order in orders:
+            self.upsert(order)
+        self.synced_to = synced_to
+        self.loaded = True
+    
+    async def sync(self, db: AsyncSession, overlap: timedelta = timedelta(0)) -> int:
+        """Apply the ads changed since the last load or sync; returns rows applied
+        
+        Rows from up to ``overlap`` before the last seen ``updated_at`` are
+        read again, since a transaction's timestamp can be older than rows
+        that committed before it.
+        """
+        query = select(P2POrder).options(joinedload(P2POrder.user))
+        if self.synced_to is not None:
+            query = query.where(P2POrder.updated_at > self.synced_to - overlap)
+        orders = (await db.execute(query)).scalars().all()
+        for order in orders:
+            self.upsert(order)
+            self.refresh_user(order.user)
+            if order.updated_at is not None and (self.synced_to is None or order.updated_at > self.synced_to):
+                self.synced_to = order.updated_at
+        return len(orders)
+    
+    @staticmethod
+    def _index(index: Dict[Any, Set[str]], key: Any, order_id: str):
+        index.setdefault(key, set()).add(order_id)
+    
+    @staticmethod
+    def _unindex(index: Dict[Any, Set[str]], key: Any, order_id: str):
+        members = index.get(key)
+        if members is not None:
+            members.discard(order_id)
+            if not members:
+                del index[key]
+    
+    def upsert(self, order: P2POrder):
+        """Add or refresh an ad; ads that are no longer active are dropped"""
+        self.remove(order.order_id)
+        if order.status != OrderStatus.ACTIVE:
+            return
+        if order.expires_at is not None and order.expires_at <= datetime.utcnow():
+            return
+        
+        side = OrderType(order.order_type)
+        book = (order.cryptocurrency, order.fiat_currency, side.value)
+        price = Decimal(order.price_per_unit)
+        sort_key = (price if side == OrderType.SELL else -price, order.id, order.order_id)
+        entry = {
+            "book": book,
+            "sort_key": sort_key,
+            "payload": serialize_ad(order),
+            "expires_at": order.expires_at,
+            "user_id": order.user_id,
+            "payment_methods": set(order.accepted_payment_methods or ()),
+            "allowed": {country.upper() for country in order.allowed_countries or ()},
+            "blocked": {country.upper() for country in order.blocked_countries or ()}
+        }
+        
+        self.ads[order.order_id] = entry
+        bisect.insort(self.books.setdefault(book, []), sort_key)
+        for method in entry["payment_methods"]:
+            self._index(self.by_payment_method, method, order.order_id)
+        if entry["allowed"]:
+            for country in entry["allowed"]:
+                self._index(self.allowed_in, country, order.order_id)
+        else:
+            self.open_to_all.add(order.order_id)
+        for country in entry["blocked"]:
+            self._index(self.blocked_in, country, order.order_id)
+        self._index(self.by_user, order.user_id, order.order_id)
+    
+    def remove(self, order_id: str):
+        entry = self.ads.pop(order_id, None)
+        if entry is None:
+            return
+        
+        keys = self.books[entry["book"]]
+        del keys[bisect.bisect_left(keys, entry["sort_key"])]
+        if not keys:
+            del self.books[entry["book"]]
+        for method in entry["payment_methods"]:
+            self._unindex(self.by_payment_method, method, order_id)
+        for country in entry["allowed"]:
+            self._unindex(self.allowed_in, country, order_id)
+        self.open_to_all.discard(order_id)
+        for country in entry["blocked"]:
+            self._unindex(self.blocked_in, country, order_id)
+        self._unindex(self.by_user, entry["user_id"], order_id)
+    
+    def refresh_user(self, user: P2PUser):
+        """Update the advertiser stats shown on all of a user's ads"""
+        stats = serialize_ad_user(user)
+        for order_id in self.by_user.get(user.id, ()):
+            self.ads[order_id]["payload"]["user"] = stats
+    
+    def is_eligible(self, order_id: str, country: Optional[str], payment_method: Optional[str]) -> bool:
+        if payment_method is not None and order_id not in self.by_payment_method.get(payment_method, ()):
+            return False
+        if country is not None:
+            if order_id in self.blocked_in.get(country, ()):
+                return False
+            if order_id not in self.open_to_all and order_id not in self.allowed_in.get(country, ()):
+                return False
+        return True
+    
+    @staticmethod
+    def encode_cursor(sort_key: tuple) -> str:
+        price, row_id, order_id = sort_key
+        return encode_cursor([str(price), row_id, order_id])
+    
+    @staticmethod
+    def decode_cursor(cursor: str) -> tuple:
+        price, row_id, order_id = decode_cursor(cursor, 3)
+        try:
+            return Decimal(price), int(row_id), str(order_id)
+        except (ArithmeticError, TypeError, ValueError):
+            raise ValueError("Invalid cursor")
+    
+    def query(self, order_type: Optional[OrderType] = None, cryptocurrency: Optional[str] = None,
+              fiat_currency: Optional[str] = None, country: Optional[str] = None,
+              payment_method: Optional[str] = None, limit: int = 20, offset: int = 0,
+              cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Best-priced eligible ads plus the next page's cursor
+        
+        Books matching a partial key are merged by price. A cursor is the
+        sort key of the last ad served, so each book resumes by bisection
+        instead of re-walking the ads before it.
+        """
+        country = country.upper() if country else None
+        after = self.decode_cursor(cursor) if cursor else None
+        books = [
+            itertools.islice(keys, bisect.bisect_right(keys, after), None) if after else keys
+            for (crypto, fiat, side), keys in self.books.items()
+            if (cryptocurrency is None or crypto == cryptocurrency)
+            and (fiat_currency is None or fiat == fiat_currency)
+            and (order_type is None or side == OrderType(order_type).value)
+        ]
+        if payment_method is not None and payment_method not in self.by_payment_method:
+            return [], None
+        
+        now = datetime.utcnow()
+        expired = []
+        results = []
+        last_key = None
+        has_more = False
+        skip = 0 if after else offset
+        for sort_key in heapq.merge(*books):
+            order_id = sort_key[2]
+            entry = self.ads[order_id]
+            if entry["expires_at"] is not None and entry["expires_at"] <= now:
+                expired.append(order_id)
+                continue
+            if not self.is_eligible(order_id, country, payment_method):
+                continue
+            if skip:
+                skip -= 1
+                continue
+            if len(results) >= limit:
+                has_more = True
+                break
+            results.append(entry["payload"])
+            last_key = sort_key
+        
+        for order_id in expired:
+            self.remove(order_id)
+        return results, self.encode_cursor(last_key) if has_more else None
+
+class ChatRoomHub:
+    """Fans trade chat out to every socket in a room, across workers.
+    
+    Each worker groups its sockets by chat room and holds one Redis pub/sub
+    connection, subscribed to a room's channel while it has a socket in that
+    room. Messages are published to the channel and delivered to local
+    sockets by the channel reader, so participants connected to different
+    workers see each other. Without Redis, or when a publish fails, messages
+    are delivered locally.
+    """
+    
+    def __init__(self):
+        self.redis_client = None
+        self.pubsub = None
+        self.reader: Optional[asyncio.Task] = None
+        self.rooms: Dict[str, Set[WebSocket]] = {}
+        self.subscribed = asyncio.Event()
+        self.delivered = 0
+        self.dropped = 0
+        self.publish_failures = 0
+    
+    @staticmethod
+    def channel(chat_room_id: str) -> str:
+        return f"{config.CHAT_CHANNEL_PREFIX}{chat_room_id}"
+    
+    async def start(self, redis_client):
+        self.redis_client = redis_client
+        self.pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+        if self.rooms:
+            await self.pubsub.subscribe(*(self.channel(room) for room in self.rooms))
+            self.subscribed.set()
+        self.reader = asyncio.create_task(self.read_loop())
+    
+    async def stop(self):
+        if self.reader is not None:
+            self.reader.cancel()
+            self.reader = None
+        if self.pubsub is not None:
+            await self.pubsub.close()
+            self.pubsub = None
+    
+    async def join(self, chat_room_id: str, websocket: WebSocket):
+        sockets = self.rooms.setdefault(chat_room_id, set())
+        sockets.add(websocket)
+        if len(sockets) == 1 and self.pubsub is not None:
+            await self.pubsub.subscribe(self.channel(chat_room_id))
+            self.subscribed.set()
+    
+    async def leave(self, chat_room_id: str, websocket: WebSocket):
+        sockets = self.rooms.get(chat_room_id)
+        if sockets is None or websocket not in sockets:
+            return
+        sockets.discard(websocket)
+        if not sockets:
+            del self.rooms[chat_room_id]
+            if self.pubsub is not None:
+                await self.pubsub.unsubscribe(self.channel(chat_room_id))
+                if not self.rooms:
+                    self.subscribed.clear()
+    
+    async def publish(self, chat_room_id: str, payload: str):
+        if self.pubsub is not None:
+            try:
+                await self.redis_client.publish(self.channel(chat_room_id), payload)
+                return
+            except Exception as e:
+                self.publish_failures += 1
+                logger.error(f"Error publishing to P2P chat room {chat_room_id}, delivering locally: {e}")
+        await self.deliver(chat_room_id, payload)
+    
+    async def deliver(self, chat_room_id: str, payload: str):
+        """Send to this worker's sockets in the room; sockets that fail are dropped"""
+        sockets = list(self.rooms.get(chat_room_id, ()))
+        if not sockets:
+            return
+        results = await asyncio.gather(
+            *(websocket.send_text(payload) for websocket in sockets), return_exceptions=True
+        )
+        for websocket, result in zip(sockets, results):
+            if isinstance(result, Exception):
+                self.dropped += 1
+                await self.leave(chat_room_id, websocket)
+            else:
+                self.delivered += 1
+    
+    async def read_loop(self):
+        prefix = len(config.CHAT_CHANNEL_PREFIX)
+        while True:
+            await self.subscribed.wait()
+            try:
+                message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except Exception as e:
+                logger.error(f"Error reading P2P chat channel: {e}")
+                await asyncio.sleep(1)
+                continue
+            if not message or message.get("type") != "message":
+                continue
+            channel, data = message["channel"], message["data"]
+            if isinstance(channel, bytes):
+                channel = channel.decode()
+            if isinstance(data, bytes):
+                data = data.decode()
+            await self.deliver(channel[prefix:], data)
+    
+    def metrics(self) -> Dict[str, int]:
+        return {
+            "rooms": len(self.rooms),
+            "sockets": sum(len(sockets) for sockets in self.rooms.values()),
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "publish_failures": self.publish_failures
+        }
+
+class ChatMessageWriter:
+    """Persists chat into ``trade_messages`` in batches.
+    
+    Messages are queued as rows and written with one multi-row INSERT every
+    ``flush_interval`` seconds, or sooner once ``batch_size`` rows are
+    waiting. Only the worker a message arrived on queues it.
+    
+    If a batch is rejected for its data (an integrity or data error), the
+    rows are written one at a time and the ones that still fail are dropped
+    and logged. If the database cannot be reached, the rows go back to the
+    front of the queue and flushes back off exponentially; a row is dropped
+    after ``max_attempts`` failed writes. At most ``max_pending`` rows are
+    held; beyond that new messages are dropped.
+    """
+    
+    ROW_ERRORS = (IntegrityError, DataError)
+    
+    def __init__(self, session_factory=None, flush_interval: float = config.CHAT_FLUSH_INTERVAL,
+                 batch_size: int = config.CHAT_FLUSH_BATCH_SIZE, max_pending: int = config.CHAT_MAX_PENDING,
+                 max_attempts: int = config.CHAT_FLUSH_MAX_ATTEMPTS):
+        self.session_factory = session_factory or AsyncSessionLocal
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.pending: List[Dict[str, Any]] = []
+        self.attempts: Dict[str, int] = {}
+        self.full = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.closing = False
+        self.failures = 0
+        self.written = 0
+        self.batches = 0
+        self.dropped = 0
+    
+    def enqueue(self, row: Dict[str, Any]):
+        if len(self.pending) >= self.max_pending:
+            self.dropped += 1
+            logger.error(f"P2P chat write queue is full, dropping message {row.get('message_id')}")
+            return
+        self.pending.append(row)
+        if len(self.pending) >= self.batch_size and not self.failures:
+            self.full.set()
+    
+    def drop(self, rows: List[Dict[str, Any]], reason: str):
+        for row in rows:
+            self.attempts.pop(row.get("message_id"), None)
+            logger.error(f"Dropping P2P chat message {row.get('message_id')} "
+                         f"for trade {row.get('trade_id')}: {reason}")
+        self.dropped += len(rows)
+    
+    async def write_rows(self, rows: List[Dict[str, Any]]) -> Tuple[int, List[Dict[str, Any]]]:
+        """Insert rows one per transaction; returns rows written and rows left unwritten"""
+        written = 0
+        async with self.session_factory() as db:
+            for index, row in enumerate(rows):
+                try:
+                    await db.execute(insert(TradeMessage), [row])
+                    await db.commit()
+                    written += 1
+                except self.ROW_ERRORS as e:
+                    await db.rollback()
+                    self.drop([row], str(e.orig))
+                except Exception as e:
+                    logger.error(f"Error writing P2P chat messages one by one: {e}")
+                    return written, rows[index:]
+        return written, []
+    
+    async def flush(self) -> int:
+        """Write everything queued so far; returns rows written"""
+        rows, self.pending = self.pending, []
+        self.full.clear()
+        if not rows:
+            return 0
+        unwritten: List[Dict[str, Any]] = []
+        try:
+            async with self.session_factory() as db:
+                await db.execute(insert(TradeMessage), rows)
+                await db.commit()
+            written = len(rows)
+        except self.ROW_ERRORS as e:
+            logger.error(f"P2P chat batch of {len(rows)} rejected, writing rows singly: {e.orig}")
+            try:
+                written, unwritten = await self.write_rows(rows)
+            except Exception as e:
+                logger.error(f"Error writing P2P chat messages one by one: {e}")
+                written, unwritten = 0, rows
+        except Exception as e:
+            logger.error(f"Error writing {len(rows)} P2P chat messages: {e}")
+            written, unwritten = 0, rows
+        
+        self.written += written
+        if written:
+            self.batches += 1
+        for row in rows[:len(rows) - len(unwritten)]:
+            self.attempts.pop(row.get("message_id"), None)
+        if unwritten:
+            self.failures += 1
+            retry = []
+            for row in unwritten:
+                attempts = self.attempts.get(row.get("message_id"), 0) + 1
+                if attempts >= self.max_attempts:
+                    self.drop([row], f"not written after {attempts} attempts")
+                else:
+                    self.attempts[row.get("message_id")] = attempts
+                    retry.append(row)
+            # Retries go first; when over the bound, the newest messages are shed
+            self.pending[:0] = retry
+            if len(self.pending) > self.max_pending:
+                self.drop(self.pending[self.max_pending:], "write queue is full")
+                del self.pending[self.max_pending:]
+        else:
+            self.failures = 0
+        return written
+    
+    def start(self):
+        self.closing = False
+        self.task = asyncio.create_task(self.run())
+    
+    async def run(self):
+        while not self.closing:
+            delay = self.flush_interval
+            if self.failures:
+                delay = min(delay * 2 ** self.failures, config.CHAT_FLUSH_MAX_BACKOFF)
+            try:
+                await asyncio.wait_for(self.full.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+    
+    async def stop(self):
+        """Let an in-flight flush finish, then write what is left"""
+        self.closing = True
+        self.full.set()
+        if self.task is not None:
+            await self.task
+            self.task = None
+        await self.flush()
+        if self.pending:
+            self.drop(self.pending, "service is shutting down")
+            self.pending = []
+    
+    def metrics(self) -> Dict[str, int]:
+        return {
+            "pending": len(self.pending),
+            "written": self.written,
+            "batches": self.batches,
+            "dropped": self.dropped
+        }
+
+OPEN_TRADE_STATUSES = (TradeStatus.PENDING, TradeStatus.PAYMENT_PENDING, TradeStatus.PAYMENT_CONFIRMED)
+
+def trade_deadline():
+    """The deadline an open trade is held to: payment until paid, release after.
+    
+    Trades confirmed before ``release_deadline`` existed keep their payment
+    deadline.
+    """
+    return case(
+        (P2PTrade.status == TradeStatus.PAYMENT_CONFIRMED,
+         func.coalesce(P2PTrade.release_deadline, P2PTrade.payment_deadline)),
+        else_=P2PTrade.payment_deadline
+    )
+
+class DeadlineScheduler:
+    """Expires P2P trades and ads at their deadlines without scanning for them.
+    
+    Unpaid trades (``payment_deadline``), paid trades (``release_deadline``)
+    and active ads (``expires_at``) are loaded into a min-heap at startup and
+    added as they are created or paid. The loop sleeps until the earliest
+    deadline, then handles everything due in one transaction: unpaid trades
+    are cancelled, paid but unreleased trades are escalated to a dispute,
+    and ads are expired. Cancelled or replaced
+    entries stay in the heap and are skipped when popped.
+    
+    Every worker runs a scheduler. Rows are locked with SKIP LOCKED and
+    updated only while still open, so each deadline is acted on once.
+    """
+    
+    TRADE = "trade"
+    AD = "ad"
+    
+    def __init__(self, session_factory=None, on_ads_expired: Optional[Callable[[List[str]], None]] = None,
+                 batch_size: int = config.DEADLINE_BATCH_SIZE):
+        self.session_factory = session_factory or AsyncSessionLocal
+        self.on_ads_expired = on_ads_expired
+        self.batch_size = batch_size
+        self.heap: List[Tuple[datetime, str, str]] = []
+        self.deadlines: Dict[Tuple[str, str], datetime] = {}
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.cancelled = 0
+        self.escalated = 0
+        self.expired = 0
+    
+    def schedule(self, kind: str, key: str, deadline: Optional[datetime]):
+        """Schedule or move a deadline; waking the loop if it is now the earliest"""
+        if deadline is None:
+            return
+        self.deadlines[(kind, key)] = deadline
+        heapq.heappush(self.heap, (deadline, kind, key))
+        if self.heap[0][0] == deadline:
+            self.wakeup.set()
+    
+    def cancel(self, kind: str, key: str):
+        self.deadlines.pop((kind, key), None)
+    
+    def next_deadline(self) -> Optional[datetime]:
+        while self.heap:
+            deadline, kind, key = self.heap[0]
+            if self.deadlines.get((kind, key)) == deadline:
+                return deadline
+            heapq.heappop(self.heap)
+        return None
+    
+    def pop_due(self, now: datetime) -> Tuple[List[str], List[str]]:
+        """Trade and ad ids whose deadline has passed, at most ``batch_size``"""
+        trade_ids: List[str] = []
+        order_ids: List[str] = []
+        while self.heap and self.heap[0][0] <= now and len(trade_ids) + len(order_ids) < self.batch_size:
+            deadline, kind, key = heapq.heappop(self.heap)
+            if self.deadlines.get((kind, key)) != deadline:
+                continue
+            del self.deadlines[(kind, key)]
+            (trade_ids if kind == self.TRADE else order_ids).append(key)
+        return trade_ids, order_ids
+    
+    async def load(self, db: AsyncSession):
+        trades = await db.execute(
+            select(P2PTrade.trade_id, trade_deadline()).where(P2PTrade.status.in_(OPEN_TRADE_STATUSES))
+        )
+        for trade_id, deadline in trades:
+            self.schedule(self.TRADE, trade_id, deadline)
+        ads = await db.execute(
+            select(P2POrder.order_id, P2POrder.expires_at).where(
+                P2POrder.status == OrderStatus.ACTIVE, P2POrder.expires_at.isnot(None)
+            )
+        )
+        for order_id, deadline in ads:
+            self.schedule(self.AD, order_id, deadline)
+    
+    async def expire(self, trade_ids: List[str], order_ids: List[str], now: datetime) -> Dict[str, int]:
+        """Cancel, escalate and expire one batch of due ids in a single transaction"""
+        unpaid, paid, expired_ads = [], [], []
+        async with self.session_factory() as db:
+            if trade_ids:
+                result = await db.execute(
+                    select(P2PTrade.id, P2PTrade.status, P2PTrade.buyer_id, P2PTrade.seller_id).where(
+                        P2PTrade.trade_id.in_(trade_ids),
+                        P2PTrade.status.in_(OPEN_TRADE_STATUSES),
+                        trade_deadline() <= now
+                    ).with_for_update(skip_locked=True)
+                )
+                for row in result:
+                    (paid if row.status == TradeStatus.PAYMENT_CONFIRMED else unpaid).append(row)
+            
+            messages = []
+            if unpaid:
+                await db.execute(
+                    update(P2PTrade).where(P2PTrade.id.in_([row.id for row in unpaid]))
+                    .values(status=TradeStatus.CANCELLED)
+                )
+                messages += [(row.id, row.buyer_id, "Payment deadline passed. Trade cancelled.") for row in unpaid]
+            if paid:
+                await db.execute(
+                    update(P2PTrade).where(P2PTrade.id.in_([row.id for row in paid]))
+                    .values(status=TradeStatus.DISPUTED)
+                )
+                await db.execute(insert(TradeDispute), [
+                    {
+                        "dispute_id": f"DISPUTE_{secrets.token_hex(8).upper()}",
+                        "trade_id": row.id,
+                        "initiated_by": row.buyer_id,
+                        "dispute_reason": "release_timeout",
+                        "description": "Crypto was not released before the release deadline",
+                        "evidence_urls": [],
+                        "status": DisputeStatus.OPEN,
+                        "created_at": now
+                    }
+                    for row in paid
+                ])
+                messages += [
+                    (row.id, row.seller_id, "Crypto not released before the deadline. Dispute opened.")
+                    for row in paid
+                ]
+            if messages:
+                await db.execute(insert(TradeMessage), [
+                    {
+                        "message_id": f"MSG_{secrets.token_hex(8).upper()}",
+                        "trade_id": trade_pk,
+                        "sender_id": sender_id,
+                        "message_type": "system",
+                        "content": content,
+                        "is_system_message": True,
+                        "created_at": now
+                    }
+                    for trade_pk, sender_id, content in messages
+                ])
+            
+            if order_ids:
+                result = await db.execute(
+                    update(P2POrder).where(
+                        P2POrder.order_id.in_(order_ids),
+                        P2POrder.status == OrderStatus.ACTIVE,
+                        P2POrder.expires_at <= now
+                    ).values(status=OrderStatus.EXPIRED).returning(P2POrder.order_id)
+                )
+                expired_ads = list(result.scalars())
+            
+            await db.commit()
+        
+        self.cancelled += len(unpaid)
+        self.escalated += len(paid)
+        self.expired += len(expired_ads)
+        if expired_ads and self.on_ads_expired is not None:
+            self.on_ads_expired(expired_ads)
+        return {"cancelled": len(unpaid), "escalated": len(paid), "expired": len(expired_ads)}
+    
+    async def start(self):
+        async with self.session_factory() as db:
+            await self.load(db)
+        self.task = asyncio.create_task(self.run())
+    
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+    
+    async def run(self):
+        while True:
+            self.wakeup.clear()
+            deadline = self.next_deadline()
+            if deadline is None:
+                await self.wakeup.wait()
+                continue
+            delay = (deadline - datetime.utcnow()).total_seconds()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            
+            now = datetime.utcnow()
+            trade_ids, order_ids = self.pop_due(now)
+            try:
+                await self.expire(trade_ids, order_ids, now)
+            except Exception as e:
+                logger.error(f"Error expiring P2P deadlines: {e}")
+                retry_at = now + timedelta(seconds=config.DEADLINE_RETRY_SECONDS)
+                for trade_id in trade_ids:
+                    self.schedule(self.TRADE, trade_id, retry_at)
+                for order_id in order_ids:
+                    self.schedule(self.AD, order_id, retry_at)
+    
+    def metrics(self) -> Dict[str, int]:
+        return {
+            "scheduled": len(self.deadlines),
+            "cancelled": self.cancelled,
+            "escalated": self.escalated,
+            "expired": self.expired
+        }
+
 # P2P Trading Manager
 class P2PTradingManager:
     def __init__(self):
         self.redis_client = None
         self.active_connections: Dict[str, WebSocket] = {}
+        self.ad_book = P2PAdBook()
+        self.chat = ChatRoomHub()
+        self.chat_writer = ChatMessageWriter()
+        self.deadlines = DeadlineScheduler(on_ads_expired=self.remove_ads)
         
     async def initialize(self):
         self.redis_client = await aioredis.from_url(config.REDIS_URL)
+        asyncio.create_task(self.sync_ad_book_loop())
+        await self.chat.start(self.redis_client)
+        self.chat_writer.start()
+        await self.deadlines.start()
+    
+    async def shutdown(self):
+        await self.deadlines.stop()
+        await self.chat.stop()
+        await self.chat_writer.stop()
+    
+    def remove_ads(self, order_ids: List[str]):
+        for order_id in order_ids:
+            self.ad_book.remove(order_id)
+    
+    async def sync_ad_book(self, session_factory=None) -> int:
+        """Load the ad book, or apply the ads changed since the last sync"""
+        async with (session_factory or AsyncSessionLocal)() as db:
+            if not self.ad_book.loaded:
+                await self.ad_book.load(db)
+                return len(self.ad_book.ads)
+            return await self.ad_book.sync(db, timedelta(seconds=config.AD_BOOK_SYNC_OVERLAP_SECONDS))
+    
+    async def sync_ad_book_loop(self):
+        """Keep the ad book in step with ads changed by other workers"""
+        while True:
+            try:
+                await self.sync_ad_book()
+            except Exception as e:
+                logger.error(f"Error syncing P2P ad book: {e}")
+            await asyncio.sleep(config.AD_BOOK_SYNC_SECONDS)
     
-    async def create_p2p_order(self, order_data: P2POrderCreate, user: Dict[str, Any], db: Session):
+    async def create_p2p_order(self, order_data: P2POrderCreate, user: Dict[str, Any], db: AsyncSession):
         """Create new P2P order"""
         
         # Get or create P2P user
@@ -457,6 +1232,7 @@ class P2PTradingManager:
         order = P2POrder(
             order_id=order_id,
             user_id=p2p_user.id,
+            user=p2p_user,
             order_type=order_data.order_type,
             cryptocurrency=order_data.cryptocurrency,
             fiat_currency=order_data.fiat_currency,
@@ -474,19 +1250,23 @@ class P2PTradingManager:
         )
         
         db.add(order)
-        db.commit()
-        db.refresh(order)
+        await db.commit()
+        await db.refresh(order)
+        
+        if self.ad_book.loaded:
+            self.ad_book.upsert(order)
+        self.deadlines.schedule(DeadlineScheduler.AD, order.order_id, order.expires_at)
         
         return order
     
-    async def create_p2p_trade(self, trade_data: P2PTradeCreate, user: Dict[str, Any], db: Session):
+    async def create_p2p_trade(self, trade_data: P2PTradeCreate, user: Dict[str, Any], db: AsyncSession):
         """Create new P2P trade"""
         
         # Get P2P user
         p2p_user = await self.get_or_create_p2p_user(user, db)
         
         # Get order
-        order = db.query(P2POrder).filter(P2POrder.order_id == trade_data.order_id).first()
+        order = await db.scalar(select(P2POrder).where(P2POrder.order_id == trade_data.order_id))
         if not order:
             raise HTTPException(status_code=404, detail="Order not found")
         
@@ -535,6 +1315,7 @@ class P2PTradingManager:
         )
         
         db.add(trade)
+        await db.flush()
         
         # Create initial system message
         if trade_data.message:
@@ -557,15 +1338,16 @@ class P2PTradingManager:
         )
         db.add(system_message)
         
-        db.commit()
-        db.refresh(trade)
+        await db.commit()
+        await db.refresh(trade)
+        self.deadlines.schedule(DeadlineScheduler.TRADE, trade.trade_id, trade.payment_deadline)
         
         return trade
     
-    async def get_or_create_p2p_user(self, user: Dict[str, Any], db: Session) -> P2PUser:
+    async def get_or_create_p2p_user(self, user: Dict[str, Any], db: AsyncSession) -> P2PUser:
         """Get or create P2P user profile"""
         
-        p2p_user = db.query(P2PUser).filter(P2PUser.user_id == user["user_id"]).first()
+        p2p_user = await db.scalar(select(P2PUser).where(P2PUser.user_id == user["user_id"]))
         
         if not p2p_user:
             p2p_user = P2PUser(
@@ -575,15 +1357,28 @@ class P2PTradingManager:
                 country_code=user.get("country_code", "US")
             )
             db.add(p2p_user)
-            db.commit()
-            db.refresh(p2p_user)
+            await db.commit()
+            await db.refresh(p2p_user)
         
         return p2p_user
     
-    async def confirm_payment(self, trade_id: str, user: Dict[str, Any], db: Session):
+    async def transition_trade(self, trade: P2PTrade, expected: TradeStatus, db: AsyncSession, **values):
+        """Update a trade only if it is still in ``expected`` status.
+        
+        The deadline scheduler cancels and escalates trades in its own
+        transaction, so the status read before this point may be stale.
+        """
+        result = await db.execute(
+            update(P2PTrade).where(P2PTrade.id == trade.id, P2PTrade.status == expected).values(**values)
+        )
+        if result.rowcount != 1:
+            await db.rollback()
+            raise HTTPException(status_code=409, detail="Trade status has changed, reload the trade")
+    
+    async def confirm_payment(self, trade_id: str, user: Dict[str, Any], db: AsyncSession):
         """Confirm payment made"""
         
-        trade = db.query(P2PTrade).filter(P2PTrade.trade_id == trade_id).first()
+        trade = await db.scalar(select(P2PTrade).where(P2PTrade.trade_id == trade_id))
         if not trade:
             raise HTTPException(status_code=404, detail="Trade not found")
         
@@ -595,7 +1390,10 @@ class P2PTradingManager:
         if trade.status != TradeStatus.PENDING:
             raise HTTPException(status_code=400, detail="Trade is not in pending status")
         
-        trade.status = TradeStatus.PAYMENT_CONFIRMED
+        await self.transition_trade(
+            trade, TradeStatus.PENDING, db, status=TradeStatus.PAYMENT_CONFIRMED,
+            release_deadline=datetime.utcnow() + timedelta(hours=config.RELEASE_TIMEOUT_HOURS)
+        )
         
         # Create system message
         message = TradeMessage(
@@ -607,14 +1405,17 @@ class P2PTradingManager:
         )
         db.add(message)
         
-        db.commit()
+        await db.commit()
+        self.deadlines.schedule(DeadlineScheduler.TRADE, trade.trade_id, trade.release_deadline)
         
         return trade
     
-    async def release_crypto(self, trade_id: str, user: Dict[str, Any], db: Session):
+    async def release_crypto(self, trade_id: str, user: Dict[str, Any], db: AsyncSession):
         """Release cryptocurrency to buyer"""
         
-        trade = db.query(P2PTrade).filter(P2PTrade.trade_id == trade_id).first()
+        trade = await db.scalar(
+            select(P2PTrade).options(joinedload(P2PTrade.order)).where(P2PTrade.trade_id == trade_id)
+        )
         if not trade:
             raise HTTPException(status_code=404, detail="Trade not found")
         
@@ -626,12 +1427,13 @@ class P2PTradingManager:
         if trade.status != TradeStatus.PAYMENT_CONFIRMED:
             raise HTTPException(status_code=400, detail="Payment not confirmed yet")
         
-        trade.status = TradeStatus.COMPLETED
-        trade.completed_at = datetime.utcnow()
+        await self.transition_trade(
+            trade, TradeStatus.PAYMENT_CONFIRMED, db, status=TradeStatus.COMPLETED, completed_at=datetime.utcnow()
+        )
         
         # Update statistics
-        buyer = db.query(P2PUser).filter(P2PUser.id == trade.buyer_id).first()
-        seller = db.query(P2PUser).filter(P2PUser.id == trade.seller_id).first()
+        buyer = await db.get(P2PUser, trade.buyer_id)
+        seller = await db.get(P2PUser, trade.seller_id)
         
         for user_obj in [buyer, seller]:
             user_obj.total_trades += 1
@@ -653,14 +1455,20 @@ class P2PTradingManager:
         )
         db.add(message)
         
-        db.commit()
+        await db.commit()
+        self.deadlines.cancel(DeadlineScheduler.TRADE, trade_id)
+        
+        if self.ad_book.loaded:
+            self.ad_book.upsert(order)
+            self.ad_book.refresh_user(buyer)
+            self.ad_book.refresh_user(seller)
         
         return trade
     
-    async def create_dispute(self, trade_id: str, dispute_data: DisputeCreate, user: Dict[str, Any], db: Session):
+    async def create_dispute(self, trade_id: str, dispute_data: DisputeCreate, user: Dict[str, Any], db: AsyncSession):
         """Create trade dispute"""
         
-        trade = db.query(P2PTrade).filter(P2PTrade.trade_id == trade_id).first()
+        trade = await db.scalar(select(P2PTrade).where(P2PTrade.trade_id == trade_id))
         if not trade:
             raise HTTPException(status_code=404, detail="Trade not found")
         
@@ -673,7 +1481,7 @@ class P2PTradingManager:
             raise HTTPException(status_code=400, detail="Cannot dispute completed or cancelled trade")
         
         # Check if dispute already exists
-        existing_dispute = db.query(TradeDispute).filter(TradeDispute.trade_id == trade.id).first()
+        existing_dispute = await db.scalar(select(TradeDispute).where(TradeDispute.trade_id == trade.id))
         if existing_dispute:
             raise HTTPException(status_code=400, detail="Dispute already exists for this trade")
         
@@ -703,8 +1511,9 @@ class P2PTradingManager:
         )
         db.add(message)
         
-        db.commit()
-        db.refresh(dispute)
+        await db.commit()
+        await db.refresh(dispute)
+        self.deadlines.cancel(DeadlineScheduler.TRADE, trade_id)
         
         return dispute
 
@@ -715,31 +1524,16 @@ p2p_manager = P2PTradingManager()
 async def startup_event():
     await p2p_manager.initialize()
 
-# WebSocket connection manager
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[str, WebSocket] = {}
-    
-    async def connect(self, websocket: WebSocket, chat_room_id: str):
-        await websocket.accept()
-        self.active_connections[chat_room_id] = websocket
-    
-    def disconnect(self, chat_room_id: str):
-        if chat_room_id in self.active_connections:
-            del self.active_connections[chat_room_id]
-    
-    async def send_message(self, message: str, chat_room_id: str):
-        if chat_room_id in self.active_connections:
-            await self.active_connections[chat_room_id].send_text(message)
-
-manager = ConnectionManager()
+@app.on_event("shutdown")
+async def shutdown_event():
+    await p2p_manager.shutdown()
 
 # API Endpoints
 @app.post("/api/v1/p2p/orders")
 async def create_p2p_order(
     order_data: P2POrderCreate,
     current_user: Dict[str, Any] = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create new P2P order"""
     order = await p2p_manager.create_p2p_order(order_data, current_user, db)
@@ -761,55 +1555,39 @@ async def get_p2p_orders(
     fiat_currency: Optional[str] = None,
     country: Optional[str] = None,
     payment_method: Optional[str] = None,
-    limit: int = 20,
-    offset: int = 0,
-    db: Session = Depends(get_db)
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Get P2P orders"""
-    query = db.query(P2POrder).filter(P2POrder.status == OrderStatus.ACTIVE)
-    
-    if order_type:
-        query = query.filter(P2POrder.order_type == order_type)
-    
-    if cryptocurrency:
-        query = query.filter(P2POrder.cryptocurrency == cryptocurrency)
+    """Get P2P orders, best price first"""
+    if not p2p_manager.ad_book.loaded:
+        await p2p_manager.ad_book.load(db)
     
-    if fiat_currency:
-        query = query.filter(P2POrder.fiat_currency == fiat_currency)
-    
-    orders = query.offset(offset).limit(limit).all()
+    try:
+        orders, next_cursor = p2p_manager.ad_book.query(
+            order_type=order_type,
+            cryptocurrency=cryptocurrency,
+            fiat_currency=fiat_currency,
+            country=country,
+            payment_method=payment_method,
+            limit=limit,
+            offset=offset,
+            cursor=cursor
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     return {
-        "orders": [
-            {
-                "order_id": order.order_id,
-                "order_type": order.order_type,
-                "cryptocurrency": order.cryptocurrency,
-                "fiat_currency": order.fiat_currency,
-                "crypto_amount": str(order.crypto_amount),
-                "price_per_unit": str(order.price_per_unit),
-                "total_fiat_amount": str(order.total_fiat_amount),
-                "min_trade_amount": str(order.min_trade_amount) if order.min_trade_amount else None,
-                "max_trade_amount": str(order.max_trade_amount) if order.max_trade_amount else None,
-                "accepted_payment_methods": order.accepted_payment_methods,
-                "terms": order.terms,
-                "user": {
-                    "username": order.user.username,
-                    "total_trades": order.user.total_trades,
-                    "successful_trades": order.user.successful_trades,
-                    "average_rating": str(order.user.average_rating)
-                },
-                "created_at": order.created_at.isoformat()
-            }
-            for order in orders
-        ]
+        "orders": orders,
+        "next_cursor": next_cursor
     }
 
 @app.post("/api/v1/p2p/trades")
 async def create_p2p_trade(
     trade_data: P2PTradeCreate,
     current_user: Dict[str, Any] = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create new P2P trade"""
     trade = await p2p_manager.create_p2p_trade(trade_data, current_user, db)
@@ -826,20 +1604,46 @@ async def create_p2p_trade(
 @app.get("/api/v1/p2p/trades")
 async def get_user_trades(
     status: Optional[TradeStatus] = None,
+    limit: int = Query(50, ge=1, le=100),
+    cursor: Optional[str] = None,
     current_user: Dict[str, Any] = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Get user's P2P trades"""
+    """Get user's P2P trades, newest first
+    
+    Pages by keyset on (created_at, id); the order and both counterparties
+    are joined into the same statement.
+    """
     p2p_user = await p2p_manager.get_or_create_p2p_user(current_user, db)
     
-    query = db.query(P2PTrade).filter(
+    query = select(P2PTrade).options(
+        joinedload(P2PTrade.order),
+        joinedload(P2PTrade.buyer),
+        joinedload(P2PTrade.seller)
+    ).where(
         (P2PTrade.buyer_id == p2p_user.id) | (P2PTrade.seller_id == p2p_user.id)
     )
     
     if status:
-        query = query.filter(P2PTrade.status == status)
+        query = query.where(P2PTrade.status == status)
+    
+    if cursor:
+        try:
+            created_at, trade_pk = decode_cursor(cursor, 2)
+            created_at, trade_pk = datetime.fromisoformat(created_at), int(trade_pk)
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = query.where(
+            (P2PTrade.created_at < created_at)
+            | ((P2PTrade.created_at == created_at) & (P2PTrade.id < trade_pk))
+        )
     
-    trades = query.order_by(P2PTrade.created_at.desc()).all()
+    result = await db.execute(query.order_by(P2PTrade.created_at.desc(), P2PTrade.id.desc()).limit(limit + 1))
+    trades = result.scalars().all()
+    next_cursor = None
+    if len(trades) > limit:
+        trades = trades[:limit]
+        next_cursor = encode_cursor([trades[-1].created_at.isoformat(), trades[-1].id])
     
     return {
         "trades": [
@@ -863,20 +1667,22 @@ async def get_user_trades(
                 "created_at": trade.created_at.isoformat()
             }
             for trade in trades
-        ]
+        ],
+        "next_cursor": next_cursor
     }
 
 @app.post("/api/v1/p2p/trades/{trade_id}/confirm-payment")
 async def confirm_payment(
     trade_id: str,
     current_user: Dict[str, Any] = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Confirm payment made"""
     trade = await p2p_manager.confirm_payment(trade_id, current_user, db)
     return {
         "trade_id": trade_id,
         "status": trade.status,
+        "release_deadline": trade.release_deadline.isoformat(),
         "message": "Payment confirmed"
     }
 
@@ -884,7 +1690,7 @@ async def confirm_payment(
 async def release_crypto(
     trade_id: str,
     current_user: Dict[str, Any] = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Release cryptocurrency"""
     trade = await p2p_manager.release_crypto(trade_id, current_user, db)
@@ -899,7 +1705,7 @@ async def create_dispute(
     trade_id: str,
     dispute_data: DisputeCreate,
     current_user: Dict[str, Any] = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create trade dispute"""
     dispute = await p2p_manager.create_dispute(trade_id, dispute_data, current_user, db)
@@ -914,7 +1720,7 @@ async def create_dispute(
 async def create_payment_method(
     method_data: PaymentMethodCreate,
     current_user: Dict[str, Any] = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create payment method"""
     p2p_user = await p2p_manager.get_or_create_p2p_user(current_user, db)
@@ -935,8 +1741,8 @@ async def create_payment_method(
     )
     
     db.add(payment_method)
-    db.commit()
-    db.refresh(payment_method)
+    await db.commit()
+    await db.refresh(payment_method)
     
     return {
         "method_id": payment_method.method_id,
@@ -948,15 +1754,16 @@ async def create_payment_method(
 @app.get("/api/v1/p2p/payment-methods")
 async def get_payment_methods(
     current_user: Dict[str, Any] = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get user's payment methods"""
     p2p_user = await p2p_manager.get_or_create_p2p_user(current_user, db)
     
-    methods = db.query(PaymentMethod).filter(
+    result = await db.execute(select(PaymentMethod).where(
         PaymentMethod.user_id == p2p_user.id,
         PaymentMethod.is_active == True
-    ).all()
+    ))
+    methods = result.scalars().all()
     
     return {
         "payment_methods": [
@@ -974,19 +1781,67 @@ async def get_payment_methods(
     }
 
 @app.websocket("/ws/chat/{chat_room_id}")
-async def websocket_chat(websocket: WebSocket, chat_room_id: str):
-    """WebSocket chat for P2P trades"""
-    await manager.connect(websocket, chat_room_id)
+async def websocket_chat(
+    websocket: WebSocket,
+    chat_room_id: str,
+    current_user: Dict[str, Any] = Depends(get_chat_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """WebSocket chat for P2P trades, open to the trade's buyer and seller"""
+    trade = await db.scalar(select(P2PTrade).where(P2PTrade.chat_room_id == chat_room_id))
+    if not trade:
+        await websocket.close(code=4404)
+        return
+    p2p_user = await p2p_manager.get_or_create_p2p_user(current_user, db)
+    if p2p_user.id not in (trade.buyer_id, trade.seller_id):
+        await websocket.close(code=4403)
+        return
+    trade_pk, trade_id, sender_id, username = trade.id, trade.trade_id, p2p_user.id, p2p_user.username
+    # Hand the connection back to the pool; chat sockets stay open for the whole trade
+    await db.close()
+    
+    await websocket.accept()
+    await p2p_manager.chat.join(chat_room_id, websocket)
     try:
         while True:
             data = await websocket.receive_text()
-            await manager.send_message(data, chat_room_id)
+            try:
+                message = TradeMessageCreate(**json.loads(data))
+            except (ValueError, TypeError):
+                message = TradeMessageCreate(content=data)
+            
+            row = {
+                "message_id": f"MSG_{secrets.token_hex(8).upper()}",
+                "trade_id": trade_pk,
+                "sender_id": sender_id,
+                "message_type": message.message_type,
+                "content": message.content,
+                "is_system_message": False,
+                "created_at": datetime.utcnow()
+            }
+            p2p_manager.chat_writer.enqueue(row)
+            await p2p_manager.chat.publish(chat_room_id, json.dumps({
+                "message_id": row["message_id"],
+                "trade_id": trade_id,
+                "sender": username,
+                "message_type": row["message_type"],
+                "content": row["content"],
+                "created_at": row["created_at"].isoformat()
+            }))
     except WebSocketDisconnect:
-        manager.disconnect(chat_room_id)
+        pass
+    finally:
+        await p2p_manager.chat.leave(chat_room_id, websocket)
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "service": "p2p-trading"}
+    return {
+        "status": "healthy",
+        "service": "p2p-trading",
+        "chat": p2p_manager.chat.metrics(),
+        "chat_writer": p2p_manager.chat_writer.metrics(),
+        "deadlines": p2p_manager.deadlines.metrics()
+    }
 
 if __name__ == "__main__":
     import uvicorn
@@ -6,23 +6,30 @@ Supports all popular coins for spot, futures, margin, and options trading
 
 import os
 import asyncio
+import base64
+import bisect
+import hashlib
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any, Tuple
+from typing import Callable, Dict, List, Optional, Any, Set, Tuple
+from urllib.parse import urlsplit
 from dataclasses import dataclass
 from enum import Enum
 import json
+import numpy as np
 import aiohttp
 import asyncpg
 import redis.asyncio as redis
-from fastapi import FastAPI, HTTPException, BackgroundTasks, Depends
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Depends, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, validator
 import requests
 from decimal import Decimal
-import ccxt
+import ccxt.async_support as ccxt_async
 import websockets
-from web3 import Web3
 from solana.rpc.api import Client as SolanaClient
 import base58
 
@@ -64,6 +71,19 @@ class Config:
     
     # Update intervals
     PRICE_UPDATE_INTERVAL = 10  # seconds
+    STREAM_MAX_LAG = 5  # publishes a streaming client may fall behind before it is dropped
+    
+    # Outbound HTTP
+    HTTP_TIMEOUT = 15  # seconds
+    HTTP_MAX_CONNECTIONS = 100
+    HTTP_MAX_CONNECTIONS_PER_HOST = 10
+    COINGECKO_RATE_LIMIT = float(os.getenv("COINGECKO_RATE_LIMIT", "0.5"))  # requests per second
+    COINGECKO_BURST = int(os.getenv("COINGECKO_BURST", "5"))
+    ONBOARDING_CONCURRENCY = 8
+    EXCHANGE_FETCH_TIMEOUT = 8  # seconds per venue
+    CATALOG_MAX_AGE = int(os.getenv("CATALOG_MAX_AGE", "60"))  # seconds before coins/pairs are re-read
+    QUOTE_MAX_AGE = 60  # seconds before a venue quote is considered stale
+    QUOTE_MAX_DEVIATION = 0.05  # max relative distance from the cross-venue median
     MARKET_DATA_UPDATE_INTERVAL = 60  # seconds
     TOKEN_INFO_UPDATE_INTERVAL = 3600  # 1 hour
 
@@ -176,6 +196,7 @@ class AddCoinRequest(BaseModel):
     blockchain: Blockchain
     contract_address: Optional[str] = None
     decimals: int = 18
+    coingecko_id: Optional[str] = None
     logo_url: Optional[str] = None
     description: Optional[str] = None
     website: Optional[str] = None
@@ -201,21 +222,904 @@ class PriceUpdateRequest(BaseModel):
     volume_24h: Optional[Decimal] = None
     price_change_24h: Optional[Decimal] = None
 
+class LatencyHistogram:
+    """Cumulative latency histogram with fixed bucket bounds (seconds)"""
+    
+    DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+    
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+    
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+    
+    def snapshot(self) -> Dict[str, Any]:
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(list(self.buckets) + ["+Inf"], self.counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        return {"buckets": buckets, "count": self.count, "sum": round(self.total, 6)}
+
+class ExchangeTickerFetcher:
+    """Fetches tickers from all venues concurrently with per-venue timeouts.
+    
+    Async ccxt clients (``ccxt.async_support``) are awaited directly, so a
+    timeout cancels the request itself. Blocking clients run on a bounded
+    thread pool; a timeout cannot interrupt their thread, so their own ccxt
+    ``timeout`` is capped to ours and a venue whose last call is still
+    running is skipped instead of taking another worker. A full refresh
+    costs the slowest venue rather than the sum of all of them.
+    """
+    
+    def __init__(self, timeout: float = config.EXCHANGE_FETCH_TIMEOUT, max_workers: int = 8):
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ticker-fetch")
+        self.latency: Dict[str, LatencyHistogram] = {}
+        self.failures: Dict[str, int] = {}
+        self.busy: Set[str] = set()
+    
+    def _submit(self, name: str, exchange) -> asyncio.Future:
+        """Run a blocking client's fetch on the pool, marking the venue busy until it returns"""
+        timeout_ms = int(self.timeout * 1000)
+        if getattr(exchange, "timeout", None) is not None and exchange.timeout > timeout_ms:
+            exchange.timeout = timeout_ms  # ccxt timeouts are in milliseconds
+        loop = asyncio.get_running_loop()
+        self.busy.add(name)
+        future = self.executor.submit(exchange.fetch_tickers)
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self.busy.discard, name))
+        return asyncio.wrap_future(future)
+    
+    async def fetch(self, exchange) -> Optional[Dict[str, Dict]]:
+        """Fetch one venue's tickers, or None on error or timeout"""
+        name = getattr(exchange, "id", None) or exchange.name
+        if name in self.busy:
+            self.failures[name] = self.failures.get(name, 0) + 1
+            logger.warning(f"Skipping {name}: its previous ticker fetch is still running")
+            return None
+        started = time.monotonic()
+        try:
+            if asyncio.iscoroutinefunction(exchange.fetch_tickers):
+                call = exchange.fetch_tickers()
+            else:
+                call = self._submit(name, exchange)
+            return await asyncio.wait_for(call, timeout=self.timeout)
+        except asyncio.TimeoutError:
+            self.failures[name] = self.failures.get(name, 0) + 1
+            logger.warning(f"Timed out fetching tickers from {name} after {self.timeout}s")
+        except Exception as e:
+            self.failures[name] = self.failures.get(name, 0) + 1
+            logger.error(f"Error fetching tickers from {name}: {e}")
+        finally:
+            self.latency.setdefault(name, LatencyHistogram()).observe(time.monotonic() - started)
+        return None
+    
+    async def fetch_all(self, exchanges: List[Any]) -> Dict[str, Dict[str, Dict]]:
+        """Fetch every venue in parallel; venues that fail are left out"""
+        results = await asyncio.gather(*(self.fetch(exchange) for exchange in exchanges))
+        return {
+            getattr(exchange, "id", None) or exchange.name: tickers
+            for exchange, tickers in zip(exchanges, results)
+            if tickers is not None
+        }
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            venue: {"latency": histogram.snapshot(), "failures": self.failures.get(venue, 0)}
+            for venue, histogram in self.latency.items()
+        }
+
+def normalize_symbol(symbol: str) -> Optional[str]:
+    """Map a ccxt unified spot symbol (``BTC/USDT``) to ours
+    
+    Derivatives carry a settle suffix (``BTC/USDT:USDT``) and trade at a
+    basis to spot, so they map to None rather than onto the spot symbol.
+    """
+    if ":" in symbol:
+        return None
+    return symbol.replace("/", "").upper()
+
+@dataclass
+class ReferencePrice:
+    symbol: str
+    price: float
+    change_24h: float
+    volume_24h: float
+    sources: int
+
+class ReferencePriceEngine:
+    """Consolidates one refresh cycle of per-venue quotes into a reference price.
+    
+    All quotes for the cycle are flattened into arrays and processed in one
+    vectorized pass: stale quotes are dropped, quotes further than
+    ``max_deviation`` from the per-symbol median are rejected as outliers,
+    and the survivors are combined into a quote-volume weighted price. A
+    symbol whose surviving venues report no volume, or whose venues all
+    disagree, falls back to the median.
+    
+    Venues in ``median_only`` (aggregators such as CoinGecko, whose volume
+    is global rather than their own) vote on the median but carry no VWAP
+    weight and are left out of the volume total.
+    """
+    
+    def __init__(self, max_age: float = config.QUOTE_MAX_AGE,
+                 max_deviation: float = config.QUOTE_MAX_DEVIATION,
+                 median_only: Set[str] = frozenset()):
+        self.max_age = max_age
+        self.max_deviation = max_deviation
+        self.median_only = set(median_only)
+        self.dropped = 0
+        self.stale = 0
+        self.outliers = 0
+    
+    def compute(self, venue_tickers: Dict[str, Dict[str, Dict]], listed_symbols: Set[str],
+                now: Optional[float] = None) -> List[ReferencePrice]:
+        """Reduce ``{venue: {ccxt_symbol: ticker}}`` to one price per listed symbol"""
+        now = time.time() if now is None else now
+        symbol_ids: Dict[str, int] = {}
+        rows = []
+        for venue, tickers in venue_tickers.items():
+            counted = 0.0 if venue in self.median_only else 1.0
+            for raw_symbol, ticker in tickers.items():
+                symbol = normalize_symbol(raw_symbol)
+                price = ticker.get('last')
+                if symbol not in listed_symbols or not price or price <= 0:
+                    self.dropped += 1
+                    continue
+                timestamp = ticker.get('timestamp')
+                rows.append((
+                    symbol_ids.setdefault(symbol, len(symbol_ids)),
+                    price,
+                    ticker.get('quoteVolume') or 0,
+                    ticker.get('percentage') or 0,
+                    now - timestamp / 1000 if timestamp else 0.0,
+                    counted,
+                ))
+        if not rows:
+            return []
+        
+        data = np.array(rows, dtype=np.float64)
+        fresh = data[:, 4] <= self.max_age
+        self.stale += int((~fresh).sum())
+        data = data[fresh]
+        if not len(data):
+            return []
+        
+        # Sort by (symbol, price) so each symbol is a contiguous, ordered run
+        data = data[np.lexsort((data[:, 1], data[:, 0]))]
+        groups = data[:, 0].astype(np.int64)
+        prices, changes = data[:, 1], data[:, 3]
+        volumes = data[:, 2] * data[:, 5]
+        present, starts, counts = np.unique(groups, return_index=True, return_counts=True)
+        medians = (prices[starts + (counts - 1) // 2] + prices[starts + counts // 2]) / 2
+        
+        n = len(symbol_ids)
+        median_of = np.zeros(n)
+        median_of[present] = medians
+        inlier = np.abs(prices - median_of[groups]) <= self.max_deviation * median_of[groups]
+        self.outliers += int((~inlier).sum())
+        
+        weights = np.where(inlier, volumes, 0.0)
+        weight_sum = np.bincount(groups, weights=weights, minlength=n)
+        vwap = np.bincount(groups, weights=weights * prices, minlength=n)
+        change = np.bincount(groups, weights=weights * changes, minlength=n)
+        has_weight = weight_sum > 0
+        safe = np.where(has_weight, weight_sum, 1.0)
+        price_out = np.where(has_weight, vwap / safe, median_of)
+        
+        inlier_count = np.bincount(groups, weights=inlier.astype(np.float64), minlength=n)
+        plain_change = np.bincount(groups, weights=np.where(inlier, changes, 0.0), minlength=n)
+        change_out = np.where(
+            has_weight, change / safe, plain_change / np.maximum(inlier_count, 1)
+        )
+        sources = np.where(inlier_count > 0, inlier_count, np.bincount(groups, minlength=n))
+        total_volume = np.bincount(groups, weights=volumes, minlength=n)
+        
+        names = list(symbol_ids)
+        return [
+            ReferencePrice(
+                symbol=names[i],
+                price=float(price_out[i]),
+                change_24h=float(change_out[i]),
+                volume_24h=float(total_volume[i]),
+                sources=int(sources[i]),
+            )
+            for i in present
+        ]
+
+PRICE_SNAPSHOT_KEY = "prices:snapshot"
+PRICE_SNAPSHOT_ETAG_KEY = "prices:snapshot:etag"
+
+class PriceSnapshot:
+    """Pre-encoded ``GET /api/v1/prices`` body with a content-derived ETag.
+    
+    Entries expire ``ttl`` seconds after they were last published, matching
+    the TTL of the per-symbol ``price:{symbol}`` keys. Expiry only runs on
+    ``update``, so readers go through ``current``, which withholds the whole
+    body once no update has landed for ``ttl`` seconds.
+    """
+    
+    def __init__(self, ttl: int = 300):
+        self.ttl = ttl
+        self.prices: Dict[str, Dict[str, Any]] = {}
+        self.expires: Dict[str, float] = {}
+        self.body: Optional[bytes] = None
+        self.etag: Optional[str] = None
+        self.updated_at: Optional[float] = None
+    
+    def current(self) -> Tuple[Optional[bytes], Optional[str]]:
+        """Body and ETag, or ``(None, None)`` if missing or older than ``ttl``"""
+        if self.updated_at is None or time.monotonic() - self.updated_at > self.ttl:
+            return None, None
+        return self.body, self.etag
+    
+    def update(self, entries: Dict[str, Dict[str, Any]]):
+        now = time.monotonic()
+        self.updated_at = now
+        for symbol in [s for s, expires in self.expires.items() if expires <= now]:
+            del self.prices[symbol]
+            del self.expires[symbol]
+        
+        self.prices.update(entries)
+        for symbol in entries:
+            self.expires[symbol] = now + self.ttl
+        
+        self.body = json.dumps({"prices": self.prices}).encode()
+        self.etag = f'"{hashlib.blake2b(self.body, digest_size=8).hexdigest()}"'
+
+class PriceSubscription:
+    """A streaming client's symbols and its conflated, undelivered updates"""
+    
+    def __init__(self):
+        self.symbols: Set[str] = set()
+        self.pending: Dict[str, Dict[str, Any]] = {}
+        self.ready = asyncio.Event()
+        self.lag = 0
+        self.closed = False
+        self.evicted = False
+        self.conflated = 0
+    
+    def push(self, updates: Dict[str, Dict[str, Any]]):
+        self.conflated += len(self.pending.keys() & updates.keys())
+        self.pending.update(updates)
+        self.ready.set()
+    
+    async def next(self) -> Optional[Dict[str, Dict[str, Any]]]:
+        """Wait for updates; returns None once the subscription is closed"""
+        await self.ready.wait()
+        self.ready.clear()
+        if self.closed:
+            return None
+        updates, self.pending = self.pending, {}
+        self.lag = 0
+        return updates
+
+class PriceStreamHub:
+    """Fans published prices out to streaming subscribers.
+    
+    Subscriptions are indexed by symbol (``*`` subscribes to everything), so
+    a publish only touches interested clients. Updates a client has not yet
+    sent are conflated latest-value-wins per symbol; a client that is still
+    behind after ``max_lag`` publishes is evicted rather than buffered.
+    """
+    
+    WILDCARD = "*"
+    
+    def __init__(self, max_lag: int = config.STREAM_MAX_LAG):
+        self.max_lag = max_lag
+        self.by_symbol: Dict[str, Set[PriceSubscription]] = {}
+        self.subscriptions: Set[PriceSubscription] = set()
+        self.evicted = 0
+    
+    def open(self) -> PriceSubscription:
+        subscription = PriceSubscription()
+        self.subscriptions.add(subscription)
+        return subscription
+    
+    def close(self, subscription: PriceSubscription):
+        self.unsubscribe(subscription, list(subscription.symbols))
+        self.subscriptions.discard(subscription)
+        subscription.closed = True
+        subscription.ready.set()
+    
+    def subscribe(self, subscription: PriceSubscription, symbols: List[str],
+                  current: Optional[Dict[str, Dict[str, Any]]] = None):
+        """Subscribe to ``symbols``, pushing their ``current`` values straight away"""
+        symbols = {symbol.upper() for symbol in symbols}
+        for symbol in symbols - subscription.symbols:
+            self.by_symbol.setdefault(symbol, set()).add(subscription)
+        subscription.symbols |= symbols
+        
+        if current:
+            if self.WILDCARD in symbols:
+                initial = dict(current)
+            else:
+                initial = {symbol: current[symbol] for symbol in symbols if symbol in current}
+            if initial:
+                subscription.push(initial)
+    
+    def unsubscribe(self, subscription: PriceSubscription, symbols: List[str]):
+        for symbol in {symbol.upper() for symbol in symbols} & subscription.symbols:
+            subscribers = self.by_symbol.get(symbol)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self.by_symbol[symbol]
+            subscription.symbols.discard(symbol)
+    
+    def broadcast(self, entries: Dict[str, Dict[str, Any]]):
+        deliveries: Dict[PriceSubscription, Dict[str, Dict[str, Any]]] = {}
+        for subscription in self.by_symbol.get(self.WILDCARD, ()):
+            deliveries[subscription] = dict(entries)
+        for symbol, entry in entries.items():
+            for subscription in self.by_symbol.get(symbol, ()):
+                deliveries.setdefault(subscription, {})[symbol] = entry
+        
+        for subscription, updates in deliveries.items():
+            if subscription.pending:
+                subscription.lag += 1
+                if subscription.lag > self.max_lag:
+                    subscription.evicted = True
+                    self.evicted += 1
+                    self.close(subscription)
+                    continue
+            subscription.push(updates)
+    
+    def metrics(self) -> Dict[str, int]:
+        return {
+            "subscribers": len(self.subscriptions),
+            "symbols": len(self.by_symbol),
+            "evicted": self.evicted
+        }
+
+class PriceBatchPublisher:
+    """Publishes a refresh cycle's prices in two round-trips.
+    
+    Prices are written to Redis through a single pipeline and applied to
+    ``trading_pairs`` with one ``UPDATE ... FROM unnest(...)`` statement.
+    The same pipeline stores the full pre-encoded snapshot so other replicas
+    can serve all prices with one ``MGET``.
+    """
+    
+    def __init__(self, redis_client=None, db_pool=None, ttl: int = 300):
+        self.redis_client = redis_client
+        self.db_pool = db_pool
+        self.ttl = ttl
+        self.listed_symbols: Set[str] = set()
+        self.snapshot = PriceSnapshot(ttl)
+        self.stream = PriceStreamHub()
+        self.published = 0
+    
+    async def refresh_listed_symbols(self):
+        async with self.db_pool.acquire() as conn:
+            rows = await conn.fetch("SELECT DISTINCT symbol FROM trading_pairs")
+        self.listed_symbols = {row['symbol'] for row in rows}
+    
+    async def publish(self, prices: List[ReferencePrice]) -> int:
+        """Write all prices to Redis and the database; returns rows published"""
+        if not prices:
+            return 0
+        
+        now = datetime.now()
+        timestamp = now.isoformat()
+        entries = {
+            quote.symbol: {
+                "symbol": quote.symbol,
+                "price": quote.price,
+                "change_24h": quote.change_24h,
+                "volume_24h": quote.volume_24h,
+                "sources": quote.sources,
+                "timestamp": timestamp
+            }
+            for quote in prices
+        }
+        self.snapshot.update(entries)
+        self.stream.broadcast(entries)
+        
+        pipe = self.redis_client.pipeline(transaction=False)
+        for symbol, entry in entries.items():
+            pipe.setex(f"price:{symbol}", self.ttl, json.dumps(entry))
+        pipe.setex(PRICE_SNAPSHOT_KEY, self.ttl, self.snapshot.body)
+        pipe.setex(PRICE_SNAPSHOT_ETAG_KEY, self.ttl, self.snapshot.etag)
+        await pipe.execute()
+        
+        async with self.db_pool.acquire() as conn:
+            await conn.execute("""
+                UPDATE trading_pairs AS tp
+                SET current_price = u.price, price_change_24h = u.change_24h,
+                    volume_24h = u.volume_24h, updated_at = $5
+                FROM unnest($1::text[], $2::numeric[], $3::numeric[], $4::numeric[])
+                    AS u(symbol, price, change_24h, volume_24h)
+                WHERE tp.symbol = u.symbol
+            """,
+                [quote.symbol for quote in prices],
+                [Decimal(str(quote.price)) for quote in prices],
+                [Decimal(str(quote.change_24h)) for quote in prices],
+                [Decimal(str(quote.volume_24h)) for quote in prices],
+                now
+            )
+        
+        self.published += len(prices)
+        return len(prices)
+
+class TokenBucket:
+    """Async token bucket; ``acquire`` waits until a request may be sent"""
+    
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    async def acquire(self):
+        async with self.lock:
+            self._refill()
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+    
+    def pause(self, seconds: float):
+        """Drain the bucket so nothing is sent for ``seconds`` (e.g. after a 429)"""
+        self._refill()
+        self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+class PooledHTTPClient:
+    """Shared aiohttp session for external market-data APIs.
+    
+    One keep-alive connection pool (with DNS caching and a per-host
+    connection cap) is reused for every call, and hosts registered with
+    ``set_rate_limit`` are throttled through a token bucket that also
+    honours ``Retry-After`` on 429 responses.
+    """
+    
+    def __init__(self, timeout: float = config.HTTP_TIMEOUT,
+                 limit: int = config.HTTP_MAX_CONNECTIONS,
+                 limit_per_host: int = config.HTTP_MAX_CONNECTIONS_PER_HOST):
+        self.timeout = timeout
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.requests = 0
+        self.throttled = 0
+    
+    def set_rate_limit(self, host: str, rate: float, burst: int):
+        self.buckets[host] = TokenBucket(rate, burst)
+    
+    async def start(self):
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit, limit_per_host=self.limit_per_host, ttl_dns_cache=300
+            )
+            self.session = aiohttp.ClientSession(
+                connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+    
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+    
+    async def request_json(self, method: str, url: str, **kwargs) -> Optional[Any]:
+        """Send a request and decode JSON; returns None on a non-200 response"""
+        await self.start()
+        bucket = self.buckets.get(urlsplit(url).hostname)
+        if bucket is not None:
+            await bucket.acquire()
+        
+        self.requests += 1
+        async with self.session.request(method, url, **kwargs) as response:
+            if response.status == 429 and bucket is not None:
+                self.throttled += 1
+                retry_after = response.headers.get("Retry-After", "")
+                bucket.pause(float(retry_after) if retry_after.isdigit() else 60)
+            if response.status != 200:
+                logger.warning(f"{method} {url} returned {response.status}")
+                return None
+            return await response.json()
+    
+    async def get_json(self, url: str, params: Optional[Dict[str, str]] = None,
+                       headers: Optional[Dict[str, str]] = None) -> Optional[Any]:
+        return await self.request_json("GET", url, params=params, headers=headers)
+    
+    async def post_json(self, url: str, payload: Any) -> Optional[Any]:
+        return await self.request_json("POST", url, json=payload)
+    
+    def metrics(self) -> Dict[str, int]:
+        return {"requests": self.requests, "throttled": self.throttled}
+
+class TokenMetadataFetcher:
+    """Reads ERC-20 ``totalSupply`` and ``decimals`` with batched JSON-RPC calls.
+    
+    Each chain's ``eth_call``s go out as JSON-RPC batch requests of up to
+    ``batch_size`` calls over the shared HTTP client, and chains are queried
+    in parallel. ``decimals`` never changes for a deployed token, so it is
+    cached per (chain, address) and only requested once.
+    """
+    
+    TOTAL_SUPPLY = "0x18160ddd"  # totalSupply()
+    DECIMALS = "0x313ce567"  # decimals()
+    
+    def __init__(self, http: "PooledHTTPClient", rpc_urls: Dict[str, str], batch_size: int = 100):
+        self.http = http
+        self.rpc_urls = rpc_urls
+        self.batch_size = batch_size
+        self.decimals: Dict[Tuple[str, str], int] = {}
+        self.batches = 0
+    
+    async def call_batch(self, url: str, calls: List[Tuple[str, str]]) -> List[Optional[int]]:
+        """eth_call each (address, selector) at ``latest``; None where a call failed"""
+        results: List[Optional[int]] = [None] * len(calls)
+        for start in range(0, len(calls), self.batch_size):
+            chunk = calls[start:start + self.batch_size]
+            payload = [
+                {"jsonrpc": "2.0", "id": start + i, "method": "eth_call",
+                 "params": [{"to": address, "data": selector}, "latest"]}
+                for i, (address, selector) in enumerate(chunk)
+            ]
+            self.batches += 1
+            responses = await self.http.post_json(url, payload)
+            if not isinstance(responses, list):
+                continue
+            ids = range(start, start + len(chunk))
+            for response in responses:
+                # Nodes answer errors with a null id and reverts with "0x" or no result
+                if not isinstance(response, dict) or response.get("id") not in ids:
+                    continue
+                value = response.get("result")
+                if isinstance(value, str) and value not in ("", "0x"):
+                    results[response["id"]] = int(value, 16)
+        return results
+    
+    async def fetch_chain(self, chain: str, addresses: List[str]) -> Dict[str, Tuple[int, int]]:
+        """Map each address to (total_supply, decimals), skipping failed reads"""
+        url = self.rpc_urls[chain]
+        calls = [(address, self.TOTAL_SUPPLY) for address in addresses]
+        uncached = [address for address in addresses if (chain, address.lower()) not in self.decimals]
+        calls += [(address, self.DECIMALS) for address in uncached]
+        
+        values = await self.call_batch(url, calls)
+        for address, decimals in zip(uncached, values[len(addresses):]):
+            if decimals is not None:
+                self.decimals[(chain, address.lower())] = decimals
+        
+        metadata = {}
+        for address, total_supply in zip(addresses, values[:len(addresses)]):
+            decimals = self.decimals.get((chain, address.lower()))
+            if total_supply is not None and decimals is not None:
+                metadata[address] = (total_supply, decimals)
+        return metadata
+    
+    async def fetch_all(self, tokens: Dict[str, List[str]]) -> Dict[Tuple[str, str], Tuple[int, int]]:
+        """Fetch ``{chain: [address, ...]}`` across all chains in parallel"""
+        chains = [chain for chain in tokens if chain in self.rpc_urls]
+        results = await asyncio.gather(
+            *(self.fetch_chain(chain, tokens[chain]) for chain in chains), return_exceptions=True
+        )
+        
+        metadata = {}
+        for chain, result in zip(chains, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error fetching token metadata on {chain}: {result}")
+                continue
+            for address, values in result.items():
+                metadata[(chain, address)] = values
+        return metadata
+
+class CatalogIndex:
+    """In-memory table with equality indexes and a precomputed sort order.
+    
+    ``fields`` are indexed value -> row ids (``multi_fields`` hold lists, e.g.
+    ``supported_trading_types``). Filtered listings intersect the smallest
+    index sets and page by keyset: the cursor is the opaque sort key of the
+    last row returned, so pages stay stable while rows are re-ranked.
+    """
+    
+    def __init__(self, fields: Tuple[str, ...], sort_key: Callable[[Dict[str, Any]], tuple],
+                 multi_fields: Tuple[str, ...] = ()):
+        self.fields = fields
+        self.multi_fields = multi_fields
+        self.sort_key = sort_key
+        self.rows: Dict[Any, Dict[str, Any]] = {}
+        self.indexes: Dict[str, Dict[Any, Set[Any]]] = {}
+        self.keys: Dict[Any, tuple] = {}
+        self.order: List[Any] = []
+        self.order_keys: List[tuple] = []
+        self.ordered = True
+    
+    def load(self, rows: List[Dict[str, Any]]):
+        self.rows = {row["id"]: row for row in rows}
+        self.indexes = {field: {} for field in self.fields + self.multi_fields}
+        for row_id, row in self.rows.items():
+            for field in self.fields:
+                self.indexes[field].setdefault(row.get(field), set()).add(row_id)
+            for field in self.multi_fields:
+                for value in row.get(field) or ():
+                    self.indexes[field].setdefault(value, set()).add(row_id)
+        self.ordered = False
+    
+    def update(self, row_ids: Set[Any], changes: Dict[str, Any]):
+        """Apply non-indexed column changes; the sort order is rebuilt lazily"""
+        for row_id in row_ids:
+            self.rows[row_id].update(changes)
+        self.ordered = False
+    
+    def lookup(self, field: str, value: Any) -> Set[Any]:
+        return self.indexes.get(field, {}).get(value, set())
+    
+    def _ensure_order(self):
+        if not self.ordered:
+            self.keys = {row_id: self.sort_key(row) for row_id, row in self.rows.items()}
+            self.order = sorted(self.rows, key=self.keys.__getitem__)
+            self.order_keys = [self.keys[row_id] for row_id in self.order]
+            self.ordered = True
+    
+    @staticmethod
+    def encode_cursor(key: tuple) -> str:
+        return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+    
+    @staticmethod
+    def decode_cursor(cursor: str) -> tuple:
+        try:
+            key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except ValueError:
+            raise ValueError("Invalid cursor")
+        if not isinstance(key, list):
+            raise ValueError("Invalid cursor")
+        return tuple(key)
+    
+    def query(self, filters: Dict[str, Any], limit: int, offset: int = 0,
+              cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Rows matching all ``filters`` in sort order, plus the next page's cursor"""
+        self._ensure_order()
+        filters = {field: value for field, value in filters.items() if value is not None}
+        
+        if filters:
+            candidates = sorted(
+                (self.lookup(field, value) for field, value in filters.items()), key=len
+            )
+            matched = set.intersection(*candidates) if candidates[0] else set()
+            ids = sorted(matched, key=self.keys.__getitem__)
+            keys = [self.keys[row_id] for row_id in ids]
+        else:
+            ids, keys = self.order, self.order_keys
+        
+        start = offset
+        if cursor:
+            try:
+                start = bisect.bisect_right(keys, self.decode_cursor(cursor))
+            except TypeError:
+                raise ValueError("Invalid cursor")
+        page = ids[start:start + limit]
+        next_cursor = None
+        if page and start + limit < len(ids):
+            next_cursor = self.encode_cursor(self.keys[page[-1]])
+        return [self.rows[row_id] for row_id in page], next_cursor
+
+def _coin_sort_key(row: Dict[str, Any]) -> tuple:
+    # market_cap_rank NULLS LAST, market_cap DESC
+    rank = row.get("market_cap_rank")
+    return (rank is None, rank or 0, -float(row.get("market_cap") or 0), str(row["id"]))
+
+def _pair_sort_key(row: Dict[str, Any]) -> tuple:
+    # volume_24h DESC
+    return (-float(row.get("volume_24h") or 0), str(row["id"]))
+
+class CoinCatalog:
+    """Active coins and trading pairs served from memory.
+    
+    Loaded lazily and reloaded after ``invalidate`` (called on every coin or
+    pair write made through this process) or once it is ``max_age`` seconds
+    old, which is how writes from other replicas and the admin services show
+    up. Both tables are small, so a reload is a full read. Published prices
+    are applied in place so the volume ordering of pairs tracks the price
+    loop without a reload.
+    """
+    
+    def __init__(self, max_age: float = config.CATALOG_MAX_AGE):
+        self.coins = CatalogIndex(("asset_type", "blockchain"), _coin_sort_key,
+                                  multi_fields=("supported_trading_types",))
+        self.pairs = CatalogIndex(("trading_type", "base_asset", "quote_asset", "symbol"), _pair_sort_key)
+        self.max_age = max_age
+        self.loaded = False
+        self.loaded_at = 0.0
+        self.lock = asyncio.Lock()
+        self.reloads = 0
+    
+    def invalidate(self):
+        self.loaded = False
+    
+    def is_fresh(self) -> bool:
+        return self.loaded and time.monotonic() - self.loaded_at < self.max_age
+    
+    async def ensure_loaded(self, db_pool):
+        if self.is_fresh():
+            return
+        async with self.lock:
+            if self.is_fresh():
+                return
+            started = time.monotonic()
+            async with db_pool.acquire() as conn:
+                coins = await conn.fetch("SELECT * FROM coins WHERE market_status = 'active'")
+                pairs = await conn.fetch("SELECT * FROM trading_pairs WHERE status = 'active'")
+            self.coins.load([dict(coin) for coin in coins])
+            self.pairs.load([dict(pair) for pair in pairs])
+            self.loaded = True
+            self.loaded_at = started
+            self.reloads += 1
+    
+    def apply_prices(self, prices: List["ReferencePrice"]):
+        for quote in prices:
+            row_ids = self.pairs.lookup("symbol", quote.symbol)
+            if row_ids:
+                self.pairs.update(row_ids, {
+                    "current_price": quote.price,
+                    "price_change_24h": quote.change_24h,
+                    "volume_24h": quote.volume_24h
+                })
+
+# Used until (and in addition to) the ids stored on the coins table
+FALLBACK_COINGECKO_IDS = {
+    "BTC": "bitcoin",
+    "ETH": "ethereum",
+    "BNB": "binancecoin",
+    "SOL": "solana",
+    "ADA": "cardano",
+    "AVAX": "avalanche-2",
+    "DOT": "polkadot",
+    "MATIC": "matic-network",
+    "USDT": "tether",
+    "USDC": "usd-coin",
+    "BUSD": "binance-usd",
+    "UNI": "uniswap",
+    "AAVE": "aave",
+    "COMP": "compound-governance-token",
+    "SUSHI": "sushi",
+    "LINK": "chainlink",
+    "LTC": "litecoin",
+    "BCH": "bitcoin-cash",
+    "XRP": "ripple",
+    "DOGE": "dogecoin",
+    "SHIB": "shiba-inu",
+    "TRX": "tron",
+    "TON": "the-open-network",
+    "PI": "pi-network"
+}
+
+class CoinGeckoRegistry:
+    """Bidirectional symbol <-> CoinGecko id map.
+    
+    Starts from ``FALLBACK_COINGECKO_IDS``; ``load`` overlays the ids stored
+    on the coins table and ``register`` applies new coins as they are added.
+    """
+    
+    def __init__(self, fallback: Dict[str, str] = FALLBACK_COINGECKO_IDS):
+        self.fallback = fallback
+        self.by_symbol: Dict[str, str] = {}
+        self.by_id: Dict[str, str] = {}
+        self.reset()
+    
+    def reset(self):
+        self.by_symbol = {}
+        self.by_id = {}
+        for symbol, coingecko_id in self.fallback.items():
+            self.register(symbol, coingecko_id)
+    
+    def register(self, symbol: str, coingecko_id: Optional[str]):
+        if not coingecko_id:
+            return
+        previous = self.by_symbol.get(symbol)
+        if previous is not None and self.by_id.get(previous) == symbol:
+            del self.by_id[previous]
+        self.by_symbol[symbol] = coingecko_id
+        self.by_id[coingecko_id] = symbol
+    
+    def resolve(self, symbols: List[str]) -> Dict[str, str]:
+        """CoinGecko ids for every symbol that has one"""
+        by_symbol = self.by_symbol
+        return {symbol: by_symbol[symbol] for symbol in symbols if symbol in by_symbol}
+    
+    async def load(self, db_pool):
+        """Rebuild from the fallback plus the ids stored on the coins table"""
+        try:
+            async with db_pool.acquire() as conn:
+                rows = await conn.fetch(
+                    "SELECT symbol, coingecko_id FROM coins WHERE coingecko_id IS NOT NULL"
+                )
+        except Exception as e:
+            logger.warning(f"Could not load CoinGecko ids from coins table, using fallback: {e}")
+            return
+        
+        self.reset()
+        for row in rows:
+            self.register(row['symbol'], row['coingecko_id'])
+
+COIN_COLUMNS = (
+    "symbol", "name", "asset_type", "blockchain", "contract_address",
+    "decimals", "total_supply", "circulating_supply", "max_supply",
+    "market_cap", "current_price", "price_change_24h", "volume_24h",
+    "market_cap_rank", "logo_url", "description", "website",
+    "whitepaper", "github", "twitter", "telegram", "discord", "reddit",
+    "is_verified", "listing_date", "supported_trading_types",
+    "market_status", "created_at", "updated_at", "coingecko_id"
+)
+
+TRADING_PAIR_COLUMNS = (
+    "base_asset", "quote_asset", "symbol", "trading_type", "status",
+    "min_quantity", "max_quantity", "step_size", "min_price", "max_price",
+    "tick_size", "min_notional", "maker_fee", "taker_fee",
+    "current_price", "price_change_24h", "volume_24h", "high_24h", "low_24h",
+    "created_at", "updated_at"
+)
+
 # Popular Coins Manager
 class PopularCoinsManager:
     def __init__(self):
         self.redis_client = None
         self.db_pool = None
-        self.web3_clients = {}
         self.solana_client = None
         self.price_feeds = {}
         self.supported_exchanges = []
-        
-        # Initialize blockchain clients
-        asyncio.create_task(self.initialize_clients())
-        
-        # Start background tasks
-        asyncio.create_task(self.start_background_tasks())
+        self.ticker_fetcher = ExchangeTickerFetcher()
+        self.price_publisher = PriceBatchPublisher()
+        self.reference_prices = ReferencePriceEngine(median_only={"coingecko"})
+        self.catalog = CoinCatalog()
+        self.coingecko_ids = CoinGeckoRegistry()
+        self.coin_columns = COIN_COLUMNS
+        self.http = PooledHTTPClient()
+        self.http.set_rate_limit("api.coingecko.com", config.COINGECKO_RATE_LIMIT, config.COINGECKO_BURST)
+        self.token_metadata = TokenMetadataFetcher(self.http, {
+            Blockchain.ETHEREUM.value: config.ETHEREUM_RPC,
+            Blockchain.BINANCE_SMART_CHAIN.value: config.BSC_RPC,
+            Blockchain.POLYGON.value: config.POLYGON_RPC,
+            Blockchain.AVALANCHE.value: config.AVALANCHE_RPC
+        })
+    
+    async def start(self):
+        """Initialize clients, then start the background loops"""
+        await self.http.start()
+        await self.initialize_clients()
+        if self.db_pool is not None:
+            await self.detect_coin_columns()
+            if "coingecko_id" in self.coin_columns:
+                await self.coingecko_ids.load(self.db_pool)
+        await self.start_background_tasks()
+    
+    async def detect_coin_columns(self):
+        """Leave ``coingecko_id`` out of coin writes on databases that predate it"""
+        try:
+            async with self.db_pool.acquire() as conn:
+                present = await conn.fetchval("""
+                    SELECT EXISTS (
+                        SELECT 1 FROM information_schema.columns
+                        WHERE table_name = 'coins' AND column_name = 'coingecko_id'
+                    )
+                """)
+        except Exception as e:
+            logger.warning(f"Could not inspect the coins table: {e}")
+            return
+        if not present:
+            logger.warning("coins.coingecko_id is missing, run the database migrations; "
+                           "using the fallback CoinGecko ids until then")
+            self.coin_columns = tuple(column for column in COIN_COLUMNS if column != "coingecko_id")
+    
+    async def stop(self):
+        await self.http.close()
+        await asyncio.gather(*(exchange.close() for exchange in self.supported_exchanges),
+                             return_exceptions=True)
+        self.ticker_fetcher.executor.shutdown(wait=False)
     
     async def initialize_clients(self):
         """Initialize blockchain and external API clients"""
@@ -225,27 +1129,23 @@ class PopularCoinsManager:
             
             # Database pool
             self.db_pool = await asyncpg.create_pool(config.DATABASE_URL)
-            
-            # Web3 clients
-            self.web3_clients = {
-                Blockchain.ETHEREUM: Web3(Web3.HTTPProvider(config.ETHEREUM_RPC)),
-                Blockchain.BINANCE_SMART_CHAIN: Web3(Web3.HTTPProvider(config.BSC_RPC)),
-                Blockchain.POLYGON: Web3(Web3.HTTPProvider(config.POLYGON_RPC)),
-                Blockchain.AVALANCHE: Web3(Web3.HTTPProvider(config.AVALANCHE_RPC))
-            }
+            self.price_publisher.redis_client = self.redis_client
+            self.price_publisher.db_pool = self.db_pool
             
             # Solana client
             self.solana_client = SolanaClient(config.SOLANA_RPC)
             
             # Initialize supported exchanges
+            # Async clients, so a per-venue timeout cancels the HTTP request
+            exchange_options = {"timeout": int(config.EXCHANGE_FETCH_TIMEOUT * 1000)}
             self.supported_exchanges = [
-                ccxt.binance(),
-                ccxt.okx(),
-                ccxt.bybit(),
-                ccxt.kucoin(),
-                ccxt.gateio(),
-                ccxt.mexc(),
-                ccxt.bitget()
+                ccxt_async.binance(exchange_options),
+                ccxt_async.okx(exchange_options),
+                ccxt_async.bybit(exchange_options),
+                ccxt_async.kucoin(exchange_options),
+                ccxt_async.gateio(exchange_options),
+                ccxt_async.mexc(exchange_options),
+                ccxt_async.bitget(exchange_options)
             ]
             
             logger.info("Blockchain clients initialized successfully")
@@ -522,12 +1422,79 @@ class PopularCoinsManager:
             }
         ]
         
-        for coin_data in popular_coins:
-            try:
-                await self.add_coin_to_database(coin_data)
-                await self.create_default_trading_pairs(coin_data)
-            except Exception as e:
-                logger.error(f"Error adding coin {coin_data['symbol']}: {e}")
+        await self.bootstrap_coins(popular_coins)
+    
+    async def bootstrap_coins(self, coins: List[Dict[str, Any]],
+                              concurrency: int = config.ONBOARDING_CONCURRENCY) -> Dict[str, int]:
+        """Bulk-load coins and their default trading pairs.
+        
+        Coin info is fetched only for symbols not yet listed, with at most
+        ``concurrency`` CoinGecko requests in flight. Both row sets are then
+        COPYed into staging tables and merged with one
+        ``INSERT ... SELECT ... ON CONFLICT DO NOTHING`` each, so existing
+        coins and pairs are left untouched.
+        """
+        async with self.db_pool.acquire() as conn:
+            rows = await conn.fetch(
+                "SELECT symbol FROM coins WHERE symbol = ANY($1::text[])",
+                [coin_data["symbol"] for coin_data in coins]
+            )
+        existing = {row['symbol'] for row in rows}
+        missing = [coin_data for coin_data in coins if coin_data["symbol"] not in existing]
+        
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        async def coin_info(coin_data: Dict[str, Any]) -> Dict[str, Any]:
+            async with semaphore:
+                return await self.fetch_coin_info_from_coingecko(coin_data.get("coingecko_id"))
+        
+        infos = await asyncio.gather(*(coin_info(coin_data) for coin_data in missing))
+        
+        now = datetime.now()
+        coin_records = [
+            self.coin_row(coin_data, info, now) for coin_data, info in zip(missing, infos)
+        ]
+        pair_records = [
+            self.trading_pair_record(coin_data["symbol"], quote_asset, trading_type, now)
+            for coin_data in coins
+            for quote_asset, trading_type in self.default_pair_specs(coin_data)
+        ]
+        
+        async with self.db_pool.acquire() as conn:
+            async with conn.transaction():
+                coins_added = await self.merge_records(conn, "coins", self.coin_columns, ("symbol",), coin_records)
+                pairs_added = await self.merge_records(
+                    conn, "trading_pairs", TRADING_PAIR_COLUMNS, ("symbol", "trading_type"), pair_records
+                )
+        
+        self.catalog.invalidate()
+        for coin_data in coins:
+            self.coingecko_ids.register(coin_data["symbol"], coin_data.get("coingecko_id"))
+        logger.info(f"Bootstrapped {coins_added} coins and {pairs_added} trading pairs")
+        return {"coins": coins_added, "trading_pairs": pairs_added}
+    
+    @staticmethod
+    async def merge_records(conn, table: str, columns: Tuple[str, ...], key: Tuple[str, ...],
+                            records: List[tuple]) -> int:
+        """COPY ``records`` into a staging table and insert the rows whose ``key`` is new"""
+        if not records:
+            return 0
+        
+        staging = f"{table}_staging"
+        column_list = ", ".join(columns)
+        key_list = ", ".join(key)
+        key_match = " AND ".join(f"t.{column} = s.{column}" for column in key)
+        await conn.execute(
+            f"CREATE TEMP TABLE {staging} ON COMMIT DROP AS SELECT {column_list} FROM {table} WITH NO DATA"
+        )
+        await conn.copy_records_to_table(staging, records=records, columns=list(columns))
+        result = await conn.execute(f"""
+            INSERT INTO {table} ({column_list})
+            SELECT DISTINCT ON ({key_list}) {column_list} FROM {staging} s
+            WHERE NOT EXISTS (SELECT 1 FROM {table} t WHERE {key_match})
+            ON CONFLICT DO NOTHING
+        """)
+        return int(result.split()[-1])
     
     async def add_coin_to_database(self, coin_data: Dict[str, Any]):
         """Add coin to database"""
@@ -537,65 +1504,29 @@ class PopularCoinsManager:
                 "SELECT id FROM coins WHERE symbol = $1",
                 coin_data["symbol"]
             )
-            
-            if existing:
-                logger.info(f"Coin {coin_data['symbol']} already exists")
-                return
-            
-            # Get additional data from CoinGecko
-            coin_info = await self.fetch_coin_info_from_coingecko(coin_data.get("coingecko_id"))
-            
+        
+        if existing:
+            logger.info(f"Coin {coin_data['symbol']} already exists")
+            return
+        
+        # Get additional data from CoinGecko without holding a pool connection
+        coin_info = await self.fetch_coin_info_from_coingecko(coin_data.get("coingecko_id"))
+        
+        columns = self.coin_columns
+        async with self.db_pool.acquire() as conn:
             # Insert coin
-            await conn.execute("""
-                INSERT INTO coins (
-                    symbol, name, asset_type, blockchain, contract_address,
-                    decimals, total_supply, circulating_supply, max_supply,
-                    market_cap, current_price, price_change_24h, volume_24h,
-                    market_cap_rank, logo_url, description, website,
-                    whitepaper, github, twitter, telegram, discord, reddit,
-                    is_verified, listing_date, supported_trading_types,
-                    market_status, created_at, updated_at
-                ) VALUES (
-                    $1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13,
-                    $14, $15, $16, $17, $18, $19, $20, $21, $22, $23, $24,
-                    $25, $26, $27, $28, $29
-                )
-            """,
-                coin_data["symbol"],
-                coin_data["name"],
-                coin_data["asset_type"].value,
-                coin_data["blockchain"].value,
-                coin_data.get("contract_address"),
-                coin_data.get("decimals", 18),
-                coin_info.get("total_supply"),
-                coin_info.get("circulating_supply"),
-                coin_info.get("max_supply"),
-                coin_info.get("market_cap"),
-                coin_info.get("current_price", 0),
-                coin_info.get("price_change_24h", 0),
-                coin_info.get("volume_24h", 0),
-                coin_info.get("market_cap_rank"),
-                coin_info.get("logo_url", ""),
-                coin_info.get("description", ""),
-                coin_info.get("website", ""),
-                coin_info.get("whitepaper", ""),
-                coin_info.get("github", ""),
-                coin_info.get("twitter", ""),
-                coin_info.get("telegram", ""),
-                coin_info.get("discord", ""),
-                coin_info.get("reddit", ""),
-                True,  # is_verified
-                datetime.now(),  # listing_date
-                [t.value for t in coin_data["supported_trading_types"]],
-                MarketStatus.ACTIVE.value,
-                datetime.now(),
-                datetime.now()
-            )
+            await conn.execute(f"""
+                INSERT INTO coins ({", ".join(columns)})
+                VALUES ({", ".join(f"${i}" for i in range(1, len(columns) + 1))})
+            """, *self.coin_row(coin_data, coin_info, datetime.now()))
+            self.catalog.invalidate()
+            self.coingecko_ids.register(coin_data["symbol"], coin_data.get("coingecko_id"))
             
             logger.info(f"Added coin {coin_data['symbol']} to database")
     
-    async def create_default_trading_pairs(self, coin_data: Dict[str, Any]):
-        """Create default trading pairs for a coin"""
+    @staticmethod
+    def default_pair_specs(coin_data: Dict[str, Any]) -> List[Tuple[str, TradingType]]:
+        """(quote_asset, trading_type) for each default pair of a coin"""
         base_asset = coin_data["symbol"]
         quote_assets = ["USDT", "USDC", "BTC", "ETH"]
         
@@ -603,19 +1534,78 @@ class PopularCoinsManager:
         if coin_data["asset_type"] == AssetType.STABLECOIN:
             quote_assets = ["BTC", "ETH"]
         
-        for quote_asset in quote_assets:
-            if base_asset == quote_asset:
-                continue
-            
-            for trading_type in coin_data["supported_trading_types"]:
-                try:
-                    await self.create_trading_pair(
-                        base_asset=base_asset,
-                        quote_asset=quote_asset,
-                        trading_type=trading_type
-                    )
-                except Exception as e:
-                    logger.error(f"Error creating trading pair {base_asset}{quote_asset}: {e}")
+        return [
+            (quote_asset, trading_type)
+            for quote_asset in quote_assets
+            if quote_asset != base_asset
+            for trading_type in coin_data["supported_trading_types"]
+        ]
+    
+    def coin_row(self, coin_data: Dict[str, Any], coin_info: Dict[str, Any], now: datetime) -> tuple:
+        """Row values for ``self.coin_columns``"""
+        # coingecko_id is the last of COIN_COLUMNS, the only one that may be left out
+        return self.coin_record(coin_data, coin_info, now)[:len(self.coin_columns)]
+    
+    @staticmethod
+    def coin_record(coin_data: Dict[str, Any], coin_info: Dict[str, Any], now: datetime) -> tuple:
+        """Row values for ``COIN_COLUMNS``"""
+        return (
+            coin_data["symbol"],
+            coin_data["name"],
+            coin_data["asset_type"].value,
+            coin_data["blockchain"].value,
+            coin_data.get("contract_address"),
+            coin_data.get("decimals", 18),
+            coin_info.get("total_supply"),
+            coin_info.get("circulating_supply"),
+            coin_info.get("max_supply"),
+            coin_info.get("market_cap"),
+            coin_info.get("current_price", 0),
+            coin_info.get("price_change_24h", 0),
+            coin_info.get("volume_24h", 0),
+            coin_info.get("market_cap_rank"),
+            coin_info.get("logo_url", ""),
+            coin_info.get("description", ""),
+            coin_info.get("website", ""),
+            coin_info.get("whitepaper", ""),
+            coin_info.get("github", ""),
+            coin_info.get("twitter", ""),
+            coin_info.get("telegram", ""),
+            coin_info.get("discord", ""),
+            coin_info.get("reddit", ""),
+            True,  # is_verified
+            now,  # listing_date
+            [t.value for t in coin_data["supported_trading_types"]],
+            MarketStatus.ACTIVE.value,
+            now,
+            now,
+            coin_data.get("coingecko_id")
+        )
+    
+    @staticmethod
+    def trading_pair_record(base_asset: str, quote_asset: str, trading_type: TradingType,
+                            now: datetime) -> tuple:
+        """Row values for ``TRADING_PAIR_COLUMNS`` with the default filters and fees"""
+        return (
+            base_asset, quote_asset, f"{base_asset}{quote_asset}", trading_type.value, MarketStatus.ACTIVE.value,
+            Decimal("0.001"), None, Decimal("0.001"), Decimal("0.0001"), None,
+            Decimal("0.0001"), Decimal("10.0"), Decimal("0.001"), Decimal("0.001"),
+            Decimal("0"), Decimal("0"), Decimal("0"), Decimal("0"), Decimal("0"),
+            now, now
+        )
+    
+    async def create_default_trading_pairs(self, coin_data: Dict[str, Any]):
+        """Create default trading pairs for a coin"""
+        base_asset = coin_data["symbol"]
+        for quote_asset, trading_type in self.default_pair_specs(coin_data):
+            try:
+                await self.create_trading_pair(
+                    base_asset=base_asset,
+                    quote_asset=quote_asset,
+                    trading_type=trading_type
+                )
+            except Exception as e:
+                logger.error(f"Error creating trading pair {base_asset}{quote_asset}: {e}")
     
     async def create_trading_pair(self, base_asset: str, quote_asset: str, trading_type: TradingType):
         """Create a trading pair"""
@@ -643,13 +1633,8 @@ class PopularCoinsManager:
                     $1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13, $14,
                     $15, $16, $17, $18, $19, $20, $21
                 )
-            """,
-                base_asset, quote_asset, symbol, trading_type.value, MarketStatus.ACTIVE.value,
-                Decimal("0.001"), None, Decimal("0.001"), Decimal("0.0001"), None,
-                Decimal("0.0001"), Decimal("10.0"), Decimal("0.001"), Decimal("0.001"),
-                Decimal("0"), Decimal("0"), Decimal("0"), Decimal("0"), Decimal("0"),
-                datetime.now(), datetime.now()
-            )
+            """, *self.trading_pair_record(base_asset, quote_asset, trading_type, datetime.now()))
+            self.catalog.invalidate()
     
     async def fetch_coin_info_from_coingecko(self, coingecko_id: str) -> Dict[str, Any]:
         """Fetch coin information from CoinGecko API"""
@@ -662,31 +1647,28 @@ class PopularCoinsManager:
             if config.COINGECKO_API_KEY:
                 headers["X-CG-Demo-API-Key"] = config.COINGECKO_API_KEY
             
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, headers=headers) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        
-                        return {
-                            "total_supply": data.get("market_data", {}).get("total_supply"),
-                            "circulating_supply": data.get("market_data", {}).get("circulating_supply"),
-                            "max_supply": data.get("market_data", {}).get("max_supply"),
-                            "market_cap": data.get("market_data", {}).get("market_cap", {}).get("usd"),
-                            "current_price": data.get("market_data", {}).get("current_price", {}).get("usd"),
-                            "price_change_24h": data.get("market_data", {}).get("price_change_percentage_24h"),
-                            "volume_24h": data.get("market_data", {}).get("total_volume", {}).get("usd"),
-                            "market_cap_rank": data.get("market_cap_rank"),
-                            "logo_url": data.get("image", {}).get("large", ""),
-                            "description": data.get("description", {}).get("en", ""),
-                            "website": data.get("links", {}).get("homepage", [""])[0],
-                            "github": data.get("links", {}).get("repos_url", {}).get("github", [""])[0] if data.get("links", {}).get("repos_url", {}).get("github") else "",
-                            "twitter": data.get("links", {}).get("twitter_screen_name", ""),
-                            "telegram": data.get("links", {}).get("telegram_channel_identifier", ""),
-                            "reddit": data.get("links", {}).get("subreddit_url", "")
-                        }
+            data = await self.http.get_json(url, headers=headers)
+            if data is not None:
+                return {
+                    "total_supply": data.get("market_data", {}).get("total_supply"),
+                    "circulating_supply": data.get("market_data", {}).get("circulating_supply"),
+                    "max_supply": data.get("market_data", {}).get("max_supply"),
+                    "market_cap": data.get("market_data", {}).get("market_cap", {}).get("usd"),
+                    "current_price": data.get("market_data", {}).get("current_price", {}).get("usd"),
+                    "price_change_24h": data.get("market_data", {}).get("price_change_percentage_24h"),
+                    "volume_24h": data.get("market_data", {}).get("total_volume", {}).get("usd"),
+                    "market_cap_rank": data.get("market_cap_rank"),
+                    "logo_url": data.get("image", {}).get("large", ""),
+                    "description": data.get("description", {}).get("en", ""),
+                    "website": data.get("links", {}).get("homepage", [""])[0],
+                    "github": data.get("links", {}).get("repos_url", {}).get("github", [""])[0] if data.get("links", {}).get("repos_url", {}).get("github") else "",
+                    "twitter": data.get("links", {}).get("twitter_screen_name", ""),
+                    "telegram": data.get("links", {}).get("telegram_channel_identifier", ""),
+                    "reddit": data.get("links", {}).get("subreddit_url", "")
+                }
         except Exception as e:
             logger.error(f"Error fetching coin info from CoinGecko: {e}")
-            return {}
+        return {}
     
     async def update_all_prices(self):
         """Update prices for all coins"""
@@ -694,41 +1676,34 @@ class PopularCoinsManager:
             # Get all coins from database
             async with self.db_pool.acquire() as conn:
                 coins = await conn.fetch("SELECT symbol, blockchain, contract_address FROM coins WHERE market_status = 'active'")
+            await self.price_publisher.refresh_listed_symbols()
             
-            # Update prices from multiple sources
-            await self.update_prices_from_exchanges(coins)
-            await self.update_prices_from_coingecko(coins)
+            # Collect quotes from every source, then publish one reference price per symbol
+            exchange_quotes, coingecko_quotes = await asyncio.gather(
+                self.fetch_exchange_quotes(coins),
+                self.fetch_coingecko_quotes(coins)
+            )
+            prices = self.reference_prices.compute(
+                {**exchange_quotes, **coingecko_quotes}, self.price_publisher.listed_symbols
+            )
+            await self.price_publisher.publish(prices)
+            self.catalog.apply_prices(prices)
             
         except Exception as e:
             logger.error(f"Error updating all prices: {e}")
     
-    async def update_prices_from_exchanges(self, coins: List[Dict]):
-        """Update prices from supported exchanges"""
-        for exchange in self.supported_exchanges:
-            try:
-                # Fetch tickers from exchange
-                tickers = exchange.fetch_tickers()
-                
-                for symbol, ticker in tickers.items():
-                    # Update price in database and cache
-                    await self.update_price_in_cache(symbol, ticker['last'], ticker.get('percentage', 0), ticker.get('quoteVolume', 0))
-                
-            except Exception as e:
-                logger.error(f"Error updating prices from {exchange.name}: {e}")
+    async def fetch_exchange_quotes(self, coins: List[Dict]) -> Dict[str, Dict[str, Dict]]:
+        """Fetch tickers from supported exchanges, keyed by venue"""
+        return await self.ticker_fetcher.fetch_all(self.supported_exchanges)
     
-    async def update_prices_from_coingecko(self, coins: List[Dict]):
-        """Update prices from CoinGecko"""
+    async def fetch_coingecko_quotes(self, coins: List[Dict]) -> Dict[str, Dict[str, Dict]]:
+        """Fetch USD prices from CoinGecko as ccxt-style tickers"""
         try:
             # Get coin IDs for CoinGecko
-            coin_ids = []
-            for coin in coins:
-                # Map symbol to CoinGecko ID (simplified)
-                coingecko_id = self.get_coingecko_id(coin['symbol'])
-                if coingecko_id:
-                    coin_ids.append(coingecko_id)
+            coin_ids = list(self.coingecko_ids.resolve([coin['symbol'] for coin in coins]).values())
             
             if not coin_ids:
-                return
+                return {}
             
             # Fetch prices from CoinGecko
             url = f"https://api.coingecko.com/api/v3/simple/price"
@@ -736,119 +1711,40 @@ class PopularCoinsManager:
                 "ids": ",".join(coin_ids),
                 "vs_currencies": "usd",
                 "include_24hr_change": "true",
-                "include_24hr_vol": "true"
+                "include_24hr_vol": "true",
+                "include_last_updated_at": "true"
             }
             
             headers = {}
             if config.COINGECKO_API_KEY:
                 headers["X-CG-Demo-API-Key"] = config.COINGECKO_API_KEY
             
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, params=params, headers=headers) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        
-                        for coin_id, price_data in data.items():
-                            symbol = self.get_symbol_from_coingecko_id(coin_id)
-                            if symbol:
-                                await self.update_price_in_cache(
-                                    f"{symbol}USDT",
-                                    price_data.get("usd", 0),
-                                    price_data.get("usd_24h_change", 0),
-                                    price_data.get("usd_24h_vol", 0)
-                                )
-            
-        except Exception as e:
-            logger.error(f"Error updating prices from CoinGecko: {e}")
-    
-    async def update_price_in_cache(self, symbol: str, price: float, change_24h: float, volume_24h: float):
-        """Update price in Redis cache and database"""
-        try:
-            # Update in Redis
-            price_data = {
-                "symbol": symbol,
-                "price": price,
-                "change_24h": change_24h,
-                "volume_24h": volume_24h,
-                "timestamp": datetime.now().isoformat()
-            }
-            
-            await self.redis_client.setex(
-                f"price:{symbol}",
-                300,  # 5 minutes TTL
-                json.dumps(price_data)
-            )
-            
-            # Update in database
-            async with self.db_pool.acquire() as conn:
-                await conn.execute("""
-                    UPDATE trading_pairs 
-                    SET current_price = $1, price_change_24h = $2, volume_24h = $3, updated_at = $4
-                    WHERE symbol = $5
-                """, Decimal(str(price)), Decimal(str(change_24h)), Decimal(str(volume_24h)), datetime.now(), symbol)
+            data = await self.http.get_json(url, params=params, headers=headers)
+            if data is not None:
+                tickers = {}
+                for coin_id, price_data in data.items():
+                    symbol = self.get_symbol_from_coingecko_id(coin_id)
+                    if symbol:
+                        updated_at = price_data.get("last_updated_at")
+                        tickers[f"{symbol}/USDT"] = {
+                            "last": price_data.get("usd"),
+                            "percentage": price_data.get("usd_24h_change"),
+                            "quoteVolume": price_data.get("usd_24h_vol"),
+                            "timestamp": updated_at * 1000 if updated_at else None
+                        }
+                return {"coingecko": tickers}
             
         except Exception as e:
-            logger.error(f"Error updating price in cache for {symbol}: {e}")
+            logger.error(f"Error fetching prices from CoinGecko: {e}")
+        return {}
     
     def get_coingecko_id(self, symbol: str) -> Optional[str]:
         """Map symbol to CoinGecko ID"""
-        mapping = {
-            "BTC": "bitcoin",
-            "ETH": "ethereum",
-            "BNB": "binancecoin",
-            "SOL": "solana",
-            "ADA": "cardano",
-            "AVAX": "avalanche-2",
-            "DOT": "polkadot",
-            "MATIC": "matic-network",
-            "USDT": "tether",
-            "USDC": "usd-coin",
-            "BUSD": "binance-usd",
-            "UNI": "uniswap",
-            "AAVE": "aave",
-            "COMP": "compound-governance-token",
-            "SUSHI": "sushi",
-            "LINK": "chainlink",
-            "LTC": "litecoin",
-            "BCH": "bitcoin-cash",
-            "XRP": "ripple",
-            "DOGE": "dogecoin",
-            "SHIB": "shiba-inu",
-            "TRX": "tron",
-            "TON": "the-open-network",
-            "PI": "pi-network"
-        }
-        return mapping.get(symbol)
+        return self.coingecko_ids.by_symbol.get(symbol)
     
     def get_symbol_from_coingecko_id(self, coingecko_id: str) -> Optional[str]:
         """Map CoinGecko ID to symbol"""
-        mapping = {
-            "bitcoin": "BTC",
-            "ethereum": "ETH",
-            "binancecoin": "BNB",
-            "solana": "SOL",
-            "cardano": "ADA",
-            "avalanche-2": "AVAX",
-            "polkadot": "DOT",
-            "matic-network": "MATIC",
-            "tether": "USDT",
-            "usd-coin": "USDC",
-            "binance-usd": "BUSD",
-            "uniswap": "UNI",
-            "aave": "AAVE",
-            "compound-governance-token": "COMP",
-            "sushi": "SUSHI",
-            "chainlink": "LINK",
-            "litecoin": "LTC",
-            "bitcoin-cash": "BCH",
-            "ripple": "XRP",
-            "dogecoin": "DOGE",
-            "shiba-inu": "SHIB",
-            "tron": "TRX",
-            "the-open-network": "TON",
-            "pi-network": "PI"
-        }
-        return mapping.get(coingecko_id)
+        return self.coingecko_ids.by_id.get(coingecko_id)
     
     async def update_market_data(self):
         """Update comprehensive market data"""
@@ -886,36 +1782,30 @@ class PopularCoinsManager:
                     WHERE contract_address IS NOT NULL AND asset_type = 'token'
                 """)
             
+            by_chain: Dict[str, List[str]] = {}
+            symbols: Dict[Tuple[str, str], str] = {}
             for token in tokens:
-                blockchain = token['blockchain']
-                contract_address = token['contract_address']
-                
-                if blockchain in self.web3_clients:
-                    web3 = self.web3_clients[blockchain]
-                    
-                    # Get token information from contract
-                    try:
-                        # This is a simplified example - in production, use proper ABI
-                        contract = web3.eth.contract(
-                            address=contract_address,
-                            abi=[
-                                {"constant": True, "inputs": [], "name": "totalSupply", "outputs": [{"name": "", "type": "uint256"}], "type": "function"},
-                                {"constant": True, "inputs": [], "name": "decimals", "outputs": [{"name": "", "type": "uint8"}], "type": "function"}
-                            ]
-                        )
-                        
-                        total_supply = contract.functions.totalSupply().call()
-                        decimals = contract.functions.decimals().call()
-                        
-                        # Update in database
-                        await conn.execute("""
-                            UPDATE coins 
-                            SET total_supply = $1, decimals = $2, updated_at = $3
-                            WHERE symbol = $4
-                        """, total_supply, decimals, datetime.now(), token['symbol'])
-                        
-                    except Exception as e:
-                        logger.error(f"Error updating contract info for {token['symbol']}: {e}")
+                by_chain.setdefault(token['blockchain'], []).append(token['contract_address'])
+                symbols[(token['blockchain'], token['contract_address'])] = token['symbol']
+            
+            metadata = await self.token_metadata.fetch_all(by_chain)
+            if not metadata:
+                return
+            
+            rows = [(symbols[key], total_supply, decimals) for key, (total_supply, decimals) in metadata.items()]
+            async with self.db_pool.acquire() as conn:
+                await conn.execute("""
+                    UPDATE coins AS c
+                    SET total_supply = u.total_supply, decimals = u.decimals, updated_at = $4
+                    FROM unnest($1::text[], $2::numeric[], $3::int[]) AS u(symbol, total_supply, decimals)
+                    WHERE c.symbol = u.symbol
+                """,
+                    [row[0] for row in rows],
+                    [Decimal(row[1]) for row in rows],
+                    [row[2] for row in rows],
+                    datetime.now()
+                )
+            self.catalog.invalidate()
             
         except Exception as e:
             logger.error(f"Error updating token contracts: {e}")
@@ -923,6 +1813,14 @@ class PopularCoinsManager:
 # Initialize manager
 coins_manager = PopularCoinsManager()
 
+@app.on_event("startup")
+async def startup_event():
+    await coins_manager.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await coins_manager.stop()
+
 # API Endpoints
 @app.post("/api/v1/coins/add")
 async def add_coin(request: AddCoinRequest):
@@ -935,6 +1833,7 @@ async def add_coin(request: AddCoinRequest):
             "blockchain": request.blockchain,
             "contract_address": request.contract_address,
             "decimals": request.decimals,
+            "coingecko_id": request.coingecko_id,
             "supported_trading_types": request.supported_trading_types
         }
         
@@ -976,40 +1875,26 @@ async def get_all_coins(
     blockchain: Optional[Blockchain] = None,
     trading_type: Optional[TradingType] = None,
     limit: int = 100,
-    offset: int = 0
+    offset: int = 0,
+    cursor: Optional[str] = None
 ):
     """Get all coins with optional filtering"""
     try:
-        async with coins_manager.db_pool.acquire() as conn:
-            query = "SELECT * FROM coins WHERE market_status = 'active'"
-            params = []
-            param_count = 0
-            
-            if asset_type:
-                param_count += 1
-                query += f" AND asset_type = ${param_count}"
-                params.append(asset_type.value)
-            
-            if blockchain:
-                param_count += 1
-                query += f" AND blockchain = ${param_count}"
-                params.append(blockchain.value)
-            
-            if trading_type:
-                param_count += 1
-                query += f" AND ${param_count} = ANY(supported_trading_types)"
-                params.append(trading_type.value)
-            
-            query += f" ORDER BY market_cap_rank NULLS LAST, market_cap DESC LIMIT ${param_count + 1} OFFSET ${param_count + 2}"
-            params.extend([limit, offset])
-            
-            coins = await conn.fetch(query, *params)
-            
-            return {
-                "coins": [dict(coin) for coin in coins],
-                "total": len(coins)
-            }
+        await coins_manager.catalog.ensure_loaded(coins_manager.db_pool)
+        coins, next_cursor = coins_manager.catalog.coins.query({
+            "asset_type": asset_type.value if asset_type else None,
+            "blockchain": blockchain.value if blockchain else None,
+            "supported_trading_types": trading_type.value if trading_type else None
+        }, limit=limit, offset=offset, cursor=cursor)
+        
+        return {
+            "coins": coins,
+            "total": len(coins),
+            "next_cursor": next_cursor
+        }
         
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error getting coins: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -1020,40 +1905,26 @@ async def get_trading_pairs(
     base_asset: Optional[str] = None,
     quote_asset: Optional[str] = None,
     limit: int = 100,
-    offset: int = 0
+    offset: int = 0,
+    cursor: Optional[str] = None
 ):
     """Get trading pairs with optional filtering"""
     try:
-        async with coins_manager.db_pool.acquire() as conn:
-            query = "SELECT * FROM trading_pairs WHERE status = 'active'"
-            params = []
-            param_count = 0
-            
-            if trading_type:
-                param_count += 1
-                query += f" AND trading_type = ${param_count}"
-                params.append(trading_type.value)
-            
-            if base_asset:
-                param_count += 1
-                query += f" AND base_asset = ${param_count}"
-                params.append(base_asset)
-            
-            if quote_asset:
-                param_count += 1
-                query += f" AND quote_asset = ${param_count}"
-                params.append(quote_asset)
-            
-            query += f" ORDER BY volume_24h DESC LIMIT ${param_count + 1} OFFSET ${param_count + 2}"
-            params.extend([limit, offset])
-            
-            pairs = await conn.fetch(query, *params)
-            
-            return {
-                "trading_pairs": [dict(pair) for pair in pairs],
-                "total": len(pairs)
-            }
+        await coins_manager.catalog.ensure_loaded(coins_manager.db_pool)
+        pairs, next_cursor = coins_manager.catalog.pairs.query({
+            "trading_type": trading_type.value if trading_type else None,
+            "base_asset": base_asset,
+            "quote_asset": quote_asset
+        }, limit=limit, offset=offset, cursor=cursor)
         
+        return {
+            "trading_pairs": pairs,
+            "total": len(pairs),
+            "next_cursor": next_cursor
+        }
+        
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error getting trading pairs: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -1075,25 +1946,89 @@ async def get_price(symbol: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/v1/prices")
-async def get_all_prices():
+async def get_all_prices(request: Request):
     """Get all current prices"""
     try:
-        # Get all price keys from Redis
-        keys = await coins_manager.redis_client.keys("price:*")
-        prices = {}
-        
-        for key in keys:
-            price_data = await coins_manager.redis_client.get(key)
-            if price_data:
-                symbol = key.decode().replace("price:", "")
-                prices[symbol] = json.loads(price_data)
+        # Serve the in-process snapshot; fall back to the shared one in Redis,
+        # whose keys expire with the same TTL
+        snapshot = coins_manager.price_publisher.snapshot
+        body, etag = snapshot.current()
+        if body is None:
+            body, etag = await coins_manager.redis_client.mget(PRICE_SNAPSHOT_KEY, PRICE_SNAPSHOT_ETAG_KEY)
+            if body is None or etag is None:
+                if snapshot.body is not None:
+                    raise HTTPException(status_code=503, detail="Price data is stale")
+                return {"prices": {}}
+            etag = etag.decode() if isinstance(etag, bytes) else etag
         
-        return {"prices": prices}
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        return Response(content=body, media_type="application/json", headers={"ETag": etag})
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error getting all prices: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/v1/stream/prices")
+async def stream_prices_sse(symbols: str = PriceStreamHub.WILDCARD):
+    """Server-sent events stream of price updates for comma separated symbols"""
+    publisher = coins_manager.price_publisher
+    subscription = publisher.stream.open()
+    publisher.stream.subscribe(subscription, symbols.split(","), current=publisher.snapshot.prices)
+    
+    async def events():
+        try:
+            while True:
+                updates = await subscription.next()
+                if updates is None:
+                    break
+                yield f"data: {json.dumps(updates)}\n\n"
+        finally:
+            publisher.stream.close(subscription)
+    
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+@app.websocket("/ws/prices")
+async def stream_prices_ws(websocket: WebSocket):
+    """Price stream; clients send {"action": "subscribe"|"unsubscribe", "symbols": [...]}"""
+    publisher = coins_manager.price_publisher
+    await websocket.accept()
+    subscription = publisher.stream.open()
+    
+    async def receive_commands():
+        try:
+            while True:
+                try:
+                    message = json.loads(await websocket.receive_text())
+                    symbols = [str(symbol) for symbol in message.get("symbols", [])]
+                except (ValueError, AttributeError, TypeError):
+                    continue
+                if message.get("action") == "unsubscribe":
+                    publisher.stream.unsubscribe(subscription, symbols)
+                else:
+                    publisher.stream.subscribe(subscription, symbols, current=publisher.snapshot.prices)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            publisher.stream.close(subscription)
+    
+    reader = asyncio.create_task(receive_commands())
+    try:
+        while True:
+            updates = await subscription.next()
+            if updates is None:
+                break
+            await websocket.send_text(json.dumps({"type": "prices", "data": updates}))
+        if subscription.evicted:
+            await websocket.close(code=1013, reason="slow consumer")
+    except WebSocketDisconnect:
+        pass
+    finally:
+        reader.cancel()
+        publisher.stream.close(subscription)
+
 @app.post("/api/v1/coins/initialize-popular")
 async def initialize_popular_coins():
     """Initialize all popular coins and tokens"""
@@ -1109,13 +2044,20 @@ async def initialize_popular_coins():
         logger.error(f"Error initializing popular coins: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/v1/ingestion/stats")
+async def get_ingestion_stats():
+    """Per-venue ticker fetch latency histograms and failure counts"""
+    return {"venues": coins_manager.ticker_fetcher.stats()}
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
     return {
         "status": "healthy",
         "timestamp": datetime.now(),
-        "version": "1.0.0"
+        "version": "1.0.0",
+        "price_stream": coins_manager.price_publisher.stream.metrics(),
+        "http": coins_manager.http.metrics()
     }
 
 if __name__ == "__main__":
@@ -13,11 +13,15 @@ Advanced risk management system with features inspired by major exchanges:
 """
 
 import asyncio
+import heapq
+from collections import deque
+import itertools
 import logging
 import json
 import time
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Tuple
+from statistics import NormalDist
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional, Set, Tuple
 from dataclasses import dataclass, asdict
 from decimal import Decimal
 import aioredis
@@ -115,6 +119,989 @@ class MarketData:
     ask: Decimal
     timestamp: datetime
 
+class PositionBook:
+    """Columnar position store for vectorized margin checks.
+
+    Every open position occupies one slot in a set of parallel NumPy arrays
+    (side, size, entry, margin, thresholds). Symbols are interned to integer
+    ids so a vector of mark prices indexed by symbol id can be broadcast onto
+    all positions in a single pass. A symbol -> positions index lets a tick
+    re-evaluate only the positions of the symbols that moved.
+
+    Gross and net notional per symbol are maintained incrementally from the
+    deltas of every insert, removal and mark change, so system exposure can
+    be read without touching individual positions.
+    """
+
+    SIDE_SIGN = {"LONG": 1.0, "SHORT": -1.0}
+
+    def __init__(self, capacity: int = 1024):
+        self.keys: List[Tuple[int, str]] = []
+        self.slots: Dict[Tuple[int, str], int] = {}
+        self.symbols: List[str] = []
+        self.symbol_ids: Dict[str, int] = {}
+        self.symbol_keys: Dict[str, Set[Tuple[int, str]]] = {}
+        self.symbol_gross = np.zeros(0)
+        self.symbol_net = np.zeros(0)
+        self.gross_total = 0.0
+        self.exposure_version = 0
+        self._allocate(capacity)
+
+    def _allocate(self, capacity: int):
+        self.capacity = capacity
+        self.user = np.zeros(capacity, dtype=np.int64)
+        self.symbol = np.zeros(capacity, dtype=np.int32)
+        self.side = np.zeros(capacity)
+        self.size = np.zeros(capacity)
+        self.entry = np.zeros(capacity)
+        self.margin = np.zeros(capacity)
+        self.margin_call_threshold = np.full(capacity, np.nan)
+        self.liquidation_threshold = np.full(capacity, np.nan)
+        self.mark = np.zeros(capacity)
+        self.pnl = np.zeros(capacity)
+
+    def _grow(self):
+        count = len(self.keys)
+        columns = {
+            name: getattr(self, name)[:count].copy()
+            for name in ("user", "symbol", "side", "size", "entry", "margin",
+                         "margin_call_threshold", "liquidation_threshold",
+                         "mark", "pnl")
+        }
+        self._allocate(self.capacity * 2)
+        for name, values in columns.items():
+            getattr(self, name)[:count] = values
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def intern_symbol(self, symbol: str) -> int:
+        symbol_id = self.symbol_ids.get(symbol)
+        if symbol_id is None:
+            symbol_id = len(self.symbols)
+            self.symbol_ids[symbol] = symbol_id
+            self.symbols.append(symbol)
+            self.symbol_gross = np.append(self.symbol_gross, 0.0)
+            self.symbol_net = np.append(self.symbol_net, 0.0)
+        return symbol_id
+
+    def _add_exposure(self, slots, sign: float):
+        """Add (sign=1) or subtract (sign=-1) the slots' notional from the aggregates"""
+        if not len(slots):
+            return
+        gross = sign * self.size[slots] * self.mark[slots]
+        np.add.at(self.symbol_gross, self.symbol[slots], gross)
+        np.add.at(self.symbol_net, self.symbol[slots], gross * self.side[slots])
+        self.gross_total += float(np.sum(gross))
+        self.exposure_version += 1
+
+    def rebuild_exposure(self):
+        """Recompute the aggregates from scratch to shed floating-point drift"""
+        count = len(self.keys)
+        gross = self.size[:count] * self.mark[:count]
+        self.symbol_gross = np.bincount(self.symbol[:count], weights=gross,
+                                        minlength=len(self.symbols)).astype(float)
+        self.symbol_net = np.bincount(self.symbol[:count], weights=gross * self.side[:count],
+                                      minlength=len(self.symbols)).astype(float)
+        self.gross_total = float(np.sum(gross))
+        self.exposure_version += 1
+
+    def upsert(self, position: Position, limits: Optional[RiskLimits]):
+        """Insert or refresh the columns for a position"""
+        key = (position.user_id, position.symbol)
+        slot = self.slots.get(key)
+        if slot is None:
+            if len(self.keys) == self.capacity:
+                self._grow()
+            slot = len(self.keys)
+            self.keys.append(key)
+            self.slots[key] = slot
+            self.symbol_keys.setdefault(position.symbol, set()).add(key)
+        else:
+            self._add_exposure([slot], -1.0)
+
+        self.user[slot] = position.user_id
+        self.symbol[slot] = self.intern_symbol(position.symbol)
+        self.side[slot] = self.SIDE_SIGN.get(position.side, 0.0)
+        self.size[slot] = float(position.size)
+        self.entry[slot] = float(position.entry_price)
+        self.margin[slot] = float(position.margin_used)
+        self.mark[slot] = float(position.mark_price)
+        self.pnl[slot] = float(position.unrealized_pnl)
+        if limits:
+            self.margin_call_threshold[slot] = limits.margin_call_threshold
+            self.liquidation_threshold[slot] = limits.liquidation_threshold
+        else:
+            # NaN thresholds never compare true, so users without limits are skipped
+            self.margin_call_threshold[slot] = np.nan
+            self.liquidation_threshold[slot] = np.nan
+        self._add_exposure([slot], 1.0)
+
+    def remove(self, key: Tuple[int, str]):
+        """Remove a position, moving the last slot into the freed one"""
+        slot = self.slots.pop(key, None)
+        if slot is None:
+            return
+        self.symbol_keys.get(key[1], set()).discard(key)
+        self._add_exposure([slot], -1.0)
+
+        last = len(self.keys) - 1
+        if slot != last:
+            moved_key = self.keys[last]
+            self.keys[slot] = moved_key
+            self.slots[moved_key] = slot
+            for column in (self.user, self.symbol, self.side, self.size, self.entry, self.margin,
+                           self.margin_call_threshold, self.liquidation_threshold,
+                           self.mark, self.pnl):
+                column[slot] = column[last]
+        self.keys.pop()
+
+    def slots_for(self, symbols) -> np.ndarray:
+        """Slots of every position in the given symbols"""
+        return np.array(
+            [self.slots[key] for symbol in symbols for key in self.symbol_keys.get(symbol, ())],
+            dtype=np.int64
+        )
+
+    def symbol_marks(self, market_data: Dict[str, MarketData], symbols=None) -> np.ndarray:
+        """Mark price per symbol id, NaN where no market data is available"""
+        marks = np.full(len(self.symbols), np.nan)
+        for symbol in (self.symbol_ids if symbols is None else symbols):
+            data = market_data.get(symbol)
+            symbol_id = self.symbol_ids.get(symbol)
+            if data and symbol_id is not None:
+                marks[symbol_id] = float(data.price)
+        return marks
+
+    def evaluate(self, symbol_marks: np.ndarray,
+                 slots: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Apply mark prices to positions and return their margin ratios.
+
+        Evaluates ``slots`` (all positions by default), updates the stored
+        mark and unrealized PnL columns in place and returns
+        ``(ratio, marked)`` aligned with ``slots``, where ``marked`` flags the
+        slots whose symbol had a mark price in this pass.
+        """
+        if slots is None:
+            slots = np.arange(len(self.keys))
+        marks = symbol_marks[self.symbol[slots]]
+        marked = ~np.isnan(marks)
+        changed = slots[marked]
+        self._add_exposure(changed, -1.0)
+        self.mark[changed] = marks[marked]
+        self._add_exposure(changed, 1.0)
+
+        mark = self.mark[slots]
+        margin = self.margin[slots]
+        pnl = self.side[slots] * (mark - self.entry[slots]) * self.size[slots]
+        self.pnl[slots] = pnl
+
+        ratio = np.full(len(slots), np.inf)
+        np.divide(margin + pnl, margin, out=ratio, where=margin != 0)
+        return ratio, marked
+
+    def exposure_matrix(self, user_ids=None) -> Tuple[np.ndarray, np.ndarray]:
+        """Signed notional per user and symbol.
+
+        Returns ``(users, matrix)`` where row ``i`` of the users x symbols
+        matrix holds the exposures of ``users[i]``; LONG is positive.
+        """
+        count = len(self.keys)
+        selected = np.arange(count)
+        if user_ids is not None:
+            selected = selected[np.isin(self.user[:count], list(user_ids))]
+        users, rows = np.unique(self.user[selected], return_inverse=True)
+        matrix = np.zeros((len(users), len(self.symbols)))
+        np.add.at(matrix, (rows, self.symbol[selected]),
+                  self.side[selected] * self.size[selected] * self.mark[selected])
+        return users, matrix
+
+    def trigger_prices(self, slot: int) -> Tuple[float, float]:
+        """Mark prices at which a position hits its margin-call and liquidation ratios.
+
+        Solves ``(margin + side * (mark - entry) * size) / margin == threshold``
+        for ``mark``; returns NaN where the position can never trigger.
+        """
+        size = self.size[slot]
+        margin = self.margin[slot]
+        if size <= 0 or margin == 0:
+            return np.nan, np.nan
+        offset = self.side[slot] * margin / size
+        entry = self.entry[slot]
+        return (entry + (self.margin_call_threshold[slot] - 1) * offset,
+                entry + (self.liquidation_threshold[slot] - 1) * offset)
+
+class TriggerIndex:
+    """Per-symbol heaps of margin-call and liquidation trigger prices.
+
+    LONG positions trigger when the mark falls to their price (max-heap),
+    SHORT positions when it rises to it (min-heap), so a tick pops exactly
+    the crossed entries in O(k log n). Re-arming a position supersedes its
+    old entries, which are dropped lazily when they surface. A popped
+    margin call waits in a recovery heap ordered the opposite way and is
+    re-armed once the mark moves back past its price, so a position that
+    recovers and falls again gets another margin call.
+    """
+
+    MARGIN_CALL = "MARGIN_CALL"
+    LIQUIDATION = "LIQUIDATION"
+    RECOVERY = "RECOVERY"
+
+    def __init__(self):
+        self.longs: Dict[str, List[Tuple[float, int, Tuple[int, str], str]]] = {}
+        self.shorts: Dict[str, List[Tuple[float, int, Tuple[int, str], str]]] = {}
+        self.recovering_longs: Dict[str, List[Tuple[float, int, Tuple[int, str], str]]] = {}
+        self.recovering_shorts: Dict[str, List[Tuple[float, int, Tuple[int, str], str]]] = {}
+        self.armed: Dict[Tuple[Tuple[int, str], str], int] = {}
+        self.live: Dict[str, int] = {}
+        self.sequence = itertools.count()
+
+    def _push(self, heap, key: Tuple[int, str], kind: str, order: float):
+        seq = next(self.sequence)
+        self.armed[(key, kind)] = seq
+        self.live[key[1]] = self.live.get(key[1], 0) + 1
+        heapq.heappush(heap, (order, seq, key, kind))
+
+    def arm(self, key: Tuple[int, str], side: str,
+            margin_call_price: float, liquidation_price: float):
+        """Register (or replace) the trigger prices for a position"""
+        self.disarm(key)
+        symbol = key[1]
+        if side == "LONG":
+            heap, sign = self.longs.setdefault(symbol, []), -1.0
+            recovering = self.recovering_longs.setdefault(symbol, [])
+        elif side == "SHORT":
+            heap, sign = self.shorts.setdefault(symbol, []), 1.0
+            recovering = self.recovering_shorts.setdefault(symbol, [])
+        else:
+            return
+
+        for kind, price in ((self.MARGIN_CALL, margin_call_price),
+                            (self.LIQUIDATION, liquidation_price)):
+            if not np.isnan(price):
+                self._push(heap, key, kind, sign * price)
+
+        for entries in (heap, recovering):
+            if len(entries) > 2 * self.live.get(symbol, 0) + 64:
+                self._compact(entries)
+
+    def disarm(self, key: Tuple[int, str]):
+        """Invalidate a position's pending triggers"""
+        for kind in (self.MARGIN_CALL, self.LIQUIDATION, self.RECOVERY):
+            if self.armed.pop((key, kind), None) is not None:
+                self.live[key[1]] -= 1
+
+    def _compact(self, heap: List[Tuple[float, int, Tuple[int, str], str]]):
+        heap[:] = [entry for entry in heap if self.armed.get((entry[2], entry[3])) == entry[1]]
+        heapq.heapify(heap)
+
+    def _take(self, key: Tuple[int, str], kind: str, seq: int) -> bool:
+        """Consume a popped entry, False if it was superseded"""
+        if self.armed.get((key, kind)) != seq:
+            return False
+        del self.armed[(key, kind)]
+        self.live[key[1]] -= 1
+        return True
+
+    def _pop(self, heap, recovering, limit: float) -> List[Tuple[str, Tuple[int, str]]]:
+        triggered = []
+        while heap and heap[0][0] <= limit:
+            order, seq, key, kind = heapq.heappop(heap)
+            if self._take(key, kind, seq):
+                triggered.append((kind, key))
+                if kind == self.MARGIN_CALL:
+                    # Negating the order flips the heap's direction for recovery
+                    self._push(recovering, key, self.RECOVERY, -order)
+        return triggered
+
+    def _recover(self, recovering, heap, limit: float):
+        while recovering and recovering[0][0] < limit:
+            order, seq, key, kind = heapq.heappop(recovering)
+            if self._take(key, kind, seq):
+                self._push(heap, key, self.MARGIN_CALL, -order)
+
+    def pop_crossed(self, symbol: str, mark: float) -> List[Tuple[str, Tuple[int, str]]]:
+        """Remove and return the ``(kind, key)`` triggers crossed by a mark price"""
+        longs = self.longs.get(symbol)
+        shorts = self.shorts.get(symbol)
+        # Re-arm the margin calls the mark has moved back past, then pop;
+        # long prices are stored negated, so every heap pops while top <= limit
+        if longs is not None:
+            self._recover(self.recovering_longs[symbol], longs, mark)
+        if shorts is not None:
+            self._recover(self.recovering_shorts[symbol], shorts, -mark)
+        return (self._pop(longs, self.recovering_longs.get(symbol), -mark) +
+                self._pop(shorts, self.recovering_shorts.get(symbol), mark))
+
+class PositionWriteBehind:
+    """Coalescing write-behind buffer for position persistence.
+
+    Dirty positions are collected per ``(user_id, symbol)`` so repeated
+    updates between flushes collapse into one row, and each flush writes the
+    whole batch with a single ``UPDATE ... FROM unnest(...)`` statement. A
+    flush happens every ``flush_interval`` seconds, as soon as
+    ``max_pending`` rows are buffered, and on shutdown.
+    """
+
+    def __init__(self, db_pool=None, flush_interval: float = 1.0, max_pending: int = 10000,
+                 refresh: Optional[Callable[[Tuple[int, str], Position], Position]] = None):
+        self.db_pool = db_pool
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.refresh = refresh
+        self.pending: Dict[Tuple[int, str], Position] = {}
+        self.flush_event = asyncio.Event()
+        self.rows_written = 0
+        self.flushes = 0
+
+    def add(self, position: Position):
+        """Queue a position for the next flush"""
+        self.pending[(position.user_id, position.symbol)] = position
+        if len(self.pending) >= self.max_pending:
+            self.flush_event.set()
+
+    async def flush(self) -> int:
+        """Write all pending positions in one statement"""
+        if not self.pending:
+            return 0
+
+        batch, self.pending = self.pending, {}
+        now = datetime.utcnow()
+        user_ids, symbols, sizes, marks, pnls = [], [], [], [], []
+        for key, position in batch.items():
+            if self.refresh:
+                position = self.refresh(key, position)
+            user_ids.append(position.user_id)
+            symbols.append(position.symbol)
+            sizes.append(position.size)
+            marks.append(position.mark_price)
+            pnls.append(position.unrealized_pnl)
+
+        try:
+            async with self.db_pool.acquire() as conn:
+                await conn.execute("""
+                    UPDATE positions AS p
+                    SET size = u.size, mark_price = u.mark_price,
+                        unrealized_pnl = u.unrealized_pnl, updated_at = $6
+                    FROM unnest($1::bigint[], $2::text[], $3::numeric[], $4::numeric[], $5::numeric[])
+                        AS u(user_id, symbol, size, mark_price, unrealized_pnl)
+                    WHERE p.user_id = u.user_id AND p.symbol = u.symbol
+                """, user_ids, symbols, sizes, marks, pnls, now)
+        except Exception:
+            # Put the batch back without clobbering anything queued meanwhile
+            for key, position in batch.items():
+                self.pending.setdefault(key, position)
+            raise
+
+        self.flushes += 1
+        self.rows_written += len(batch)
+        return len(batch)
+
+    async def run(self):
+        """Flush on the configured interval or when the buffer fills up"""
+        while True:
+            try:
+                try:
+                    await asyncio.wait_for(self.flush_event.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self.flush_event.clear()
+                await self.flush()
+            except Exception as e:
+                logger.error("Position flush error", error=str(e), pending=len(self.pending))
+                await asyncio.sleep(self.flush_interval)
+
+class RollingVolumeWindow:
+    """Trailing trade volume kept in a ring of fixed-width time buckets.
+
+    Advancing the clock only clears the slots that rolled out of the window,
+    so the running total stays exact without rescanning.
+    """
+
+    __slots__ = ("bucket_seconds", "volumes", "total", "head")
+
+    def __init__(self, bucket_seconds: int, bucket_count: int):
+        self.bucket_seconds = bucket_seconds
+        self.volumes = [Decimal('0')] * bucket_count
+        self.total = Decimal('0')
+        self.head = -1
+
+    def _advance(self, bucket: int):
+        if bucket <= self.head:
+            return
+        count = len(self.volumes)
+        for expired in range(max(self.head + 1, bucket - count + 1), bucket + 1):
+            slot = expired % count
+            self.total -= self.volumes[slot]
+            self.volumes[slot] = Decimal('0')
+        self.head = bucket
+
+    def add(self, amount: Decimal, timestamp: float):
+        bucket = int(timestamp // self.bucket_seconds)
+        self._advance(bucket)
+        if bucket <= self.head - len(self.volumes):
+            return  # Already outside the window
+        slot = bucket % len(self.volumes)
+        self.volumes[slot] += amount
+        self.total += amount
+
+    def value(self, timestamp: float) -> Decimal:
+        self._advance(int(timestamp // self.bucket_seconds))
+        return self.total
+
+class UserActivityTracker:
+    """In-memory per-user 24h filled volume and open-order counts.
+
+    Maintained from order events so pre-trade checks never touch the
+    database; ``reset`` periodically replaces the state with a snapshot
+    from Postgres to correct any drift from missed events. Events applied
+    while that snapshot is being read are journaled and replayed onto the
+    new state, skipping fills the snapshot already counted.
+
+    The ``order_events`` topic carries one JSON object per order status
+    change. No producer lives in this repository, so this is the contract
+    the order services must publish (pinned by the integration tests):
+
+    - ``user_id``, ``order_id``: integers (or integer strings)
+    - ``status``: one of ``OPEN_STATUSES`` or ``CLOSED_STATUSES``
+    - ``quantity``, ``price``: decimal strings or numbers; required for FILLED
+    - ``created_at``: optional ISO-8601 order creation time, naive means UTC;
+      fills default to the time the event is applied
+    """
+
+    OPEN_STATUSES = {"NEW", "PARTIALLY_FILLED"}
+    CLOSED_STATUSES = {"FILLED", "CANCELED", "REJECTED", "EXPIRED"}
+
+    def __init__(self, window: timedelta = timedelta(days=1), bucket_seconds: int = 300):
+        self.window = window
+        self.bucket_seconds = bucket_seconds
+        self.bucket_count = int(window.total_seconds() // bucket_seconds)
+        self.volumes: Dict[int, RollingVolumeWindow] = {}
+        self.open_orders: Dict[int, Set[int]] = {}
+        self.journal: Optional[List[Dict]] = None
+
+    def _window(self, user_id: int) -> RollingVolumeWindow:
+        window = self.volumes.get(user_id)
+        if window is None:
+            window = RollingVolumeWindow(self.bucket_seconds, self.bucket_count)
+            self.volumes[user_id] = window
+        return window
+
+    def record_fill(self, user_id: int, notional: Decimal, created_at: Optional[float] = None):
+        self._window(user_id).add(notional, time.time() if created_at is None else created_at)
+
+    def record_order_status(self, user_id: int, order_id: int, status: str):
+        if status in self.OPEN_STATUSES:
+            self.open_orders.setdefault(user_id, set()).add(order_id)
+        elif status in self.CLOSED_STATUSES:
+            self.open_orders.get(user_id, set()).discard(order_id)
+
+    def apply_order_event(self, event: Dict, count_fill: bool = True):
+        """Update counters from an order lifecycle event
+
+        The event is parsed in full before anything is recorded, so a
+        malformed one raises without reaching the counters or the journal.
+        """
+        user_id = int(event["user_id"])
+        order_id = int(event["order_id"])
+        status = event["status"]
+        notional = created_at = None
+        if status == "FILLED" and count_fill:
+            notional = Decimal(str(event["quantity"])) * Decimal(str(event["price"]))
+            created_at = event.get("created_at")
+            if created_at:
+                created_at = datetime.fromisoformat(created_at)
+                if created_at.tzinfo is None:
+                    # Naive timestamps are UTC, like the orders table
+                    created_at = created_at.replace(tzinfo=timezone.utc)
+                created_at = created_at.timestamp()
+        if self.journal is not None:
+            self.journal.append(event)
+        self.record_order_status(user_id, order_id, status)
+        if notional is not None:
+            self.record_fill(user_id, notional, created_at)
+
+    def daily_volume(self, user_id: int) -> Decimal:
+        window = self.volumes.get(user_id)
+        return window.value(time.time()) if window else Decimal('0')
+
+    def open_orders_count(self, user_id: int) -> int:
+        return len(self.open_orders.get(user_id, ()))
+
+    def begin_snapshot(self) -> List[Dict]:
+        """Start journaling events until the next ``reset``"""
+        self.journal = []
+        return self.journal
+
+    def journaled_fills(self) -> Set[int]:
+        """Order ids of the FILLED events journaled so far"""
+        return {int(event["order_id"]) for event in self.journal or ()
+                if event["status"] == "FILLED"}
+
+    def reset(self, volume_rows, open_order_rows, counted_fills: Set[int] = frozenset()):
+        """Replace all state with bucketed volumes and open order ids.
+
+        The new state is built off to the side, then the journaled events are
+        replayed onto it (their fills only if the order id is not in
+        ``counted_fills``) and it is swapped in as a whole.
+        """
+        fresh = UserActivityTracker(self.window, self.bucket_seconds)
+        for row in volume_rows:
+            fresh.record_fill(row["user_id"], Decimal(str(row["volume"])),
+                              row["bucket"] * self.bucket_seconds)
+        for row in open_order_rows:
+            fresh.open_orders.setdefault(row["user_id"], set()).add(row["id"])
+        for event in self.journal or ():
+            fresh.apply_order_event(event, int(event["order_id"]) not in counted_fills)
+        self.volumes = fresh.volumes
+        self.open_orders = fresh.open_orders
+        self.journal = None
+
+class ReturnHistory:
+    """Ring buffer of per-symbol log returns sampled at a fixed interval"""
+
+    def __init__(self, capacity: int = 1440, sample_interval: int = 60):
+        self.capacity = capacity
+        self.sample_interval = sample_interval
+        self.symbols: List[str] = []
+        self.symbol_ids: Dict[str, int] = {}
+        self.returns = np.full((capacity, 0), np.nan)
+        self.last_prices = np.zeros(0)
+        self.count = 0
+
+    def _intern(self, symbol: str) -> int:
+        symbol_id = self.symbol_ids.get(symbol)
+        if symbol_id is None:
+            symbol_id = len(self.symbols)
+            self.symbol_ids[symbol] = symbol_id
+            self.symbols.append(symbol)
+            self.returns = np.hstack([self.returns, np.full((self.capacity, 1), np.nan)])
+            self.last_prices = np.append(self.last_prices, np.nan)
+        return symbol_id
+
+    def sample(self, prices: Dict[str, float]) -> np.ndarray:
+        """Record one interval of returns; symbols without a price get NaN"""
+        for symbol in prices:
+            self._intern(symbol)
+        current = np.full(len(self.symbols), np.nan)
+        for symbol, price in prices.items():
+            current[self.symbol_ids[symbol]] = price
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            returns = np.log(current / self.last_prices)
+        self.returns[self.count % self.capacity] = returns
+        self.count += 1
+        self.last_prices = np.where(np.isnan(current), self.last_prices, current)
+        return returns
+
+    def matrix(self, symbols: List[str]) -> np.ndarray:
+        """Filled samples x ``symbols`` returns, oldest first, missing values as 0"""
+        filled = min(self.count, self.capacity)
+        start = self.count % self.capacity if self.count > self.capacity else 0
+        rows = np.roll(self.returns, -start, axis=0)[:filled]
+        matrix = np.zeros((filled, len(symbols)))
+        for column, symbol in enumerate(symbols):
+            symbol_id = self.symbol_ids.get(symbol)
+            if symbol_id is not None:
+                matrix[:, column] = rows[:, symbol_id]
+        return np.nan_to_num(matrix)
+
+class EWCovariance:
+    """Exponentially-weighted covariance of symbol returns (RiskMetrics style).
+
+    Each sampled return vector ``r`` applies ``cov = decay * cov +
+    (1 - decay) * outer(r, r)``, an O(symbols^2) vectorized update, so
+    correlations stay current without re-reading price history.
+    """
+
+    def __init__(self, decay: float = 0.94, min_samples: int = 30):
+        self.decay = decay
+        self.min_samples = min_samples
+        self.symbols: List[str] = []
+        self.symbol_ids: Dict[str, int] = {}
+        self.cov = np.zeros((0, 0))
+        self.count = 0
+
+    def update(self, symbols: List[str], returns: np.ndarray):
+        """Fold one return vector (aligned with ``symbols``) into the estimate"""
+        for symbol in symbols[len(self.symbols):]:
+            self.symbol_ids[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+        if len(self.cov) < len(self.symbols):
+            grown = np.zeros((len(self.symbols), len(self.symbols)))
+            grown[:len(self.cov), :len(self.cov)] = self.cov
+            self.cov = grown
+
+        # Symbols without a fresh price count as unchanged
+        r = np.nan_to_num(returns[:len(self.symbols)])
+        self.cov *= self.decay
+        self.cov += (1 - self.decay) * np.outer(r, r)
+        self.count += 1
+
+    @property
+    def is_ready(self) -> bool:
+        return self.count >= self.min_samples
+
+    def _select(self, symbols: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        ids = np.array([self.symbol_ids.get(symbol, -1) for symbol in symbols], dtype=np.int64)
+        return ids, ids >= 0
+
+    def volatilities(self, symbols: List[str]) -> np.ndarray:
+        """Per-sample volatility for ``symbols``, 0 where unknown"""
+        ids, known = self._select(symbols)
+        vols = np.zeros(len(symbols))
+        vols[known] = np.sqrt(np.diag(self.cov)[ids[known]])
+        return vols
+
+    def correlation(self, symbols: List[str]) -> np.ndarray:
+        """Correlation matrix for ``symbols``; unknown or flat symbols are uncorrelated"""
+        ids, known = self._select(symbols)
+        corr = np.eye(len(symbols))
+        if not self.is_ready or not known.any():
+            return corr
+
+        index = np.flatnonzero(known)
+        sub = self.cov[np.ix_(ids[known], ids[known])]
+        std = np.sqrt(np.diag(sub))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            sub_corr = sub / np.outer(std, std)
+        sub_corr = np.clip(np.nan_to_num(sub_corr), -1.0, 1.0)
+        np.fill_diagonal(sub_corr, 1.0)
+        corr[np.ix_(index, index)] = sub_corr
+        return corr
+
+class VaREngine:
+    """Portfolio Value-at-Risk for a users x symbols exposure matrix.
+
+    Supports parametric (variance-covariance), historical-simulation and
+    Monte-Carlo modes. Scenario modes build a scenarios x symbols return
+    matrix once and price every portfolio with a single matrix multiply;
+    VaR is reported as a positive loss over ``horizon_seconds``.
+    """
+
+    PARAMETRIC = "parametric"
+    HISTORICAL = "historical"
+    MONTE_CARLO = "monte_carlo"
+    METHODS = (PARAMETRIC, HISTORICAL, MONTE_CARLO)
+
+    def __init__(self, scenarios: int = 5000, default_volatility: float = 0.02,
+                 horizon_seconds: int = 86400, chunk_size: int = 1024, seed: Optional[int] = None):
+        self.scenarios = scenarios
+        self.default_volatility = default_volatility
+        self.horizon_seconds = horizon_seconds
+        self.chunk_size = chunk_size
+        self.rng = np.random.default_rng(seed)
+
+    def volatilities(self, symbols: List[str], market_data: Dict[str, MarketData],
+                     estimated: Optional[np.ndarray] = None) -> np.ndarray:
+        """Per-symbol horizon volatility from market data, then estimates, then the default"""
+        vols = np.full(len(symbols), self.default_volatility)
+        if estimated is not None:
+            vols = np.where(estimated > 0, estimated, vols)
+        for column, symbol in enumerate(symbols):
+            data = market_data.get(symbol)
+            if data and data.volatility > 0:
+                vols[column] = data.volatility
+        return vols
+
+    def covariance(self, volatilities: np.ndarray,
+                   correlation: Optional[np.ndarray] = None) -> np.ndarray:
+        if correlation is None:
+            correlation = np.eye(len(volatilities))
+        return correlation * np.outer(volatilities, volatilities)
+
+    def scenario_returns(self, method: str, covariance: np.ndarray,
+                         history: Optional[ReturnHistory] = None,
+                         symbols: Optional[List[str]] = None) -> np.ndarray:
+        """Scenarios x symbols matrix of horizon returns"""
+        if method == self.HISTORICAL:
+            returns = history.matrix(symbols)
+            if len(returns):
+                return returns * np.sqrt(self.horizon_seconds / history.sample_interval)
+            # Not enough history yet, fall back to simulation
+        # Eigen-decomposition tolerates the semi-definite matrices a
+        # streaming estimate can produce, unlike Cholesky
+        eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+        factor = eigenvectors * np.sqrt(np.clip(eigenvalues, 0, None))
+        shocks = self.rng.standard_normal((self.scenarios, len(covariance)))
+        return shocks @ factor.T
+
+    def portfolio_var(self, exposures: np.ndarray, confidence_level: float, method: str,
+                      covariance: np.ndarray, history: Optional[ReturnHistory] = None,
+                      symbols: Optional[List[str]] = None) -> np.ndarray:
+        """VaR for every row of ``exposures`` (portfolios x symbols)"""
+        if method not in self.METHODS:
+            raise ValueError(f"Unknown VaR method: {method}")
+        if not exposures.size:
+            return np.zeros(len(exposures))
+
+        if method == self.PARAMETRIC:
+            z = NormalDist().inv_cdf(confidence_level)
+            variance = np.einsum('ij,jk,ik->i', exposures, covariance, exposures)
+            return z * np.sqrt(np.clip(variance, 0, None))
+
+        returns = self.scenario_returns(method, covariance, history, symbols)
+        var = np.empty(len(exposures))
+        for start in range(0, len(exposures), self.chunk_size):
+            pnl = exposures[start:start + self.chunk_size] @ returns.T
+            var[start:start + self.chunk_size] = -np.quantile(pnl, 1 - confidence_level, axis=1)
+        return np.clip(var, 0, None)
+
+class DeliveredRecord:
+    """Already-resolved stand-in for kafka-python's record future"""
+
+    def __init__(self, topic: str):
+        self.topic = topic
+
+    def get(self, timeout: Optional[float] = None):
+        return self.topic
+
+class InMemoryBroker:
+    """Local stand-in for KafkaProducer that keeps messages per topic"""
+
+    def __init__(self):
+        self.messages: Dict[str, List[Dict]] = {}
+
+    def send(self, topic: str, value: Dict):
+        self.messages.setdefault(topic, []).append(value)
+        return DeliveredRecord(topic)
+
+    def flush(self, timeout: Optional[float] = None):
+        pass
+
+    def close(self, timeout: Optional[float] = None):
+        pass
+
+class EventPublisher:
+    """Bounded, batching publish pipeline in front of a blocking Kafka producer.
+
+    ``publish`` only enqueues, so the event loop never blocks inside
+    kafka-python. A single task drains the queue in batches and hands each
+    batch to the producer on a worker thread. When the queue is full,
+    publishers wait instead of dropping messages; those waits are counted
+    as backpressure.
+
+    Each message's record future is checked after the flush, since
+    kafka-python reports broker and serialization errors there rather than
+    from ``flush``. Failed messages are dropped except those on
+    ``critical_topics``, which are resent with exponential backoff up to
+    ``max_retries`` times (delivery is at least once, so consumers must
+    tolerate duplicates).
+    """
+
+    def __init__(self, producer=None, max_queue: int = 10000, batch_size: int = 500,
+                 critical_topics=("liquidations", "margin_calls"), max_retries: int = 5,
+                 retry_backoff: float = 0.5, max_backoff: float = 10.0, send_timeout: float = 10.0):
+        self.producer = producer
+        self.batch_size = batch_size
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.critical_topics = set(critical_topics)
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.max_backoff = max_backoff
+        self.send_timeout = send_timeout
+        self.published = 0
+        self.failed = 0
+        self.retries = 0
+        self.batches = 0
+        self.backpressure_waits = 0
+        self.backpressure_seconds = 0.0
+        self.max_depth = 0
+        self.last_batch_seconds = 0.0
+
+    async def publish(self, topic: str, value: Dict):
+        """Queue a message, waiting for room if the pipeline is saturated"""
+        if self.queue.full():
+            self.backpressure_waits += 1
+            started = time.monotonic()
+            await self.queue.put((topic, value))
+            self.backpressure_seconds += time.monotonic() - started
+        else:
+            self.queue.put_nowait((topic, value))
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+
+    def _send_batch(self, batch: List[Tuple[str, Dict]]) -> List[Tuple[Tuple[str, Dict], Exception]]:
+        """Send and flush a batch; returns the messages that failed, with their errors"""
+        sent, failures = [], []
+        for message in batch:
+            try:
+                sent.append((message, self.producer.send(*message)))
+            except Exception as e:
+                failures.append((message, e))
+        self.producer.flush()
+        for message, record in sent:
+            try:
+                record.get(timeout=self.send_timeout)
+            except Exception as e:
+                failures.append((message, e))
+        return failures
+
+    async def run(self):
+        """Drain the queue into the producer batch by batch"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < self.batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+
+            started = time.monotonic()
+            try:
+                await self._deliver(loop, batch)
+            finally:
+                self.last_batch_seconds = time.monotonic() - started
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def _deliver(self, loop, batch: List[Tuple[str, Dict]]):
+        """Send a batch, retrying its critical messages with backoff"""
+        delay = self.retry_backoff
+        for attempt in range(self.max_retries + 1):
+            try:
+                failures = await loop.run_in_executor(None, self._send_batch, batch)
+                self.batches += 1
+            except Exception as e:
+                failures = [(message, e) for message in batch]
+            self.published += len(batch) - len(failures)
+            if not failures:
+                return
+            retry = [] if attempt == self.max_retries else [
+                message for message, _ in failures if message[0] in self.critical_topics
+            ]
+            self.failed += len(failures) - len(retry)
+            logger.error("Event publish failed", error=str(failures[0][1]), messages=len(failures),
+                         retrying=len(retry), attempt=attempt + 1)
+            if not retry:
+                return
+            batch = retry
+            self.retries += 1
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_backoff)
+
+    async def close(self, timeout: float = 10.0):
+        """Wait up to ``timeout`` seconds for queued messages, then close the producer"""
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.error("Event publisher closed with undelivered messages",
+                         queued=self.queue.qsize())
+        if self.producer is not None:
+            loop = asyncio.get_running_loop()
+            try:
+                await loop.run_in_executor(None, self.producer.close, timeout)
+            except Exception as e:
+                logger.error("Event producer close failed", error=str(e))
+
+    def metrics(self) -> Dict:
+        return {
+            "queue_depth": self.queue.qsize(),
+            "max_queue_depth": self.max_depth,
+            "published": self.published,
+            "failed": self.failed,
+            "retries": self.retries,
+            "batches": self.batches,
+            "backpressure_waits": self.backpressure_waits,
+            "backpressure_seconds": round(self.backpressure_seconds, 6),
+            "last_batch_seconds": round(self.last_batch_seconds, 6)
+        }
+
+class UserFeatureCache:
+    """Per-user order statistics for anomaly scoring, kept current from order events.
+
+    Feature vector layout: ``[avg_quantity, avg_price, order_count,
+    quantity, price, time_of_day, recent_orders, daily_volume]``; the first
+    three describe the user's history, the rest the order being scored.
+    """
+
+    def __init__(self, recent_window: int = 3600, decay: float = 0.05):
+        self.recent_window = recent_window
+        self.decay = decay
+        self.stats: Dict[int, List[float]] = {}
+        self.recent: Dict[int, deque] = {}
+
+    def record_order(self, user_id: int, quantity: float, price: float,
+                     timestamp: Optional[float] = None):
+        timestamp = time.time() if timestamp is None else timestamp
+        stats = self.stats.get(user_id)
+        if stats is None:
+            self.stats[user_id] = [quantity, price, 1.0]
+        else:
+            stats[0] += self.decay * (quantity - stats[0])
+            stats[1] += self.decay * (price - stats[1])
+            stats[2] += 1.0
+        recent = self.recent.setdefault(user_id, deque())
+        recent.append(timestamp)
+        self._expire(recent, timestamp)
+
+    def apply_order_event(self, event: Dict):
+        if event.get("status") == "NEW":
+            self.record_order(int(event["user_id"]), float(event["quantity"]), float(event["price"]))
+
+    def _expire(self, recent: deque, now: float):
+        while recent and recent[0] < now - self.recent_window:
+            recent.popleft()
+
+    def features(self, user_id: int, quantity: float, price: float,
+                 daily_volume: float, now: Optional[float] = None) -> List[float]:
+        now = time.time() if now is None else now
+        stats = self.stats.get(user_id, [quantity, price, 0.0])
+        recent = self.recent.get(user_id)
+        if recent:
+            self._expire(recent, now)
+        return stats[:3] + [quantity, price, now % 86400, float(len(recent or ())), daily_volume]
+
+class AnomalyScorer:
+    """Micro-batches concurrent anomaly scoring requests into one model call.
+
+    Requests arriving within ``max_delay`` seconds (or the same event-loop
+    iteration when it is 0) share a single ``scaler.transform`` and
+    ``decision_function`` call; the score doubles as the predict decision,
+    since IsolationForest flags exactly the negative scores.
+    """
+
+    def __init__(self, detector, scaler, max_batch: int = 256, max_delay: float = 0.0):
+        self.detector = detector
+        self.scaler = scaler
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.pending: List[Tuple[List[float], asyncio.Future]] = []
+        self.scheduled = False
+        self.batches = 0
+        self.scored = 0
+
+    async def score(self, features: List[float]) -> float:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((features, future))
+        if len(self.pending) >= self.max_batch:
+            self.flush()
+        elif not self.scheduled:
+            self.scheduled = True
+            if self.max_delay > 0:
+                loop.call_later(self.max_delay, self.flush)
+            else:
+                loop.call_soon(self.flush)
+        return await future
+
+    def flush(self):
+        self.scheduled = False
+        batch, self.pending = self.pending, []
+        if not batch:
+            return
+        try:
+            scores = self.detector.decision_function(
+                self.scaler.transform(np.array([features for features, _ in batch]))
+            )
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self.batches += 1
+        self.scored += len(batch)
+        for (_, future), score in zip(batch, scores):
+            if not future.done():
+                future.set_result(float(score))
+
 class RiskEngine:
     """Core risk management engine"""
     
@@ -122,11 +1109,27 @@ class RiskEngine:
         self.redis_client = None
         self.db_pool = None
         self.kafka_producer = None
+        self.publisher = EventPublisher()
         self.risk_limits: Dict[int, RiskLimits] = {}
         self.positions: Dict[Tuple[int, str], Position] = {}
+        self.position_book = PositionBook()
+        self.trigger_index = TriggerIndex()
+        self.position_writer = PositionWriteBehind(refresh=self.refresh_pending_position)
+        self.dirty_symbols: Set[str] = set()
+        self.price_event = asyncio.Event()
+        self.activity = UserActivityTracker()
+        self.return_history = ReturnHistory()
+        self.var_engine = VaREngine()
+        self.return_covariance = EWCovariance()
+        self._exposure_snapshot: Optional[Dict] = None
+        self._exposure_snapshot_version = -1
+        self.correlation_risk = 0.0  # last value from monitor_market_risk
         self.market_data: Dict[str, MarketData] = {}
         self.anomaly_detector = IsolationForest(contamination=0.1)
         self.scaler = StandardScaler()
+        self.feature_cache = UserFeatureCache()
+        self.anomaly_scorer = AnomalyScorer(self.anomaly_detector, self.scaler)
+        self.background_tasks: List[asyncio.Task] = []
         self.is_trained = False
         
     async def initialize(self):
@@ -141,21 +1144,31 @@ class RiskEngine:
                 min_size=10,
                 max_size=20
             )
+            self.position_writer.db_pool = self.db_pool
             
             # Kafka producer
             self.kafka_producer = KafkaProducer(
                 bootstrap_servers=['localhost:9092'],
                 value_serializer=lambda x: json.dumps(x, default=str).encode('utf-8')
             )
+            self.publisher.producer = self.kafka_producer
             
             # Load risk limits and positions
             await self.load_risk_limits()
             await self.load_positions()
+            await self.reconcile_activity()
             
-            # Start background tasks
-            asyncio.create_task(self.monitor_positions())
-            asyncio.create_task(self.monitor_market_risk())
-            asyncio.create_task(self.train_anomaly_detector())
+            # Start background tasks; the writer and publisher drain on shutdown
+            asyncio.create_task(self.publisher.run())
+            asyncio.create_task(self.position_writer.run())
+            self.background_tasks = [
+                asyncio.create_task(self.monitor_positions()),
+                asyncio.create_task(self.consume_events()),
+                asyncio.create_task(self.reconcile_activity_loop()),
+                asyncio.create_task(self.sample_returns_loop()),
+                asyncio.create_task(self.monitor_market_risk()),
+                asyncio.create_task(self.train_anomaly_detector())
+            ]
             
             logger.info("Risk engine initialized successfully")
             
@@ -191,8 +1204,47 @@ class RiskEngine:
             """)
             
             for row in rows:
-                position = Position(**dict(row))
-                self.positions[(position.user_id, position.symbol)] = position
+                self.add_position(Position(**dict(row)))
+
+    def add_position(self, position: Position):
+        """Track a position in both the object map and the columnar book"""
+        self.positions[(position.user_id, position.symbol)] = position
+        key = (position.user_id, position.symbol)
+        self.position_book.upsert(position, self.risk_limits.get(position.user_id))
+        self.trigger_index.arm(key, position.side,
+                               *self.position_book.trigger_prices(self.position_book.slots[key]))
+        self.mark_symbol_dirty(position.symbol)
+
+    def remove_position(self, user_id: int, symbol: str):
+        """Stop tracking a position"""
+        self.positions.pop((user_id, symbol), None)
+        self.position_book.remove((user_id, symbol))
+        self.trigger_index.disarm((user_id, symbol))
+
+    def sync_position(self, key: Tuple[int, str]) -> Position:
+        """Copy the book's mark price and PnL back onto the Position object"""
+        position = self.positions[key]
+        slot = self.position_book.slots[key]
+        position.mark_price = Decimal(str(self.position_book.mark[slot]))
+        position.unrealized_pnl = Decimal(str(self.position_book.pnl[slot]))
+        return position
+
+    def refresh_pending_position(self, key: Tuple[int, str], position: Position) -> Position:
+        """Bring a buffered position up to date with the book before it is written"""
+        if key in self.position_book.slots and self.positions.get(key) is position:
+            return self.sync_position(key)
+        return position
+
+    async def shutdown(self):
+        """Stop the consumer and monitors, then flush buffered position writes and queued events
+        
+        The producers go first so nothing is buffered or queued after the final flush.
+        """
+        for task in self.background_tasks:
+            task.cancel()
+        await asyncio.gather(*self.background_tasks, return_exceptions=True)
+        await self.position_writer.flush()
+        await self.publisher.close()
 
     async def validate_order(self, user_id: int, symbol: str, side: str, 
                            quantity: Decimal, price: Decimal, order_type: str) -> Tuple[bool, str]:
@@ -256,49 +1308,126 @@ class RiskEngine:
             logger.error("Order validation failed", user_id=user_id, error=str(e))
             return False, f"Validation error: {str(e)}"
 
+    def mark_symbol_dirty(self, symbol: str):
+        """Schedule re-evaluation of a symbol's positions"""
+        self.dirty_symbols.add(symbol)
+        self.price_event.set()
+
+    def update_market_data(self, market_data: MarketData):
+        """Apply a price update and wake the position monitor"""
+        self.market_data[market_data.symbol] = market_data
+        if market_data.symbol in self.position_book.symbol_keys:
+            self.mark_symbol_dirty(market_data.symbol)
+
+    def apply_event(self, record):
+        """Apply one consumed record, an order lifecycle event or a mark-price tick"""
+        if record.topic == 'order_events':
+            self.activity.apply_order_event(record.value)
+            self.feature_cache.apply_order_event(record.value)
+            return
+        tick = record.value
+        self.update_market_data(MarketData(
+            symbol=tick["symbol"],
+            price=Decimal(str(tick["price"])),
+            volume_24h=Decimal(str(tick.get("volume_24h", 0))),
+            volatility=float(tick.get("volatility", 0.0)),
+            bid=Decimal(str(tick.get("bid", tick["price"]))),
+            ask=Decimal(str(tick.get("ask", tick["price"]))),
+            timestamp=datetime.utcnow()
+        ))
+
+    async def consume_events(self, consumer=None):
+        """Feed mark-price ticks and order lifecycle events from Kafka into the engine
+
+        Offsets are auto-committed, so a record that fails to apply is logged
+        and skipped rather than taking the rest of its poll down with it.
+        """
+        loop = asyncio.get_running_loop()
+        if consumer is None:
+            consumer = KafkaConsumer(
+                'market_data',
+                'order_events',
+                bootstrap_servers=['localhost:9092'],
+                value_deserializer=lambda x: json.loads(x.decode('utf-8'))
+            )
+        while True:
+            try:
+                # kafka-python polls synchronously, keep it off the event loop
+                batches = await loop.run_in_executor(None, consumer.poll, 1000)
+            except Exception as e:
+                logger.error("Event consumer error", error=str(e))
+                await asyncio.sleep(5)
+                continue
+            for records in batches.values():
+                for record in records:
+                    try:
+                        self.apply_event(record)
+                    except Exception as e:
+                        logger.error("Skipping malformed event", topic=record.topic,
+                                     offset=getattr(record, "offset", None), error=str(e))
+
     async def monitor_positions(self):
-        """Monitor positions for margin calls and liquidations"""
+        """Re-evaluate positions whenever their symbol's mark price changes"""
         while True:
             try:
-                for (user_id, symbol), position in self.positions.items():
-                    limits = self.risk_limits.get(user_id)
-                    if not limits:
-                        continue
-                    
-                    # Update mark price
-                    market_data = self.market_data.get(symbol)
-                    if market_data:
-                        position.mark_price = market_data.price
-                        position.unrealized_pnl = self.calculate_unrealized_pnl(position)
-                    
-                    # Calculate margin ratio
-                    margin_ratio = self.calculate_margin_ratio(position)
-                    
-                    # Check for margin call
-                    if margin_ratio <= limits.margin_call_threshold:
-                        await self.trigger_margin_call(user_id, symbol, position)
-                    
-                    # Check for liquidation
-                    if margin_ratio <= limits.liquidation_threshold:
-                        await self.trigger_liquidation(user_id, symbol, position)
-                    
-                    # Update position in database
-                    await self.update_position(position)
-                
-                await asyncio.sleep(1)  # Check every second
+                await self.price_event.wait()
+                self.price_event.clear()
+                symbols, self.dirty_symbols = self.dirty_symbols, set()
+                await self.evaluate_symbols(symbols)
                 
             except Exception as e:
                 logger.error("Position monitoring error", error=str(e))
                 await asyncio.sleep(5)
 
+    async def evaluate_symbols(self, symbols: Set[str]):
+        """Fire margin calls and liquidations crossed by the symbols' latest marks"""
+        book = self.position_book
+        slots = book.slots_for(symbols)
+        if not len(slots):
+            return
+        
+        marks = book.symbol_marks(self.market_data, symbols)
+        _, marked = book.evaluate(marks, slots)
+        
+        margin_call_keys = []
+        liquidation_keys = []
+        for symbol in symbols:
+            symbol_id = book.symbol_ids.get(symbol)
+            if symbol_id is None or np.isnan(marks[symbol_id]):
+                continue
+            for kind, key in self.trigger_index.pop_crossed(symbol, marks[symbol_id]):
+                if kind == TriggerIndex.MARGIN_CALL:
+                    margin_call_keys.append(key)
+                else:
+                    liquidation_keys.append(key)
+        marked_keys = [book.keys[slot] for slot in slots[marked]]
+        
+        for user_id, symbol in margin_call_keys:
+            position = self.sync_position((user_id, symbol))
+            await self.trigger_margin_call(user_id, symbol, position)
+        
+        for user_id, symbol in liquidation_keys:
+            if (user_id, symbol) in self.positions:
+                position = self.sync_position((user_id, symbol))
+                await self.trigger_liquidation(user_id, symbol, position)
+        
+        # Queue refreshed marks; values are copied from the book at flush time
+        for key in marked_keys:
+            position = self.positions.get(key)
+            if position:
+                self.position_writer.add(position)
+
     async def monitor_market_risk(self):
         """Monitor market-wide risk factors"""
         while True:
             try:
+                self.position_book.rebuild_exposure()
+                
                 # Calculate portfolio-wide metrics
                 total_exposure = await self.calculate_total_exposure()
                 concentration_risk = await self.calculate_concentration_risk()
                 correlation_risk = await self.calculate_correlation_risk()
+                self.correlation_risk = correlation_risk
                 
                 # Check for system-wide risk thresholds
                 if total_exposure > Decimal('10000000'):  # $10M threshold
@@ -313,6 +1442,12 @@ class RiskEngine:
                         f"High concentration risk: {concentration_risk:.2%}"
                     )
                 
+                if correlation_risk > 0.8:  # Held assets largely move together
+                    await self.create_risk_event(
+                        0, "CORRELATION_RISK", "MEDIUM",
+                        f"High correlation risk: {correlation_risk:.2%}"
+                    )
+                
                 # Monitor funding rates and liquidation cascades
                 await self.monitor_funding_rates()
                 await self.detect_liquidation_cascades()
@@ -352,25 +1487,15 @@ class RiskEngine:
             return False
         
         try:
-            # Get user trading history
-            user_features = await self.get_user_features(user_id, symbol)
-            
-            # Current order features
-            current_features = [
-                float(quantity),
-                float(price),
-                time.time() % 86400,  # Time of day
-                len(await self.get_user_recent_orders(user_id)),
-                float(await self.get_user_daily_volume(user_id))
-            ]
-            
-            # Combine with historical features
-            features = np.array([user_features + current_features])
-            features_scaled = self.scaler.transform(features)
+            # Cached user history combined with the current order
+            features = self.feature_cache.features(
+                user_id, float(quantity), float(price),
+                float(self.activity.daily_volume(user_id))
+            )
             
-            # Predict anomaly
-            anomaly_score = self.anomaly_detector.decision_function(features_scaled)[0]
-            is_anomaly = self.anomaly_detector.predict(features_scaled)[0] == -1
+            # Scored together with concurrent requests; predict() == -1 iff score < 0
+            anomaly_score = await self.anomaly_scorer.score(features)
+            is_anomaly = anomaly_score < 0
             
             if is_anomaly:
                 logger.warning("Anomaly detected", 
@@ -400,7 +1525,7 @@ class RiskEngine:
             })
             
             # Publish to Kafka
-            self.kafka_producer.send('margin_calls', {
+            await self.publisher.publish('margin_calls', {
                 "user_id": user_id,
                 "symbol": symbol,
                 "position": asdict(position),
@@ -437,14 +1562,14 @@ class RiskEngine:
             }
             
             # Publish to Kafka
-            self.kafka_producer.send('liquidations', liquidation_order)
+            await self.publisher.publish('liquidations', liquidation_order)
             
             # Update position status
             position.size = Decimal('0')
             await self.update_position(position)
             
             # Remove from active positions
-            del self.positions[(user_id, symbol)]
+            self.remove_position(user_id, symbol)
             
             logger.critical("Position liquidated", 
                           user_id=user_id, symbol=symbol, 
@@ -453,31 +1578,42 @@ class RiskEngine:
         except Exception as e:
             logger.error("Liquidation trigger error", error=str(e))
 
-    async def calculate_var(self, user_id: int, confidence_level: float = 0.95) -> Decimal:
+    async def sample_returns_loop(self):
+        """Sample mark prices into the return history on a fixed interval"""
+        while True:
+            await asyncio.sleep(self.return_history.sample_interval)
+            try:
+                returns = self.return_history.sample({
+                    symbol: float(data.price) for symbol, data in self.market_data.items()
+                })
+                self.return_covariance.update(self.return_history.symbols, returns)
+            except Exception as e:
+                logger.error("Return sampling error", error=str(e))
+
+    def calculate_portfolio_var(self, user_ids=None, confidence_level: float = 0.95,
+                                method: str = VaREngine.MONTE_CARLO) -> Dict[int, Decimal]:
+        """Value at Risk for the given users (all users by default) in one batch"""
+        book = self.position_book
+        users, exposures = book.exposure_matrix(user_ids)
+        estimated = None
+        correlation = None
+        if self.return_covariance.is_ready:
+            horizon_scale = np.sqrt(self.var_engine.horizon_seconds / self.return_history.sample_interval)
+            estimated = self.return_covariance.volatilities(book.symbols) * horizon_scale
+            correlation = self.return_covariance.correlation(book.symbols)
+        volatilities = self.var_engine.volatilities(book.symbols, self.market_data, estimated)
+        covariance = self.var_engine.covariance(volatilities, correlation)
+        var = self.var_engine.portfolio_var(
+            exposures, confidence_level, method, covariance,
+            history=self.return_history, symbols=book.symbols
+        )
+        return {int(user_id): Decimal(str(round(value, 8))) for user_id, value in zip(users, var)}
+
+    async def calculate_var(self, user_id: int, confidence_level: float = 0.95,
+                            method: str = VaREngine.MONTE_CARLO) -> Decimal:
         """Calculate Value at Risk for user portfolio"""
         try:
-            user_positions = [pos for (uid, _), pos in self.positions.items() if uid == user_id]
-            if not user_positions:
-                return Decimal('0')
-            
-            # Get historical price data
-            portfolio_values = []
-            for i in range(252):  # 1 year of daily data
-                portfolio_value = Decimal('0')
-                for position in user_positions:
-                    # Simulate price changes (simplified)
-                    price_change = np.random.normal(0, 0.02)  # 2% daily volatility
-                    simulated_price = position.mark_price * (1 + Decimal(str(price_change)))
-                    position_value = position.size * simulated_price
-                    portfolio_value += position_value
-                
-                portfolio_values.append(float(portfolio_value))
-            
-            # Calculate VaR
-            var_percentile = (1 - confidence_level) * 100
-            var = np.percentile(portfolio_values, var_percentile)
-            
-            return Decimal(str(var))
+            return self.calculate_portfolio_var([user_id], confidence_level, method).get(user_id, Decimal('0'))
             
         except Exception as e:
             logger.error("VaR calculation error", error=str(e))
@@ -485,40 +1621,50 @@ class RiskEngine:
 
     async def calculate_total_exposure(self) -> Decimal:
         """Calculate total system exposure"""
-        total = Decimal('0')
-        for position in self.positions.values():
-            total += position.size * position.mark_price
-        return total
+        return Decimal(str(round(self.position_book.gross_total, 8)))
 
     async def calculate_concentration_risk(self) -> float:
         """Calculate concentration risk by asset"""
-        if not self.positions:
+        book = self.position_book
+        if not len(book) or book.gross_total <= 0:
             return 0.0
-        
-        symbol_exposure = {}
-        total_exposure = Decimal('0')
-        
-        for position in self.positions.values():
-            exposure = position.size * position.mark_price
-            symbol_exposure[position.symbol] = symbol_exposure.get(position.symbol, Decimal('0')) + exposure
-            total_exposure += exposure
-        
-        if total_exposure == 0:
-            return 0.0
-        
-        max_concentration = max(symbol_exposure.values()) / total_exposure
-        return float(max_concentration)
+        return float(book.symbol_gross.max() / book.gross_total)
+
+    def exposure_snapshot(self) -> Dict:
+        """Per-symbol exposure breakdown, rebuilt only when the aggregates change"""
+        book = self.position_book
+        if self._exposure_snapshot is None or self._exposure_snapshot_version != book.exposure_version:
+            total = book.gross_total
+            self._exposure_snapshot = {
+                "total_exposure": str(Decimal(str(round(total, 8)))),
+                "concentration_risk": float(book.symbol_gross.max() / total) if total > 0 else 0.0,
+                "symbols": {
+                    symbol: {
+                        "gross_exposure": str(Decimal(str(round(book.symbol_gross[symbol_id], 8)))),
+                        "net_exposure": str(Decimal(str(round(book.symbol_net[symbol_id], 8)))),
+                        "share": float(book.symbol_gross[symbol_id] / total) if total > 0 else 0.0
+                    }
+                    for symbol, symbol_id in book.symbol_ids.items()
+                    if book.symbol_keys.get(symbol)
+                },
+                "timestamp": datetime.utcnow().isoformat()
+            }
+            self._exposure_snapshot_version = book.exposure_version
+        return self._exposure_snapshot
 
     async def calculate_correlation_risk(self) -> float:
-        """Calculate portfolio correlation risk"""
-        # Simplified correlation calculation
-        # In production, use actual correlation matrices
-        symbols = list(set(pos.symbol for pos in self.positions.values()))
-        if len(symbols) < 2:
+        """Exposure-weighted average pairwise correlation across held symbols"""
+        book = self.position_book
+        weights = book.symbol_gross
+        if np.count_nonzero(weights > 0) < 2:
             return 0.0
         
-        # Assume high correlation for crypto assets
-        return 0.8  # 80% correlation
+        correlation = self.return_covariance.correlation(book.symbols)
+        squares = float(np.sum(weights ** 2))
+        pair_weight = float(np.sum(weights)) ** 2 - squares
+        if pair_weight <= 0:
+            return 0.0
+        return float((weights @ correlation @ weights - squares) / pair_weight)
 
     def calculate_unrealized_pnl(self, position: Position) -> Decimal:
         """Calculate unrealized PnL for position"""
@@ -548,14 +1694,8 @@ class RiskEngine:
 
     # Database operations
     async def update_position(self, position: Position):
-        """Update position in database"""
-        async with self.db_pool.acquire() as conn:
-            await conn.execute("""
-                UPDATE positions 
-                SET mark_price = $1, unrealized_pnl = $2, updated_at = $3
-                WHERE user_id = $4 AND symbol = $5
-            """, position.mark_price, position.unrealized_pnl, 
-                datetime.utcnow(), position.user_id, position.symbol)
+        """Queue position for the next batched database write"""
+        self.position_writer.add(position)
 
     async def create_risk_event(self, user_id: int, event_type: str, 
                               severity: str, description: str, data: Dict = None):
@@ -583,22 +1723,59 @@ class RiskEngine:
     # Utility methods
     async def get_user_daily_volume(self, user_id: int) -> Decimal:
         """Get user's daily trading volume"""
-        async with self.db_pool.acquire() as conn:
-            result = await conn.fetchval("""
-                SELECT COALESCE(SUM(quantity * price), 0)
-                FROM orders 
-                WHERE user_id = $1 AND created_at >= $2 AND status = 'FILLED'
-            """, user_id, datetime.utcnow() - timedelta(days=1))
-            return Decimal(str(result or 0))
+        return self.activity.daily_volume(user_id)
 
     async def get_user_open_orders_count(self, user_id: int) -> int:
         """Get count of user's open orders"""
-        async with self.db_pool.acquire() as conn:
-            result = await conn.fetchval("""
-                SELECT COUNT(*) FROM orders 
-                WHERE user_id = $1 AND status IN ('NEW', 'PARTIALLY_FILLED')
-            """, user_id)
-            return result or 0
+        return self.activity.open_orders_count(user_id)
+
+    async def reconcile_activity(self):
+        """Rebuild the volume and open-order counters from the orders table"""
+        bucket_seconds = self.activity.bucket_seconds
+        self.activity.begin_snapshot()
+        try:
+            async with self.db_pool.acquire() as conn:
+                # One snapshot for every read, so the fill check below sees
+                # exactly what the volume query counted
+                async with conn.transaction(isolation='repeatable_read', readonly=True):
+                    volume_rows = await conn.fetch("""
+                        SELECT user_id,
+                               FLOOR(EXTRACT(EPOCH FROM created_at) / $2)::bigint AS bucket,
+                               SUM(quantity * price) AS volume
+                        FROM orders
+                        WHERE created_at >= $1 AND status = 'FILLED'
+                        GROUP BY user_id, bucket
+                    """, datetime.utcnow() - self.activity.window, bucket_seconds)
+                    open_order_rows = await conn.fetch("""
+                        SELECT user_id, id FROM orders
+                        WHERE status IN ('NEW', 'PARTIALLY_FILLED')
+                    """)
+                    # Fills that arrived during the reads may already be counted
+                    checked: Set[int] = set()
+                    counted: Set[int] = set()
+                    while True:
+                        unchecked = self.activity.journaled_fills() - checked
+                        if not unchecked:
+                            break
+                        rows = await conn.fetch("""
+                            SELECT id FROM orders
+                            WHERE id = ANY($1::bigint[]) AND status = 'FILLED'
+                        """, list(unchecked))
+                        counted.update(row["id"] for row in rows)
+                        checked.update(unchecked)
+        except BaseException:
+            self.activity.journal = None
+            raise
+        self.activity.reset(volume_rows, open_order_rows, counted)
+
+    async def reconcile_activity_loop(self, interval: int = 300):
+        """Periodically correct in-memory counters against Postgres"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.reconcile_activity()
+            except Exception as e:
+                logger.error("Activity reconciliation error", error=str(e))
 
     async def get_user_balance(self, user_id: int) -> Decimal:
         """Get user's total balance"""
@@ -619,7 +1796,7 @@ class RiskEngine:
         }
         
         # Publish to notification service
-        self.kafka_producer.send('notifications', notification)
+        await self.publisher.publish('notifications', notification)
 
 # FastAPI application
 app = FastAPI(title="TigerEx Risk Management Service", version="1.0.0")
@@ -639,6 +1816,10 @@ risk_engine = RiskEngine()
 async def startup_event():
     await risk_engine.initialize()
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    await risk_engine.shutdown()
+
 # API Models
 class OrderValidationRequest(BaseModel):
     user_id: int
@@ -652,6 +1833,14 @@ class OrderValidationResponse(BaseModel):
     is_valid: bool
     message: str
 
+class MarketDataUpdate(BaseModel):
+    symbol: str
+    price: str
+    volume_24h: str = "0"
+    volatility: float = 0.0
+    bid: Optional[str] = None
+    ask: Optional[str] = None
+
 # API Endpoints
 @app.post("/validate-order", response_model=OrderValidationResponse)
 async def validate_order(request: OrderValidationRequest):
@@ -667,6 +1856,20 @@ async def validate_order(request: OrderValidationRequest):
     
     return OrderValidationResponse(is_valid=is_valid, message=message)
 
+@app.post("/market-data")
+async def update_market_data(update: MarketDataUpdate):
+    """Push a mark-price tick into the risk engine"""
+    risk_engine.update_market_data(MarketData(
+        symbol=update.symbol,
+        price=Decimal(update.price),
+        volume_24h=Decimal(update.volume_24h),
+        volatility=update.volatility,
+        bid=Decimal(update.bid or update.price),
+        ask=Decimal(update.ask or update.price),
+        timestamp=datetime.utcnow()
+    ))
+    return {"symbol": update.symbol, "status": "accepted"}
+
 @app.get("/risk-limits/{user_id}")
 async def get_risk_limits(user_id: int):
     """Get risk limits for user"""
@@ -686,25 +1889,34 @@ async def get_user_positions(user_id: int):
     return positions
 
 @app.get("/var/{user_id}")
-async def get_user_var(user_id: int, confidence_level: float = 0.95):
+async def get_user_var(user_id: int, confidence_level: float = 0.95,
+                       method: str = VaREngine.MONTE_CARLO):
     """Get Value at Risk for user"""
-    var = await risk_engine.calculate_var(user_id, confidence_level)
-    return {"user_id": user_id, "var": str(var), "confidence_level": confidence_level}
+    if method not in VaREngine.METHODS:
+        raise HTTPException(status_code=400, detail=f"Unknown VaR method: {method}")
+    var = await risk_engine.calculate_var(user_id, confidence_level, method)
+    return {"user_id": user_id, "var": str(var), "confidence_level": confidence_level, "method": method}
 
-@app.get("/system/exposure")
-async def get_system_exposure():
-    """Get system-wide exposure metrics"""
-    total_exposure = await risk_engine.calculate_total_exposure()
-    concentration_risk = await risk_engine.calculate_concentration_risk()
-    correlation_risk = await risk_engine.calculate_correlation_risk()
-    
+@app.get("/system/var")
+async def get_system_var(confidence_level: float = 0.95, method: str = VaREngine.PARAMETRIC):
+    """Get Value at Risk for every user with open positions"""
+    if method not in VaREngine.METHODS:
+        raise HTTPException(status_code=400, detail=f"Unknown VaR method: {method}")
+    var = risk_engine.calculate_portfolio_var(None, confidence_level, method)
     return {
-        "total_exposure": str(total_exposure),
-        "concentration_risk": concentration_risk,
-        "correlation_risk": correlation_risk,
+        "var": {str(user_id): str(value) for user_id, value in var.items()},
+        "confidence_level": confidence_level,
+        "method": method,
         "timestamp": datetime.utcnow().isoformat()
     }
 
+@app.get("/system/exposure")
+async def get_system_exposure():
+    """Get system-wide exposure metrics"""
+    snapshot = risk_engine.exposure_snapshot()
+    # Served from the market risk monitor rather than a covariance pass per request
+    return {**snapshot, "correlation_risk": risk_engine.correlation_risk}
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
@@ -712,7 +1924,9 @@ async def health_check():
         "status": "healthy",
         "timestamp": datetime.utcnow().isoformat(),
         "active_positions": len(risk_engine.positions),
-        "monitored_users": len(risk_engine.risk_limits)
+        "monitored_users": len(risk_engine.risk_limits),
+        "pending_position_writes": len(risk_engine.position_writer.pending),
+        "event_publisher": risk_engine.publisher.metrics()
     }
 
 if __name__ == "__main__":
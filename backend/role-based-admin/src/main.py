@@ -13,21 +13,26 @@ from decimal import Decimal
 from typing import Dict, List, Optional, Any
 from enum import Enum
 import secrets
+import sys
 
 import aioredis
 from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel, validator, EmailStr
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, Text, DECIMAL, ForeignKey, JSON, Enum as SQLEnum
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, DECIMAL, ForeignKey, JSON, Enum as SQLEnum, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session, relationship
+from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 import pandas as pd
 import plotly.graph_objects as go
 import plotly.express as px
 from plotly.utils import PlotlyJSONEncoder
 
+sys.path.append(os.path.join(os.path.dirname(__file__), "../../shared"))
+from async_db import create_session_factory, session_dependency
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -56,8 +61,7 @@ class Config:
 config = Config()
 
 # Database setup
-engine = create_engine(config.DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+engine, AsyncSessionLocal = create_session_factory(config.DATABASE_URL)
 Base = declarative_base()
 
 security = HTTPBearer()
@@ -329,12 +333,7 @@ class AffiliateApproval(BaseModel):
     notes: Optional[str] = None
 
 # Dependencies
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+get_async_db = session_dependency(AsyncSessionLocal)
 
 async def get_current_admin(credentials: HTTPAuthorizationCredentials = Depends(security)):
     # Simplified admin authentication - in production, verify JWT and check admin role
@@ -355,7 +354,7 @@ class RoleBasedAdminManager:
     async def initialize(self):
         self.redis_client = await aioredis.from_url(config.REDIS_URL)
     
-    async def get_dashboard_data(self, admin_role: AdminRole, db: Session) -> Dict[str, Any]:
+    async def get_dashboard_data(self, admin_role: AdminRole, db: AsyncSession) -> Dict[str, Any]:
         """Get role-specific dashboard data"""
         
         if admin_role == AdminRole.CUSTOMER_SUPPORT:
@@ -373,31 +372,31 @@ class RoleBasedAdminManager:
         else:
             return await self._get_general_dashboard(db)
     
-    async def _get_support_dashboard(self, db: Session) -> Dict[str, Any]:
+    async def _get_support_dashboard(self, db: AsyncSession) -> Dict[str, Any]:
         """Customer Support dashboard data"""
         
         # Ticket statistics
-        total_tickets = db.query(SupportTicket).count()
-        open_tickets = db.query(SupportTicket).filter(SupportTicket.status == TicketStatus.OPEN).count()
-        in_progress_tickets = db.query(SupportTicket).filter(SupportTicket.status == TicketStatus.IN_PROGRESS).count()
-        resolved_today = db.query(SupportTicket).filter(
+        total_tickets = await db.scalar(select(func.count()).select_from(SupportTicket))
+        open_tickets = await db.scalar(select(func.count()).select_from(SupportTicket).where(SupportTicket.status == TicketStatus.OPEN))
+        in_progress_tickets = await db.scalar(select(func.count()).select_from(SupportTicket).where(SupportTicket.status == TicketStatus.IN_PROGRESS))
+        resolved_today = await db.scalar(select(func.count()).select_from(SupportTicket).where(
             SupportTicket.status == TicketStatus.RESOLVED,
             SupportTicket.resolved_at >= datetime.utcnow().date()
-        ).count()
+        ))
         
         # Average resolution time
-        avg_resolution = db.query(func.avg(SupportTicket.resolution_time)).filter(
+        avg_resolution = await db.scalar(select(func.avg(SupportTicket.resolution_time)).where(
             SupportTicket.status == TicketStatus.RESOLVED
-        ).scalar() or 0
+        )) or 0
         
         # Recent tickets
-        recent_tickets = db.query(SupportTicket).order_by(SupportTicket.created_at.desc()).limit(10).all()
+        recent_tickets = (await db.execute(select(SupportTicket).order_by(SupportTicket.created_at.desc()).limit(10))).scalars().all()
         
         # Ticket categories
-        category_stats = db.query(
+        category_stats = (await db.execute(select(
             SupportTicket.category,
             func.count(SupportTicket.id).label('count')
-        ).group_by(SupportTicket.category).all()
+        ).group_by(SupportTicket.category))).all()
         
         return {
             "overview": {
@@ -424,30 +423,30 @@ class RoleBasedAdminManager:
             ]
         }
     
-    async def _get_kyc_dashboard(self, db: Session) -> Dict[str, Any]:
+    async def _get_kyc_dashboard(self, db: AsyncSession) -> Dict[str, Any]:
         """KYC Admin dashboard data"""
         
         # KYC statistics
-        total_applications = db.query(KYCApplication).count()
-        pending_review = db.query(KYCApplication).filter(KYCApplication.status == KYCStatus.PENDING).count()
-        under_review = db.query(KYCApplication).filter(KYCApplication.status == KYCStatus.UNDER_REVIEW).count()
-        approved_today = db.query(KYCApplication).filter(
+        total_applications = await db.scalar(select(func.count()).select_from(KYCApplication))
+        pending_review = await db.scalar(select(func.count()).select_from(KYCApplication).where(KYCApplication.status == KYCStatus.PENDING))
+        under_review = await db.scalar(select(func.count()).select_from(KYCApplication).where(KYCApplication.status == KYCStatus.UNDER_REVIEW))
+        approved_today = await db.scalar(select(func.count()).select_from(KYCApplication).where(
             KYCApplication.status == KYCStatus.APPROVED,
             KYCApplication.reviewed_at >= datetime.utcnow().date()
-        ).count()
+        ))
         
         # Recent applications
-        recent_applications = db.query(KYCApplication).order_by(KYCApplication.created_at.desc()).limit(10).all()
+        recent_applications = (await db.execute(select(KYCApplication).order_by(KYCApplication.created_at.desc()).limit(10))).scalars().all()
         
         # Risk score distribution
-        risk_distribution = db.query(
+        risk_distribution = (await db.execute(select(
             func.case(
                 (KYCApplication.risk_score < 30, 'Low'),
                 (KYCApplication.risk_score < 70, 'Medium'),
                 else_='High'
             ).label('risk_level'),
             func.count(KYCApplication.id).label('count')
-        ).group_by('risk_level').all()
+        ).group_by('risk_level'))).all()
         
         return {
             "overview": {
@@ -474,22 +473,22 @@ class RoleBasedAdminManager:
             ]
         }
     
-    async def _get_affiliate_dashboard(self, db: Session) -> Dict[str, Any]:
+    async def _get_affiliate_dashboard(self, db: AsyncSession) -> Dict[str, Any]:
         """Affiliate Manager dashboard data"""
         
         # Affiliate statistics
-        total_partners = db.query(AffiliatePartner).count()
-        active_partners = db.query(AffiliatePartner).filter(AffiliatePartner.status == AffiliateStatus.ACTIVE).count()
-        pending_approval = db.query(AffiliatePartner).filter(AffiliatePartner.status == AffiliateStatus.PENDING).count()
+        total_partners = await db.scalar(select(func.count()).select_from(AffiliatePartner))
+        active_partners = await db.scalar(select(func.count()).select_from(AffiliatePartner).where(AffiliatePartner.status == AffiliateStatus.ACTIVE))
+        pending_approval = await db.scalar(select(func.count()).select_from(AffiliatePartner).where(AffiliatePartner.status == AffiliateStatus.PENDING))
         
         # Commission statistics
-        total_commission_earned = db.query(func.sum(AffiliatePartner.total_commission_earned)).scalar() or 0
-        total_commission_paid = db.query(func.sum(AffiliatePartner.total_commission_paid)).scalar() or 0
+        total_commission_earned = await db.scalar(select(func.sum(AffiliatePartner.total_commission_earned))) or 0
+        total_commission_paid = await db.scalar(select(func.sum(AffiliatePartner.total_commission_paid))) or 0
         
         # Top performers
-        top_performers = db.query(AffiliatePartner).order_by(
+        top_performers = (await db.execute(select(AffiliatePartner).order_by(
             AffiliatePartner.total_commission_earned.desc()
-        ).limit(10).all()
+        ).limit(10))).scalars().all()
         
         return {
             "overview": {
@@ -513,28 +512,28 @@ class RoleBasedAdminManager:
             ]
         }
     
-    async def _get_listing_dashboard(self, db: Session) -> Dict[str, Any]:
+    async def _get_listing_dashboard(self, db: AsyncSession) -> Dict[str, Any]:
         """Listing Manager dashboard data"""
         
         # Listing statistics
-        total_applications = db.query(TokenListingApplication).count()
-        pending_review = db.query(TokenListingApplication).filter(
+        total_applications = await db.scalar(select(func.count()).select_from(TokenListingApplication))
+        pending_review = await db.scalar(select(func.count()).select_from(TokenListingApplication).where(
             TokenListingApplication.status == "pending"
-        ).count()
-        approved_applications = db.query(TokenListingApplication).filter(
+        ))
+        approved_applications = await db.scalar(select(func.count()).select_from(TokenListingApplication).where(
             TokenListingApplication.status == "approved"
-        ).count()
+        ))
         
         # Recent applications
-        recent_applications = db.query(TokenListingApplication).order_by(
+        recent_applications = (await db.execute(select(TokenListingApplication).order_by(
             TokenListingApplication.created_at.desc()
-        ).limit(10).all()
+        ).limit(10))).scalars().all()
         
         # Blockchain distribution
-        blockchain_stats = db.query(
+        blockchain_stats = (await db.execute(select(
             TokenListingApplication.blockchain_network,
             func.count(TokenListingApplication.id).label('count')
-        ).group_by(TokenListingApplication.blockchain_network).all()
+        ).group_by(TokenListingApplication.blockchain_network))).all()
         
         return {
             "overview": {
@@ -559,7 +558,7 @@ class RoleBasedAdminManager:
             ]
         }
     
-    async def _get_business_dev_dashboard(self, db: Session) -> Dict[str, Any]:
+    async def _get_business_dev_dashboard(self, db: AsyncSession) -> Dict[str, Any]:
         """Business Development Manager dashboard data"""
         
         # Partnership statistics
@@ -586,7 +585,7 @@ class RoleBasedAdminManager:
             "regional_stats": regional_stats
         }
     
-    async def _get_general_dashboard(self, db: Session) -> Dict[str, Any]:
+    async def _get_general_dashboard(self, db: AsyncSession) -> Dict[str, Any]:
         """General admin dashboard data"""
         
         return {
@@ -609,7 +608,7 @@ async def startup_event():
 @app.get("/api/v1/admin/dashboard")
 async def get_admin_dashboard(
     current_admin: Dict[str, Any] = Depends(get_current_admin),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get role-specific admin dashboard"""
     dashboard_data = await admin_manager.get_dashboard_data(current_admin["role"], db)
@@ -624,20 +623,20 @@ async def get_support_tickets(
     limit: int = 50,
     offset: int = 0,
     current_admin: Dict[str, Any] = Depends(check_role([AdminRole.CUSTOMER_SUPPORT])),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get support tickets"""
-    query = db.query(SupportTicket)
+    query = select(SupportTicket)
     
     if status:
-        query = query.filter(SupportTicket.status == status)
+        query = query.where(SupportTicket.status == status)
     if priority:
-        query = query.filter(SupportTicket.priority == priority)
+        query = query.where(SupportTicket.priority == priority)
     if assigned_to:
-        query = query.filter(SupportTicket.assigned_to == assigned_to)
+        query = query.where(SupportTicket.assigned_to == assigned_to)
     
-    tickets = query.order_by(SupportTicket.created_at.desc()).offset(offset).limit(limit).all()
-    total = query.count()
+    tickets = (await db.execute(query.order_by(SupportTicket.created_at.desc()).offset(offset).limit(limit))).scalars().all()
+    total = await db.scalar(select(func.count()).select_from(query.subquery()))
     
     return {
         "tickets": [
@@ -662,10 +661,10 @@ async def assign_ticket(
     ticket_id: str,
     assignment: TicketAssignment,
     current_admin: Dict[str, Any] = Depends(check_role([AdminRole.CUSTOMER_SUPPORT])),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Assign ticket to admin"""
-    ticket = db.query(SupportTicket).filter(SupportTicket.ticket_id == ticket_id).first()
+    ticket = await db.scalar(select(SupportTicket).where(SupportTicket.ticket_id == ticket_id))
     if not ticket:
         raise HTTPException(status_code=404, detail="Ticket not found")
     
@@ -676,7 +675,7 @@ async def assign_ticket(
     if assignment.priority:
         ticket.priority = assignment.priority
     
-    db.commit()
+    await db.commit()
     
     return {"message": "Ticket assigned successfully"}
 
@@ -685,10 +684,10 @@ async def resolve_ticket(
     ticket_id: str,
     resolution: TicketResolution,
     current_admin: Dict[str, Any] = Depends(check_role([AdminRole.CUSTOMER_SUPPORT])),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Resolve support ticket"""
-    ticket = db.query(SupportTicket).filter(SupportTicket.ticket_id == ticket_id).first()
+    ticket = await db.scalar(select(SupportTicket).where(SupportTicket.ticket_id == ticket_id))
     if not ticket:
         raise HTTPException(status_code=404, detail="Ticket not found")
     
@@ -699,7 +698,7 @@ async def resolve_ticket(
     if ticket.created_at:
         ticket.resolution_time = int((datetime.utcnow() - ticket.created_at).total_seconds() / 60)
     
-    db.commit()
+    await db.commit()
     
     return {"message": "Ticket resolved successfully"}
 
@@ -711,23 +710,23 @@ async def get_kyc_applications(
     limit: int = 50,
     offset: int = 0,
     current_admin: Dict[str, Any] = Depends(check_role([AdminRole.KYC_ADMIN])),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get KYC applications"""
-    query = db.query(KYCApplication)
+    query = select(KYCApplication)
     
     if status:
-        query = query.filter(KYCApplication.status == status)
+        query = query.where(KYCApplication.status == status)
     if risk_level:
         if risk_level == "low":
-            query = query.filter(KYCApplication.risk_score < 30)
+            query = query.where(KYCApplication.risk_score < 30)
         elif risk_level == "medium":
-            query = query.filter(KYCApplication.risk_score.between(30, 70))
+            query = query.where(KYCApplication.risk_score.between(30, 70))
         elif risk_level == "high":
-            query = query.filter(KYCApplication.risk_score > 70)
+            query = query.where(KYCApplication.risk_score > 70)
     
-    applications = query.order_by(KYCApplication.created_at.desc()).offset(offset).limit(limit).all()
-    total = query.count()
+    applications = (await db.execute(query.order_by(KYCApplication.created_at.desc()).offset(offset).limit(limit))).scalars().all()
+    total = await db.scalar(select(func.count()).select_from(query.subquery()))
     
     return {
         "applications": [
@@ -751,12 +750,12 @@ async def review_kyc_application(
     application_id: str,
     review: KYCReview,
     current_admin: Dict[str, Any] = Depends(check_role([AdminRole.KYC_ADMIN])),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Review KYC application"""
-    application = db.query(KYCApplication).filter(
+    application = await db.scalar(select(KYCApplication).where(
         KYCApplication.application_id == application_id
-    ).first()
+    ))
     
     if not application:
         raise HTTPException(status_code=404, detail="Application not found")
@@ -772,7 +771,7 @@ async def review_kyc_application(
     if review.risk_score:
         application.risk_score = review.risk_score
     
-    db.commit()
+    await db.commit()
     
     return {"message": "KYC application reviewed successfully"}
 
@@ -784,18 +783,18 @@ async def get_affiliate_partners(
     limit: int = 50,
     offset: int = 0,
     current_admin: Dict[str, Any] = Depends(check_role([AdminRole.AFFILIATE_MANAGER])),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get affiliate partners"""
-    query = db.query(AffiliatePartner)
+    query = select(AffiliatePartner)
     
     if status:
-        query = query.filter(AffiliatePartner.status == status)
+        query = query.where(AffiliatePartner.status == status)
     if partner_type:
-        query = query.filter(AffiliatePartner.partner_type == partner_type)
+        query = query.where(AffiliatePartner.partner_type == partner_type)
     
-    partners = query.order_by(AffiliatePartner.created_at.desc()).offset(offset).limit(limit).all()
-    total = query.count()
+    partners = (await db.execute(query.order_by(AffiliatePartner.created_at.desc()).offset(offset).limit(limit))).scalars().all()
+    total = await db.scalar(select(func.count()).select_from(query.subquery()))
     
     return {
         "partners": [
@@ -821,10 +820,10 @@ async def approve_affiliate_partner(
     partner_id: str,
     approval: AffiliateApproval,
     current_admin: Dict[str, Any] = Depends(check_role([AdminRole.AFFILIATE_MANAGER])),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Approve/reject affiliate partner"""
-    partner = db.query(AffiliatePartner).filter(AffiliatePartner.partner_id == partner_id).first()
+    partner = await db.scalar(select(AffiliatePartner).where(AffiliatePartner.partner_id == partner_id))
     if not partner:
         raise HTTPException(status_code=404, detail="Partner not found")
     
@@ -835,7 +834,7 @@ async def approve_affiliate_partner(
     if approval.commission_rate:
         partner.commission_rate = approval.commission_rate
     
-    db.commit()
+    await db.commit()
     
     return {"message": "Affiliate partner status updated successfully"}
 
@@ -847,18 +846,18 @@ async def get_token_listings(
     limit: int = 50,
     offset: int = 0,
     current_admin: Dict[str, Any] = Depends(check_role([AdminRole.LISTING_MANAGER])),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get token listing applications"""
-    query = db.query(TokenListingApplication)
+    query = select(TokenListingApplication)
     
     if status:
-        query = query.filter(TokenListingApplication.status == status)
+        query = query.where(TokenListingApplication.status == status)
     if blockchain:
-        query = query.filter(TokenListingApplication.blockchain_network == blockchain)
+        query = query.where(TokenListingApplication.blockchain_network == blockchain)
     
-    applications = query.order_by(TokenListingApplication.created_at.desc()).offset(offset).limit(limit).all()
-    total = query.count()
+    applications = (await db.execute(query.order_by(TokenListingApplication.created_at.desc()).offset(offset).limit(limit))).scalars().all()
+    total = await db.scalar(select(func.count()).select_from(query.subquery()))
     
     return {
         "applications": [
@@ -0,0 +1,63 @@
+"""
+TigerEx async database session layer
+Shared by the Python services whose FastAPI handlers talk to Postgres through
+SQLAlchemy, so queries are awaited instead of blocking the event loop
+
+Services import it by path:
+
+    sys.path.append(os.path.join(os.path.dirname(__file__), "../../shared"))
+    from async_db import create_session_factory, session_dependency
+
+Images copy it in from a named build context (``COPY --from=shared . /shared/``),
+which docker-compose passes as ``additional_contexts``; outside compose, build
+with ``docker build --build-context shared=../shared .``
+"""
+
+import os
+from typing import Any, AsyncIterator, Callable, Dict, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+
+# Database pool, per worker process
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+def async_database_url(url: str) -> str:
+    """Point a DATABASE_URL at the asyncio driver for its backend"""
+    scheme, sep, rest = url.partition("://")
+    return f"{ASYNC_DRIVERS.get(scheme, scheme)}{sep}{rest}"
+
+def pool_options(url: str) -> Dict[str, Any]:
+    if url.startswith("sqlite"):
+        return {}
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": True
+    }
+
+def create_session_factory(url: str) -> Tuple[AsyncEngine, async_sessionmaker]:
+    """Engine and session factory for a DATABASE_URL
+
+    Sessions keep loaded attributes after commit, since an expired attribute
+    would need an implicit lazy load, which AsyncSession does not allow.
+    """
+    engine = create_async_engine(async_database_url(url), **pool_options(url))
+    return engine, async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+
+def session_dependency(session_factory: async_sessionmaker) -> Callable[[], AsyncIterator[AsyncSession]]:
+    """FastAPI dependency yielding one session per request"""
+    async def get_async_db() -> AsyncIterator[AsyncSession]:
+        async with session_factory() as db:
+            yield db
+    return get_async_db
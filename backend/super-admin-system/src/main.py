@@ -14,6 +14,7 @@ from typing import Dict, List, Optional, Any
 from enum import Enum
 import secrets
 import subprocess
+import sys
 import docker
 import boto3
 from kubernetes import client, config as k8s_config
@@ -23,13 +24,17 @@ from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel, validator, EmailStr
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, Text, DECIMAL, ForeignKey, JSON, Enum as SQLEnum
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, DECIMAL, ForeignKey, JSON, Enum as SQLEnum, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session, relationship
+from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from web3 import Web3
 import solcx
 
+sys.path.append(os.path.join(os.path.dirname(__file__), "../../shared"))
+from async_db import create_session_factory, session_dependency
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -68,8 +73,7 @@ class Config:
 config = Config()
 
 # Database setup
-engine = create_engine(config.DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+engine, AsyncSessionLocal = create_session_factory(config.DATABASE_URL)
 Base = declarative_base()
 
 security = HTTPBearer()
@@ -356,12 +360,7 @@ class ExplorerCreate(BaseModel):
     domain_name: Optional[str] = None
 
 # Dependencies
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+get_async_db = session_dependency(AsyncSessionLocal)
 
 async def get_current_admin(credentials: HTTPAuthorizationCredentials = Depends(security)):
     # Simplified admin authentication - in production, verify JWT and check admin role
@@ -394,7 +393,7 @@ class SuperAdminManager:
         except:
             k8s_config.load_kube_config()
     
-    async def create_custom_blockchain(self, blockchain_data: BlockchainCreate, admin: Dict[str, Any], db: Session):
+    async def create_custom_blockchain(self, blockchain_data: BlockchainCreate, admin: Dict[str, Any], db: AsyncSession):
         """Create and deploy custom blockchain"""
         
         blockchain_id = f"CHAIN_{secrets.token_hex(8).upper()}"
@@ -414,8 +413,8 @@ class SuperAdminManager:
         )
         
         db.add(blockchain)
-        db.commit()
-        db.refresh(blockchain)
+        await db.commit()
+        await db.refresh(blockchain)
         
         # Start deployment process
         await self._deploy_blockchain(blockchain)
@@ -598,15 +597,15 @@ CMD ["echo", "Custom blockchain container"]
             logger.error(f"Domain/SSL setup failed: {str(e)}")
             return None
     
-    async def create_custom_dex(self, dex_data: DEXCreate, admin: Dict[str, Any], db: Session):
+    async def create_custom_dex(self, dex_data: DEXCreate, admin: Dict[str, Any], db: AsyncSession):
         """Create and deploy custom DEX"""
         
         dex_id = f"DEX_{secrets.token_hex(8).upper()}"
         
         # Get blockchain
-        blockchain = db.query(CustomBlockchain).filter(
+        blockchain = await db.scalar(select(CustomBlockchain).where(
             CustomBlockchain.blockchain_id == dex_data.blockchain_id
-        ).first()
+        ))
         
         if not blockchain:
             raise HTTPException(status_code=404, detail="Blockchain not found")
@@ -624,8 +623,9 @@ CMD ["echo", "Custom blockchain container"]
         )
         
         db.add(dex)
-        db.commit()
-        db.refresh(dex)
+        await db.commit()
+        await db.refresh(dex)
+        await db.refresh(dex, ["blockchain"])
         
         # Deploy smart contracts and frontend
         await self._deploy_dex(dex, blockchain)
@@ -700,7 +700,7 @@ CMD ["npm", "start"]
         # Deploy to Kubernetes (similar to blockchain deployment)
         # This would create the frontend deployment
     
-    async def create_whitelabel_exchange(self, exchange_data: ExchangeCreate, admin: Dict[str, Any], db: Session):
+    async def create_whitelabel_exchange(self, exchange_data: ExchangeCreate, admin: Dict[str, Any], db: AsyncSession):
         """Create white-label exchange"""
         
         exchange_id = f"EXCHANGE_{secrets.token_hex(8).upper()}"
@@ -723,8 +723,8 @@ CMD ["npm", "start"]
         )
         
         db.add(exchange)
-        db.commit()
-        db.refresh(exchange)
+        await db.commit()
+        await db.refresh(exchange)
         
         # Deploy exchange infrastructure
         await self._deploy_exchange(exchange)
@@ -781,20 +781,20 @@ async def startup_event():
 @app.get("/api/v1/super-admin/dashboard")
 async def get_super_admin_dashboard(
     current_admin: Dict[str, Any] = Depends(check_permission(AdminRole.SUPER_ADMIN)),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get super admin dashboard"""
     
     # Get counts
-    total_admins = db.query(AdminUser).count()
-    total_blockchains = db.query(CustomBlockchain).count()
-    total_dexs = db.query(CustomDEX).count()
-    total_exchanges = db.query(WhiteLabelExchange).count()
-    total_explorers = db.query(BlockExplorer).count()
+    total_admins = await db.scalar(select(func.count()).select_from(AdminUser))
+    total_blockchains = await db.scalar(select(func.count()).select_from(CustomBlockchain))
+    total_dexs = await db.scalar(select(func.count()).select_from(CustomDEX))
+    total_exchanges = await db.scalar(select(func.count()).select_from(WhiteLabelExchange))
+    total_explorers = await db.scalar(select(func.count()).select_from(BlockExplorer))
     
     # Get recent deployments
-    recent_blockchains = db.query(CustomBlockchain).order_by(CustomBlockchain.created_at.desc()).limit(5).all()
-    recent_exchanges = db.query(WhiteLabelExchange).order_by(WhiteLabelExchange.created_at.desc()).limit(5).all()
+    recent_blockchains = (await db.execute(select(CustomBlockchain).order_by(CustomBlockchain.created_at.desc()).limit(5))).scalars().all()
+    recent_exchanges = (await db.execute(select(WhiteLabelExchange).order_by(WhiteLabelExchange.created_at.desc()).limit(5))).scalars().all()
     
     return {
         "overview": {
@@ -830,7 +830,7 @@ async def get_super_admin_dashboard(
 async def create_blockchain(
     blockchain_data: BlockchainCreate,
     current_admin: Dict[str, Any] = Depends(check_permission(AdminRole.SUPER_ADMIN)),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create custom blockchain"""
     blockchain = await admin_manager.create_custom_blockchain(blockchain_data, current_admin, db)
@@ -846,7 +846,7 @@ async def create_blockchain(
 async def create_dex(
     dex_data: DEXCreate,
     current_admin: Dict[str, Any] = Depends(check_permission(AdminRole.SUPER_ADMIN)),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create custom DEX"""
     dex = await admin_manager.create_custom_dex(dex_data, current_admin, db)
@@ -862,7 +862,7 @@ async def create_dex(
 async def create_exchange(
     exchange_data: ExchangeCreate,
     current_admin: Dict[str, Any] = Depends(check_permission(AdminRole.SUPER_ADMIN)),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create white-label exchange"""
     exchange = await admin_manager.create_whitelabel_exchange(exchange_data, current_admin, db)
@@ -877,10 +877,10 @@ async def create_exchange(
 @app.get("/api/v1/super-admin/blockchains")
 async def get_blockchains(
     current_admin: Dict[str, Any] = Depends(check_permission(AdminRole.SUPER_ADMIN)),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get all custom blockchains"""
-    blockchains = db.query(CustomBlockchain).all()
+    blockchains = (await db.execute(select(CustomBlockchain))).scalars().all()
     return {
         "blockchains": [
             {
@@ -902,10 +902,10 @@ async def get_blockchains(
 @app.get("/api/v1/super-admin/exchanges")
 async def get_exchanges(
     current_admin: Dict[str, Any] = Depends(check_permission(AdminRole.SUPER_ADMIN)),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get all white-label exchanges"""
-    exchanges = db.query(WhiteLabelExchange).all()
+    exchanges = (await db.execute(select(WhiteLabelExchange))).scalars().all()
     return {
         "exchanges": [
             {
@@ -14,6 +14,7 @@ from typing import Dict, List, Optional, Any
 from enum import Enum
 import secrets
 import hashlib
+import sys
 from mnemonic import Mnemonic
 from hdwallet import HDWallet
 from hdwallet.symbols import BTC, ETH
@@ -28,12 +29,16 @@ from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel, validator, EmailStr
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, Text, DECIMAL, ForeignKey, JSON, Enum as SQLEnum, LargeBinary
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, DECIMAL, ForeignKey, JSON, Enum as SQLEnum, LargeBinary, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session, relationship
+from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from web3 import Web3
 
+sys.path.append(os.path.join(os.path.dirname(__file__), "../../shared"))
+from async_db import create_session_factory, session_dependency
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -69,8 +74,7 @@ class Config:
 config = Config()
 
 # Database setup
-engine = create_engine(config.DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+engine, AsyncSessionLocal = create_session_factory(config.DATABASE_URL)
 Base = declarative_base()
 
 security = HTTPBearer()
@@ -317,12 +321,7 @@ class WalletBackup(BaseModel):
     backup_locations: List[str] = []
 
 # Dependencies
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+get_async_db = session_dependency(AsyncSessionLocal)
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     return {"user_id": "user_123", "username": "testuser"}
@@ -352,7 +351,7 @@ class WalletManager:
         """Decrypt sensitive data"""
         return self.fernet.decrypt(encrypted_data).decode()
     
-    async def create_wallet(self, wallet_data: WalletCreate, user: Dict[str, Any], db: Session):
+    async def create_wallet(self, wallet_data: WalletCreate, user: Dict[str, Any], db: AsyncSession):
         """Create new wallet"""
         
         wallet_id = f"WALLET_{secrets.token_hex(8).upper()}"
@@ -385,8 +384,8 @@ class WalletManager:
         )
         
         db.add(wallet)
-        db.commit()
-        db.refresh(wallet)
+        await db.commit()
+        await db.refresh(wallet)
         
         # Initialize balance records
         await self._initialize_wallet_balances(wallet, db)
@@ -471,7 +470,7 @@ class WalletManager:
         else:
             raise HTTPException(status_code=400, detail="Unsupported network for non-custodial wallet")
     
-    async def _initialize_wallet_balances(self, wallet: Wallet, db: Session):
+    async def _initialize_wallet_balances(self, wallet: Wallet, db: AsyncSession):
         """Initialize balance records for wallet"""
         
         # Get supported tokens for the network
@@ -488,7 +487,7 @@ class WalletManager:
             )
             db.add(balance)
         
-        db.commit()
+        await db.commit()
     
     def _get_supported_tokens(self, network: BlockchainNetwork) -> List[Dict]:
         """Get supported tokens for a blockchain network"""
@@ -515,7 +514,7 @@ class WalletManager:
         else:
             return [{"symbol": network.value.upper(), "address": None}]
     
-    async def import_wallet(self, import_data: WalletImport, user: Dict[str, Any], db: Session):
+    async def import_wallet(self, import_data: WalletImport, user: Dict[str, Any], db: AsyncSession):
         """Import existing wallet"""
         
         wallet_id = f"WALLET_{secrets.token_hex(8).upper()}"
@@ -554,8 +553,8 @@ class WalletManager:
         )
         
         db.add(wallet)
-        db.commit()
-        db.refresh(wallet)
+        await db.commit()
+        await db.refresh(wallet)
         
         # Initialize balances and sync
         await self._initialize_wallet_balances(wallet, db)
@@ -620,7 +619,7 @@ class WalletManager:
         except Exception as e:
             raise HTTPException(status_code=400, detail="Failed to decrypt keystore")
     
-    async def _sync_wallet_balance(self, wallet: Wallet, db: Session):
+    async def _sync_wallet_balance(self, wallet: Wallet, db: AsyncSession):
         """Sync wallet balance with blockchain"""
         
         try:
@@ -632,10 +631,10 @@ class WalletManager:
                 balance_eth = web3.from_wei(balance_wei, 'ether')
                 
                 # Update native token balance
-                native_balance = db.query(WalletBalance).filter(
+                native_balance = await db.scalar(select(WalletBalance).where(
                     WalletBalance.wallet_id == wallet.id,
                     WalletBalance.token_address.is_(None)
-                ).first()
+                ))
                 
                 if native_balance:
                     native_balance.available_balance = balance_eth
@@ -645,18 +644,18 @@ class WalletManager:
                 # Get ERC20 token balances (simplified)
                 # In production, you would iterate through all tokens
                 
-                db.commit()
+                await db.commit()
                 
         except Exception as e:
             logger.error(f"Failed to sync wallet balance: {str(e)}")
     
-    async def create_transaction(self, wallet_id: str, tx_data: TransactionCreate, user: Dict[str, Any], db: Session):
+    async def create_transaction(self, wallet_id: str, tx_data: TransactionCreate, user: Dict[str, Any], db: AsyncSession):
         """Create new transaction"""
         
-        wallet = db.query(Wallet).filter(
+        wallet = await db.scalar(select(Wallet).where(
             Wallet.wallet_id == wallet_id,
             Wallet.user_id == user["user_id"]
-        ).first()
+        ))
         
         if not wallet:
             raise HTTPException(status_code=404, detail="Wallet not found")
@@ -665,10 +664,10 @@ class WalletManager:
             raise HTTPException(status_code=400, detail="Wallet is not active")
         
         # Check balance
-        balance = db.query(WalletBalance).filter(
+        balance = await db.scalar(select(WalletBalance).where(
             WalletBalance.wallet_id == wallet.id,
             WalletBalance.token_symbol == tx_data.token_symbol
-        ).first()
+        ))
         
         if not balance or balance.available_balance < tx_data.amount:
             raise HTTPException(status_code=400, detail="Insufficient balance")
@@ -693,15 +692,15 @@ class WalletManager:
         balance.available_balance -= tx_data.amount
         balance.locked_balance += tx_data.amount
         
-        db.commit()
-        db.refresh(transaction)
+        await db.commit()
+        await db.refresh(transaction)
         
         # Process transaction asynchronously
         await self._process_transaction(transaction, wallet, db)
         
         return transaction
     
-    async def _process_transaction(self, transaction: WalletTransaction, wallet: Wallet, db: Session):
+    async def _process_transaction(self, transaction: WalletTransaction, wallet: Wallet, db: AsyncSession):
         """Process blockchain transaction"""
         
         try:
@@ -728,23 +727,23 @@ class WalletManager:
                 # For cold wallets, mark as pending manual processing
                 transaction.status = TransactionStatus.PENDING
             
-            db.commit()
+            await db.commit()
             
         except Exception as e:
             logger.error(f"Transaction processing failed: {str(e)}")
             transaction.status = TransactionStatus.FAILED
             
             # Unlock balance
-            balance = db.query(WalletBalance).filter(
+            balance = await db.scalar(select(WalletBalance).where(
                 WalletBalance.wallet_id == wallet.id,
                 WalletBalance.token_symbol == transaction.token_symbol
-            ).first()
+            ))
             
             if balance:
                 balance.available_balance += transaction.amount
                 balance.locked_balance -= transaction.amount
             
-            db.commit()
+            await db.commit()
     
     async def _send_blockchain_transaction(self, web3: Web3, private_key: str, transaction: WalletTransaction) -> str:
         """Send transaction to blockchain"""
@@ -780,7 +779,7 @@ async def startup_event():
 async def create_wallet(
     wallet_data: WalletCreate,
     current_user: Dict[str, Any] = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create new wallet"""
     wallet = await wallet_manager.create_wallet(wallet_data, current_user, db)
@@ -797,7 +796,7 @@ async def create_wallet(
 async def import_wallet(
     import_data: WalletImport,
     current_user: Dict[str, Any] = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Import existing wallet"""
     wallet = await wallet_manager.import_wallet(import_data, current_user, db)
@@ -813,10 +812,10 @@ async def import_wallet(
 @app.get("/api/v1/wallets")
 async def get_user_wallets(
     current_user: Dict[str, Any] = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get user's wallets"""
-    wallets = db.query(Wallet).filter(Wallet.user_id == current_user["user_id"]).all()
+    wallets = (await db.execute(select(Wallet).where(Wallet.user_id == current_user["user_id"]))).scalars().all()
     
     return {
         "wallets": [
@@ -838,18 +837,18 @@ async def get_user_wallets(
 async def get_wallet_balance(
     wallet_id: str,
     current_user: Dict[str, Any] = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get wallet balance"""
-    wallet = db.query(Wallet).filter(
+    wallet = await db.scalar(select(Wallet).where(
         Wallet.wallet_id == wallet_id,
         Wallet.user_id == current_user["user_id"]
-    ).first()
+    ))
     
     if not wallet:
         raise HTTPException(status_code=404, detail="Wallet not found")
     
-    balances = db.query(WalletBalance).filter(WalletBalance.wallet_id == wallet.id).all()
+    balances = (await db.execute(select(WalletBalance).where(WalletBalance.wallet_id == wallet.id))).scalars().all()
     
     return {
         "wallet_id": wallet_id,
@@ -871,7 +870,7 @@ async def send_transaction(
     wallet_id: str,
     tx_data: TransactionCreate,
     current_user: Dict[str, Any] = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Send transaction from wallet"""
     transaction = await wallet_manager.create_transaction(wallet_id, tx_data, current_user, db)
@@ -889,20 +888,20 @@ async def get_wallet_transactions(
     limit: int = 50,
     offset: int = 0,
     current_user: Dict[str, Any] = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get wallet transactions"""
-    wallet = db.query(Wallet).filter(
+    wallet = await db.scalar(select(Wallet).where(
         Wallet.wallet_id == wallet_id,
         Wallet.user_id == current_user["user_id"]
-    ).first()
+    ))
     
     if not wallet:
         raise HTTPException(status_code=404, detail="Wallet not found")
     
-    transactions = db.query(WalletTransaction).filter(
+    transactions = (await db.execute(select(WalletTransaction).where(
         WalletTransaction.wallet_id == wallet.id
-    ).order_by(WalletTransaction.created_at.desc()).offset(offset).limit(limit).all()
+    ).order_by(WalletTransaction.created_at.desc()).offset(offset).limit(limit))).scalars().all()
     
     return {
         "transactions": [
@@ -89,7 +89,8 @@ build_images() {
         log_info "Building ${service}..."
         
         if [ -f "backend/${service}/Dockerfile" ]; then
-            docker build -t "${DOCKER_REGISTRY}/${service}:${VERSION}" "backend/${service}/"
+            docker build --build-context shared=backend/shared \
+                -t "${DOCKER_REGISTRY}/${service}:${VERSION}" "backend/${service}/"
         elif [ -f "frontend/Dockerfile" ] && [ "${service}" = "frontend" ]; then
             docker build -t "${DOCKER_REGISTRY}/${service}:${VERSION}" "frontend/"
         else
@@ -2,29 +2,40 @@
 Integration tests for P2P Trading System
 """
 
+import asyncio
+import json
 import pytest
+import secrets
+from datetime import datetime, timedelta
+from decimal import Decimal
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from fastapi import HTTPException, WebSocketDisconnect
+from sqlalchemy import create_engine, event, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 import sys
 
 # Import the P2P trading service
 sys.path.append('backend/p2p-trading/src')
-from main import app, get_db, Base
+from main import (
+    app, get_async_db, get_chat_user, get_current_user, p2p_manager, Base, ChatMessageWriter, ChatRoomHub,
+    DeadlineScheduler, P2PAdBook, P2POrder, P2PTrade, P2PUser, PaymentMethod, TradeDispute, TradeMessage,
+    DisputeStatus, OrderStatus, OrderType, PaymentMethodType, TradeStatus
+)
 
-# Test database setup
+# Test database setup: the service runs on aiosqlite, schema and seed data go through a sync engine
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test_p2p.db"
 engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+async_engine = create_async_engine("sqlite+aiosqlite:///./test_p2p.db", poolclass=NullPool)
+AsyncTestingSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 
-def override_get_db():
-    try:
-        db = TestingSessionLocal()
+async def override_get_async_db():
+    async with AsyncTestingSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
-app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_async_db] = override_get_async_db
 
 @pytest.fixture(scope="module")
 def setup_database():
@@ -205,5 +216,826 @@ class TestP2PTrading:
         assert response.status_code == 404
         assert "Trade not found" in response.json()["detail"]
 
+class TestP2PAdBook:
+    """Test the in-memory P2P ad book behind GET /api/v1/p2p/orders"""
+    
+    ADS = [
+        # price, payment methods, allowed countries, blocked countries
+        (3100, ["bank_transfer"], [], []),
+        (3000, ["paypal"], ["US"], []),
+        (2950, ["bank_transfer", "wise"], [], ["DE"]),
+        (3050, ["wise"], ["GB", "DE"], []),
+    ]
+    
+    @pytest.fixture
+    def eth_ads(self, client, auth_headers):
+        if self.prices(client):
+            return
+        for price, methods, allowed, blocked in self.ADS:
+            response = client.post("/api/v1/p2p/orders", json={
+                "order_type": "sell",
+                "cryptocurrency": "ETH",
+                "fiat_currency": "EUR",
+                "crypto_amount": 1,
+                "price_per_unit": price,
+                "accepted_payment_methods": methods,
+                "allowed_countries": allowed,
+                "blocked_countries": blocked
+            }, headers=auth_headers)
+            assert response.status_code == 200
+    
+    def prices(self, client, **params):
+        params = {"order_type": "sell", "cryptocurrency": "ETH", "fiat_currency": "EUR", **params}
+        response = client.get("/api/v1/p2p/orders", params=params)
+        assert response.status_code == 200
+        return [Decimal(order["price_per_unit"]) for order in response.json()["orders"]]
+    
+    def test_sell_ads_are_cheapest_first(self, client, eth_ads):
+        assert self.prices(client) == [2950, 3000, 3050, 3100]
+        assert self.prices(client, limit=2, offset=1) == [3000, 3050]
+    
+    def test_cursor_pages_resume_after_last_ad(self, client, eth_ads):
+        params = {"order_type": "sell", "cryptocurrency": "ETH", "fiat_currency": "EUR", "limit": 3}
+        first = client.get("/api/v1/p2p/orders", params=params).json()
+        assert [Decimal(o["price_per_unit"]) for o in first["orders"]] == [2950, 3000, 3050]
+        assert first["next_cursor"]
+        
+        second = client.get("/api/v1/p2p/orders", params={**params, "cursor": first["next_cursor"]}).json()
+        assert [Decimal(o["price_per_unit"]) for o in second["orders"]] == [3100]
+        assert second["next_cursor"] is None
+        
+        response = client.get("/api/v1/p2p/orders", params={"cursor": "not-a-cursor"})
+        assert response.status_code == 400
+    
+    def test_out_of_range_page_is_rejected(self, client, eth_ads):
+        for params in ({"limit": 0}, {"limit": 101}, {"offset": -1}):
+            response = client.get("/api/v1/p2p/orders", params=params)
+            assert response.status_code == 422
+    
+    def test_payment_method_filter(self, client, eth_ads):
+        assert self.prices(client, payment_method="wise") == [2950, 3050]
+        assert self.prices(client, payment_method="zelle") == []
+    
+    def test_country_eligibility(self, client, eth_ads):
+        assert self.prices(client, country="us") == [2950, 3000, 3100]
+        assert self.prices(client, country="DE") == [3050, 3100]
+    
+    def test_buy_ads_are_highest_first(self):
+        book = P2PAdBook()
+        user = P2PUser(id=1, username="maker", total_trades=0, successful_trades=0, average_rating=0)
+        for i, price in enumerate([10, 30, 20]):
+            book.upsert(P2POrder(
+                id=i, order_id=f"BUY_{i}", user_id=1, user=user, order_type=OrderType.BUY,
+                cryptocurrency="USDT", fiat_currency="INR", crypto_amount=1,
+                price_per_unit=Decimal(price), total_fiat_amount=Decimal(price),
+                status=OrderStatus.ACTIVE, created_at=datetime.utcnow()
+            ))
+        
+        ads, _ = book.query(order_type=OrderType.BUY)
+        assert [ad["order_id"] for ad in ads] == ["BUY_1", "BUY_2", "BUY_0"]
+    
+    def test_expired_and_inactive_ads_leave_the_book(self):
+        book = P2PAdBook()
+        user = P2PUser(id=1, username="maker", total_trades=0, successful_trades=0, average_rating=0)
+        order = P2POrder(
+            id=1, order_id="SELL_1", user_id=1, user=user, order_type=OrderType.SELL,
+            cryptocurrency="BTC", fiat_currency="USD", crypto_amount=1,
+            price_per_unit=Decimal(1), total_fiat_amount=Decimal(1),
+            status=OrderStatus.ACTIVE, created_at=datetime.utcnow(),
+            expires_at=datetime.utcnow() + timedelta(hours=1)
+        )
+        book.upsert(order)
+        user.total_trades = 5
+        book.refresh_user(user)
+        assert book.query()[0][0]["user"]["total_trades"] == 5
+        
+        order.expires_at = datetime.utcnow() - timedelta(seconds=1)
+        book.ads["SELL_1"]["expires_at"] = order.expires_at
+        assert book.query() == ([], None)
+        assert book.books == {} and book.by_user == {}
+        
+        order.expires_at = None
+        book.upsert(order)
+        order.status = OrderStatus.COMPLETED
+        book.upsert(order)
+        assert book.ads == {}
+
+    @pytest.mark.asyncio
+    async def test_sync_applies_only_changed_ads(self, client):
+        """Ads written by another worker reach the book without a full reload"""
+        book = P2PAdBook()
+        async with AsyncTestingSessionLocal() as db:
+            await book.load(db)
+        loaded = set(book.ads)
+        changed_at = (book.synced_to or datetime.utcnow()) + timedelta(seconds=1)
+        
+        tag = secrets.token_hex(4).upper()
+        db = TestingSessionLocal()
+        try:
+            user = P2PUser(user_id=f"sync_{tag}", username=f"sync_{tag}", email="", country_code="US")
+            db.add(user)
+            db.flush()
+            order = P2POrder(
+                order_id=f"SYNC_{tag}", user_id=user.id, order_type=OrderType.SELL,
+                cryptocurrency="SOL", fiat_currency="USD", crypto_amount=1,
+                price_per_unit=150, total_fiat_amount=150, status=OrderStatus.ACTIVE,
+                updated_at=changed_at
+            )
+            db.add(order)
+            db.commit()
+            
+            async with AsyncTestingSessionLocal() as adb:
+                assert await book.sync(adb) == 1
+                assert await book.sync(adb) == 0
+            assert set(book.ads) == loaded | {order.order_id}
+            
+            order.status = OrderStatus.COMPLETED
+            order.updated_at = changed_at + timedelta(seconds=1)
+            db.commit()
+            async with AsyncTestingSessionLocal() as adb:
+                assert await book.sync(adb) == 1
+            assert set(book.ads) == loaded
+        finally:
+            db.close()
+
+class TestP2PTradeFlow:
+    """End-to-end trade lifecycle on the async session layer"""
+    
+    @pytest.fixture
+    def as_user(self):
+        def switch(user_id):
+            app.dependency_overrides[get_current_user] = lambda: {
+                "user_id": user_id, "username": user_id, "country_code": "GB"
+            }
+        yield switch
+        app.dependency_overrides.pop(get_current_user, None)
+    
+    def test_trade_from_ad_to_release(self, client, auth_headers, as_user):
+        as_user("flow_seller")
+        response = client.post("/api/v1/p2p/orders", json={
+            "order_type": "sell",
+            "cryptocurrency": "SOL",
+            "fiat_currency": "GBP",
+            "crypto_amount": 10,
+            "price_per_unit": 100,
+            "min_trade_amount": 100,
+            "accepted_payment_methods": ["bank_transfer"]
+        }, headers=auth_headers)
+        assert response.status_code == 200
+        order_id = response.json()["order_id"]
+        
+        as_user("flow_buyer")
+        response = client.post("/api/v1/p2p/trades", json={
+            "order_id": order_id,
+            "fiat_amount": 250,
+            "payment_method_id": "1",
+            "message": "Paying by bank transfer"
+        }, headers=auth_headers)
+        assert response.status_code == 200
+        trade_id = response.json()["trade_id"]
+        assert Decimal(response.json()["crypto_amount"]) == Decimal("2.5")
+        
+        response = client.post(f"/api/v1/p2p/trades/{trade_id}/release", headers=auth_headers)
+        assert response.status_code == 403
+        response = client.post(f"/api/v1/p2p/trades/{trade_id}/confirm-payment", headers=auth_headers)
+        assert response.json()["status"] == "payment_confirmed"
+        release_deadline = datetime.fromisoformat(response.json()["release_deadline"])
+        assert release_deadline > datetime.utcnow()
+        assert p2p_manager.deadlines.deadlines[(DeadlineScheduler.TRADE, trade_id)] == release_deadline
+        
+        as_user("flow_seller")
+        response = client.post(f"/api/v1/p2p/trades/{trade_id}/release", headers=auth_headers)
+        assert response.status_code == 200
+        assert response.json()["status"] == "completed"
+        
+        trades = client.get("/api/v1/p2p/trades", headers=auth_headers).json()["trades"]
+        assert trades[0]["trade_id"] == trade_id
+        assert trades[0]["is_buyer"] is False
+        assert trades[0]["counterparty"]["username"] == "flow_buyer"
+        
+        response = client.post(f"/api/v1/p2p/trades/{trade_id}/dispute", json={
+            "dispute_reason": "payment_not_received",
+            "description": "Opened after the trade completed"
+        }, headers=auth_headers)
+        assert response.status_code == 400
+
+class TestP2PTradeListing:
+    """GET /api/v1/p2p/trades must not lazy-load per row"""
+    
+    TRADES = 12
+    
+    @pytest.fixture
+    def trades(self, client, auth_headers):
+        assert client.get("/api/v1/p2p/trades", headers=auth_headers).status_code == 200
+        db = TestingSessionLocal()
+        try:
+            buyer = db.query(P2PUser).filter(P2PUser.user_id == "user_123").one()
+            if db.query(P2PTrade).filter(P2PTrade.buyer_id == buyer.id).count() >= self.TRADES:
+                return
+            seller = P2PUser(user_id="seller_456", username="seller", email="", country_code="GB")
+            db.add(seller)
+            db.flush()
+            method = PaymentMethod(
+                method_id="PM_LISTING", user_id=seller.id, method_type=PaymentMethodType.BANK_TRANSFER,
+                method_name="Bank", account_details={}, supported_currencies=["USD"], supported_countries=["GB"]
+            )
+            # One order per trade, so a lazy load per row would show up in the count
+            orders = [
+                P2POrder(
+                    order_id=f"P2P_LISTING_{i}", user_id=seller.id, order_type=OrderType.SELL,
+                    cryptocurrency="BTC", fiat_currency="USD", crypto_amount=1,
+                    price_per_unit=45000, total_fiat_amount=45000, status=OrderStatus.COMPLETED
+                )
+                for i in range(self.TRADES)
+            ]
+            db.add_all([method, *orders])
+            db.flush()
+            # Pairs of trades share a timestamp so paging relies on the id tiebreak
+            base = datetime(2024, 1, 1)
+            for i, order in enumerate(orders):
+                db.add(P2PTrade(
+                    trade_id=f"TRADE_LISTING_{i}", order_id=order.id, buyer_id=buyer.id, seller_id=seller.id,
+                    crypto_amount=Decimal("0.01"), fiat_amount=450, price_per_unit=45000,
+                    payment_method_id=method.id, payment_deadline=base + timedelta(hours=1),
+                    chat_room_id=f"CHAT_LISTING_{i}", created_at=base + timedelta(minutes=i // 2)
+                ))
+            db.commit()
+        finally:
+            db.close()
+    
+    def count_statements(self, client, auth_headers, params):
+        statements = []
+        
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        
+        event.listen(async_engine.sync_engine, "before_cursor_execute", record)
+        try:
+            response = client.get("/api/v1/p2p/trades", params=params, headers=auth_headers)
+        finally:
+            event.remove(async_engine.sync_engine, "before_cursor_execute", record)
+        assert response.status_code == 200
+        return len(statements), response.json()
+    
+    def test_statement_count_is_independent_of_page_size(self, client, auth_headers, trades):
+        small, small_page = self.count_statements(client, auth_headers, {"limit": 2})
+        large, large_page = self.count_statements(client, auth_headers, {"limit": self.TRADES})
+        
+        assert len(small_page["trades"]) == 2
+        assert len(large_page["trades"]) == self.TRADES
+        assert large_page["trades"][0]["counterparty"]["username"] == "seller"
+        assert small == large
+    
+    def test_cursor_walks_every_trade_once(self, client, auth_headers, trades):
+        seen = []
+        params = {"limit": 5}
+        while True:
+            page = client.get("/api/v1/p2p/trades", params=params, headers=auth_headers).json()
+            seen.extend(trade["trade_id"] for trade in page["trades"])
+            if not page["next_cursor"]:
+                break
+            params["cursor"] = page["next_cursor"]
+        
+        listing = [trade_id for trade_id in seen if trade_id.startswith("TRADE_LISTING_")]
+        assert listing == [f"TRADE_LISTING_{i}" for i in reversed(range(self.TRADES))]
+        assert len(seen) == len(set(seen))
+        
+        response = client.get("/api/v1/p2p/trades", params={"cursor": "bm9wZQ=="}, headers=auth_headers)
+        assert response.status_code == 400
+    
+    def test_out_of_range_limit_is_rejected(self, client, auth_headers):
+        for limit in (0, -1, 101):
+            response = client.get("/api/v1/p2p/trades", params={"limit": limit}, headers=auth_headers)
+            assert response.status_code == 422
+
+class FakeSocket:
+    def __init__(self, fail=False):
+        self.sent = []
+        self.fail = fail
+    
+    async def send_text(self, payload):
+        if self.fail:
+            raise RuntimeError("socket closed")
+        self.sent.append(payload)
+
+class FakeBroker:
+    """In-process stand-in for Redis pub/sub shared by several workers"""
+    
+    def __init__(self):
+        self.pubsubs = []
+    
+    def client(self):
+        return FakeRedisClient(self)
+
+class FakeRedisClient:
+    def __init__(self, broker):
+        self.broker = broker
+    
+    def pubsub(self, ignore_subscribe_messages=False):
+        pubsub = FakePubSub()
+        self.broker.pubsubs.append(pubsub)
+        return pubsub
+    
+    async def publish(self, channel, data):
+        for pubsub in self.broker.pubsubs:
+            if channel in pubsub.channels:
+                pubsub.queue.put_nowait({"type": "message", "channel": channel.encode(), "data": data.encode()})
+
+class FakePubSub:
+    def __init__(self):
+        self.channels = set()
+        self.queue = asyncio.Queue()
+    
+    async def subscribe(self, *channels):
+        self.channels.update(channels)
+    
+    async def unsubscribe(self, *channels):
+        self.channels.difference_update(channels)
+    
+    async def get_message(self, ignore_subscribe_messages=False, timeout=0.0):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+    
+    async def close(self):
+        pass
+
+class TestP2PChat:
+    """Room fan-out across sockets and workers, and batched persistence"""
+    
+    @pytest.fixture
+    def trade(self, setup_database):
+        """A pending trade between chat_buyer and chat_seller"""
+        db = TestingSessionLocal()
+        try:
+            trade = db.query(P2PTrade).filter(P2PTrade.chat_room_id == "CHAT_ROOM_TEST").first()
+            if trade is None:
+                buyer = P2PUser(user_id="chat_buyer", username="chat_buyer", email="", country_code="US")
+                seller = P2PUser(user_id="chat_seller", username="chat_seller", email="", country_code="US")
+                db.add_all([buyer, seller])
+                db.flush()
+                order = P2POrder(
+                    order_id="P2P_CHAT_TEST", user_id=seller.id, order_type=OrderType.SELL,
+                    cryptocurrency="USDT", fiat_currency="USD", crypto_amount=100,
+                    price_per_unit=1, total_fiat_amount=100, status=OrderStatus.ACTIVE
+                )
+                db.add(order)
+                db.flush()
+                trade = P2PTrade(
+                    trade_id="TRADE_CHAT_TEST", order_id=order.id, buyer_id=buyer.id, seller_id=seller.id,
+                    crypto_amount=50, fiat_amount=50, price_per_unit=1, payment_method_id=1,
+                    payment_deadline=datetime.utcnow() + timedelta(hours=1), chat_room_id="CHAT_ROOM_TEST"
+                )
+                db.add(trade)
+                db.commit()
+            return trade.id, trade.buyer_id
+        finally:
+            db.close()
+    
+    @pytest.mark.asyncio
+    async def test_room_reaches_every_local_socket(self):
+        hub = ChatRoomHub()
+        buyer, seller, other, broken = FakeSocket(), FakeSocket(), FakeSocket(), FakeSocket(fail=True)
+        await hub.join("ROOM_A", buyer)
+        await hub.join("ROOM_A", seller)
+        await hub.join("ROOM_A", broken)
+        await hub.join("ROOM_B", other)
+        
+        await hub.publish("ROOM_A", "hello")
+        assert buyer.sent == ["hello"] and seller.sent == ["hello"]
+        assert other.sent == []
+        assert hub.metrics() == {"rooms": 2, "sockets": 3, "delivered": 2, "dropped": 1, "publish_failures": 0}
+        
+        await hub.leave("ROOM_A", buyer)
+        await hub.leave("ROOM_A", seller)
+        assert set(hub.rooms) == {"ROOM_B"}
+    
+    @pytest.mark.asyncio
+    async def test_rooms_span_workers_through_pubsub(self):
+        broker = FakeBroker()
+        worker_a, worker_b = ChatRoomHub(), ChatRoomHub()
+        await worker_a.start(broker.client())
+        await worker_b.start(broker.client())
+        try:
+            buyer, seller = FakeSocket(), FakeSocket()
+            await worker_a.join("ROOM_X", buyer)
+            await worker_b.join("ROOM_X", seller)
+            
+            await worker_a.publish("ROOM_X", "sent from A")
+            for _ in range(50):
+                if buyer.sent and seller.sent:
+                    break
+                await asyncio.sleep(0.01)
+            assert buyer.sent == ["sent from A"]
+            assert seller.sent == ["sent from A"]
+            
+            await worker_b.leave("ROOM_X", seller)
+            assert broker.pubsubs[1].channels == set()
+            assert not worker_b.subscribed.is_set()
+        finally:
+            await worker_a.stop()
+            await worker_b.stop()
+    
+    @pytest.mark.asyncio
+    async def test_writer_persists_a_batch_in_one_statement(self, trade):
+        trade_pk, sender_pk = trade
+        writer = ChatMessageWriter(session_factory=AsyncTestingSessionLocal, batch_size=3)
+        for i in range(5):
+            writer.enqueue({
+                "message_id": f"MSG_BATCH_{i}", "trade_id": trade_pk, "sender_id": sender_pk,
+                "message_type": "text", "content": f"message {i}", "is_system_message": False,
+                "created_at": datetime.utcnow()
+            })
+        assert writer.full.is_set()
+        
+        inserts = []
+        
+        def record(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith("INSERT"):
+                inserts.append(statement)
+        
+        event.listen(async_engine.sync_engine, "before_cursor_execute", record)
+        try:
+            assert await writer.flush() == 5
+        finally:
+            event.remove(async_engine.sync_engine, "before_cursor_execute", record)
+        assert len(inserts) == 1
+        assert writer.pending == [] and writer.batches == 1
+        
+        async with AsyncTestingSessionLocal() as session:
+            result = await session.execute(
+                select(TradeMessage.content).where(TradeMessage.message_id.like("MSG_BATCH_%"))
+            )
+            assert sorted(result.scalars()) == [f"message {i}" for i in range(5)]
+    
+    @pytest.mark.asyncio
+    async def test_failed_batch_is_retried(self):
+        class BrokenSession:
+            async def __aenter__(self):
+                raise ConnectionError("database unavailable")
+            
+            async def __aexit__(self, *exc):
+                return False
+        
+        writer = ChatMessageWriter(session_factory=BrokenSession, max_attempts=3)
+        writer.enqueue({"message_id": "MSG_RETRY"})
+        assert await writer.flush() == 0
+        assert writer.pending == [{"message_id": "MSG_RETRY"}]
+        assert await writer.flush() == 0
+        assert writer.pending == [{"message_id": "MSG_RETRY"}]
+        
+        assert await writer.flush() == 0
+        assert writer.pending == [] and writer.attempts == {}
+        assert writer.dropped == 1
+    
+    @pytest.mark.asyncio
+    async def test_bad_row_is_dropped_and_the_rest_written(self, trade):
+        trade_pk, sender_pk = trade
+        writer = ChatMessageWriter(session_factory=AsyncTestingSessionLocal)
+        for i in range(3):
+            writer.enqueue({
+                "message_id": f"MSG_ROWS_{i}", "trade_id": trade_pk, "sender_id": sender_pk,
+                "message_type": "text", "content": None if i == 1 else f"message {i}",
+                "is_system_message": False, "created_at": datetime.utcnow()
+            })
+        
+        assert await writer.flush() == 2
+        assert writer.pending == [] and writer.dropped == 1
+        assert writer.failures == 0
+        
+        async with AsyncTestingSessionLocal() as session:
+            result = await session.execute(
+                select(TradeMessage.message_id).where(TradeMessage.message_id.like("MSG_ROWS_%"))
+            )
+            assert sorted(result.scalars()) == ["MSG_ROWS_0", "MSG_ROWS_2"]
+    
+    @pytest.mark.asyncio
+    async def test_pending_is_bounded(self):
+        class BrokenSession:
+            async def __aenter__(self):
+                raise ConnectionError("database unavailable")
+            
+            async def __aexit__(self, *exc):
+                return False
+        
+        writer = ChatMessageWriter(session_factory=BrokenSession, max_pending=3)
+        for i in range(4):
+            writer.enqueue({"message_id": f"MSG_BOUND_{i}"})
+        assert len(writer.pending) == 3 and writer.dropped == 1
+        
+        await writer.flush()
+        writer.enqueue({"message_id": "MSG_BOUND_LATE"})
+        assert [row["message_id"] for row in writer.pending] == [f"MSG_BOUND_{i}" for i in range(3)]
+        assert writer.dropped == 2
+    
+    @pytest.mark.asyncio
+    async def test_stop_waits_for_an_in_flight_flush(self):
+        written = []
+        release = asyncio.Event()
+        
+        class SlowSession:
+            async def __aenter__(self):
+                return self
+            
+            async def __aexit__(self, *exc):
+                return False
+            
+            async def execute(self, statement, rows):
+                await release.wait()
+                written.extend(row["message_id"] for row in rows)
+            
+            async def commit(self):
+                pass
+        
+        writer = ChatMessageWriter(session_factory=SlowSession, flush_interval=0.01)
+        writer.start()
+        writer.enqueue({"message_id": "MSG_IN_FLIGHT"})
+        for _ in range(50):
+            if not writer.pending:
+                break
+            await asyncio.sleep(0.01)
+        assert writer.pending == []
+        writer.enqueue({"message_id": "MSG_AFTER"})
+        
+        stopping = asyncio.create_task(writer.stop())
+        await asyncio.sleep(0.05)
+        assert not stopping.done()
+        release.set()
+        await stopping
+        assert written == ["MSG_IN_FLIGHT", "MSG_AFTER"]
+        assert writer.written == 2 and writer.dropped == 0
+    
+    def test_websocket_room_for_both_participants(self, trade, monkeypatch):
+        trade_pk, _ = trade
+        chat_room_id = "CHAT_ROOM_TEST"
+        participants = {"buyer": "chat_buyer", "seller": "chat_seller"}
+        
+        async def no_startup():
+            pass
+        
+        connections = iter(["buyer", "seller", "buyer"])
+        monkeypatch.setattr(p2p_manager, "initialize", no_startup)
+        monkeypatch.setattr(p2p_manager.chat_writer, "session_factory", AsyncTestingSessionLocal)
+        app.dependency_overrides[get_chat_user] = lambda: {
+            "user_id": participants[next(connections)], "username": "participant", "country_code": "US"
+        }
+        try:
+            with TestClient(app) as local_client:
+                with local_client.websocket_connect(f"/ws/chat/{chat_room_id}") as buyer_socket, \
+                        local_client.websocket_connect(f"/ws/chat/{chat_room_id}") as seller_socket:
+                    buyer_socket.send_text(json.dumps({"content": "Payment sent"}))
+                    assert json.loads(buyer_socket.receive_text())["content"] == "Payment sent"
+                    assert json.loads(seller_socket.receive_text())["content"] == "Payment sent"
+                    seller_socket.send_text("Received, releasing")
+                    assert json.loads(buyer_socket.receive_text())["content"] == "Received, releasing"
+                    assert local_client.get("/health").json()["chat"]["sockets"] == 2
+                
+                app.dependency_overrides[get_chat_user] = lambda: {
+                    "user_id": "outsider", "username": "outsider", "country_code": "US"
+                }
+                with pytest.raises(WebSocketDisconnect) as rejected:
+                    with local_client.websocket_connect(f"/ws/chat/{chat_room_id}") as outsider_socket:
+                        outsider_socket.receive_text()
+                assert rejected.value.code == 4403
+                assert p2p_manager.chat.rooms == {}
+        finally:
+            app.dependency_overrides.pop(get_chat_user, None)
+        
+        db = TestingSessionLocal()
+        try:
+            contents = [m.content for m in db.query(TradeMessage).filter(TradeMessage.trade_id == trade_pk)]
+        finally:
+            db.close()
+        assert "Payment sent" in contents and "Received, releasing" in contents
+    
+    def test_websocket_survives_a_failed_publish(self, trade, monkeypatch):
+        trade_pk, _ = trade
+        chat_room_id = "CHAT_ROOM_TEST"
+        
+        class FailingRedisClient:
+            async def publish(self, channel, data):
+                raise ConnectionError("redis unavailable")
+        
+        async def no_startup():
+            pass
+        
+        monkeypatch.setattr(p2p_manager, "initialize", no_startup)
+        monkeypatch.setattr(p2p_manager.chat_writer, "session_factory", AsyncTestingSessionLocal)
+        monkeypatch.setattr(p2p_manager.chat, "redis_client", FailingRedisClient())
+        monkeypatch.setattr(p2p_manager.chat, "pubsub", FakePubSub())
+        monkeypatch.setattr(p2p_manager.chat, "publish_failures", 0)
+        app.dependency_overrides[get_chat_user] = lambda: {
+            "user_id": "chat_buyer", "username": "chat_buyer", "country_code": "US"
+        }
+        try:
+            with TestClient(app) as local_client:
+                with local_client.websocket_connect(f"/ws/chat/{chat_room_id}") as socket:
+                    socket.send_text("Sent while redis is down")
+                    assert json.loads(socket.receive_text())["content"] == "Sent while redis is down"
+                    socket.send_text("Still connected")
+                    assert json.loads(socket.receive_text())["content"] == "Still connected"
+                    assert local_client.get("/health").json()["chat"]["publish_failures"] == 2
+        finally:
+            app.dependency_overrides.pop(get_chat_user, None)
+        
+        db = TestingSessionLocal()
+        try:
+            contents = [m.content for m in db.query(TradeMessage).filter(TradeMessage.trade_id == trade_pk)]
+        finally:
+            db.close()
+        assert "Sent while redis is down" in contents and "Still connected" in contents
+
+class TestDeadlineScheduler:
+    """Trade and ad deadlines enforced from a min-heap"""
+    
+    def test_heap_pops_due_entries_in_deadline_order(self):
+        scheduler = DeadlineScheduler()
+        now = datetime(2024, 6, 1, 12, 0)
+        scheduler.schedule(DeadlineScheduler.TRADE, "T_LATE", now + timedelta(minutes=5))
+        scheduler.schedule(DeadlineScheduler.TRADE, "T_FIRST", now - timedelta(minutes=2))
+        scheduler.schedule(DeadlineScheduler.AD, "AD_1", now - timedelta(minutes=1))
+        scheduler.schedule(DeadlineScheduler.TRADE, "T_DONE", now - timedelta(minutes=3))
+        scheduler.cancel(DeadlineScheduler.TRADE, "T_DONE")
+        scheduler.schedule(DeadlineScheduler.AD, "AD_2", now - timedelta(minutes=4))
+        scheduler.schedule(DeadlineScheduler.AD, "AD_2", now + timedelta(hours=1))
+        
+        assert scheduler.next_deadline() == now - timedelta(minutes=2)
+        assert scheduler.pop_due(now) == (["T_FIRST"], ["AD_1"])
+        assert scheduler.pop_due(now) == ([], [])
+        assert scheduler.next_deadline() == now + timedelta(minutes=5)
+        assert scheduler.metrics()["scheduled"] == 2
+    
+    @pytest.fixture
+    def due(self, setup_database):
+        """Unpaid, paid, paid within its release window, completed and future trades, plus an expired ad"""
+        tag = secrets.token_hex(4).upper()
+        db = TestingSessionLocal()
+        try:
+            buyer = P2PUser(user_id=f"due_buyer_{tag}", username="due_buyer", email="", country_code="US")
+            seller = P2PUser(user_id=f"due_seller_{tag}", username="due_seller", email="", country_code="US")
+            db.add_all([buyer, seller])
+            db.flush()
+            past = datetime.utcnow() - timedelta(minutes=1)
+            order = P2POrder(
+                order_id=f"P2P_DUE_AD_{tag}", user_id=seller.id, order_type=OrderType.SELL,
+                cryptocurrency="BTC", fiat_currency="USD", crypto_amount=1, price_per_unit=45000,
+                total_fiat_amount=45000, status=OrderStatus.ACTIVE, expires_at=past
+            )
+            db.add(order)
+            db.flush()
+            future = datetime.utcnow() + timedelta(hours=1)
+            for name, status, deadline, release_deadline in [
+                ("UNPAID", TradeStatus.PENDING, past, None),
+                ("PAID", TradeStatus.PAYMENT_CONFIRMED, past, past),
+                ("RELEASING", TradeStatus.PAYMENT_CONFIRMED, past, future),
+                ("COMPLETED", TradeStatus.COMPLETED, past, None),
+                ("FUTURE", TradeStatus.PENDING, future, None),
+            ]:
+                db.add(P2PTrade(
+                    trade_id=f"TRADE_DUE_{name}_{tag}", order_id=order.id, buyer_id=buyer.id, seller_id=seller.id,
+                    crypto_amount=Decimal("0.01"), fiat_amount=450, price_per_unit=45000,
+                    payment_method_id=1, status=status, payment_deadline=deadline,
+                    release_deadline=release_deadline,
+                    chat_room_id=f"CHAT_DUE_{name}_{tag}"
+                ))
+            db.commit()
+        finally:
+            db.close()
+        return tag
+    
+    def statuses(self, tag):
+        db = TestingSessionLocal()
+        try:
+            trades = {
+                trade.trade_id[:-len(tag) - 1]: trade.status
+                for trade in db.query(P2PTrade).filter(P2PTrade.trade_id.like(f"TRADE_DUE_%_{tag}"))
+            }
+            ad = db.query(P2POrder).filter(P2POrder.order_id == f"P2P_DUE_AD_{tag}").one().status
+            return trades, ad
+        finally:
+            db.close()
+    
+    @pytest.mark.asyncio
+    async def test_due_deadlines_expire_in_one_transaction(self, due):
+        tag = due
+        ad_id = f"P2P_DUE_AD_{tag}"
+        removed = []
+        scheduler = DeadlineScheduler(session_factory=AsyncTestingSessionLocal, on_ads_expired=removed.extend)
+        async with AsyncTestingSessionLocal() as db:
+            await scheduler.load(db)
+        assert (DeadlineScheduler.TRADE, f"TRADE_DUE_COMPLETED_{tag}") not in scheduler.deadlines
+        
+        now = datetime.utcnow()
+        trade_ids, order_ids = scheduler.pop_due(now)
+        assert {f"TRADE_DUE_UNPAID_{tag}", f"TRADE_DUE_PAID_{tag}"} <= set(trade_ids)
+        assert f"TRADE_DUE_FUTURE_{tag}" not in trade_ids
+        assert f"TRADE_DUE_RELEASING_{tag}" not in trade_ids
+        assert ad_id in order_ids
+        
+        # A paid trade is held to its release deadline even if popped early
+        trade_ids = [f"TRADE_DUE_{name}_{tag}" for name in ("UNPAID", "PAID", "RELEASING", "COMPLETED")]
+        commits = []
+        
+        def record(conn):
+            commits.append(conn)
+        
+        event.listen(async_engine.sync_engine, "commit", record)
+        try:
+            result = await scheduler.expire(trade_ids, [ad_id], now)
+        finally:
+            event.remove(async_engine.sync_engine, "commit", record)
+        
+        assert result == {"cancelled": 1, "escalated": 1, "expired": 1}
+        assert len(commits) == 1
+        assert removed == [ad_id]
+        trades, ad = self.statuses(tag)
+        assert trades == {
+            "TRADE_DUE_UNPAID": TradeStatus.CANCELLED,
+            "TRADE_DUE_PAID": TradeStatus.DISPUTED,
+            "TRADE_DUE_RELEASING": TradeStatus.PAYMENT_CONFIRMED,
+            "TRADE_DUE_COMPLETED": TradeStatus.COMPLETED,
+            "TRADE_DUE_FUTURE": TradeStatus.PENDING,
+        }
+        assert ad == OrderStatus.EXPIRED
+        
+        db = TestingSessionLocal()
+        try:
+            paid = db.query(P2PTrade).filter(P2PTrade.trade_id == f"TRADE_DUE_PAID_{tag}").one()
+            assert db.query(TradeDispute).filter(TradeDispute.trade_id == paid.id).one().dispute_reason == "release_timeout"
+            assert db.query(TradeMessage).filter(
+                TradeMessage.trade_id == paid.id, TradeMessage.is_system_message == True
+            ).count() == 1
+        finally:
+            db.close()
+        
+        # A second pass finds nothing left to change
+        assert await scheduler.expire(trade_ids, [ad_id], now) == {"cancelled": 0, "escalated": 0, "expired": 0}
+    
+    def race_scheduler(self, monkeypatch, trade_id):
+        """Let the scheduler act on ``trade_id`` after a handler has read it"""
+        scheduler = DeadlineScheduler(session_factory=AsyncTestingSessionLocal)
+        get_or_create = p2p_manager.get_or_create_p2p_user
+        
+        async def read_then_expire(user, db):
+            p2p_user = await get_or_create(user, db)
+            await scheduler.expire([trade_id], [], datetime.utcnow())
+            return p2p_user
+        
+        monkeypatch.setattr(p2p_manager, "get_or_create_p2p_user", read_then_expire)
+        return scheduler
+    
+    @pytest.mark.asyncio
+    async def test_confirmation_does_not_revive_a_cancelled_trade(self, due, monkeypatch):
+        trade_id = f"TRADE_DUE_UNPAID_{due}"
+        scheduler = self.race_scheduler(monkeypatch, trade_id)
+        async with AsyncTestingSessionLocal() as db:
+            with pytest.raises(HTTPException) as exc:
+                await p2p_manager.confirm_payment(trade_id, {"user_id": f"due_buyer_{due}", "username": "due_buyer"}, db)
+        assert exc.value.status_code == 409
+        assert scheduler.cancelled == 1
+        assert self.statuses(due)[0]["TRADE_DUE_UNPAID"] == TradeStatus.CANCELLED
+        assert (DeadlineScheduler.TRADE, trade_id) not in p2p_manager.deadlines.deadlines
+    
+    @pytest.mark.asyncio
+    async def test_release_does_not_complete_an_escalated_trade(self, due, monkeypatch):
+        trade_id = f"TRADE_DUE_PAID_{due}"
+        scheduler = self.race_scheduler(monkeypatch, trade_id)
+        async with AsyncTestingSessionLocal() as db:
+            with pytest.raises(HTTPException) as exc:
+                await p2p_manager.release_crypto(trade_id, {"user_id": f"due_seller_{due}", "username": "due_seller"}, db)
+        assert exc.value.status_code == 409
+        assert scheduler.escalated == 1
+        assert self.statuses(due)[0]["TRADE_DUE_PAID"] == TradeStatus.DISPUTED
+        
+        db = TestingSessionLocal()
+        try:
+            seller = db.query(P2PUser).filter(P2PUser.user_id == f"due_seller_{due}").one()
+            assert seller.total_trades == 0 and seller.successful_trades == 0
+            paid = db.query(P2PTrade).filter(P2PTrade.trade_id == trade_id).one()
+            assert db.query(TradeDispute).filter(TradeDispute.trade_id == paid.id).one().status == DisputeStatus.OPEN
+        finally:
+            db.close()
+    
+    @pytest.mark.asyncio
+    async def test_loop_fires_at_the_deadline(self, due):
+        scheduler = DeadlineScheduler(session_factory=AsyncTestingSessionLocal)
+        scheduler.task = asyncio.create_task(scheduler.run())
+        try:
+            await asyncio.sleep(0.05)
+            assert scheduler.metrics()["cancelled"] == 0
+            scheduler.schedule(
+                DeadlineScheduler.TRADE, f"TRADE_DUE_UNPAID_{due}", datetime.utcnow() + timedelta(milliseconds=100)
+            )
+            for _ in range(100):
+                if scheduler.metrics()["cancelled"]:
+                    break
+                await asyncio.sleep(0.02)
+        finally:
+            await scheduler.stop()
+        
+        assert scheduler.metrics()["cancelled"] == 1
+        assert self.statuses(due)[0]["TRADE_DUE_UNPAID"] == TradeStatus.CANCELLED
+
 if __name__ == "__main__":
     pytest.main([__file__])
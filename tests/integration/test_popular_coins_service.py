@@ -0,0 +1,920 @@
+"""
+Integration tests for Popular Coins Service
+"""
+
+import asyncio
+import importlib.util
+import json
+import time
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from fastapi.testclient import TestClient
+
+# Load the popular coins service under its own module name so it does not
+# collide with the other services' ``main`` modules
+spec = importlib.util.spec_from_file_location(
+    "popular_coins_main", "backend/popular-coins-service/src/main.py"
+)
+coins_main = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(coins_main)
+
+PopularCoinsManager = coins_main.PopularCoinsManager
+ExchangeTickerFetcher = coins_main.ExchangeTickerFetcher
+LatencyHistogram = coins_main.LatencyHistogram
+PriceBatchPublisher = coins_main.PriceBatchPublisher
+ReferencePriceEngine = coins_main.ReferencePriceEngine
+ReferencePrice = coins_main.ReferencePrice
+normalize_symbol = coins_main.normalize_symbol
+PriceSnapshot = coins_main.PriceSnapshot
+PriceStreamHub = coins_main.PriceStreamHub
+TokenBucket = coins_main.TokenBucket
+PooledHTTPClient = coins_main.PooledHTTPClient
+TokenMetadataFetcher = coins_main.TokenMetadataFetcher
+CoinCatalog = coins_main.CoinCatalog
+CoinGeckoRegistry = coins_main.CoinGeckoRegistry
+
+class StubExchange:
+    """Blocking ccxt-style exchange returning canned tickers"""
+
+    def __init__(self, name, tickers, delay=0.0, error=None):
+        self.id = name
+        self.name = name
+        self.tickers = tickers
+        self.delay = delay
+        self.error = error
+
+    def fetch_tickers(self):
+        time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return self.tickers
+
+class AsyncStubExchange(StubExchange):
+    """ccxt.async_support-style exchange"""
+
+    async def fetch_tickers(self):
+        await asyncio.sleep(self.delay)
+        return self.tickers
+
+def make_ticker(last, percentage=0.0, quote_volume=0.0, timestamp=None):
+    return {"last": last, "percentage": percentage, "quoteVolume": quote_volume,
+            "timestamp": timestamp}
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def setex(self, key, ttl, value):
+        self.commands.append((key, ttl, value))
+        return self
+
+    async def execute(self):
+        self.redis.pipelines += 1
+        for key, ttl, value in self.commands:
+            self.redis.store[key] = value
+        return [True] * len(self.commands)
+
+class FakeRedis:
+    def __init__(self):
+        self.store = {}
+        self.pipelines = 0
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    async def get(self, key):
+        return self.store.get(key)
+
+    async def mget(self, *keys):
+        return [self.store.get(key) for key in keys]
+
+class FakeTransaction:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+class FakeConnection:
+    def __init__(self, rows=None, coins=None, coins_have_coingecko_id=True):
+        self.rows = rows or []
+        self.coins = coins or []
+        self.coins_have_coingecko_id = coins_have_coingecko_id
+        self.executed = []
+        self.copied = {}
+
+    async def fetch(self, query, *args):
+        if "FROM coins" in query:
+            return self.coins
+        return self.rows
+
+    async def fetchrow(self, query, *args):
+        return None
+
+    async def fetchval(self, query, *args):
+        if "information_schema.columns" in query:
+            return self.coins_have_coingecko_id
+        return None
+
+    async def execute(self, query, *args):
+        self.executed.append((query, args))
+        if "INSERT INTO" in query and " FROM " in query:
+            staging = query.split(" FROM ")[1].split()[0]
+            return f"INSERT 0 {len(self.copied.get(staging, []))}"
+        return "OK"
+
+    async def copy_records_to_table(self, table, records, columns):
+        self.copied[table] = records
+
+    def transaction(self):
+        return FakeTransaction()
+
+class FakePool:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def acquire(self):
+        pool = self
+
+        class _Acquire:
+            async def __aenter__(self):
+                return pool.connection
+
+            async def __aexit__(self, *exc):
+                return False
+
+        return _Acquire()
+
+@pytest.fixture
+def publisher():
+    connection = FakeConnection(rows=[{"symbol": "BTCUSDT"}, {"symbol": "ETHUSDT"}])
+    return PriceBatchPublisher(redis_client=FakeRedis(), db_pool=FakePool(connection))
+
+class TestExchangeTickerFetcher:
+    """Test concurrent multi-venue ticker ingestion"""
+
+    @pytest.mark.asyncio
+    async def test_venues_are_fetched_in_parallel(self):
+        fetcher = ExchangeTickerFetcher(timeout=2.0)
+        exchanges = [
+            StubExchange(f"venue{i}", {"BTC/USDT": make_ticker(50000 + i)}, delay=0.2)
+            for i in range(4)
+        ]
+
+        started = time.monotonic()
+        results = await fetcher.fetch_all(exchanges)
+        elapsed = time.monotonic() - started
+
+        assert set(results) == {"venue0", "venue1", "venue2", "venue3"}
+        assert elapsed < 0.6  # sequential would take 0.8s
+
+    @pytest.mark.asyncio
+    async def test_slow_and_failing_venues_are_dropped(self):
+        fetcher = ExchangeTickerFetcher(timeout=0.1)
+        exchanges = [
+            StubExchange("fast", {"BTC/USDT": make_ticker(50000)}),
+            StubExchange("slow", {"BTC/USDT": make_ticker(50001)}, delay=0.5),
+            StubExchange("broken", {}, error=RuntimeError("boom")),
+        ]
+
+        results = await fetcher.fetch_all(exchanges)
+
+        assert list(results) == ["fast"]
+        stats = fetcher.stats()
+        assert stats["slow"]["failures"] == 1
+        assert stats["broken"]["failures"] == 1
+        assert stats["fast"]["latency"]["count"] == 1
+
+    @pytest.mark.asyncio
+    async def test_timed_out_venue_is_skipped_until_its_call_returns(self):
+        fetcher = ExchangeTickerFetcher(timeout=0.05)
+        exchange = StubExchange("slow", {"BTC/USDT": make_ticker(50000)}, delay=0.3)
+        exchange.timeout = 10000
+        calls = []
+        fetch_tickers = exchange.fetch_tickers
+        exchange.fetch_tickers = lambda: calls.append(1) or fetch_tickers()
+
+        assert await fetcher.fetch(exchange) is None
+        assert exchange.timeout == 50
+        assert await fetcher.fetch(exchange) is None
+        assert len(calls) == 1
+
+        await asyncio.sleep(0.35)
+        exchange.delay = 0.0
+        assert await fetcher.fetch(exchange) == {"BTC/USDT": make_ticker(50000)}
+        assert len(calls) == 2
+        assert fetcher.stats()["slow"]["failures"] == 2
+
+    @pytest.mark.asyncio
+    async def test_async_exchanges_are_awaited_directly(self):
+        fetcher = ExchangeTickerFetcher(timeout=1.0)
+        exchange = AsyncStubExchange("async", {"ETH/USDT": make_ticker(3000)})
+
+        results = await fetcher.fetch_all([exchange])
+
+        assert results["async"]["ETH/USDT"]["last"] == 3000
+
+class TestReferencePriceEngine:
+    """Test cross-venue reference price consolidation"""
+
+    LISTED = {"BTCUSDT", "ETHUSDT"}
+
+    def test_normalize_symbol(self):
+        assert normalize_symbol("BTC/USDT") == "BTCUSDT"
+        assert normalize_symbol("ETH/USDT:USDT") is None
+
+    def test_volume_weighted_price(self):
+        engine = ReferencePriceEngine()
+        prices = engine.compute({
+            "a": {"BTC/USDT": make_ticker(50000, 1.0, 300)},
+            "b": {"BTC/USDT": make_ticker(50100, 2.0, 100)},
+        }, self.LISTED)
+
+        assert len(prices) == 1
+        btc = prices[0]
+        assert btc.symbol == "BTCUSDT"
+        assert btc.price == pytest.approx(50025)
+        assert btc.change_24h == pytest.approx(1.25)
+        assert btc.volume_24h == 400
+        assert btc.sources == 2
+
+    def test_outlier_venue_is_rejected(self):
+        engine = ReferencePriceEngine(max_deviation=0.05)
+        prices = engine.compute({
+            "a": {"ETH/USDT": make_ticker(3000, quote_volume=10)},
+            "b": {"ETH/USDT": make_ticker(3010, quote_volume=10)},
+            "c": {"ETH/USDT": make_ticker(3005, quote_volume=10)},
+            "bad": {"ETH/USDT": make_ticker(4500, quote_volume=1000)},
+        }, self.LISTED)
+
+        assert prices[0].price == pytest.approx(3005)
+        assert prices[0].sources == 3
+        assert engine.outliers == 1
+
+    def test_stale_venue_is_excluded(self):
+        engine = ReferencePriceEngine(max_age=30)
+        now = 1_700_000_000.0
+        prices = engine.compute({
+            "fresh": {"BTC/USDT": make_ticker(50000, quote_volume=1, timestamp=(now - 5) * 1000)},
+            "stale": {"BTC/USDT": make_ticker(40000, quote_volume=1, timestamp=(now - 120) * 1000)},
+        }, self.LISTED, now=now)
+
+        assert prices[0].price == 50000
+        assert engine.stale == 1
+
+    def test_without_volume_falls_back_to_median(self):
+        engine = ReferencePriceEngine()
+        prices = engine.compute({
+            "a": {"BTC/USDT": make_ticker(100)},
+            "b": {"BTC/USDT": make_ticker(102)},
+            "c": {"BTC/USDT": make_ticker(101)},
+        }, self.LISTED)
+
+        assert prices[0].price == 101
+
+    def test_median_only_venue_has_no_weight_or_volume(self):
+        engine = ReferencePriceEngine(median_only={"coingecko"})
+        prices = engine.compute({
+            "a": {"BTC/USDT": make_ticker(50000, 1.0, 300)},
+            "b": {"BTC/USDT": make_ticker(50100, 2.0, 100)},
+            "coingecko": {"BTC/USDT": make_ticker(50200, 3.0, 1_000_000)},
+        }, self.LISTED)
+
+        assert prices[0].price == pytest.approx(50025)
+        assert prices[0].volume_24h == 400
+        assert prices[0].sources == 3
+
+    def test_median_only_venue_is_a_fallback(self):
+        engine = ReferencePriceEngine(median_only={"coingecko"})
+        prices = engine.compute({
+            "coingecko": {"ETH/USDT": make_ticker(3000, 1.5, 1_000_000)},
+        }, self.LISTED)
+
+        assert prices[0].price == 3000
+        assert prices[0].change_24h == 1.5
+        assert prices[0].volume_24h == 0
+
+    def test_perpetuals_do_not_price_spot(self):
+        engine = ReferencePriceEngine()
+        prices = engine.compute({
+            "a": {"BTC/USDT": make_ticker(50000, quote_volume=1), "BTC/USDT:USDT": make_ticker(50500, quote_volume=99)},
+        }, self.LISTED)
+
+        assert prices[0].price == 50000
+        assert engine.dropped == 1
+
+    def test_unlisted_and_priceless_tickers_are_dropped(self):
+        engine = ReferencePriceEngine()
+        prices = engine.compute({
+            "a": {"ETH/USDT": make_ticker(None), "DOGE/USDT": make_ticker(0.1)},
+        }, self.LISTED)
+
+        assert prices == []
+        assert engine.dropped == 2
+
+    @pytest.mark.asyncio
+    async def test_manager_publishes_once_per_cycle(self, publisher):
+        manager = PopularCoinsManager()
+        manager.db_pool = publisher.db_pool
+        manager.price_publisher = publisher
+        manager.supported_exchanges = [
+            StubExchange("a", {"BTC/USDT": make_ticker(50000), "ETH/USDT": make_ticker(3000)}),
+            StubExchange("b", {"BTC/USDT": make_ticker(50010)}),
+        ]
+
+        await manager.update_all_prices()
+
+        assert publisher.redis_client.pipelines == 1
+        price_keys = {key for key in publisher.redis_client.store if key.startswith("price:")}
+        assert price_keys == {"price:BTCUSDT", "price:ETHUSDT"}
+        assert json.loads(publisher.redis_client.store["price:BTCUSDT"])["sources"] == 2
+
+class TestPriceBatchPublisher:
+    """Test batched price publishing"""
+
+    @pytest.mark.asyncio
+    async def test_cycle_is_one_pipeline_and_one_statement(self, publisher):
+        published = await publisher.publish([
+            ReferencePrice("BTCUSDT", 50000, 0, 0, 1),
+            ReferencePrice("ETHUSDT", 3000, 0, 0, 1),
+        ])
+
+        assert published == 2
+        assert publisher.redis_client.pipelines == 1
+        executed = publisher.db_pool.connection.executed
+        assert len(executed) == 1
+        query, args = executed[0]
+        assert "unnest" in query
+        assert args[0] == ["BTCUSDT", "ETHUSDT"]
+        assert json.loads(publisher.redis_client.store["price:ETHUSDT"])["price"] == 3000
+
+    @pytest.mark.asyncio
+    async def test_empty_cycle_does_nothing(self, publisher):
+        assert await publisher.publish([]) == 0
+        assert publisher.redis_client.pipelines == 0
+
+class TestPriceSnapshot:
+    """Test the pre-encoded all-prices snapshot"""
+
+    def test_etag_changes_only_with_content(self):
+        snapshot = PriceSnapshot()
+        snapshot.update({"BTCUSDT": {"price": 1}})
+        first = snapshot.etag
+        snapshot.update({"BTCUSDT": {"price": 1}})
+        assert snapshot.etag == first
+        snapshot.update({"BTCUSDT": {"price": 2}})
+        assert snapshot.etag != first
+
+    def test_entries_expire_after_ttl(self):
+        snapshot = PriceSnapshot(ttl=0)
+        snapshot.update({"BTCUSDT": {"price": 1}})
+        snapshot.update({"ETHUSDT": {"price": 2}})
+        assert json.loads(snapshot.body) == {"prices": {"ETHUSDT": {"price": 2}}}
+
+    def test_current_withholds_stale_body(self):
+        snapshot = PriceSnapshot(ttl=60)
+        assert snapshot.current() == (None, None)
+
+        snapshot.update({"BTCUSDT": {"price": 1}})
+        assert snapshot.current() == (snapshot.body, snapshot.etag)
+
+        snapshot.updated_at -= 61
+        assert snapshot.current() == (None, None)
+
+    @pytest.mark.asyncio
+    async def test_publish_stores_shared_snapshot(self, publisher):
+        await publisher.publish([ReferencePrice("BTCUSDT", 50000, 0, 0, 1)])
+
+        store = publisher.redis_client.store
+        assert store[coins_main.PRICE_SNAPSHOT_KEY] == publisher.snapshot.body
+        assert store[coins_main.PRICE_SNAPSHOT_ETAG_KEY] == publisher.snapshot.etag
+
+class TestPricesEndpoint:
+    """Test GET /api/v1/prices"""
+
+    @pytest.fixture
+    def client(self, publisher, monkeypatch):
+        manager = PopularCoinsManager()
+        manager.redis_client = publisher.redis_client
+        manager.price_publisher = publisher
+        monkeypatch.setattr(coins_main, "coins_manager", manager)
+        return TestClient(coins_main.app)
+
+    def test_serves_snapshot_with_etag(self, client, publisher):
+        asyncio.run(publisher.publish([ReferencePrice("BTCUSDT", 50000, 0, 0, 1)]))
+
+        response = client.get("/api/v1/prices")
+        assert response.status_code == 200
+        assert response.json()["prices"]["BTCUSDT"]["price"] == 50000
+
+        cached = client.get("/api/v1/prices", headers={"If-None-Match": response.headers["etag"]})
+        assert cached.status_code == 304
+
+    def test_falls_back_to_redis_snapshot(self, client, publisher):
+        other = PriceSnapshot()
+        other.update({"ETHUSDT": {"price": 3000}})
+        publisher.redis_client.store[coins_main.PRICE_SNAPSHOT_KEY] = other.body
+        publisher.redis_client.store[coins_main.PRICE_SNAPSHOT_ETAG_KEY] = other.etag.encode()
+
+        response = client.get("/api/v1/prices")
+        assert response.json() == {"prices": {"ETHUSDT": {"price": 3000}}}
+        assert response.headers["etag"] == other.etag
+
+    def test_stale_snapshot_is_not_served(self, client, publisher):
+        asyncio.run(publisher.publish([ReferencePrice("BTCUSDT", 50000, 0, 0, 1)]))
+        publisher.snapshot.updated_at -= publisher.snapshot.ttl + 1
+        store = publisher.redis_client.store
+        del store[coins_main.PRICE_SNAPSHOT_KEY], store[coins_main.PRICE_SNAPSHOT_ETAG_KEY]
+
+        response = client.get("/api/v1/prices")
+        assert response.status_code == 503
+
+    def test_empty_before_first_publish(self, client):
+        assert client.get("/api/v1/prices").json() == {"prices": {}}
+
+class TestPriceStreamHub:
+    """Test streaming price fan-out"""
+
+    @pytest.mark.asyncio
+    async def test_updates_are_routed_by_symbol(self):
+        hub = PriceStreamHub()
+        btc, everything = hub.open(), hub.open()
+        hub.subscribe(btc, ["btcusdt"])
+        hub.subscribe(everything, ["*"])
+
+        hub.broadcast({"BTCUSDT": {"price": 1}, "ETHUSDT": {"price": 2}})
+
+        assert await btc.next() == {"BTCUSDT": {"price": 1}}
+        assert set(await everything.next()) == {"BTCUSDT", "ETHUSDT"}
+
+    @pytest.mark.asyncio
+    async def test_pending_updates_are_conflated(self):
+        hub = PriceStreamHub()
+        subscription = hub.open()
+        hub.subscribe(subscription, ["BTCUSDT"])
+
+        hub.broadcast({"BTCUSDT": {"price": 1}})
+        hub.broadcast({"BTCUSDT": {"price": 2}})
+
+        assert await subscription.next() == {"BTCUSDT": {"price": 2}}
+        assert subscription.conflated == 1
+
+    @pytest.mark.asyncio
+    async def test_slow_consumer_is_evicted(self):
+        hub = PriceStreamHub(max_lag=2)
+        slow, fast = hub.open(), hub.open()
+        hub.subscribe(slow, ["BTCUSDT"])
+        hub.subscribe(fast, ["BTCUSDT"])
+
+        for price in range(4):
+            hub.broadcast({"BTCUSDT": {"price": price}})
+            assert await fast.next() == {"BTCUSDT": {"price": price}}
+
+        assert slow.evicted
+        assert await slow.next() is None
+        assert hub.metrics() == {"subscribers": 1, "symbols": 1, "evicted": 1}
+
+    @pytest.mark.asyncio
+    async def test_subscribe_pushes_current_values(self):
+        hub = PriceStreamHub()
+        subscription = hub.open()
+        hub.subscribe(subscription, ["ETHUSDT", "XRPUSDT"], current={"ETHUSDT": {"price": 3000}})
+
+        assert await subscription.next() == {"ETHUSDT": {"price": 3000}}
+
+    def test_close_removes_symbol_index(self):
+        hub = PriceStreamHub()
+        subscription = hub.open()
+        hub.subscribe(subscription, ["BTCUSDT"])
+        hub.close(subscription)
+
+        assert hub.by_symbol == {}
+        hub.broadcast({"BTCUSDT": {"price": 1}})
+        assert subscription.pending == {}
+
+    def test_websocket_stream(self, publisher, monkeypatch):
+        manager = PopularCoinsManager()
+        manager.price_publisher = publisher
+        monkeypatch.setattr(coins_main, "coins_manager", manager)
+        publisher.snapshot.update({"BTCUSDT": {"price": 50000}})
+
+        with TestClient(coins_main.app).websocket_connect("/ws/prices") as websocket:
+            websocket.send_text("not json")
+            websocket.send_text(json.dumps({"action": "subscribe", "symbols": ["BTCUSDT"]}))
+            message = websocket.receive_json()
+
+        assert message == {"type": "prices", "data": {"BTCUSDT": {"price": 50000}}}
+
+class TestPooledHTTPClient:
+    """Test the shared outbound HTTP client"""
+
+    @pytest.mark.asyncio
+    async def test_token_bucket_paces_requests(self):
+        bucket = TokenBucket(rate=20, capacity=1)
+        started = time.monotonic()
+        for _ in range(3):
+            await bucket.acquire()
+        assert time.monotonic() - started >= 0.09
+
+    @pytest.mark.asyncio
+    async def test_session_is_reused_and_429_pauses_host(self):
+        calls = []
+
+        async def handler(request):
+            calls.append(request.query.get("n"))
+            if request.query.get("n") == "limited":
+                return web.Response(status=429, headers={"Retry-After": "1"})
+            return web.json_response({"ok": True})
+
+        app = web.Application()
+        app.router.add_get("/data", handler)
+        server = TestServer(app)
+        await server.start_server()
+        client = PooledHTTPClient()
+        client.set_rate_limit(server.host, rate=100, burst=10)
+        try:
+            assert await client.get_json(str(server.make_url("/data")), params={"n": "1"}) == {"ok": True}
+            session = client.session
+            assert await client.get_json(str(server.make_url("/data")), params={"n": "limited"}) is None
+            assert client.session is session
+            assert client.throttled == 1
+            assert client.buckets[server.host].tokens < 0
+        finally:
+            await client.close()
+            await server.close()
+
+class JSONRPCStub:
+    """Local JSON-RPC endpoint answering ERC-20 eth_calls from a token table"""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.requests = []
+
+    async def handle(self, request):
+        batch = await request.json()
+        self.requests.append(batch)
+        responses = []
+        for call in batch:
+            target = call["params"][0]
+            token = self.tokens.get(target["to"])
+            if token is None:
+                responses.append({"jsonrpc": "2.0", "id": call["id"], "error": {"code": -32000, "message": "revert"}})
+                continue
+            value = token[0] if target["data"] == TokenMetadataFetcher.TOTAL_SUPPLY else token[1]
+            responses.append({"jsonrpc": "2.0", "id": call["id"], "result": hex(value)})
+        return web.json_response(responses)
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/", self.handle)
+        self.server = TestServer(app)
+        await self.server.start_server()
+        return str(self.server.make_url("/"))
+
+class TestTokenMetadataFetcher:
+    """Test batched on-chain token metadata refresh"""
+
+    @pytest.mark.asyncio
+    async def test_batched_calls_and_decimals_cache(self):
+        stub = JSONRPCStub({"0xaaa": (10 ** 24, 18), "0xbbb": (5 * 10 ** 12, 6)})
+        url = await stub.start()
+        http = PooledHTTPClient()
+        fetcher = TokenMetadataFetcher(http, {"ethereum": url, "polygon": url}, batch_size=3)
+        try:
+            first = await fetcher.fetch_all({
+                "ethereum": ["0xaaa", "0xbbb", "0xdead"],
+                "polygon": ["0xbbb"],
+                "solana": ["ignored"],
+            })
+            calls_first = sum(len(batch) for batch in stub.requests)
+            await fetcher.fetch_all({"ethereum": ["0xaaa", "0xbbb"]})
+            second = stub.requests[len(stub.requests) - 1]
+        finally:
+            await http.close()
+            await stub.server.close()
+
+        assert first == {
+            ("ethereum", "0xaaa"): (10 ** 24, 18),
+            ("ethereum", "0xbbb"): (5 * 10 ** 12, 6),
+            ("polygon", "0xbbb"): (5 * 10 ** 12, 6),
+        }
+        # 6 ethereum calls in two batches of 3, 2 polygon calls in one
+        assert calls_first == 8 and fetcher.batches == 4
+        # decimals are cached, so the refresh only reads totalSupply
+        assert {call["params"][0]["data"] for call in second} == {TokenMetadataFetcher.TOTAL_SUPPLY}
+
+    @pytest.mark.asyncio
+    async def test_malformed_responses_are_skipped(self):
+        class CannedHTTP:
+            async def post_json(self, url, payload):
+                return [
+                    {"jsonrpc": "2.0", "id": None, "error": {"code": -32600, "message": "invalid"}},
+                    {"jsonrpc": "2.0", "id": 7, "result": "0x10"},
+                    {"jsonrpc": "2.0", "id": 0, "result": "0x0a"},
+                    {"jsonrpc": "2.0", "id": 1, "result": "0x"},
+                    {"jsonrpc": "2.0", "id": 2},
+                    "garbage",
+                ]
+
+        fetcher = TokenMetadataFetcher(CannedHTTP(), {})
+        calls = [("0xaaa", TokenMetadataFetcher.TOTAL_SUPPLY),
+                 ("0xbbb", TokenMetadataFetcher.TOTAL_SUPPLY),
+                 ("0xccc", TokenMetadataFetcher.TOTAL_SUPPLY)]
+
+        assert await fetcher.call_batch("http://rpc", calls) == [10, None, None]
+
+    @pytest.mark.asyncio
+    async def test_update_token_contracts_writes_one_bulk_update(self):
+        stub = JSONRPCStub({"0xaaa": (1000, 18)})
+        url = await stub.start()
+        connection = FakeConnection(coins=[
+            {"symbol": "AAA", "blockchain": "ethereum", "contract_address": "0xaaa"},
+        ])
+        manager = PopularCoinsManager()
+        manager.db_pool = FakePool(connection)
+        manager.token_metadata.rpc_urls = {"ethereum": url}
+        try:
+            await manager.update_token_contracts()
+        finally:
+            await manager.http.close()
+            await stub.server.close()
+
+        (query, args), = connection.executed
+        assert "unnest" in query
+        assert args[:3] == (["AAA"], [1000], [18])
+
+def make_catalog_rows():
+    coins = [
+        {"id": i, "symbol": symbol, "asset_type": asset_type, "blockchain": chain,
+         "supported_trading_types": types, "market_cap_rank": rank, "market_cap": cap}
+        for i, (symbol, asset_type, chain, types, rank, cap) in enumerate([
+            ("BTC", "cryptocurrency", "bitcoin", ["spot", "futures"], 1, 1e12),
+            ("ETH", "cryptocurrency", "ethereum", ["spot", "futures"], 2, 4e11),
+            ("USDT", "stablecoin", "ethereum", ["spot"], 3, 1e11),
+            ("UNI", "token", "ethereum", ["spot"], None, 5e9),
+            ("LINK", "token", "ethereum", ["spot", "margin"], None, 8e9),
+        ])
+    ]
+    pairs = [
+        {"id": i, "symbol": f"{base}{quote}", "base_asset": base, "quote_asset": quote,
+         "trading_type": trading_type, "volume_24h": volume}
+        for i, (base, quote, trading_type, volume) in enumerate([
+            ("BTC", "USDT", "spot", 900),
+            ("BTC", "USDT", "futures", 1200),
+            ("ETH", "USDT", "spot", 500),
+            ("ETH", "BTC", "spot", 50),
+            ("UNI", "USDT", "spot", 10),
+        ])
+    ]
+    return coins, pairs
+
+class TestCoinCatalog:
+    """Test the in-memory coin and trading pair catalog"""
+
+    @pytest.fixture
+    def catalog(self):
+        coins, pairs = make_catalog_rows()
+        catalog = CoinCatalog()
+        catalog.coins.load(coins)
+        catalog.pairs.load(pairs)
+        catalog.loaded = True
+        return catalog
+
+    def test_coin_filters_and_ordering(self, catalog):
+        rows, _ = catalog.coins.query({"blockchain": "ethereum", "asset_type": "token"}, limit=10)
+        # market_cap_rank NULLS LAST, then market_cap DESC
+        assert [row["symbol"] for row in rows] == ["LINK", "UNI"]
+
+        rows, _ = catalog.coins.query({"supported_trading_types": "futures"}, limit=10)
+        assert [row["symbol"] for row in rows] == ["BTC", "ETH"]
+
+        rows, _ = catalog.coins.query({"asset_type": "nft"}, limit=10)
+        assert rows == []
+
+    def test_keyset_pages_match_offset_pages(self, catalog):
+        everything, _ = catalog.coins.query({}, limit=10)
+        seen, cursor = [], None
+        while True:
+            page, cursor = catalog.coins.query({}, limit=2, cursor=cursor)
+            seen.extend(page)
+            if cursor is None:
+                break
+        assert seen == everything
+        assert catalog.coins.query({}, limit=2, offset=2)[0] == everything[2:4]
+
+    def test_prices_reorder_pairs_by_volume(self, catalog):
+        rows, _ = catalog.pairs.query({"quote_asset": "USDT"}, limit=10)
+        assert [(row["symbol"], row["trading_type"]) for row in rows][:2] == [
+            ("BTCUSDT", "futures"), ("BTCUSDT", "spot")
+        ]
+
+        catalog.apply_prices([ReferencePrice("ETHUSDT", 3000, 1.0, 5000, 2)])
+        rows, _ = catalog.pairs.query({"quote_asset": "USDT"}, limit=1)
+        assert rows[0]["symbol"] == "ETHUSDT" and rows[0]["current_price"] == 3000
+
+    def test_invalid_cursor(self, catalog):
+        with pytest.raises(ValueError):
+            catalog.pairs.query({}, limit=1, cursor="not-a-cursor")
+
+    @pytest.mark.asyncio
+    async def test_reloads_only_after_invalidate(self):
+        coins, pairs = make_catalog_rows()
+        pool = FakePool(FakeConnection(rows=pairs, coins=coins))
+        catalog = CoinCatalog()
+
+        await catalog.ensure_loaded(pool)
+        await catalog.ensure_loaded(pool)
+        assert catalog.reloads == 1
+
+        catalog.invalidate()
+        await catalog.ensure_loaded(pool)
+        assert catalog.reloads == 2
+
+    @pytest.mark.asyncio
+    async def test_reloads_once_older_than_max_age(self):
+        """Rows written by another replica show up without a local invalidate"""
+        coins, pairs = make_catalog_rows()
+        connection = FakeConnection(rows=pairs, coins=coins[:1])
+        catalog = CoinCatalog(max_age=60)
+
+        await catalog.ensure_loaded(FakePool(connection))
+        connection.coins = coins
+        await catalog.ensure_loaded(FakePool(connection))
+        assert len(catalog.coins.query({}, limit=100)[0]) == 1
+
+        catalog.loaded_at -= 61
+        await catalog.ensure_loaded(FakePool(connection))
+        assert catalog.reloads == 2
+        assert len(catalog.coins.query({}, limit=100)[0]) == len(coins)
+
+    def test_list_endpoints(self, monkeypatch):
+        coins, pairs = make_catalog_rows()
+        manager = PopularCoinsManager()
+        manager.db_pool = FakePool(FakeConnection(rows=pairs, coins=coins))
+        monkeypatch.setattr(coins_main, "coins_manager", manager)
+        client = TestClient(coins_main.app)
+
+        response = client.get("/api/v1/coins", params={"blockchain": "ethereum", "limit": 2})
+        body = response.json()
+        assert [coin["symbol"] for coin in body["coins"]] == ["ETH", "USDT"]
+
+        response = client.get("/api/v1/coins", params={"blockchain": "ethereum", "cursor": body["next_cursor"]})
+        assert [coin["symbol"] for coin in response.json()["coins"]] == ["LINK", "UNI"]
+        assert response.json()["next_cursor"] is None
+
+        response = client.get("/api/v1/trading-pairs", params={"base_asset": "ETH"})
+        assert [pair["symbol"] for pair in response.json()["trading_pairs"]] == ["ETHUSDT", "ETHBTC"]
+
+        assert client.get("/api/v1/trading-pairs", params={"cursor": "bogus"}).status_code == 400
+
+class BrokenPool:
+    def acquire(self):
+        raise RuntimeError("column coingecko_id does not exist")
+
+class TestCoinGeckoRegistry:
+    """Test the symbol <-> CoinGecko id registry"""
+
+    def test_fallback_lookups_both_ways(self):
+        manager = PopularCoinsManager()
+        assert manager.get_coingecko_id("AVAX") == "avalanche-2"
+        assert manager.get_symbol_from_coingecko_id("avalanche-2") == "AVAX"
+        assert manager.get_coingecko_id("NOPE") is None
+
+    def test_bulk_resolution(self):
+        registry = CoinGeckoRegistry()
+        assert registry.resolve(["BTC", "NOPE", "ETH"]) == {"BTC": "bitcoin", "ETH": "ethereum"}
+
+    @pytest.mark.asyncio
+    async def test_load_overlays_coins_table(self):
+        registry = CoinGeckoRegistry(fallback={"BTC": "bitcoin", "POL": "matic-network"})
+        rows = [{"symbol": "POL", "coingecko_id": "polygon-ecosystem-token"},
+                {"symbol": "ARB", "coingecko_id": "arbitrum"}]
+        await registry.load(FakePool(FakeConnection(coins=rows)))
+
+        assert registry.by_symbol == {
+            "BTC": "bitcoin", "POL": "polygon-ecosystem-token", "ARB": "arbitrum"
+        }
+        assert "matic-network" not in registry.by_id
+        assert registry.by_id["arbitrum"] == "ARB"
+
+    @pytest.mark.asyncio
+    async def test_load_failure_keeps_fallback(self):
+        registry = CoinGeckoRegistry()
+        registry.register("ARB", "arbitrum")
+        await registry.load(BrokenPool())
+        assert registry.by_symbol["ARB"] == "arbitrum"
+        assert registry.by_symbol["BTC"] == "bitcoin"
+
+    @pytest.mark.asyncio
+    async def test_bootstrap_registers_new_coins(self):
+        manager = PopularCoinsManager()
+        manager.db_pool = FakePool(FakeConnection())
+
+        async def fetch_info(coingecko_id):
+            return {}
+
+        manager.fetch_coin_info_from_coingecko = fetch_info
+        coin = TestBootstrapCoins.make_coin("ARB")
+        coin["coingecko_id"] = "arbitrum"
+        await manager.bootstrap_coins([coin])
+
+        assert manager.get_symbol_from_coingecko_id("arbitrum") == "ARB"
+        assert manager.db_pool.connection.copied["coins_staging"][0][-1] == "arbitrum"
+
+    @pytest.mark.asyncio
+    async def test_coins_table_without_coingecko_id(self):
+        """Databases that predate the column keep accepting coin writes"""
+        connection = FakeConnection(coins_have_coingecko_id=False)
+        manager = PopularCoinsManager()
+        manager.db_pool = FakePool(connection)
+
+        async def fetch_info(coingecko_id):
+            return {}
+
+        manager.fetch_coin_info_from_coingecko = fetch_info
+        await manager.detect_coin_columns()
+        assert "coingecko_id" not in manager.coin_columns
+
+        coin = TestBootstrapCoins.make_coin("ARB")
+        coin["coingecko_id"] = "arbitrum"
+        await manager.add_coin_to_database(coin)
+        await manager.bootstrap_coins([TestBootstrapCoins.make_coin("OP")])
+
+        query, args = connection.executed[0]
+        assert "coingecko_id" not in query
+        assert len(args) == len(manager.coin_columns) == query.count("$")
+        staging = [query for query, _ in connection.executed if "coins_staging" in query]
+        assert staging and all("coingecko_id" not in query for query in staging)
+        assert len(connection.copied["coins_staging"][0]) == len(manager.coin_columns)
+        # Ids still resolve for coins added this run
+        assert manager.get_coingecko_id("ARB") == "arbitrum"
+
+class TestBootstrapCoins:
+    """Test bulk popular-coin bootstrap"""
+
+    @staticmethod
+    def make_coin(symbol, asset_type=coins_main.AssetType.CRYPTOCURRENCY):
+        return {
+            "symbol": symbol,
+            "name": symbol,
+            "asset_type": asset_type,
+            "blockchain": coins_main.Blockchain.ETHEREUM,
+            "coingecko_id": symbol.lower(),
+            "supported_trading_types": [coins_main.TradingType.SPOT, coins_main.TradingType.FUTURES],
+        }
+
+    def test_default_pair_specs(self):
+        specs = PopularCoinsManager.default_pair_specs(self.make_coin("ETH"))
+        assert {quote for quote, _ in specs} == {"USDT", "USDC", "BTC"}
+        assert len(specs) == 6
+
+        stable = PopularCoinsManager.default_pair_specs(
+            self.make_coin("USDT", coins_main.AssetType.STABLECOIN)
+        )
+        assert {quote for quote, _ in stable} == {"BTC", "ETH"}
+
+    @pytest.mark.asyncio
+    async def test_bulk_load_skips_existing_coins(self):
+        connection = FakeConnection(coins=[{"symbol": "BTC"}])
+        manager = PopularCoinsManager()
+        manager.db_pool = FakePool(connection)
+        in_flight = peak = 0
+        fetched = []
+
+        async def fetch_info(coingecko_id):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            fetched.append(coingecko_id)
+            return {"current_price": 1}
+
+        manager.fetch_coin_info_from_coingecko = fetch_info
+        coins = [self.make_coin(symbol) for symbol in ("BTC", "ETH", "SOL", "ADA", "DOT")]
+        result = await manager.bootstrap_coins(coins, concurrency=2)
+
+        assert "btc" not in fetched and len(fetched) == 4
+        assert peak == 2
+        assert [record[0] for record in connection.copied["coins_staging"]] == ["ETH", "SOL", "ADA", "DOT"]
+        # Pairs are generated for every coin, existing ones included
+        assert len(connection.copied["trading_pairs_staging"]) == 5 * 8 - 4
+        assert result == {"coins": 4, "trading_pairs": 36}
+        inserts = [query for query, _ in connection.executed if "INSERT INTO" in query]
+        assert len(inserts) == 2
+        assert all("ON CONFLICT DO NOTHING" in query for query in inserts)
+
+def test_latency_histogram_is_cumulative():
+    histogram = LatencyHistogram(buckets=(0.1, 1.0))
+    for seconds in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(seconds)
+
+    snapshot = histogram.snapshot()
+    assert snapshot["buckets"] == {"0.1": 1, "1.0": 3, "+Inf": 4}
+    assert snapshot["count"] == 4
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,986 @@
+"""
+Integration tests for Risk Management Service
+"""
+
+import asyncio
+import importlib.util
+import time
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import numpy as np
+import pytest
+
+# Load the risk management service under its own module name so it does not
+# collide with the other services' ``main`` modules
+spec = importlib.util.spec_from_file_location(
+    "risk_management_main", "backend/risk-management/src/main.py"
+)
+risk_main = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(risk_main)
+
+RiskEngine = risk_main.RiskEngine
+RiskLimits = risk_main.RiskLimits
+Position = risk_main.Position
+MarketData = risk_main.MarketData
+PositionBook = risk_main.PositionBook
+TriggerIndex = risk_main.TriggerIndex
+PositionWriteBehind = risk_main.PositionWriteBehind
+RollingVolumeWindow = risk_main.RollingVolumeWindow
+UserActivityTracker = risk_main.UserActivityTracker
+ReturnHistory = risk_main.ReturnHistory
+VaREngine = risk_main.VaREngine
+EWCovariance = risk_main.EWCovariance
+EventPublisher = risk_main.EventPublisher
+InMemoryBroker = risk_main.InMemoryBroker
+UserFeatureCache = risk_main.UserFeatureCache
+AnomalyScorer = risk_main.AnomalyScorer
+
+def make_limits(user_id, margin_call_threshold=0.5, liquidation_threshold=0.2):
+    now = datetime.utcnow()
+    return RiskLimits(
+        user_id=user_id,
+        max_position_size=Decimal("100"),
+        max_daily_loss=Decimal("10000"),
+        max_leverage=10.0,
+        max_open_orders=50,
+        max_daily_volume=Decimal("1000000"),
+        margin_call_threshold=margin_call_threshold,
+        liquidation_threshold=liquidation_threshold,
+        withdrawal_limit_24h=Decimal("100000"),
+        api_rate_limit=1200,
+        max_symbols_per_user=20,
+        vip_level=0,
+        is_institutional=False,
+        created_at=now,
+        updated_at=now
+    )
+
+def make_position(user_id, symbol, side, size="1", entry="100", margin="10"):
+    now = datetime.utcnow()
+    return Position(
+        user_id=user_id,
+        symbol=symbol,
+        side=side,
+        size=Decimal(size),
+        entry_price=Decimal(entry),
+        mark_price=Decimal(entry),
+        unrealized_pnl=Decimal("0"),
+        margin_used=Decimal(margin),
+        leverage=10.0,
+        liquidation_price=Decimal("0"),
+        maintenance_margin=Decimal("1"),
+        created_at=now,
+        updated_at=now
+    )
+
+def make_market_data(symbol, price):
+    return MarketData(
+        symbol=symbol,
+        price=Decimal(price),
+        volume_24h=Decimal("0"),
+        volatility=0.02,
+        bid=Decimal(price),
+        ask=Decimal(price),
+        timestamp=datetime.utcnow()
+    )
+
+class FakeConnection:
+    """Records statements instead of sending them to Postgres"""
+
+    def __init__(self, fail=False):
+        self.statements = []
+        self.fail = fail
+
+    async def execute(self, query, *args):
+        if self.fail:
+            raise ConnectionError("database unavailable")
+        self.statements.append((query, args))
+
+class FakePool:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def acquire(self):
+        pool = self
+
+        class Acquire:
+            async def __aenter__(self):
+                return pool.connection
+
+            async def __aexit__(self, *exc):
+                return False
+
+        return Acquire()
+
+def full_scan_breaches(book, ratio, slots=None):
+    """Slots at or below their thresholds, found by scanning every ratio"""
+    if slots is None:
+        slots = np.arange(len(ratio))
+    margin_calls = slots[ratio <= book.margin_call_threshold[slots]]
+    liquidations = slots[ratio <= book.liquidation_threshold[slots]]
+    return margin_calls, liquidations
+
+@pytest.fixture
+def engine():
+    """Risk engine with limits for two users and no external connections"""
+    engine = RiskEngine()
+    engine.risk_limits = {1: make_limits(1), 2: make_limits(2)}
+    return engine
+
+class TestPositionBook:
+    """Test the columnar position store"""
+
+    def test_evaluate_matches_decimal_calculation(self, engine):
+        """Vectorized PnL and margin ratio match the per-position formulas"""
+        engine.add_position(make_position(1, "BTCUSDT", "LONG"))
+        engine.add_position(make_position(2, "BTCUSDT", "SHORT"))
+        engine.market_data["BTCUSDT"] = make_market_data("BTCUSDT", "95")
+
+        book = engine.position_book
+        ratio, marked = book.evaluate(book.symbol_marks(engine.market_data))
+
+        assert marked.all()
+        for key, slot in book.slots.items():
+            position = engine.sync_position(key)
+            assert position.unrealized_pnl == engine.calculate_unrealized_pnl(position)
+            assert ratio[slot] == pytest.approx(engine.calculate_margin_ratio(position))
+
+    def test_evaluate_ratios_flag_only_crossed_positions(self, engine):
+        """Only positions past their thresholds are emitted"""
+        engine.add_position(make_position(1, "BTCUSDT", "LONG"))
+        engine.add_position(make_position(2, "BTCUSDT", "SHORT"))
+        engine.add_position(make_position(1, "ETHUSDT", "LONG"))
+        engine.market_data["BTCUSDT"] = make_market_data("BTCUSDT", "93")
+
+        book = engine.position_book
+        ratio, _ = book.evaluate(book.symbol_marks(engine.market_data))
+        margin_calls, liquidations = full_scan_breaches(book, ratio)
+
+        assert [book.keys[slot] for slot in margin_calls] == [(1, "BTCUSDT")]
+        assert len(liquidations) == 0
+
+    def test_positions_without_limits_are_skipped(self, engine):
+        """Users without risk limits never breach"""
+        engine.add_position(make_position(3, "BTCUSDT", "LONG"))
+        engine.market_data["BTCUSDT"] = make_market_data("BTCUSDT", "1")
+
+        book = engine.position_book
+        ratio, _ = book.evaluate(book.symbol_marks(engine.market_data))
+        margin_calls, liquidations = full_scan_breaches(book, ratio)
+
+        assert len(margin_calls) == 0
+        assert len(liquidations) == 0
+
+    def test_remove_keeps_slots_dense(self, engine):
+        """Removing a position moves the last slot into the hole"""
+        engine.add_position(make_position(1, "BTCUSDT", "LONG", entry="100"))
+        engine.add_position(make_position(2, "BTCUSDT", "SHORT", entry="200"))
+        engine.add_position(make_position(1, "ETHUSDT", "LONG", entry="300"))
+
+        engine.remove_position(1, "BTCUSDT")
+
+        book = engine.position_book
+        assert len(book) == 2
+        assert book.slots[(1, "ETHUSDT")] == 0
+        assert book.entry[0] == 300.0
+        assert sorted(book.keys) == sorted(engine.positions)
+
+    def test_book_grows_past_initial_capacity(self):
+        """The book reallocates its columns when full"""
+        book = PositionBook(capacity=2)
+        for user_id in range(5):
+            book.upsert(make_position(user_id, "BTCUSDT", "LONG"), make_limits(user_id))
+
+        assert len(book) == 5
+        assert book.capacity >= 5
+        assert np.all(book.entry[:5] == 100.0)
+
+class TestEventDrivenMonitoring:
+    """Test per-symbol re-evaluation on price updates"""
+
+    def test_price_update_marks_only_its_symbol_dirty(self, engine):
+        """A tick schedules re-evaluation of the symbol that moved"""
+        engine.add_position(make_position(1, "BTCUSDT", "LONG"))
+        engine.add_position(make_position(1, "ETHUSDT", "LONG"))
+        engine.dirty_symbols.clear()
+        engine.price_event.clear()
+
+        engine.update_market_data(make_market_data("BTCUSDT", "99"))
+
+        assert engine.dirty_symbols == {"BTCUSDT"}
+        assert engine.price_event.is_set()
+
+    def test_price_update_for_untracked_symbol_is_ignored(self, engine):
+        """Ticks for symbols without positions do not wake the monitor"""
+        engine.price_event.clear()
+
+        engine.update_market_data(make_market_data("SOLUSDT", "20"))
+
+        assert not engine.dirty_symbols
+        assert not engine.price_event.is_set()
+
+    @pytest.mark.asyncio
+    async def test_evaluate_symbols_only_touches_dirty_positions(self, engine):
+        """Positions of symbols that did not move keep their old mark"""
+        engine.add_position(make_position(1, "BTCUSDT", "LONG"))
+        engine.add_position(make_position(2, "ETHUSDT", "LONG"))
+        engine.market_data["BTCUSDT"] = make_market_data("BTCUSDT", "101")
+        engine.market_data["ETHUSDT"] = make_market_data("ETHUSDT", "50")
+
+        await engine.evaluate_symbols({"BTCUSDT"})
+
+        book = engine.position_book
+        assert list(engine.position_writer.pending) == [(1, "BTCUSDT")]
+        assert book.mark[book.slots[(1, "BTCUSDT")]] == 101.0
+        assert book.mark[book.slots[(2, "ETHUSDT")]] == 100.0
+
+class TestTriggerIndex:
+    """Test the per-symbol trigger-price heaps"""
+
+    def test_trigger_prices_match_margin_ratio(self, engine):
+        """A position sits exactly on its thresholds at its trigger prices"""
+        engine.add_position(make_position(1, "BTCUSDT", "LONG"))
+        engine.add_position(make_position(2, "BTCUSDT", "SHORT"))
+
+        book = engine.position_book
+        for key, slot in book.slots.items():
+            margin_call_price, liquidation_price = book.trigger_prices(slot)
+            position = engine.positions[key]
+            for price, threshold in ((margin_call_price, 0.5), (liquidation_price, 0.2)):
+                position.mark_price = Decimal(str(price))
+                position.unrealized_pnl = engine.calculate_unrealized_pnl(position)
+                assert engine.calculate_margin_ratio(position) == pytest.approx(threshold)
+
+    def test_pop_crossed_agrees_with_full_scan(self, engine):
+        """The index pops the same positions a full ratio scan would flag"""
+        for user_id, entry in enumerate(["90", "95", "100", "105", "110"], start=1):
+            engine.risk_limits[user_id] = make_limits(user_id)
+            engine.add_position(make_position(user_id, "BTCUSDT", "LONG", entry=entry))
+            engine.add_position(make_position(user_id, "ETHUSDT", "SHORT", entry=entry))
+
+        book = engine.position_book
+        for symbol, mark in (("BTCUSDT", 97.0), ("ETHUSDT", 101.0)):
+            slots = book.slots_for([symbol])
+            marks = np.full(len(book.symbols), np.nan)
+            marks[book.symbol_ids[symbol]] = mark
+            ratio, _ = book.evaluate(marks, slots)
+            margin_calls, liquidations = full_scan_breaches(book, ratio, slots)
+
+            crossed = engine.trigger_index.pop_crossed(symbol, mark)
+
+            assert sorted(key for kind, key in crossed if kind == TriggerIndex.MARGIN_CALL) == \
+                sorted(book.keys[slot] for slot in margin_calls)
+            assert sorted(key for kind, key in crossed if kind == TriggerIndex.LIQUIDATION) == \
+                sorted(book.keys[slot] for slot in liquidations)
+
+    def test_triggers_fire_once(self):
+        """A crossed trigger is not popped again on the next tick"""
+        index = TriggerIndex()
+        index.arm((1, "BTCUSDT"), "LONG", 95.0, 92.0)
+
+        assert index.pop_crossed("BTCUSDT", 94.0) == [(TriggerIndex.MARGIN_CALL, (1, "BTCUSDT"))]
+        assert index.pop_crossed("BTCUSDT", 94.0) == []
+
+    def test_margin_call_rearms_after_recovery(self):
+        """A position that recovers and falls again gets a second margin call"""
+        index = TriggerIndex()
+        index.arm((1, "BTCUSDT"), "LONG", 95.0, 92.0)
+        index.arm((2, "BTCUSDT"), "SHORT", 105.0, 108.0)
+
+        assert index.pop_crossed("BTCUSDT", 94.0) == [(TriggerIndex.MARGIN_CALL, (1, "BTCUSDT"))]
+        assert index.pop_crossed("BTCUSDT", 95.0) == []
+        assert index.pop_crossed("BTCUSDT", 100.0) == []
+        assert index.pop_crossed("BTCUSDT", 94.0) == [(TriggerIndex.MARGIN_CALL, (1, "BTCUSDT"))]
+
+        assert index.pop_crossed("BTCUSDT", 106.0) == [(TriggerIndex.MARGIN_CALL, (2, "BTCUSDT"))]
+        assert index.pop_crossed("BTCUSDT", 104.0) == []
+        assert index.pop_crossed("BTCUSDT", 106.0) == [(TriggerIndex.MARGIN_CALL, (2, "BTCUSDT"))]
+
+    def test_disarm_drops_pending_recovery(self):
+        """A closed position is not re-armed when the mark recovers"""
+        index = TriggerIndex()
+        index.arm((1, "BTCUSDT"), "LONG", 95.0, 92.0)
+        index.pop_crossed("BTCUSDT", 94.0)
+        index.disarm((1, "BTCUSDT"))
+
+        assert index.pop_crossed("BTCUSDT", 100.0) == []
+        assert index.pop_crossed("BTCUSDT", 94.0) == []
+        assert index.live["BTCUSDT"] == 0
+
+    def test_rearm_supersedes_old_prices(self):
+        """Stale entries from a previous arm are ignored"""
+        index = TriggerIndex()
+        index.arm((1, "BTCUSDT"), "SHORT", 105.0, 108.0)
+        index.arm((1, "BTCUSDT"), "SHORT", 120.0, 130.0)
+
+        assert index.pop_crossed("BTCUSDT", 110.0) == []
+        assert index.pop_crossed("BTCUSDT", 125.0) == [(TriggerIndex.MARGIN_CALL, (1, "BTCUSDT"))]
+
+    def test_disarm_removes_triggers(self):
+        """Closed positions never trigger"""
+        index = TriggerIndex()
+        index.arm((1, "BTCUSDT"), "LONG", 95.0, 92.0)
+        index.disarm((1, "BTCUSDT"))
+
+        assert index.pop_crossed("BTCUSDT", 1.0) == []
+        assert index.live["BTCUSDT"] == 0
+
+class TestPositionWriteBehind:
+    """Test batched position persistence"""
+
+    @pytest.mark.asyncio
+    async def test_updates_coalesce_into_one_statement(self, engine):
+        """Many updates to many positions flush as a single UPDATE"""
+        connection = FakeConnection()
+        engine.position_writer.db_pool = FakePool(connection)
+        for user_id in range(1, 3):
+            engine.add_position(make_position(user_id, "BTCUSDT", "LONG"))
+        engine.market_data["BTCUSDT"] = make_market_data("BTCUSDT", "102")
+
+        for _ in range(3):
+            await engine.evaluate_symbols({"BTCUSDT"})
+        written = await engine.position_writer.flush()
+
+        assert written == 2
+        assert len(connection.statements) == 1
+        _, (user_ids, symbols, sizes, marks, pnls, _) = connection.statements[0]
+        assert sorted(user_ids) == [1, 2]
+        assert marks == [Decimal("102.0"), Decimal("102.0")]
+        assert pnls == [Decimal("2.0"), Decimal("2.0")]
+
+    @pytest.mark.asyncio
+    async def test_liquidated_position_is_written_with_zero_size(self, engine):
+        """Positions removed before the flush keep their final state"""
+        connection = FakeConnection()
+        engine.position_writer.db_pool = FakePool(connection)
+        position = make_position(1, "BTCUSDT", "LONG")
+        engine.add_position(position)
+
+        position.size = Decimal("0")
+        await engine.update_position(position)
+        engine.remove_position(1, "BTCUSDT")
+        await engine.position_writer.flush()
+
+        _, (user_ids, _, sizes, _, _, _) = connection.statements[0]
+        assert user_ids == [1]
+        assert sizes == [Decimal("0")]
+
+    @pytest.mark.asyncio
+    async def test_failed_flush_requeues_batch(self):
+        """A failed write keeps the rows for the next attempt"""
+        writer = PositionWriteBehind(db_pool=FakePool(FakeConnection(fail=True)))
+        writer.add(make_position(1, "BTCUSDT", "LONG"))
+
+        with pytest.raises(ConnectionError):
+            await writer.flush()
+
+        assert list(writer.pending) == [(1, "BTCUSDT")]
+
+    def test_size_bound_wakes_flusher(self):
+        """Reaching max_pending triggers an early flush"""
+        writer = PositionWriteBehind(max_pending=2)
+        writer.add(make_position(1, "BTCUSDT", "LONG"))
+        assert not writer.flush_event.is_set()
+
+        writer.add(make_position(2, "BTCUSDT", "LONG"))
+        assert writer.flush_event.is_set()
+
+    @pytest.mark.asyncio
+    async def test_bad_event_does_not_drop_the_rest_of_the_poll(self, engine):
+        """A malformed order event is skipped, the tick after it still applies"""
+        class Record:
+            def __init__(self, topic, value):
+                self.topic, self.value, self.offset = topic, value, 0
+
+        class OneBatchConsumer:
+            polls = 0
+
+            def poll(self, timeout_ms):
+                self.polls += 1
+                if self.polls > 1:
+                    time.sleep(timeout_ms / 1000 / 100)
+                    return {}
+                return {"partition": [
+                    Record("order_events", {"user_id": 7, "status": "FILLED", "quantity": "oops"}),
+                    Record("market_data", {"symbol": "BTCUSDT", "price": "101"}),
+                ]}
+
+        engine.add_position(make_position(1, "BTCUSDT", "LONG"))
+        consumer = asyncio.create_task(engine.consume_events(OneBatchConsumer()))
+        try:
+            for _ in range(50):
+                if "BTCUSDT" in engine.market_data:
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            consumer.cancel()
+
+        assert engine.market_data["BTCUSDT"].price == Decimal("101")
+        assert engine.activity.open_orders_count(7) == 0
+        assert engine.activity.daily_volume(7) == Decimal("0")
+
+class TestUserActivityTracker:
+    """Test in-memory pre-trade counters"""
+
+    def test_rolling_window_expires_old_buckets(self):
+        """Volume older than the window drops out of the total"""
+        window = RollingVolumeWindow(bucket_seconds=60, bucket_count=5)
+        window.add(Decimal("10"), 0)
+        window.add(Decimal("5"), 130)
+
+        assert window.value(200) == Decimal("15")
+        assert window.value(300) == Decimal("5")
+        assert window.value(1000) == Decimal("0")
+
+    def test_late_fill_outside_window_is_ignored(self):
+        """Fills older than the window never count"""
+        window = RollingVolumeWindow(bucket_seconds=60, bucket_count=5)
+        window.add(Decimal("5"), 600)
+        window.add(Decimal("10"), 0)
+
+        assert window.value(600) == Decimal("5")
+
+    def test_order_events_drive_counters(self):
+        """Open orders and filled volume follow the order lifecycle"""
+        tracker = UserActivityTracker()
+        tracker.apply_order_event({"user_id": 1, "order_id": 7, "status": "NEW",
+                                   "quantity": "2", "price": "100"})
+        tracker.apply_order_event({"user_id": 1, "order_id": 8, "status": "NEW",
+                                   "quantity": "1", "price": "50"})
+        assert tracker.open_orders_count(1) == 2
+
+        tracker.apply_order_event({"user_id": 1, "order_id": 7, "status": "FILLED",
+                                   "quantity": "2", "price": "100"})
+        tracker.apply_order_event({"user_id": 1, "order_id": 8, "status": "CANCELED",
+                                   "quantity": "1", "price": "50"})
+        tracker.apply_order_event({"user_id": 1, "order_id": 8, "status": "CANCELED",
+                                   "quantity": "1", "price": "50"})
+
+        assert tracker.open_orders_count(1) == 0
+        assert tracker.daily_volume(1) == Decimal("200")
+
+    def test_reset_replaces_state_from_snapshot(self):
+        """Reconciliation rows overwrite drifted counters"""
+        tracker = UserActivityTracker(window=timedelta(hours=1), bucket_seconds=60)
+        tracker.record_fill(1, Decimal("999"))
+        now_bucket = int(time.time() // 60)
+
+        tracker.reset(
+            [{"user_id": 1, "bucket": now_bucket, "volume": Decimal("40")},
+             {"user_id": 1, "bucket": now_bucket - 5, "volume": Decimal("2")},
+             {"user_id": 2, "bucket": now_bucket - 120, "volume": Decimal("7")}],
+            [{"user_id": 2, "id": 11}, {"user_id": 2, "id": 12}]
+        )
+
+        assert tracker.daily_volume(1) == Decimal("42")
+        assert tracker.daily_volume(2) == Decimal("0")
+        assert tracker.open_orders_count(2) == 2
+
+    def test_order_event_contract(self):
+        """Pin the order_events payload the tracker consumes"""
+        tracker = UserActivityTracker()
+        created_at = datetime.now(timezone.utc) - timedelta(minutes=5)
+        tracker.apply_order_event({"user_id": "3", "order_id": "41", "status": "PARTIALLY_FILLED",
+                                   "quantity": "0.5", "price": "20000"})
+        assert tracker.open_orders_count(3) == 1
+
+        tracker.apply_order_event({"user_id": 3, "order_id": 41, "status": "FILLED",
+                                   "quantity": 0.5, "price": 20000,
+                                   "created_at": created_at.isoformat()})
+        tracker.apply_order_event({"user_id": 3, "order_id": 42, "status": "FILLED",
+                                   "quantity": "1", "price": "10",
+                                   "created_at": (datetime.utcnow() - timedelta(days=2)).isoformat()})
+
+        assert tracker.open_orders_count(3) == 0
+        assert tracker.daily_volume(3) == Decimal("10000")
+
+    def test_reset_replays_events_seen_during_snapshot(self):
+        """Events applied while the snapshot was read survive the swap once"""
+        tracker = UserActivityTracker()
+        tracker.begin_snapshot()
+        tracker.apply_order_event({"user_id": 1, "order_id": 5, "status": "FILLED",
+                                   "quantity": "1", "price": "30"})
+        tracker.apply_order_event({"user_id": 1, "order_id": 6, "status": "FILLED",
+                                   "quantity": "1", "price": "70"})
+        tracker.apply_order_event({"user_id": 1, "order_id": 9, "status": "NEW",
+                                   "quantity": "1", "price": "1"})
+        now_bucket = int(time.time() // tracker.bucket_seconds)
+
+        # The snapshot already counted order 5 and still saw it open
+        tracker.reset(
+            [{"user_id": 1, "bucket": now_bucket, "volume": Decimal("30")}],
+            [{"user_id": 1, "id": 5}],
+            counted_fills={5}
+        )
+
+        assert tracker.daily_volume(1) == Decimal("100")
+        assert tracker.open_orders == {1: {9}}
+        assert tracker.journal is None
+
+    @pytest.mark.asyncio
+    async def test_reconcile_checks_fills_against_the_snapshot(self, engine):
+        """Fills arriving mid-reconcile are counted exactly once"""
+        now_bucket = int(time.time() // engine.activity.bucket_seconds)
+
+        class SnapshotConnection:
+            def __init__(self):
+                self.fill_checks = []
+
+            def transaction(self, **options):
+                assert options == {"isolation": "repeatable_read", "readonly": True}
+
+                class Transaction:
+                    async def __aenter__(self):
+                        return self
+
+                    async def __aexit__(self, *exc):
+                        return False
+
+                return Transaction()
+
+            async def fetch(self, query, *args):
+                if "SUM(quantity * price)" in query:
+                    # Order 5 fills and is committed just before the snapshot
+                    engine.activity.apply_order_event({"user_id": 1, "order_id": 5, "status": "FILLED",
+                                                       "quantity": "1", "price": "30"})
+                    return [{"user_id": 1, "bucket": now_bucket, "volume": Decimal("30")}]
+                if "PARTIALLY_FILLED" in query:
+                    # Order 6 fills after the snapshot was taken
+                    engine.activity.apply_order_event({"user_id": 1, "order_id": 6, "status": "FILLED",
+                                                       "quantity": "1", "price": "70"})
+                    return []
+                self.fill_checks.append(sorted(args[0]))
+                return [{"id": 5}] if 5 in args[0] else []
+
+        connection = SnapshotConnection()
+        engine.db_pool = FakePool(connection)
+        engine.activity.record_fill(1, Decimal("999"))
+
+        await engine.reconcile_activity()
+
+        assert connection.fill_checks == [[5, 6]]
+        assert engine.activity.daily_volume(1) == Decimal("100")
+        assert engine.activity.journal is None
+
+    @pytest.mark.asyncio
+    async def test_validate_order_uses_in_memory_counters(self, engine):
+        """Volume and open-order checks need no database"""
+        engine.activity.record_fill(1, Decimal("999950"))
+
+        is_valid, message = await engine.validate_order(
+            1, "BTCUSDT", "LONG", Decimal("1"), Decimal("100"), "SPOT"
+        )
+
+        assert not is_valid
+        assert "Daily volume limit exceeded" in message
+
+class TestVaREngine:
+    """Test batched Value-at-Risk"""
+
+    def test_parametric_var_single_position(self):
+        """A lone position's VaR is z * sigma * notional"""
+        var_engine = VaREngine()
+        exposures = np.array([[1000.0]])
+        covariance = var_engine.covariance(np.array([0.02]))
+
+        var = var_engine.portfolio_var(exposures, 0.99, VaREngine.PARAMETRIC, covariance)
+
+        assert var[0] == pytest.approx(2.3263 * 0.02 * 1000, rel=1e-3)
+
+    def test_monte_carlo_converges_to_parametric(self):
+        """Simulated VaR agrees with the closed form for normal returns"""
+        var_engine = VaREngine(scenarios=200000, seed=7)
+        exposures = np.array([[1000.0, -500.0], [200.0, 300.0]])
+        correlation = np.array([[1.0, 0.6], [0.6, 1.0]])
+        covariance = var_engine.covariance(np.array([0.02, 0.05]), correlation)
+
+        parametric = var_engine.portfolio_var(exposures, 0.95, VaREngine.PARAMETRIC, covariance)
+        simulated = var_engine.portfolio_var(exposures, 0.95, VaREngine.MONTE_CARLO, covariance)
+
+        assert simulated == pytest.approx(parametric, rel=0.03)
+
+    def test_historical_var_uses_sampled_returns(self):
+        """Historical mode prices portfolios against recorded returns"""
+        history = ReturnHistory(capacity=4, sample_interval=86400)
+        for price in (100.0, 90.0, 99.0, 89.1, 98.01):
+            history.sample({"BTCUSDT": price})
+        var_engine = VaREngine()
+
+        var = var_engine.portfolio_var(
+            np.array([[1000.0]]), 0.99, VaREngine.HISTORICAL,
+            np.zeros((1, 1)), history=history, symbols=["BTCUSDT"]
+        )
+
+        assert var[0] == pytest.approx(-1000.0 * np.log(0.9), rel=1e-2)
+
+    def test_calculate_portfolio_var_covers_all_users(self, engine):
+        """One call returns VaR for every user with positions"""
+        engine.add_position(make_position(1, "BTCUSDT", "LONG"))
+        engine.add_position(make_position(2, "BTCUSDT", "SHORT", size="2"))
+        engine.market_data["BTCUSDT"] = make_market_data("BTCUSDT", "100")
+
+        var = engine.calculate_portfolio_var(method=VaREngine.PARAMETRIC)
+
+        assert set(var) == {1, 2}
+        assert float(var[2]) == pytest.approx(2 * float(var[1]), rel=1e-6)
+
+    def test_unknown_method_is_rejected(self):
+        """Invalid methods raise instead of silently returning zero"""
+        with pytest.raises(ValueError):
+            VaREngine().portfolio_var(np.ones((1, 1)), 0.95, "bogus", np.eye(1))
+
+class TestExposureAggregates:
+    """Test incrementally maintained exposure"""
+
+    def full_scan(self, engine):
+        by_symbol = {}
+        for key in engine.positions:
+            position = engine.sync_position(key)
+            by_symbol[position.symbol] = by_symbol.get(position.symbol, 0.0) + \
+                float(position.size * position.mark_price)
+        return by_symbol
+
+    @pytest.mark.asyncio
+    async def test_aggregates_track_adds_removes_and_ticks(self, engine):
+        """Deltas keep totals equal to a full recomputation"""
+        engine.add_position(make_position(1, "BTCUSDT", "LONG", size="2"))
+        engine.add_position(make_position(2, "BTCUSDT", "SHORT", size="1"))
+        engine.add_position(make_position(1, "ETHUSDT", "LONG", size="3", entry="10"))
+        engine.market_data["BTCUSDT"] = make_market_data("BTCUSDT", "110")
+        await engine.evaluate_symbols({"BTCUSDT"})
+        engine.add_position(make_position(2, "BTCUSDT", "SHORT", size="4"))
+        engine.remove_position(1, "ETHUSDT")
+
+        expected = self.full_scan(engine)
+        book = engine.position_book
+
+        assert float(await engine.calculate_total_exposure()) == pytest.approx(sum(expected.values()))
+        assert book.symbol_gross[book.symbol_ids["BTCUSDT"]] == pytest.approx(expected["BTCUSDT"])
+        assert book.symbol_net[book.symbol_ids["BTCUSDT"]] == pytest.approx(2 * 110 - 4 * 100)
+        assert await engine.calculate_concentration_risk() == pytest.approx(1.0)
+
+    def test_rebuild_matches_incremental_state(self, engine):
+        """A full rebuild produces the same aggregates"""
+        for user_id in range(1, 4):
+            engine.risk_limits[user_id] = make_limits(user_id)
+            engine.add_position(make_position(user_id, "BTCUSDT", "LONG", size=str(user_id)))
+            engine.add_position(make_position(user_id, "ETHUSDT", "SHORT", size="1", entry="10"))
+        book = engine.position_book
+        gross, net, total = book.symbol_gross.copy(), book.symbol_net.copy(), book.gross_total
+
+        book.rebuild_exposure()
+
+        assert np.allclose(book.symbol_gross, gross)
+        assert np.allclose(book.symbol_net, net)
+        assert book.gross_total == pytest.approx(total)
+
+    def test_snapshot_is_cached_until_exposure_changes(self, engine):
+        """Repeated reads reuse the snapshot; a change rebuilds it"""
+        engine.add_position(make_position(1, "BTCUSDT", "LONG"))
+        engine.add_position(make_position(1, "ETHUSDT", "LONG", size="3"))
+
+        first = engine.exposure_snapshot()
+        assert engine.exposure_snapshot() is first
+        assert first["total_exposure"] == "400.0"
+        assert first["symbols"]["ETHUSDT"]["share"] == pytest.approx(0.75)
+
+        engine.remove_position(1, "ETHUSDT")
+        second = engine.exposure_snapshot()
+        assert second is not first
+        assert set(second["symbols"]) == {"BTCUSDT"}
+
+    @pytest.mark.asyncio
+    async def test_endpoint_serves_monitored_correlation_risk(self, engine, monkeypatch):
+        """The exposure endpoint does not recompute correlation per request"""
+        engine.add_position(make_position(1, "BTCUSDT", "LONG"))
+        engine.correlation_risk = 0.42
+
+        async def recompute():
+            raise AssertionError("correlation recomputed on request")
+
+        monkeypatch.setattr(engine, "calculate_correlation_risk", recompute)
+        monkeypatch.setattr(risk_main, "risk_engine", engine)
+
+        exposure = await risk_main.get_system_exposure()
+
+        assert exposure["correlation_risk"] == 0.42
+        assert exposure["total_exposure"] == "100.0"
+
+class TestEWCovariance:
+    """Test streaming correlation estimates"""
+
+    def sample_correlated(self, model, count, rho, seed=3):
+        rng = np.random.default_rng(seed)
+        covariance = np.array([[1.0, rho], [rho, 1.0]]) * 0.01 ** 2
+        for shock in rng.multivariate_normal(np.zeros(2), covariance, size=count):
+            model.update(["BTCUSDT", "ETHUSDT"], shock)
+
+    def test_correlation_tracks_true_value(self):
+        """The EW estimate converges to the generating correlation"""
+        model = EWCovariance(decay=0.99)
+        self.sample_correlated(model, 3000, 0.7)
+
+        corr = model.correlation(["BTCUSDT", "ETHUSDT"])
+
+        assert corr[0, 1] == pytest.approx(0.7, abs=0.15)
+        assert corr[0, 0] == 1.0
+
+    def test_not_ready_returns_identity(self):
+        """Too few samples give no correlation"""
+        model = EWCovariance(min_samples=30)
+        self.sample_correlated(model, 5, 0.9)
+
+        assert np.array_equal(model.correlation(["BTCUSDT", "ETHUSDT"]), np.eye(2))
+
+    def test_new_symbols_extend_the_matrix(self):
+        """Symbols seen later are added without disturbing existing entries"""
+        model = EWCovariance(min_samples=1)
+        model.update(["BTCUSDT"], np.array([0.01]))
+        model.update(["BTCUSDT", "ETHUSDT"], np.array([0.01, np.nan]))
+
+        corr = model.correlation(["ETHUSDT", "SOLUSDT", "BTCUSDT"])
+
+        assert corr.shape == (3, 3)
+        assert corr[0, 2] == 0.0
+        assert model.volatilities(["BTCUSDT"])[0] > 0
+
+    @pytest.mark.asyncio
+    async def test_correlation_risk_uses_estimate(self, engine):
+        """Correlation risk reflects the streaming estimate, not a constant"""
+        engine.add_position(make_position(1, "BTCUSDT", "LONG"))
+        engine.add_position(make_position(1, "ETHUSDT", "LONG"))
+        self.sample_correlated(engine.return_covariance, 3000, 0.7)
+
+        risk = await engine.calculate_correlation_risk()
+
+        assert risk == pytest.approx(
+            engine.return_covariance.correlation(["BTCUSDT", "ETHUSDT"])[0, 1]
+        )
+
+class TestEventPublisher:
+    """Test the non-blocking publish pipeline"""
+
+    @pytest.mark.asyncio
+    async def test_liquidation_cascade_is_published_in_batches(self, engine):
+        """Crossed positions reach the broker without blocking the monitor"""
+        broker = InMemoryBroker()
+        engine.publisher = EventPublisher(producer=broker, batch_size=100)
+        engine.db_pool = FakePool(FakeConnection())
+        engine.position_writer.db_pool = engine.db_pool
+        for user_id in range(1, 21):
+            engine.risk_limits[user_id] = make_limits(user_id)
+            engine.add_position(make_position(user_id, "BTCUSDT", "LONG"))
+        engine.market_data["BTCUSDT"] = make_market_data("BTCUSDT", "50")
+
+        runner = asyncio.create_task(engine.publisher.run())
+        await engine.evaluate_symbols({"BTCUSDT"})
+        await engine.shutdown()
+        runner.cancel()
+
+        assert len(broker.messages["liquidations"]) == 20
+        assert len(broker.messages["margin_calls"]) == 20
+        assert engine.publisher.batches < engine.publisher.published
+        assert not engine.positions
+
+    @pytest.mark.asyncio
+    async def test_shutdown_stops_producers_before_flushing(self, engine):
+        """No position can be buffered after the final flush"""
+        engine.publisher = EventPublisher(producer=InMemoryBroker())
+        engine.db_pool = FakePool(FakeConnection())
+        engine.position_writer.db_pool = engine.db_pool
+        engine.background_tasks = [asyncio.create_task(asyncio.sleep(3600)) for _ in range(2)]
+        flushed_with = []
+        flush = engine.position_writer.flush
+
+        async def recording_flush():
+            flushed_with.append([task.done() for task in engine.background_tasks])
+            return await flush()
+
+        engine.position_writer.flush = recording_flush
+        await engine.shutdown()
+
+        assert flushed_with == [[True, True]]
+        assert all(task.cancelled() for task in engine.background_tasks)
+
+    @pytest.mark.asyncio
+    async def test_full_queue_applies_backpressure(self):
+        """Publishers wait for room instead of dropping messages"""
+        broker = InMemoryBroker()
+        publisher = EventPublisher(producer=broker, max_queue=2, batch_size=1)
+        await publisher.publish("notifications", {"n": 1})
+        await publisher.publish("notifications", {"n": 2})
+
+        blocked = asyncio.create_task(publisher.publish("notifications", {"n": 3}))
+        await asyncio.sleep(0)
+        assert not blocked.done()
+
+        runner = asyncio.create_task(publisher.run())
+        await blocked
+        await publisher.close()
+        runner.cancel()
+
+        assert [message["n"] for message in broker.messages["notifications"]] == [1, 2, 3]
+        assert publisher.metrics()["backpressure_waits"] == 1
+
+    @pytest.mark.asyncio
+    async def test_producer_errors_are_counted(self):
+        """A failing producer does not stall the pipeline"""
+        class FailingProducer(InMemoryBroker):
+            def flush(self, timeout=None):
+                raise ConnectionError("broker unavailable")
+
+        publisher = EventPublisher(producer=FailingProducer(), max_retries=2, retry_backoff=0)
+        runner = asyncio.create_task(publisher.run())
+        await publisher.publish("liquidations", {"user_id": 1})
+        await publisher.publish("notifications", {"user_id": 1})
+        await publisher.close()
+        runner.cancel()
+
+        assert publisher.failed == 2
+        assert publisher.retries == 2
+
+    @pytest.mark.asyncio
+    async def test_critical_messages_are_retried(self):
+        """Liquidations survive a transient broker failure, other topics do not"""
+        class FlakyProducer(InMemoryBroker):
+            failures = 2
+
+            def flush(self, timeout=None):
+                if self.failures:
+                    self.failures -= 1
+                    self.messages.clear()
+                    raise ConnectionError("broker unavailable")
+
+        broker = FlakyProducer()
+        publisher = EventPublisher(producer=broker, retry_backoff=0)
+        await publisher.publish("liquidations", {"user_id": 1})
+        await publisher.publish("notifications", {"user_id": 1})
+        await publisher.publish("margin_calls", {"user_id": 2})
+        runner = asyncio.create_task(publisher.run())
+        await publisher.close()
+        runner.cancel()
+
+        assert broker.messages == {"liquidations": [{"user_id": 1}],
+                                   "margin_calls": [{"user_id": 2}]}
+        assert publisher.failed == 1
+        assert publisher.retries == 2
+
+    @pytest.mark.asyncio
+    async def test_failed_record_futures_are_retried(self):
+        """Errors kafka-python reports on the record future, not flush, are retried"""
+        class RejectedRecord:
+            def get(self, timeout=None):
+                raise ValueError("record rejected by broker")
+
+        class RejectingProducer(InMemoryBroker):
+            rejections = 2
+
+            def send(self, topic, value):
+                if self.rejections:
+                    self.rejections -= 1
+                    return RejectedRecord()
+                return super().send(topic, value)
+
+        broker = RejectingProducer()
+        publisher = EventPublisher(producer=broker, retry_backoff=0)
+        await publisher.publish("liquidations", {"user_id": 1})
+        await publisher.publish("notifications", {"user_id": 2})
+        runner = asyncio.create_task(publisher.run())
+        await publisher.close()
+        runner.cancel()
+
+        assert broker.messages == {"liquidations": [{"user_id": 1}]}
+        assert publisher.published == 1
+        assert publisher.failed == 1
+        assert publisher.retries == 1
+
+    @pytest.mark.asyncio
+    async def test_close_gives_up_on_a_dead_broker(self):
+        """Shutdown is bounded even when the producer never answers"""
+        class HangingProducer(InMemoryBroker):
+            closed = False
+
+            def flush(self, timeout=None):
+                time.sleep(0.5)
+                raise ConnectionError("broker unavailable")
+
+            def close(self, timeout=None):
+                self.closed = True
+
+        broker = HangingProducer()
+        publisher = EventPublisher(producer=broker, retry_backoff=60)
+        runner = asyncio.create_task(publisher.run())
+        await publisher.publish("liquidations", {"user_id": 1})
+
+        started = time.monotonic()
+        await publisher.close(timeout=0.1)
+        runner.cancel()
+
+        assert time.monotonic() - started < 0.5
+        assert broker.closed
+
+class TestAnomalyScoring:
+    """Test cached features and micro-batched scoring"""
+
+    @pytest.fixture
+    def trained_engine(self, engine):
+        rng = np.random.default_rng(11)
+        samples = rng.normal(size=(2000, 8))
+        engine.anomaly_detector.fit(engine.scaler.fit_transform(samples))
+        engine.is_trained = True
+        return engine
+
+    def test_feature_cache_tracks_order_events(self):
+        """Order events update averages and the recent-order count"""
+        cache = UserFeatureCache(recent_window=60, decay=0.5)
+        cache.record_order(1, 2.0, 100.0, timestamp=1000.0)
+        cache.record_order(1, 4.0, 200.0, timestamp=1030.0)
+
+        features = cache.features(1, 1.0, 150.0, 500.0, now=1070.0)
+
+        assert features[:3] == [3.0, 150.0, 2.0]
+        assert features[3:5] == [1.0, 150.0]
+        assert features[6] == 1.0
+        assert features[7] == 500.0
+
+    @pytest.mark.asyncio
+    async def test_concurrent_requests_share_one_model_call(self, trained_engine):
+        """Concurrent validations are scored in a single batch"""
+        rng = np.random.default_rng(5)
+        rows = [list(row) for row in rng.normal(size=(50, 8))]
+        rows[0] = [25.0] * 8
+        scorer = trained_engine.anomaly_scorer
+
+        scores = await asyncio.gather(*(scorer.score(row) for row in rows))
+
+        expected = trained_engine.anomaly_detector.predict(
+            trained_engine.scaler.transform(np.array(rows))
+        )
+        assert scorer.batches == 1
+        assert scorer.scored == 50
+        assert [-1 if score < 0 else 1 for score in scores] == list(expected)
+        assert scores[0] < 0
+
+    @pytest.mark.asyncio
+    async def test_max_batch_flushes_immediately(self, trained_engine):
+        """A full batch is scored without waiting for the loop"""
+        scorer = AnomalyScorer(trained_engine.anomaly_detector, trained_engine.scaler,
+                               max_batch=4)
+
+        await asyncio.gather(*(scorer.score([0.0] * 8) for _ in range(10)))
+
+        assert scorer.batches == 3
+
+    @pytest.mark.asyncio
+    async def test_detect_anomaly_needs_no_database(self, trained_engine):
+        """Anomaly detection runs from cached features only"""
+        trained_engine.feature_cache.record_order(1, 1.0, 100.0)
+
+        result = await trained_engine.detect_anomaly(1, "BTCUSDT", Decimal("1"), Decimal("100"))
+
+        assert result in (True, False)
+        assert trained_engine.anomaly_scorer.scored == 1
+
+if __name__ == "__main__":
+    pytest.main([__file__])